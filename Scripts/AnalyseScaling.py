@@ -0,0 +1,98 @@
+# AnalyseScaling.py by J. M. Skelton
+
+
+import argparse;
+
+from Analysis import CalculateGPUSpeedups, CalculateStrongScaling, FindBestConfigurations, FitPowerLaws, LoadResultArrays, PlotScaling, PredictSCFTimes, WritePowerLaws, WriteScaling, WriteSummary;
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Analyse the scaling of VASP with system size, number of processes and device (CPU/GPU) from benchmark results.");
+    
+    parser.set_defaults(
+        OutputPrefix = "Scaling",
+        PredictNumAtoms = []
+        );
+    
+    parser.add_argument(
+        metavar = "results_file", type = str, nargs = '+',
+        dest = 'ResultFiles',
+        help = "result stores (\".npz\" or \".parquet\") and/or CSV files written by CPUTest.py and GPUTest.py"
+        );
+    
+    parser.add_argument(
+        "--poscar_dir",
+        type = str, dest = 'POSCARDir',
+        help = "directory containing \"POSCAR_<system>.vasp\" files to read the number of atoms from when importing CSV files"
+        );
+    
+    parser.add_argument(
+        "--output_prefix",
+        type = str, dest = 'OutputPrefix',
+        help = "prefix for output files (default: Scaling)"
+        );
+    
+    parser.add_argument(
+        "--predict",
+        type = int, nargs = '+', dest = 'PredictNumAtoms',
+        help = "system sizes (number of atoms) to predict the best SCF times for from the fitted power laws"
+        );
+    
+    parser.add_argument(
+        "--no_plots",
+        dest = 'NoPlots', action = 'store_true',
+        help = "do not generate plots (plotting requires Matplotlib)"
+        );
+    
+    args = parser.parse_args();
+    
+    arrays = LoadResultArrays(args.ResultFiles, poscarDir = args.POSCARDir);
+    
+    print("Loaded {0} result(s)".format(len(arrays["System"])));
+    print("");
+    
+    best = CalculateGPUSpeedups(FindBestConfigurations(arrays));
+    
+    print("Best configurations:");
+    
+    for i in range(len(best["System"])):
+        speedup = best["SpeedupVsCPU"][i];
+        
+        print("  -> {0:<12} {1:<5}: # proc = {2}, KPAR = {3}, NPAR = {4}, NSIM = {5} -> t_SCF = {6:.2f} s{7}".format(
+            best["System"][i], best["DeviceClass"][i], best["NumProcesses"][i], best["KPAR"][i], best["NPAR"][i], best["NSIM"][i], best["TSCFAve"][i],
+            " ({0:.2f}x vs. CPU)".format(speedup) if speedup == speedup and best["DeviceClass"][i] != "CPU" else ""
+            ));
+    
+    print("");
+    
+    fits = FitPowerLaws(best);
+    
+    print("Power-law fits (t_SCF = A * N_atoms ^ B):");
+    
+    predictions = PredictSCFTimes(fits, args.PredictNumAtoms);
+    
+    for deviceClass, a, b, rSquared, numSystems in fits:
+        print("  -> {0:<5}: A = {1:.3e} s, B = {2:.2f} (R^2 = {3:.3f}, {4} systems)".format(deviceClass, a, b, rSquared, numSystems));
+        
+        for numAtoms, t in zip(args.PredictNumAtoms, predictions[deviceClass]):
+            print("     N = {0:<6}: t_SCF ~ {1:.2f} s".format(numAtoms, t));
+    
+    print("");
+    
+    scaling = CalculateStrongScaling(arrays);
+    
+    outputFiles = ["{0}-Summary.csv".format(args.OutputPrefix), "{0}-StrongScaling.csv".format(args.OutputPrefix), "{0}-PowerLaw.csv".format(args.OutputPrefix)];
+    
+    WriteSummary(outputFiles[0], best);
+    WriteScaling(outputFiles[1], scaling);
+    WritePowerLaws(outputFiles[2], fits, predictNumAtoms = args.PredictNumAtoms);
+    
+    if not args.NoPlots:
+        try:
+            outputFiles = outputFiles + PlotScaling(args.OutputPrefix, best, scaling, fits);
+        except ImportError:
+            print("WARNING: Matplotlib not available -> skipping plots");
+            print("");
+    
+    for outputFile in outputFiles:
+        print("Wrote \"{0}\"".format(outputFile));
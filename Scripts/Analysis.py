@@ -0,0 +1,304 @@
+# Analysis.py by J. M. Skelton
+
+
+import csv;
+
+import numpy as np;
+
+from ResultStore import LoadResults;
+
+
+# Columns identifying the device setup of a run; results are compared between and within these "device classes", e.g. "CPU", "1GPU" or "4GPU".
+
+DeviceClassKey = "DeviceClass";
+
+
+def LoadResultArrays(filePaths, poscarDir = None):
+    # Loads results with ResultStore.LoadResults() and returns them as a dictionary of NumPy arrays (see GetAnalysisArrays()).
+    
+    return GetAnalysisArrays(LoadResults(filePaths, poscarDir = poscarDir));
+
+def GetAnalysisArrays(store):
+    # Returns the columns of store as NumPy arrays with the device class added.
+    
+    arrays = store.GetArrays();
+    
+    arrays[DeviceClassKey] = np.where(
+        arrays["Device"] == "CPU", "CPU", np.char.add(arrays["NumGPUs"].astype(np.str_), "GPU")
+        );
+    
+    return arrays;
+
+def GetValidMask(arrays):
+    # Runs with a valid average SCF time, excluding runs that failed the checks on the final energy and number of SCF steps (see Validation.ValidateResults()).
+    
+    return np.isfinite(arrays["TSCFAve"]) & (arrays["NumSCFSteps"] > 0) & (arrays["Valid"] != 0);
+
+def GetGroupIDs(keys):
+    # Returns (groupIDs, firstIndices): groupIDs maps each row to a group of rows with the same values in keys (a list of arrays), and firstIndices gives a representative row for each group.
+    
+    records = np.rec.fromarrays(keys);
+    
+    _, firstIndices, groupIDs = np.unique(records, return_index = True, return_inverse = True);
+    
+    return (groupIDs.ravel(), firstIndices);
+
+def GetGroupArgMin(keys, values):
+    # Returns the index of the row with the smallest value in each group of rows sharing the same keys; ties are resolved in favour of the first row.
+    
+    groupIDs, firstIndices = GetGroupIDs(keys);
+    
+    groupMin = np.full(len(firstIndices), np.inf);
+    
+    np.minimum.at(groupMin, groupIDs, values);
+    
+    # Reverse the rows before assigning, so the first of any tied rows is written last.
+    
+    isMin = values == groupMin[groupIDs];
+    
+    indices = np.full(len(firstIndices), -1, dtype = np.int64);
+    
+    rows = np.nonzero(isMin)[0][::-1];
+    
+    indices[groupIDs[rows]] = rows;
+    
+    return indices;
+
+def _Subset(arrays, indices):
+    return dict((name, array[indices]) for name, array in arrays.items() if name not in ("SCFTimes", "SCFTimeOffsets"));
+
+def FindBestConfigurations(arrays):
+    # Returns the fastest valid run (lowest average SCF time) for each system and device class, sorted by device class and number of atoms.
+    
+    valid = np.nonzero(GetValidMask(arrays))[0];
+    
+    indices = valid[GetGroupArgMin([arrays["System"][valid], arrays[DeviceClassKey][valid]], arrays["TSCFAve"][valid])];
+    
+    indices = indices[np.lexsort([arrays["NumAtoms"][indices], arrays[DeviceClassKey][indices]])];
+    
+    best = _Subset(arrays, indices);
+    
+    # Cost of each SCF step in core seconds and GPU seconds.
+    
+    best["CoreSecondsPerSCF"] = best["TSCFAve"] * best["NumProcesses"];
+    best["GPUSecondsPerSCF"] = best["TSCFAve"] * best["NumGPUs"];
+    
+    return best;
+
+def CalculateStrongScaling(arrays):
+    # For each system and device class, takes the fastest run at each number of processes (i.e. with the best KPAR, NPAR, NSIM, etc.) and calculates the speedup and parallel efficiency relative to the smallest number of processes tested.
+    
+    valid = np.nonzero(GetValidMask(arrays))[0];
+    
+    indices = valid[GetGroupArgMin(
+        [arrays["System"][valid], arrays[DeviceClassKey][valid], arrays["NumProcesses"][valid]], arrays["TSCFAve"][valid]
+        )];
+    
+    indices = indices[np.lexsort([arrays["NumProcesses"][indices], arrays["NumAtoms"][indices], arrays[DeviceClassKey][indices]])];
+    
+    scaling = _Subset(arrays, indices);
+    
+    groupIDs, _ = GetGroupIDs([scaling["System"], scaling[DeviceClassKey]]);
+    
+    references = GetGroupArgMin([scaling["System"], scaling[DeviceClassKey]], scaling["NumProcesses"].astype(np.float64));
+    
+    tReference = scaling["TSCFAve"][references][groupIDs];
+    numProcessesReference = scaling["NumProcesses"][references][groupIDs];
+    
+    scaling["Speedup"] = tReference / scaling["TSCFAve"];
+    scaling["Efficiency"] = scaling["Speedup"] * numProcessesReference / scaling["NumProcesses"];
+    
+    return scaling;
+
+def CalculateGPUSpeedups(best, referenceClass = "CPU"):
+    # Adds the ratio of the best average SCF time for referenceClass to that of each device class, for the same system, to the results from FindBestConfigurations(); systems not tested with referenceClass get NaN.
+    
+    isReference = best[DeviceClassKey] == referenceClass;
+    
+    referenceSystems = best["System"][isReference];
+    referenceTimes = best["TSCFAve"][isReference];
+    
+    order = np.argsort(referenceSystems);
+    
+    referenceSystems, referenceTimes = referenceSystems[order], referenceTimes[order];
+    
+    positions = np.clip(np.searchsorted(referenceSystems, best["System"]), 0, max(len(referenceSystems) - 1, 0));
+    
+    speedups = np.full(len(best["System"]), np.nan);
+    
+    if len(referenceSystems) > 0:
+        found = referenceSystems[positions] == best["System"];
+        
+        speedups[found] = referenceTimes[positions[found]] / best["TSCFAve"][found];
+    
+    best["SpeedupVs{0}".format(referenceClass)] = speedups;
+    
+    return best;
+
+def FitPowerLaws(best):
+    # Fits t_SCF = A * N_atoms ^ B to the best average SCF times for each device class by linear regression of log(t_SCF) against log(N_atoms).
+    # Returns a list of (device class, A, B, R^2, number of systems) tuples; classes with fewer than two system sizes are skipped.
+    
+    fits = [];
+    
+    for deviceClass in np.unique(best[DeviceClassKey]):
+        mask = (best[DeviceClassKey] == deviceClass) & (best["NumAtoms"] > 0);
+        
+        if len(np.unique(best["NumAtoms"][mask])) < 2:
+            continue;
+        
+        x, y = np.log(best["NumAtoms"][mask]), np.log(best["TSCFAve"][mask]);
+        
+        b, logA = np.polyfit(x, y, 1);
+        
+        residuals = y - (logA + b * x);
+        
+        sumSquares = np.sum((y - np.mean(y)) ** 2);
+        
+        rSquared = 1.0 - np.sum(residuals ** 2) / sumSquares if sumSquares > 0.0 else 1.0;
+        
+        fits.append((str(deviceClass), float(np.exp(logA)), float(b), float(rSquared), int(np.count_nonzero(mask))));
+    
+    return fits;
+
+def PredictSCFTimes(fits, numAtoms):
+    # Returns a dictionary mapping each device class to an array of predicted SCF times for the system sizes in numAtoms.
+    
+    numAtoms = np.asarray(numAtoms, dtype = np.float64);
+    
+    return dict((deviceClass, a * numAtoms ** b) for deviceClass, a, b, _, _ in fits);
+
+def _WriteTable(filePath, headers, columns):
+    with open(filePath, 'w') as outputWriter:
+        outputWriterCSV = csv.writer(outputWriter, delimiter = ',', quotechar = '\"', quoting = csv.QUOTE_ALL);
+        
+        outputWriterCSV.writerow(headers);
+        
+        for row in zip(*columns):
+            outputWriterCSV.writerow([value.item() if hasattr(value, 'item') else value for value in row]);
+
+def WriteSummary(filePath, best):
+    headers = [
+        "System", "N_Atoms", "Device", "# Proc", "KPAR", "NPAR", "NSIM", "Extra Tags",
+        "t_SCF,Ave [s]", "t_Elapsed [s]", "Core s / SCF", "GPU s / SCF", "Speedup vs. CPU"
+        ];
+    
+    names = [
+        "System", "NumAtoms", DeviceClassKey, "NumProcesses", "KPAR", "NPAR", "NSIM", "ExtraTags",
+        "TSCFAve", "TElapsed", "CoreSecondsPerSCF", "GPUSecondsPerSCF", "SpeedupVsCPU"
+        ];
+    
+    _WriteTable(filePath, headers, [best[name] for name in names]);
+
+def WriteScaling(filePath, scaling):
+    headers = ["System", "N_Atoms", "Device", "# Proc", "KPAR", "NPAR", "NSIM", "t_SCF,Ave [s]", "Speedup", "Efficiency"];
+    names = ["System", "NumAtoms", DeviceClassKey, "NumProcesses", "KPAR", "NPAR", "NSIM", "TSCFAve", "Speedup", "Efficiency"];
+    
+    _WriteTable(filePath, headers, [scaling[name] for name in names]);
+
+def WritePowerLaws(filePath, fits, predictNumAtoms = None):
+    # If predictNumAtoms is set, the predicted SCF times for those system sizes are added as extra columns.
+    
+    predictNumAtoms = list(predictNumAtoms) if predictNumAtoms != None else [];
+    
+    predictions = PredictSCFTimes(fits, predictNumAtoms);
+    
+    headers = ["Device", "A [s]", "B", "R^2", "# Systems"] + ["t_SCF(N = {0}) [s]".format(numAtoms) for numAtoms in predictNumAtoms];
+    
+    with open(filePath, 'w') as outputWriter:
+        outputWriterCSV = csv.writer(outputWriter, delimiter = ',', quotechar = '\"', quoting = csv.QUOTE_ALL);
+        
+        outputWriterCSV.writerow(headers);
+        
+        for deviceClass, a, b, rSquared, numSystems in fits:
+            outputWriterCSV.writerow([deviceClass, a, b, rSquared, numSystems] + [float(t) for t in predictions[deviceClass]]);
+
+def PlotScaling(outputPrefix, best, scaling, fits):
+    # Plots the best SCF time against system size (with the fitted power laws) and the strong-scaling speedup and efficiency for each system; requires Matplotlib.
+    # Returns the list of files written.
+    
+    import matplotlib;
+    
+    matplotlib.use('Agg');
+    
+    import matplotlib.pyplot as plt;
+    import matplotlib.ticker;
+    
+    filesWritten = [];
+    
+    deviceClasses = list(np.unique(best[DeviceClassKey]));
+    
+    fitParameters = dict((deviceClass, (a, b)) for deviceClass, a, b, _, _ in fits);
+    
+    figure, axes = plt.subplots(figsize = (8.6 / 2.54, 7.0 / 2.54));
+    
+    for deviceClass in deviceClasses:
+        mask = best[DeviceClassKey] == deviceClass;
+        
+        lines = axes.plot(best["NumAtoms"][mask], best["TSCFAve"][mask], 'o', label = deviceClass);
+        
+        if deviceClass in fitParameters:
+            a, b = fitParameters[deviceClass];
+            
+            x = np.linspace(np.min(best["NumAtoms"]), np.max(best["NumAtoms"]), 100);
+            
+            axes.plot(x, a * x ** b, '--', color = lines[0].get_color(), linewidth = 0.75);
+    
+    axes.set_xscale('log');
+    axes.set_yscale('log');
+    
+    # Label the system sizes tested rather than the default logarithmic ticks, which overlap over the narrow range of sizes typically tested.
+    
+    numAtoms = np.unique(best["NumAtoms"][best["NumAtoms"] > 0]);
+    
+    axes.set_xticks(numAtoms);
+    axes.set_xticklabels([str(value) for value in numAtoms], rotation = 90, fontsize = 'small');
+    axes.xaxis.set_minor_formatter(matplotlib.ticker.NullFormatter());
+    
+    axes.set_xlabel(r"$N_\mathrm{atoms}$");
+    axes.set_ylabel(r"Best $t_\mathrm{SCF}$ [s]");
+    
+    axes.legend(loc = 'upper left', fontsize = 'small');
+    
+    figure.tight_layout();
+    
+    filePath = "{0}-TSCF.png".format(outputPrefix);
+    
+    figure.savefig(filePath, dpi = 300);
+    plt.close(figure);
+    
+    filesWritten.append(filePath);
+    
+    systems = np.unique(scaling["System"]);
+    
+    for system in systems[np.argsort([scaling["NumAtoms"][scaling["System"] == system][0] for system in systems])]:
+        figure, (axes1, axes2) = plt.subplots(1, 2, figsize = (16.8 / 2.54, 7.0 / 2.54));
+        
+        for deviceClass in deviceClasses:
+            mask = (scaling["System"] == system) & (scaling[DeviceClassKey] == deviceClass);
+            
+            if np.count_nonzero(mask) < 2:
+                continue;
+            
+            axes1.plot(scaling["NumProcesses"][mask], scaling["Speedup"][mask], 'o-', label = deviceClass);
+            axes2.plot(scaling["NumProcesses"][mask], scaling["Efficiency"][mask], 'o-', label = deviceClass);
+        
+        for axes, label in (axes1, "Speedup"), (axes2, "Parallel efficiency"):
+            axes.set_xlabel("# MPI processes");
+            axes.set_ylabel(label);
+            
+            if len(axes.get_lines()) > 0:
+                axes.legend(loc = 'best', fontsize = 'small');
+        
+        axes1.set_title(str(system), fontsize = 'medium');
+        
+        figure.tight_layout();
+        
+        filePath = "{0}-Scaling_{1}.png".format(outputPrefix, system);
+        
+        figure.savefig(filePath, dpi = 300);
+        plt.close(figure);
+        
+        filesWritten.append(filePath);
+    
+    return filesWritten;
@@ -0,0 +1,537 @@
+# Batch.py by J. M. Skelton
+
+
+import getpass;
+import glob;
+import json;
+import os;
+import re;
+import shutil;
+import subprocess;
+import time;
+
+try:
+    from shlex import quote as _ShellQuote;
+except ImportError:
+    from pipes import quote as _ShellQuote;
+
+from Failures import ClassifyFailure;
+from Launcher import WriteLaunchScripts;
+from Scheduler import GetRunCommand, GetStdOutFile, PrepareRunDir, PrintLines;
+from Shared import CollectRunRecord;
+
+
+def _GetCommandOutput(command):
+    # Returns (exit status, output) from a shell command; stderr is included in the output, so it can be shown in error messages.
+    
+    process = subprocess.Popen(command, shell = True, stdout = subprocess.PIPE, stderr = subprocess.STDOUT);
+    
+    output, _ = process.communicate();
+    
+    return (process.returncode, output.decode('utf-8', 'replace'));
+
+
+class SLURMBackend(object):
+    Name = "SLURM";
+    
+    # Environment variable set to the index of each task in a job array.
+    
+    ArrayIndexVariable = "SLURM_ARRAY_TASK_ID";
+    
+    def __init__(self, submitCommand = "sbatch", queueCommand = "squeue"):
+        self.SubmitCommand = submitCommand;
+        self.QueueCommand = queueCommand;
+    
+    def GetDirectives(self, name, numNodes, numProcessesPerNode, numGPUsPerNode, wallTime, arraySize, logDir, extraDirectives, numThreads = None):
+        directives = [
+            "--job-name={0}".format(name),
+            "--nodes={0}".format(numNodes),
+            "--ntasks-per-node={0}".format(numProcessesPerNode)
+            ];
+        
+        if numThreads != None:
+            directives.append("--cpus-per-task={0}".format(numThreads));
+        
+        if numGPUsPerNode > 0:
+            directives.append("--gres=gpu:{0}".format(numGPUsPerNode));
+        
+        if wallTime != None:
+            directives.append("--time={0}".format(wallTime));
+        
+        if arraySize != None:
+            directives.append("--array=0-{0}".format(arraySize - 1));
+            directives.append("--output={0}".format(os.path.join(logDir, "%A_%a.log")));
+        else:
+            directives.append("--output={0}".format(os.path.join(logDir, "%j.log")));
+        
+        return ["#SBATCH {0}".format(directive) for directive in directives + extraDirectives];
+    
+    def GetLogFile(self, logDir, jobID, arrayIndex):
+        # Returns the path to the log file of a job, as set by GetDirectives().
+        
+        return os.path.join(logDir, "{0}_{1}.log".format(jobID, arrayIndex) if arrayIndex != None else "{0}.log".format(jobID));
+    
+    def Submit(self, scriptFile, dependencies = None):
+        # Returns the job ID; if dependencies are given, the job only starts if they all finish successfully, and is cancelled otherwise.
+        
+        command = "{0} --parsable".format(self.SubmitCommand);
+        
+        if dependencies != None and len(dependencies) > 0:
+            command = "{0} --dependency=afterok:{1} --kill-on-invalid-dep=yes".format(command, ":".join(dependencies));
+        
+        status, output = _GetCommandOutput("{0} {1}".format(command, _ShellQuote(scriptFile)));
+        
+        if status != 0:
+            raise Exception("Error: Submitting \"{0}\" failed: {1}".format(scriptFile, output.strip()));
+        
+        # --parsable prints "<job ID>" or "<job ID>;<cluster>".
+        
+        return output.strip().splitlines()[-1].split(';')[0];
+    
+    def GetQueuedJobs(self):
+        # Returns a dictionary mapping (job ID, array index or None) to 'Pending' or 'Running' for the user's queued jobs, or None if the queue could not be read.
+        
+        status, output = _GetCommandOutput("{0} -h -r -o \"%i %T\" -u {1}".format(self.QueueCommand, _ShellQuote(getpass.getuser())));
+        
+        if status != 0:
+            return None;
+        
+        queuedJobs = { };
+        
+        for line in output.splitlines():
+            values = line.split();
+            
+            if len(values) < 2:
+                continue;
+            
+            jobID, _, arrayIndex = values[0].partition('_');
+            
+            queuedJobs[(jobID, int(arrayIndex) if arrayIndex.isdigit() else None)] = 'Running' if values[1] in ("RUNNING", "COMPLETING") else 'Pending';
+        
+        return queuedJobs;
+
+
+class PBSBackend(object):
+    Name = "PBS";
+    
+    ArrayIndexVariable = "PBS_ARRAY_INDEX";
+    
+    # Job IDs printed by qsub and qstat, e.g. "12345.server", "12345[].server" or "12345[3].server".
+    
+    _JobIDRegex = re.compile(r"^(?P<job_id>\d+)(\[(?P<array_index>\d*)\])?");
+    
+    def __init__(self, submitCommand = "qsub", queueCommand = "qstat"):
+        self.SubmitCommand = submitCommand;
+        self.QueueCommand = queueCommand;
+    
+    def GetDirectives(self, name, numNodes, numProcessesPerNode, numGPUsPerNode, wallTime, arraySize, logDir, extraDirectives, numThreads = None):
+        select = "select={0}:ncpus={1}:mpiprocs={2}".format(numNodes, numProcessesPerNode * (numThreads if numThreads != None else 1), numProcessesPerNode);
+        
+        if numThreads != None:
+            select = "{0}:ompthreads={1}".format(select, numThreads);
+        
+        if numGPUsPerNode > 0:
+            select = "{0}:ngpus={1}".format(select, numGPUsPerNode);
+        
+        directives = ["-N {0}".format(name), "-l {0}".format(select), "-j oe", "-o {0}/".format(logDir)];
+        
+        if wallTime != None:
+            directives.append("-l walltime={0}".format(wallTime));
+        
+        if arraySize != None:
+            directives.append("-J 0-{0}".format(arraySize - 1));
+        
+        return ["#PBS {0}".format(directive) for directive in directives + extraDirectives];
+    
+    def GetLogFile(self, logDir, jobID, arrayIndex):
+        # With "-o <dir>/", PBS names the log "<job name>.o<job ID>", with ".<index>" appended for array subjobs.
+        
+        logFiles = glob.glob(os.path.join(logDir, "*.o{0}{1}".format(jobID, ".{0}".format(arrayIndex) if arrayIndex != None else "")));
+        
+        return logFiles[0] if len(logFiles) > 0 else None;
+    
+    def Submit(self, scriptFile, dependencies = None):
+        command = self.SubmitCommand;
+        
+        if dependencies != None and len(dependencies) > 0:
+            command = "{0} -W depend=afterok:{1}".format(command, ":".join(dependencies));
+        
+        status, output = _GetCommandOutput("{0} {1}".format(command, _ShellQuote(scriptFile)));
+        
+        match = self._JobIDRegex.match(output.strip().splitlines()[-1]) if status == 0 and output.strip() != "" else None;
+        
+        if not match:
+            raise Exception("Error: Submitting \"{0}\" failed: {1}".format(scriptFile, output.strip()));
+        
+        return match.group('job_id');
+    
+    def GetQueuedJobs(self):
+        status, output = _GetCommandOutput("{0} -t -u {1}".format(self.QueueCommand, _ShellQuote(getpass.getuser())));
+        
+        if status != 0:
+            return None;
+        
+        queuedJobs = { };
+        
+        for line in output.splitlines():
+            values = line.split();
+            
+            # With -u, qstat prints the alternate layout: job ID, user name, queue, job name, session ID, # nodes, # tasks, requested memory, requested time, state, elapsed time.
+            
+            match = self._JobIDRegex.match(values[0]) if len(values) >= 11 else None;
+            
+            if not match:
+                continue;
+            
+            arrayIndex = match.group('array_index');
+            
+            # The parent of a job array is listed as "12345[]" alongside the subjobs.
+            
+            if arrayIndex == "":
+                continue;
+            
+            state = values[9];
+            
+            if state in ("F", "X"):
+                continue;
+            
+            queuedJobs[(match.group('job_id'), int(arrayIndex) if arrayIndex != None else None)] = 'Running' if state in ("R", "E") else 'Pending';
+        
+        return queuedJobs;
+
+
+def GetBatchBackend(batchSystem, commands = None):
+    # commands: optional (submit command, queue command), e.g. to use FakeSLURM.py for testing.
+    
+    backends = { "slurm" : SLURMBackend, "pbs" : PBSBackend };
+    
+    if batchSystem.lower() not in backends:
+        raise Exception("Error: Unknown batch system \"{0}\" - must be one of \"slurm\" or \"pbs\".".format(batchSystem));
+    
+    backend = backends[batchSystem.lower()];
+    
+    return backend(*commands) if commands != None else backend();
+
+
+class BatchRunner(object):
+    def __init__(self, backend, coresPerNode, wallTime = None, directives = None, setupCommands = None, useArrays = True, pollInterval = 60.0, stateFile = None):
+        # Runs jobs (Scheduler.Job objects) by submitting them to a batch system through backend (e.g. a SLURMBackend), as an alternative to Scheduler.RunJobs().
+        # Each job is sized from its number of processes and GPUs: the number of nodes is the number of processes divided by coresPerNode, rounded up.
+        # If useArrays is True, jobs needing the same resources are submitted as a job array; otherwise each job is submitted separately.
+        # The state of the submitted jobs is written to stateFile, if set; when RunJobs() is called again (e.g. after the script is restarted), jobs recorded as submitted are not resubmitted.
+        
+        self.Backend = backend;
+        
+        self.CoresPerNode = coresPerNode;
+        self.WallTime = wallTime;
+        
+        self.Directives = directives if directives != None else [];
+        self.SetupCommands = setupCommands if setupCommands != None else [];
+        
+        self.UseArrays = useArrays;
+        self.PollInterval = pollInterval;
+        
+        self.StateFile = stateFile;
+        
+        self._entries = [];
+        
+        if stateFile != None and os.path.isfile(stateFile):
+            with open(stateFile, 'r') as inputReader:
+                self._entries = json.load(inputReader)['Jobs'];
+    
+    def _SaveState(self):
+        if self.StateFile == None:
+            return;
+        
+        tempFile = "{0}.tmp".format(self.StateFile);
+        
+        with open(tempFile, 'w') as outputWriter:
+            json.dump({ 'Backend' : self.Backend.Name, 'Jobs' : self._entries }, outputWriter, indent = 1);
+        
+        os.rename(tempFile, self.StateFile);
+    
+    def _GetResources(self, job):
+        # Returns (number of nodes, processes per node, GPUs per node).
+        
+        # Jobs with launch settings are sized from the number of cores, i.e. the number of processes times the number of OpenMP threads.
+        
+        numNodes = max((job.NumCores + self.CoresPerNode - 1) // self.CoresPerNode, 1);
+        
+        return (numNodes, (job.NumProcesses + numNodes - 1) // numNodes, (job.NumGPUs + numNodes - 1) // numNodes);
+    
+    def _WriteScript(self, scriptFile, name, job, tasks, isArray):
+        # tasks: list of (run directory, archive directory, command) for each task; all paths are absolute, as PBS starts jobs in the home directory.
+        
+        numNodes, numProcessesPerNode, numGPUsPerNode = self._GetResources(job);
+        
+        logDir = os.path.abspath(os.path.dirname(scriptFile));
+        
+        lines = ["#!/bin/sh", ""];
+        
+        lines = lines + self.Backend.GetDirectives(
+            name, numNodes, numProcessesPerNode, numGPUsPerNode, self.WallTime, len(tasks) if isArray else None, logDir, self.Directives, numThreads = job.NumThreads
+            );
+        
+        lines.append("");
+        
+        if len(self.SetupCommands) > 0:
+            lines = lines + self.SetupCommands + [""];
+        
+        if isArray:
+            lines.append("case \"${0}\" in".format(self.Backend.ArrayIndexVariable));
+            
+            for i, (runDir, archiveDir, command) in enumerate(tasks):
+                lines.append("    {0}) RUN_DIR={1}; ARCHIVE_DIR={2}; COMMAND={3} ;;".format(i, _ShellQuote(runDir), _ShellQuote(archiveDir), _ShellQuote(command)));
+            
+            lines.append("    *) exit 1 ;;");
+            lines.append("esac");
+        else:
+            runDir, archiveDir, command = tasks[0];
+            
+            lines.append("RUN_DIR={0}; ARCHIVE_DIR={1}; COMMAND={2}".format(_ShellQuote(runDir), _ShellQuote(archiveDir), _ShellQuote(command)));
+        
+        # Same handling as Scheduler._ExecuteJob(): the output goes to "<archive dir>.out", and the run directory is renamed to the archive directory if VASP exits cleanly.
+        # The exit status is written to "<run dir>.exit", so that jobs killed by the batch system (e.g. for exceeding the wall time) can be told apart from ones that failed.
+        
+        lines = lines + [
+            "",
+            "cd \"$RUN_DIR\" || exit 1",
+            "",
+            "sh -c \"$COMMAND\" > \"$ARCHIVE_DIR.out\" 2>&1",
+            "STATUS=$?",
+            "",
+            "cd /",
+            "",
+            "if [ \"$STATUS\" -eq 0 ] ; then",
+            "    mv \"$RUN_DIR\" \"$ARCHIVE_DIR\"",
+            "else",
+            "    rm -rf \"$RUN_DIR\"",
+            "fi",
+            "",
+            "echo \"$STATUS\" > \"$RUN_DIR.exit\"",
+            "",
+            "exit $STATUS"
+            ];
+        
+        with open(scriptFile, 'w') as outputWriter:
+            for line in lines:
+                outputWriter.write("{0}\n".format(line));
+    
+    def _Submit(self, batches, runDir, vaspRunCommand, scriptName, stager = None):
+        # batches: list of (jobs, dependent jobs): the jobs are submitted as one job (or array), and only start once the dependent jobs have finished successfully.
+        
+        jobIDs = { };
+        
+        for jobs, dependencies in batches:
+            tasks = [];
+            
+            for job in jobs:
+                jobRunDir = os.path.join(runDir, job.ArchiveDir.replace(os.sep, '_'));
+                
+                # Clear out the run directory left behind by a job killed by the batch system.
+                
+                if os.path.isdir(jobRunDir):
+                    shutil.rmtree(jobRunDir);
+                
+                PrepareRunDir(jobRunDir, job.INCARTags, scriptName, inputDir = job.InputDir, stager = stager);
+                
+                # The GPUs are assigned by the batch system, so the launch scripts bind the processes to those in CUDA_VISIBLE_DEVICES.
+                
+                command = WriteLaunchScripts(job, jobRunDir, GetRunCommand(vaspRunCommand, job.NumProcesses), scriptName);
+                
+                tasks.append((os.path.abspath(jobRunDir), os.path.abspath(job.ArchiveDir), command));
+            
+            isArray = len(jobs) > 1;
+            
+            scriptFile = os.path.join(runDir, "Batch-{0:0>4}.sh".format(len(set(entry['BatchJobID'] for entry in self._entries))));
+            
+            self._WriteScript(scriptFile, scriptName.replace(".py", ""), jobs[0], tasks, isArray);
+            
+            jobID = self.Backend.Submit(os.path.abspath(scriptFile), dependencies = [jobIDs[job.ArchiveDir] for job in dependencies]);
+            
+            messages = [];
+            
+            for arrayIndex, (job, (jobRunDir, _, _)) in enumerate(zip(jobs, tasks)):
+                jobIDs[job.ArchiveDir] = jobID;
+                
+                self._entries.append({
+                    'ArchiveDir' : job.ArchiveDir, 'Label' : job.Label, 'RunDir' : jobRunDir,
+                    'BatchJobID' : jobID, 'ArrayIndex' : arrayIndex if isArray else None, 'State' : 'Submitted', 'ExitStatus' : None
+                    });
+                
+                messages.append("Submitted test with {0} -> {1} job {2}{3}".format(job.Label, self.Backend.Name, jobID, "[{0}]".format(arrayIndex) if isArray else ""));
+            
+            PrintLines(messages + [""]);
+        
+        self._SaveState();
+    
+    def _FinishEntry(self, entry, job, monitor, stager = None):
+        exitFile = "{0}.exit".format(entry['RunDir']);
+        
+        exitStatus = None;
+        
+        if os.path.isfile(exitFile):
+            with open(exitFile, 'r') as inputReader:
+                exitStatus = int(inputReader.read().strip() or -1);
+            
+            os.remove(exitFile);
+        
+        success = os.path.isdir(job.ArchiveDir);
+        
+        # The batch system reports e.g. jobs killed for exceeding the wall time or memory limit in its log, rather than in the output from VASP.
+        
+        if not success:
+            job.Failure = ClassifyFailure([
+                GetStdOutFile(job), os.path.join(entry['RunDir'], "OUTCAR"), self.Backend.GetLogFile(os.path.dirname(os.path.abspath(entry['RunDir'])), entry['BatchJobID'], entry['ArrayIndex'])
+                ]);
+        
+        # Jobs cancelled before they start (e.g. because a dependency failed) or killed by the batch system leave their run directory behind.
+        
+        if not success and os.path.isdir(entry['RunDir']):
+            shutil.rmtree(entry['RunDir']);
+        
+        entry['State'] = 'Success' if success else 'Failed';
+        entry['ExitStatus'] = exitStatus;
+        
+        messages = ["Finished test with {0}...".format(job.Label)];
+        
+        messages.append("  -> {0} job: {1}{2}".format(self.Backend.Name, entry['BatchJobID'], "[{0}]".format(entry['ArrayIndex']) if entry['ArrayIndex'] != None else ""));
+        messages.append("  -> Exit status: {0}".format(exitStatus if exitStatus != None else "unknown (cancelled or killed by the batch system?)"));
+        
+        if job.Failure != None:
+            messages.append("  -> Failure: {0}".format(job.Failure));
+        
+        if success:
+            if stager != None:
+                messages += ["  -> {0}".format(message) for message in stager.Archive(job.ArchiveDir)];
+            
+            record = CollectRunRecord(job.ArchiveDir);
+            
+            if record['TSCFAve'] != None:
+                messages.append("  -> # SCF steps: {0}, t_SCF,Ave = {1:.3f} s".format(record['NumSCFSteps'], record['TSCFAve']));
+        
+        messages.append("");
+        
+        PrintLines(messages);
+        
+        job.Status = entry['State'];
+        
+        if monitor != None:
+            monitor.JobFinished(job, job.Status);
+    
+    def RunJobs(self, jobs, runDir, vaspRunCommand, scriptName, abortGroupOnFail = False, monitor = None, stager = None):
+        # Submits jobs and waits for them to finish; the arguments are as for Scheduler.RunJobs().
+        # If abortGroupOnFail is set, each job in a group is submitted separately and made dependent on the one before, so a failure cancels the rest of the group; job arrays cannot be aborted part way through, so only jobs without a group are submitted as arrays.
+        
+        pending = [];
+        
+        for job in jobs:
+            if os.path.exists(job.ArchiveDir):
+                PrintLines(["Job dir \"{0}\" ({1}) already exists -> skipping...".format(job.ArchiveDir, job.Label), ""]);
+                
+                job.Status = 'Skipped';
+            else:
+                pending.append(job);
+        
+        if len(pending) == 0:
+            return;
+        
+        if monitor != None:
+            monitor.AddJobs(pending);
+        
+        if not os.path.isdir(runDir):
+            os.makedirs(runDir);
+        
+        # Jobs that were submitted by a previous run of the script are waited for rather than resubmitted.
+        
+        submittedEntries = dict((entry['ArchiveDir'], entry) for entry in self._entries if entry['State'] in ('Submitted', 'Running'));
+        
+        submit = [job for job in pending if job.ArchiveDir not in submittedEntries];
+        
+        if len(submit) < len(pending):
+            PrintLines(["Waiting for {0} test(s) submitted previously".format(len(pending) - len(submit)), ""]);
+        
+        batches = [];
+        
+        arrays, lastInGroup = { }, { };
+        
+        numChained = 0;
+        
+        for job in submit:
+            chain = abortGroupOnFail and job.Group != None;
+            
+            if self.UseArrays and not chain:
+                key = (job.NumProcesses, job.NumGPUs, job.NumThreads);
+                
+                if key not in arrays:
+                    arrays[key] = [];
+                    batches.append((arrays[key], []));
+                
+                arrays[key].append(job);
+            else:
+                dependencies = [];
+                
+                if chain:
+                    if job.Group in lastInGroup:
+                        dependencies.append(lastInGroup[job.Group]);
+                    
+                    lastInGroup[job.Group] = job;
+                    
+                    numChained += 1;
+                
+                batches.append(([job], dependencies));
+        
+        if self.UseArrays and numChained > 0:
+            PrintLines(["{0} test(s) in abort groups submitted as separate dependent jobs rather than job arrays, so a failure cancels the rest of the group".format(numChained), ""]);
+        
+        self._Submit(batches, runDir, vaspRunCommand, scriptName, stager = stager);
+        
+        entries = dict((entry['ArchiveDir'], entry) for entry in self._entries);
+        
+        active = [(job, entries[job.ArchiveDir]) for job in pending];
+        
+        startedJobs = set();
+        
+        while len(active) > 0:
+            time.sleep(self.PollInterval);
+            
+            queuedJobs = self.Backend.GetQueuedJobs();
+            
+            if queuedJobs == None:
+                PrintLines(["WARNING: BatchRunner.RunJobs(): Unable to read the {0} queue -> trying again in {1} s".format(self.Backend.Name, self.PollInterval), ""]);
+                
+                continue;
+            
+            stillActive = [];
+            
+            for job, entry in active:
+                state = queuedJobs.get((entry['BatchJobID'], entry['ArrayIndex']));
+                
+                if state == None:
+                    self._FinishEntry(entry, job, monitor, stager = stager);
+                else:
+                    if state == 'Running' and job.ArchiveDir not in startedJobs:
+                        PrintLines(["Running test with {0}...".format(job.Label), ""]);
+                        
+                        entry['State'] = 'Running';
+                        startedJobs.add(job.ArchiveDir);
+                        
+                        if monitor != None:
+                            monitor.JobStarted(job, entry['RunDir']);
+                    
+                    stillActive.append((job, entry));
+            
+            active = stillActive;
+            
+            self._SaveState();
+        
+        # As for Scheduler.RunJobs(), the batch scripts and logs are left for inspection if anything went wrong.
+        # Otherwise, the state file is removed along with them, so that a later run does not read the state of jobs that no longer exist.
+        
+        if all(entry['State'] == 'Success' for entry in self._entries):
+            shutil.rmtree(runDir);
+            
+            self._entries = [];
+            
+            if self.StateFile != None and os.path.isfile(self.StateFile):
+                os.remove(self.StateFile);
@@ -0,0 +1,258 @@
+# BenchmarkParsers.py by J. M. Skelton
+
+
+import argparse;
+import os;
+import random;
+import re;
+import shutil;
+import tempfile;
+
+from timeit import default_timer;
+
+from Shared import OUTCARParser, SummariseSCFTimes;
+from Staging import ArchiveCompressionFormats, CheckCompressionFormat, CompressFile;
+
+
+# Regexes used by the line-by-line reference parser.
+
+_OUTCAR_TSCFRegex = re.compile("LOOP\:\s+cpu time\s+\d+\.\d+\:\s+real time\s+(?P<t_scf>\d+\.\d+)");
+_OUTCAR_TElapsedRegex = re.compile("Elapsed time \(sec\)\:\s+(?P<t_elapsed>\d+\.\d+)");
+
+# Number of bands listed in the eigenvalue blocks of the synthetic OUTCAR; together with the number of k-points, this sets the amount of output per SCF step.
+
+_SyntheticNumBands = 512;
+_SyntheticNumKPoints = 4;
+
+
+def ParseOUTCARLineByLine(filePath, skipSCFCycles = 0):
+    # Reference implementation of Shared.ParseOUTCAR() that applies the regexes to every line of the file; used for benchmarking OUTCARParser.
+    
+    scfTimes, tElapsed = [], None;
+    
+    with open(filePath, 'r') as inputReader:
+        for line in inputReader:
+            match = _OUTCAR_TSCFRegex.search(line);
+            
+            if match:
+                scfTimes.append(
+                    float(match.group('t_scf'))
+                    );
+            else:
+                match = _OUTCAR_TElapsedRegex.search(line);
+                
+                if match:
+                    tElapsed = float(match.group('t_elapsed'));
+    
+    return SummariseSCFTimes(scfTimes, tElapsed, skipSCFCycles);
+
+def _GetSyntheticSCFBlock(step):
+    # Imitates the verbose per-SCF-step output of VASP (eigenvalues and occupations, charge density information, etc.), which makes up the bulk of large OUTCARs.
+    
+    lines = [];
+    
+    lines.append("----------------------------------------- Iteration    1({0:4d})  ---------------------------------------".format(step));
+    lines.append("");
+    lines.append("    POTLOK:  cpu time      0.4123: real time      0.4156");
+    lines.append("    SETDIJ:  cpu time      0.0101: real time      0.0102");
+    lines.append("    EDDAV:  cpu time      5.1234: real time      5.1467");
+    lines.append("    DOS:  cpu time      0.0012: real time      0.0012");
+    lines.append("");
+    
+    for kPoint in range(1, _SyntheticNumKPoints + 1):
+        lines.append(" k-point {0:5d} :       0.0000    0.0000    0.0000".format(kPoint));
+        lines.append("  band No.  band energies     occupation");
+        
+        for band in range(1, _SyntheticNumBands + 1):
+            lines.append("  {0:6d}      {1:10.4f}      {2:8.5f}".format(band, -12.0 + 0.03 * band, 2.0 if band < _SyntheticNumBands // 2 else 0.0));
+        
+        lines.append("");
+    
+    lines.append("  free energy    TOTEN  =     -1852.14320000 eV");
+    lines.append("");
+    lines.append("      LOOP:  cpu time   {0:9.4f}: real time   {1:9.4f}".format(48.0 + random.random(), 49.0 + random.random()));
+    lines.append("");
+    
+    return "\n".join(lines) + "\n";
+
+def WriteSyntheticOUTCAR(filePath, sizeMB):
+    # Writes a synthetic OUTCAR of (at least) sizeMB MB and returns the number of SCF steps in it.
+    
+    targetSize = sizeMB * 1024 * 1024;
+    
+    size, numSCFSteps = 0, 0;
+    
+    with open(filePath, 'w') as outputWriter:
+        header = " vasp.5.4.1 05Feb16 (build Mar 01 2016 12:00:00) complex\n executed on LinuxIFC date 2016.03.01  12:00:00\n";
+        
+        outputWriter.write(header);
+        size += len(header);
+        
+        while size < targetSize:
+            numSCFSteps += 1;
+            
+            block = _GetSyntheticSCFBlock(numSCFSteps);
+            
+            outputWriter.write(block);
+            size += len(block);
+        
+        footer = "     LOOP+:  cpu time 1652.1234: real time 1659.4660\n\n General timing and accounting informations for this job:\n ========================================================\n\n                  Total CPU time used (sec):     1652.123\n                            User time (sec):     1640.456\n                          System time (sec):       11.667\n                         Elapsed time (sec):     1659.466\n";
+        
+        outputWriter.write(footer);
+    
+    return numSCFSteps;
+
+def _Time(function, repeats):
+    bestTime, result = None, None;
+    
+    for i in range(repeats):
+        startTime = default_timer();
+        result = function();
+        elapsedTime = default_timer() - startTime;
+        
+        if bestTime == None or elapsedTime < bestTime:
+            bestTime = elapsedTime;
+    
+    return (bestTime, result);
+
+def _ParseOUTCARMMap(filePath, skipSCFCycles):
+    parser = OUTCARParser(filePath);
+    parser.Update();
+    
+    return parser.GetResults(skipSCFCycles = skipSCFCycles);
+
+def _ReparseOUTCAR(filePath, skipSCFCycles):
+    # Time to re-parse a file that has already been parsed and has not changed since.
+    
+    parser = OUTCARParser(filePath);
+    parser.Update();
+    
+    startTime = default_timer();
+    
+    parser.Update();
+    results = parser.GetResults(skipSCFCycles = skipSCFCycles);
+    
+    return (default_timer() - startTime, results);
+
+def _BenchmarkCodecs(outcarFile, codecs, repeats, skipSCFCycles):
+    # Returns a list of (codec, compression time, compressed size in MB, parse time, results) for each codec in codecs.
+    # Each codec is benchmarked on a compressed copy of outcarFile, which is deleted afterwards.
+    
+    benchmarks = [];
+    
+    for codec in codecs:
+        fileHandle, tempFile = tempfile.mkstemp(prefix = "OUTCAR-Benchmark-");
+        os.close(fileHandle);
+        
+        shutil.copy(outcarFile, tempFile);
+        
+        compressedFile = "{0}.{1}".format(tempFile, codec);
+        
+        try:
+            startTime = default_timer();
+            CompressFile(tempFile, codec);
+            tCompress = default_timer() - startTime;
+            
+            tParse, results = _Time(lambda: _ParseOUTCARMMap(compressedFile, skipSCFCycles), repeats);
+            
+            benchmarks.append((codec, tCompress, os.path.getsize(compressedFile) / (1024.0 * 1024.0), tParse, results));
+        finally:
+            for filePath in tempFile, compressedFile:
+                if os.path.isfile(filePath):
+                    os.remove(filePath);
+    
+    return benchmarks;
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Benchmark the OUTCAR parsers on a synthetic (or real) OUTCAR file.");
+    
+    parser.set_defaults(
+        SizeMB = 200,
+        Repeats = 3,
+        SkipSCFCycles = 5
+        );
+    
+    parser.add_argument(
+        "--size_mb",
+        type = int, dest = 'SizeMB',
+        help = "size of the synthetic OUTCAR to generate in MB (default: 200)"
+        );
+    
+    parser.add_argument(
+        "--outcar",
+        type = str, dest = 'OUTCARFile',
+        help = "benchmark with an existing OUTCAR file instead of a synthetic one"
+        );
+    
+    parser.add_argument(
+        "--repeats",
+        type = int, dest = 'Repeats',
+        help = "number of times to repeat each timing; the best time is reported (default: 3)"
+        );
+    
+    parser.add_argument(
+        "--skip_scf_cycles",
+        type = int, dest = 'SkipSCFCycles',
+        help = "exclude the first N SCF cycles from the average (default: 5)"
+        );
+    
+    parser.add_argument(
+        "--codecs",
+        type = str, nargs = '+', dest = 'Codecs', choices = ArchiveCompressionFormats,
+        help = "also benchmark parsing compressed copies of the OUTCAR with the given compression formats"
+        );
+    
+    args = parser.parse_args();
+    
+    if args.Codecs != None:
+        for codec in args.Codecs:
+            CheckCompressionFormat(codec);
+    
+    outcarFile = args.OUTCARFile;
+    
+    if outcarFile == None:
+        fileHandle, outcarFile = tempfile.mkstemp(prefix = "OUTCAR-Benchmark-");
+        os.close(fileHandle);
+        
+        print("Writing {0} MB synthetic OUTCAR to \"{1}\"...".format(args.SizeMB, outcarFile));
+        
+        numSCFSteps = WriteSyntheticOUTCAR(outcarFile, args.SizeMB);
+        
+        print("  -> # SCF steps: {0}".format(numSCFSteps));
+        print("");
+    
+    try:
+        sizeMB = os.path.getsize(outcarFile) / (1024.0 * 1024.0);
+        
+        print("Benchmarking parsers on \"{0}\" ({1:.1f} MB, best of {2})...".format(outcarFile, sizeMB, args.Repeats));
+        
+        tLineByLine, resultsLineByLine = _Time(lambda: ParseOUTCARLineByLine(outcarFile, skipSCFCycles = args.SkipSCFCycles), args.Repeats);
+        tMMap, resultsMMap = _Time(lambda: _ParseOUTCARMMap(outcarFile, args.SkipSCFCycles), args.Repeats);
+        
+        tReparse, resultsReparse = _ReparseOUTCAR(outcarFile, args.SkipSCFCycles);
+        
+        for name, t in ("Line by line", tLineByLine), ("mmap + prefilter", tMMap), ("Re-parse (unchanged)", tReparse):
+            print("  -> {0:<22}: {1:9.4f} s ({2:9.1f} MB/s)".format(name, t, sizeMB / t if t > 0.0 else float('inf')));
+        
+        print("  -> Speedup (mmap + prefilter): {0:.1f}x".format(tLineByLine / tMMap));
+        
+        if resultsMMap != resultsLineByLine or resultsReparse != resultsLineByLine:
+            print("  -> WARNING: Parsers returned different results: {0} vs. {1} vs. {2}".format(resultsLineByLine, resultsMMap, resultsReparse));
+        else:
+            print("  -> Results agree: {0}".format(resultsLineByLine));
+        
+        if args.Codecs != None:
+            print("");
+            print("Benchmarking parsing of compressed OUTCARs (throughput relative to the uncompressed size)...");
+            
+            for codec, tCompress, compressedSizeMB, tParse, results in _BenchmarkCodecs(outcarFile, args.Codecs, args.Repeats, args.SkipSCFCycles):
+                print("  -> {0:<4}: {1:9.4f} s ({2:9.1f} MB/s), {3:8.1f} MB ({4:5.1f} % of original, compressed in {5:.1f} s)".format(
+                    codec, tParse, sizeMB / tParse if tParse > 0.0 else float('inf'), compressedSizeMB, 100.0 * compressedSizeMB / sizeMB, tCompress
+                    ));
+                
+                if results != resultsMMap:
+                    print("     WARNING: Results differ from the uncompressed file: {0} vs. {1}".format(results, resultsMMap));
+    finally:
+        if args.OUTCARFile == None:
+            os.remove(outcarFile);
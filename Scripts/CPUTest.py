@@ -20,53 +20,266 @@ TestNPARValues = [1, 2, 4, 8, 16];
 
 TestNSIMValues = [1, 2, 4, 8, 12, 16, 24, 32, 48, 64];
 
-# Temporary directory to run VASP jobs.
+# Other INCAR tags to test, as a list of (tag, values) pairs, e.g. [("LPLANE", [".TRUE.", ".FALSE."])].
+
+TestExtraTags = [];
+
+# Temporary directory to run VASP jobs; each job is run in its own subdirectory.
 # ** The script needs to overwrite the contents of this directory, and will therefore crash if it exists when it starts [better safe than sorry, right?] **
 
 RunDir = "Tmp";
 
 # Command to execute VASP.
 # The string "<nproc>" must be present, and will be substituted with the number of MPI processes.
+# If PoolNodes is set, the string "<host>" will be substituted with the node a job is assigned to (e.g. "mpirun -np <nproc> -host <host> ...").
 
 VASPRunCommand = "mpirun -np <nproc> ~/scratch/VASP/vasp.5.4.1.gpu/bin/vasp_gam";
 
+# Resources available for running jobs concurrently.
+# PoolCoresPerNode is the number of cores on each node; jobs are packed onto the nodes as long as there are enough free cores.
+# If set to None, it defaults to NumProcesses, i.e. jobs are run one at a time.
+# PoolNodes is a list of host names to run jobs on; if set to None, all jobs are run on the current node.
+
+PoolCoresPerNode = None;
+
+PoolNodes = None;
+
+# Batch system to submit the tests to, rather than running them in the current job: "slurm" or "pbs"; if set to None, the tests are run directly on the resources set by the Pool* parameters.
+# Each test is submitted as a separate batch job (or job-array task) requesting the number of MPI processes in the test; the script waits for the jobs to finish and then collects the results as usual.
+# EarlyStopTolerance, TelemetryInterval, WallTimeLimit and IdleTimeout are not used for tests run through the batch system.
+
+BatchSystem = None;
+
+# Number of cores per node, used to work out how many nodes to request for each test.
+
+BatchCoresPerNode = 16;
+
+# Wall time limit for each test.
+
+BatchWallTime = "6:00:00";
+
+# Extra batch directives for each test, e.g. ["--partition=batch-64gb", "--account=free"] for SLURM or ["-q batch"] for PBS.
+
+BatchDirectives = [];
+
+# Commands run at the start of each batch job, e.g. to load modules: ["module load openmpi/intel/1.8.4"].
+
+BatchSetupCommands = [];
+
+# If True, tests needing the same resources are submitted as job arrays; otherwise, each test is submitted as a separate job.
+
+BatchUseArrays = True;
+
+# Interval (in seconds) at which to check the queue for finished jobs.
+
+BatchPollInterval = 60.0;
+
+# Commands used to submit and query jobs, as a (submit, query) tuple; if set to None, the defaults for BatchSystem are used ("sbatch"/"squeue" or "qsub"/"qstat").
+# FakeSLURM.py and FakePBS.py can be used to test a setup without a batch system: ("python FakeSLURM.py sbatch", "python FakeSLURM.py squeue") or ("python FakePBS.py qsub", "python FakePBS.py qstat").
+
+BatchCommands = None;
+
+# File to record the state of submitted jobs in; if the script is restarted, jobs that were already submitted are waited for rather than submitted again.
+
+BatchStateFile = "CPUTest-Batch.json";
+
 # Name of archive directories to store completed jobs.
 # The strings "<nproc>", "<kpar>", "<npar>" and "<nsim>", if present, will be substituted with the number of MPI processes, KPAR, NPAR and NSIM, respectively.
+# Tags in TestExtraTags are substituted in the same way, using the lower-case tag name (e.g. "<lplane>").
 # The strings corresponding to the parameters being swept must be present.
 
 ArchiveDirName = "CPUTest-<nproc>-<kpar>-<npar>-<nsim>";
 
+# Ways of staging the KPOINTS, POSCAR and POTCAR files into the job directories, in order of preference: "hardlink", "reflink" (a copy-on-write clone, e.g. on Btrfs or XFS), "symlink" and "copy".
+# The files are copied if none of the others work (e.g. hard links across filesystems); set to ["copy"] to always copy them.
+# ** Links share the input files between the jobs, so these should not be modified while the tests are running **
+
+StagingModes = ["hardlink", "reflink", "symlink", "copy"];
+
+# If RunDir is on a different filesystem to the input files (e.g. a scratch filesystem), setting StagingCacheDir to a directory on the same filesystem as RunDir copies the input files there once and links the job files to the copies.
+
+StagingCacheDir = None;
+
+# Files to keep in the archive directories, e.g. ["INCAR", "OUTCAR", "OSZICAR", "vasprun.xml"]; the files needed to collect the results are always kept.
+# If set to None, the whole job directory is kept.
+
+ArchiveFiles = None;
+
+# If set to "gz", "bz2", "xz" (Python 3 only) or "zst" (requires the zstandard module or the zstd command), compress the files kept in the archive directories; the results are collected from the compressed files.
+
+ArchiveCompression = None;
+
+# Failed tests are classified from their output as running out of host or GPU memory, CUDA errors, MPI aborts, crashes, bad KPAR/NPAR values or timeouts (see Failures.py).
+# Tests that fail with a transient error (a CUDA error other than running out of memory, or an MPI abort or lost connection, but not a crash such as a segmentation fault) are rerun up to MaxRetries times (default: 0, i.e. failed tests are not rerun); the output of each failed attempt is kept as "<archive dir>.attempt<N>.out".
+
+MaxRetries = 0;
+
+# If True, skip the tests that are certain to fail after another test has failed: after a test fails because KPAR/NPAR do not divide the number of processes, the other tests with the same values and number of processes.
+# Other failures (e.g. running out of memory, or timeouts) do not cause any tests to be skipped.
+
+PruneFailedTests = False;
+
+# If True, search for the fastest value of NSIM for each combination of KPAR, NPAR (and any extra tags being tested), rather than testing every value in TestNSIMValues.
+# The search assumes t_SCF varies smoothly with NSIM with a single minimum, and uses a golden-section search over the (sorted) values in TestNSIMValues, typically needing around half the tests.
+# The values that were not tested, and the reason, are written to SkippedOutputFile.
+
+AdaptiveNSIMSearch = False;
+
+# Path to the output file for tests skipped by the adaptive NSIM search.
+# ** As with DataOutputFile, the script will crash if this file already exists when it starts **
+
+SkippedOutputFile = "CPUTest-Skipped.csv";
+
+# Number of archive directories to collect results from in parallel.
+
+CollectJobs = 8;
+
+# Path to a file used to cache the results collected from archive directories, so that re-collecting results (e.g. with CollectOnly = True) only needs to parse the output files of new or modified jobs.
+# If set to None, the results are always parsed from the output files.
+# Entries are matched to the archive directories by path and by the size and modification time of the OUTCAR and OSZICAR files, not by the VASP binary or the INCAR, so use a separate cache file (or delete it) when re-running tests into the same directories, e.g. "ResultCache.jsonl".
+
+ResultCacheFile = None;
+
+# Maximum number of entries to keep in ResultCacheFile; the least recently used entries are removed first.
+
+ResultCacheMaxEntries = 10000;
+
+# Path to a JSON file the progress of the tests is written to while they are running (the state of each test, the SCF times of running tests and the estimated time remaining), e.g. "CPUTest-Status.json"; set to None to disable.
+# The file is updated every few seconds, and can be viewed with ShowProgress.py.
+
+ProgressStatusFile = None;
+
+# Interval (in seconds) at which to print a progress summary, with the SCF times of running tests and the estimated time remaining, e.g. 60.0; if set to None (the default), no summaries are printed.
+
+ProgressPrintInterval = None;
+
 # If True, skip running tests and collect results from any archive directories found.
 
 CollectOnly = False;
 
+# If True, don't run or collect any tests: print the tests that would be run, those that would be skipped (e.g. because NPAR does not divide the number of processes) and any duplicates, with an estimate of how long each would take, write them to PlanOutputFile, and exit.
+# The estimates come from a simple timing model (see Planner.py) and are only a rough guide; tests removed by AdaptiveNSIMSearch, EarlyStopTolerance or a campaign are not predicted, so the totals are upper bounds.
+
+DryRun = False;
+
+# Path to the output file for DryRun.
+# ** As with DataOutputFile, the script will crash if this file already exists when it starts **
+
+PlanOutputFile = "CPUTest-Plan.csv";
+
+# Parameters of the timing model used by DryRun and SimulateVASPTimeScale: t_SCF (in seconds) of a 64-atom system on one core, which is scaled to the number of atoms in the POSCAR, and the number of SCF steps to converge (if not set by NELM/NELMIN or FixedSCFSteps).
+
+PlanReferenceTSCF = 16.0;
+
+PlanNumSCFSteps = 20;
+
+# If set, the tests are run with a simulated VASP (FakeVASP.py) in place of VASPRunCommand, to test the setup end to end on a machine without VASP.
+# The simulated VASP writes OUTCAR and OSZICAR files with the times from the timing model, and each test takes SimulateVASPTimeScale times the modelled time (e.g. 0.01).
+
+SimulateVASPTimeScale = None;
+
 # Path to the data output file.
 # ** As the script would overwrite this file, it will crash if it already exists when it starts [again, better safe than sorry...] **
 
 DataOutputFile = "CPUTest.csv";
 
+# If True, the median, standard deviation and minimum SCF time, the average ionic-step time and the memory use reported in the OUTCAR are added to the data output file.
+# The telemetry summary (see TelemetryInterval) is added if telemetry is enabled; the result store (StoreOutputFile) always has all the columns.
+
+DataOutputExtraStatistics = False;
+
+# Path to an output file for the timings of each SCF and ionic step and the breakdown of the time spent in each routine, for all tests, e.g. "CPUTest-Timings.csv"; set to None to disable.
+# ** As with DataOutputFile, the script will crash if this file already exists when it starts **
+
+TimingsOutputFile = None;
+
+# Path to a result store to write the results to, with one row per test, for analysis alongside other benchmarks; set to None to disable.
+# The format is set by the extension: ".npz" (requires NumPy) or ".parquet" (requires PyArrow).
+# ** As with DataOutputFile, the script will crash if this file already exists when it starts **
+
+StoreOutputFile = None;
+
+# Name of the system used to label the results in StoreOutputFile; if set to None, the name is made from the POSCAR title line and the number of atoms (e.g. "GeTe-64").
+
+SystemName = None;
+
+# Structures to run a campaign over, as a list of POSCAR files and/or patterns, e.g. ["POSCAR_GeTe-*.vasp"]; if set to None, the tests are run for the structure in POSCAR.
+# The tests are run for each structure in turn, from the smallest to the largest, with the INCAR, KPOINTS and POTCAR files in the current directory.
+# Each structure is run in a directory named after it (e.g. "GeTe-64" for "POSCAR_GeTe-64.vasp"), which holds its archive directories and its DataOutputFile, TimingsOutputFile and SkippedOutputFile; StoreOutputFile contains the results for all the structures.
+# The timings for the smaller structures are used to skip unpromising configurations for the larger ones and to predict how long the tests will take.
+
+CampaignPOSCARFiles = None;
+
+# In a campaign, configurations that failed or gave invalid results for the previous structure are skipped, as are those predicted to have a t_SCF more than CampaignPruneFactor times the fastest; set to None to only skip failed configurations.
+
+CampaignPruneFactor = 3.0;
+
+# If set, configurations predicted to take longer than this (in seconds) are also skipped.
+
+CampaignMaxTestTime = None;
+
+# Path to an output file for the results for all the structures in a campaign.
+# ** As with DataOutputFile, the script will crash if this file already exists when it starts **
+
+CampaignOutputFile = "CPUTest-Campaign.csv";
+
+# Tolerances for checking the results of the tests: the final energy of each test must be within EnergyTolerance eV of the consensus (median) value over all the tests, and the number of SCF steps within SCFStepsTolerance (as a fraction) of the consensus value.
+# Tests that fail the checks are marked as invalid in DataOutputFile and StoreOutputFile, and treated as failed by the adaptive NSIM search; set EnergyTolerance to None to disable the checks, or SCFStepsTolerance to None to only check the energies.
+
+EnergyTolerance = 1.0e-3;
+
+SCFStepsTolerance = 0.5;
+
 # If larger than zero, the first N SCF steps will be ignored when computing the average SCF time.
 # Useful for benchmarking e.g. ALGO = Fast or hybrids, where the first five SCF steps (typically) are very different to the others.
 
 SkipSCFCycles = 5;
 
+# If set, run a fixed workload of SkipSCFCycles + FixedSCFSteps SCF steps in every test, rather than converging the SCF to EDIFF: NELM and NELMIN are set to this number of steps and EDIFF to zero, overriding any values in the INCAR file.
+# Every test then does the same amount of work, so t_Elapsed can be compared between tests, and the cost of each test is capped; the final energies are not converged, but the number of SCF steps is the same for every test.
 
-import commands;
-import csv;
-import os;
+FixedSCFSteps = None;
 
-import shutil;
+# If larger than zero, stop each job once the average SCF time (excluding the first SkipSCFCycles steps) is known to within +/- this fraction of its value at 95 % confidence, e.g. 0.02 = +/- 2 %.
+# Jobs are stopped by writing a STOPCAR with LABORT = .TRUE., and the archive directory is flagged by a file named TRUNCATED.
+# ** t_Elapsed and the final energy from truncated jobs are not comparable to those from complete runs **
 
-from Shared import CollectResults;
+EarlyStopTolerance = 0.0;
 
+# Minimum number of SCF steps (after SkipSCFCycles) to average over before a job can be stopped early.
 
-def _GetArchiveDirName(template, nproc, kpar, npar, nsim):
-    jobDir = template;
-    
-    for find, replace in ("<nproc>", nproc), ("<kpar>", kpar), ("<npar>", npar), ("<nsim>", nsim):
-        jobDir = jobDir.replace(find, str(replace));
-    
-    return jobDir;
+EarlyStopMinSCFSteps = 5;
+
+# If set, kill any test that runs for longer than WallTimeLimit seconds, or that writes nothing to its standard output or OUTCAR for IdleTimeout seconds (e.g. a hung VASP run), so that one test cannot hold up the rest of the sweep.
+# Tests that are killed are sent SIGTERM, followed by SIGKILL KillGracePeriod seconds later, and are recorded as failed with a timeout; IdleTimeout should be set well above the longest expected SCF step.
+
+WallTimeLimit = None;
+IdleTimeout = None;
+
+KillGracePeriod = 30.0;
+
+# If set, sample the CPU utilisation and resident memory (RSS) of the processes in each job every TelemetryInterval seconds while it runs.
+# The samples are written to "<archive dir>.telemetry.csv", and the peak memory and mean utilisation are added to DataOutputFile and StoreOutputFile.
+# Only processes on the node running the script are sampled.
+
+TelemetryInterval = None;
+
+
+import os;
+import sys;
+
+from Batch import BatchRunner, GetBatchBackend;
+from Campaign import Campaign, GetSystemPath;
+from Execution import Executor;
+from Monitor import ProgressMonitor;
+from Planner import GetSimulatedVASPCommand, PrintPlanTotals, SweepPlan, TimingModel, WritePlans;
+from ResultStore import CheckStoreFormat, GetNumAtoms, GetSystemName;
+from Scheduler import ResourcePool;
+from Shared import ResultCache;
+from Staging import Stager;
+from Sweep import DivisibilityFilter, FixedWorkloadTags, GetResultColumns, NumProcessesKey, Sweep;
+from Telemetry import TelemetrySampler;
+from Watcher import EarlyStopWatcher;
 
 
 if __name__ == "__main__":
@@ -81,144 +294,229 @@ if __name__ == "__main__":
     if TestNSIMValues == None or len(TestNSIMValues) == 0:
         TestNSIMValues = [4];
     
-    testKPAR = len(TestKPARValues) > 1;
-    testNPAR = len(TestNPARValues) > 1;
-    testNSIM = len(TestNSIMValues) > 1;
-
+    if TestExtraTags == None:
+        TestExtraTags = [];
+    
+    # Timing model for dry runs and simulated runs.
+    
+    timingModel = TimingModel(referenceTSCF = PlanReferenceTSCF, numSCFSteps = PlanNumSCFSteps);
+    
+    if SimulateVASPTimeScale != None:
+        VASPRunCommand, _ = GetSimulatedVASPCommand(SimulateVASPTimeScale, timingModel);
+        
+        print("Simulating VASP with: {0}".format(VASPRunCommand));
+        print("");
+    
+    # In campaign mode, a sweep is run for each system in its own directory; otherwise, systems is [None] and the sweep is run in the current directory.
+    
+    campaign = None;
+    
+    if CampaignPOSCARFiles != None:
+        campaign = Campaign(CampaignPOSCARFiles, pruneFactor = CampaignPruneFactor, maxTestTime = CampaignMaxTestTime);
+    
+    systems = campaign.Systems if campaign != None else [None];
+    
+    fixedTags = FixedWorkloadTags(FixedSCFSteps, skipSCFCycles = SkipSCFCycles) if FixedSCFSteps != None else None;
+    
+    sweeps = [
+        Sweep(
+            [(NumProcessesKey, [NumProcesses]), ("KPAR", TestKPARValues), ("NPAR", TestNPARValues), ("NSIM", TestNSIMValues)] + TestExtraTags,
+            GetSystemPath(system, ArchiveDirName), "CPUTest.py", filters = [DivisibilityFilter],
+            inputDir = system.Directory if system != None else ".", numAtoms = system.NumAtoms if system != None else None,
+            fixedTags = fixedTags
+            )
+            for system in systems
+        ];
+    
     # Startup checks.
     
     # If none of KPAR, NPAR or NSIM are being swept, the "test" may as well be run as a single VASP job, and it is quite likely a user error -> crash.
     
-    if not (testKPAR or testNPAR or testNSIM):
-        raise Exception("Error: One of TargetKPARValues, TargetNPARValues or TargetNSIMValues must be not be None and must contain more than one element.");
-    
-    # ArchiveDirName is required regardless of CollectOnly.
+    if len(sweeps[0].GetSweptParameters()) == 0:
+        raise Exception("Error: One of TargetKPARValues, TargetNPARValues, TargetNSIMValues or TestExtraTags must be not be None and must contain more than one element.");
     
-    for parameter, placeholder, required in ("KPAR", "<kpar>", testKPAR), ("NPAR", "<npar>", testNPAR), ("NSIM", "<nsim>", testNSIM):
-        if required and placeholder not in ArchiveDirName:
-            raise Exception("Error: If {0} is being tested, the string \"{1}\" must appear in ArchiveDirName.".format(parameter, placeholder));
+    # Resources for running the tests, which are also used to estimate the wall time in a dry run.
     
-    # DataOutputFile must not exist regardless of CollectOnly.
+    pool = ResourcePool(
+        PoolCoresPerNode if PoolCoresPerNode != None else NumProcesses, nodes = PoolNodes, maxJobs = 1 if PoolCoresPerNode == None else None
+        );
     
-    if os.path.isfile(DataOutputFile):
-        raise Exception("Error: DataOutputFile \"{0}\" already exists - please rename/delete and run again.".format(DataOutputFile));
+    if DryRun:
+        if os.path.isfile(PlanOutputFile):
+            raise Exception("Error: PlanOutputFile \"{0}\" already exists - please rename/delete and run again.".format(PlanOutputFile));
+        
+        plans = [];
+        
+        for system, sweep in zip(systems, sweeps):
+            if system != None:
+                name, numAtoms = system.Name, system.NumAtoms;
+            else:
+                name, numAtoms = SystemName if SystemName != None else GetSystemName("POSCAR"), GetNumAtoms("POSCAR");
+            
+            # Check the archive directory names and output files as for a real run; the other checks are on the run setup.
+            
+            sweep.CheckSetup(GetSystemPath(system, DataOutputFile), RunDir, VASPRunCommand, True);
+            
+            # Batch jobs wait in the queue, so the wall time is not estimated for them.
+            
+            plan = SweepPlan(sweep, timingModel, numAtoms, pool = pool if BatchSystem == None else None);
+            
+            plan.Print(name);
+            
+            plans.append((name, plan));
+        
+        PrintPlanTotals(plans, campaign = campaign != None);
+        
+        print("Writing plan to \"{0}\"...".format(PlanOutputFile));
+        
+        WritePlans(PlanOutputFile, plans);
+        
+        sys.exit(0);
     
-    if not CollectOnly:
-        # These other checks are only needed if CollectOnly is False.
+    if campaign != None:
+        if os.path.isfile(CampaignOutputFile):
+            raise Exception("Error: CampaignOutputFile \"{0}\" already exists - please rename/delete and run again.".format(CampaignOutputFile));
+        
+        if not CollectOnly:
+            campaign.CheckSetup();
+            campaign.PrepareSystemDirs();
     
-        if os.path.isdir(RunDir):
-            raise Exception("Error: RunDir \"{0}\" already exists - please remove and run again.".format(RunDir));
+    for system, sweep in zip(systems, sweeps):
+        sweep.CheckSetup(GetSystemPath(system, DataOutputFile), RunDir, VASPRunCommand, CollectOnly, runDirMayExist = BatchSystem != None and os.path.isfile(BatchStateFile));
         
-        if "<nproc>" not in VASPRunCommand:
-            raise Exception("Error: The string \"<nproc>\" must appear in VASPRunCommand.");
+        if TimingsOutputFile != None and os.path.isfile(GetSystemPath(system, TimingsOutputFile)):
+            raise Exception("Error: TimingsOutputFile \"{0}\" already exists - please rename/delete and run again.".format(GetSystemPath(system, TimingsOutputFile)));
         
-        for vaspInputFile in "INCAR", "KPOINTS", "POSCAR", "POTCAR":
-            if not os.path.isfile(vaspInputFile):
-                raise Exception("Error: Required VASP input file \"{0}\" not found.".format(vaspInputFile));
+        if (AdaptiveNSIMSearch or campaign != None) and not CollectOnly and os.path.isfile(GetSystemPath(system, SkippedOutputFile)):
+            raise Exception("Error: SkippedOutputFile \"{0}\" already exists - please rename/delete and run again.".format(GetSystemPath(system, SkippedOutputFile)));
+    
+    if StoreOutputFile != None:
+        if os.path.isfile(StoreOutputFile):
+            raise Exception("Error: StoreOutputFile \"{0}\" already exists - please rename/delete and run again.".format(StoreOutputFile));
         
-        with open("INCAR", 'r') as inputReader:
-            for line in inputReader:
-                if "KPAR" in line or "NPAR" in line or "NSIM" in line:
-                    raise Exception("Error: INCAR file must not contain the KPAR, NPAR or NSIM control tags - these are set by the script.");
+        CheckStoreFormat(StoreOutputFile);
+    
+    monitor, stager, executor = None, None, None;
     
     if not CollectOnly:
-        for kparValue in TestKPARValues:
-            for nparValue in TestNPARValues:
-                # If the number of MPI processes is not divisible by KPAR * NPAR, VASP will almost certainly throw an error -> print a warning and skip this parameter combination.
+        watcherFactory = None;
+        
+        if EarlyStopTolerance > 0.0:
+            watcherFactory = lambda runDir: EarlyStopWatcher(
+                runDir, EarlyStopTolerance, skipSCFCycles = SkipSCFCycles, minSCFSteps = EarlyStopMinSCFSteps
+                );
+        
+        samplerFactory = None;
+        
+        if TelemetryInterval != None:
+            samplerFactory = lambda runDir, gpuIDs: TelemetrySampler(TelemetryInterval);
+        
+        batch = None;
+        
+        if BatchSystem != None:
+            batch = BatchRunner(
+                GetBatchBackend(BatchSystem, commands = BatchCommands), BatchCoresPerNode, wallTime = BatchWallTime, directives = BatchDirectives,
+                setupCommands = BatchSetupCommands, useArrays = BatchUseArrays, pollInterval = BatchPollInterval, stateFile = BatchStateFile
+                );
+        
+        stager = Stager(modes = StagingModes, cacheDir = StagingCacheDir, archiveFiles = ArchiveFiles, archiveCompression = ArchiveCompression);
+        
+        executor = Executor(wallTimeLimit = WallTimeLimit, idleTimeout = IdleTimeout, gracePeriod = KillGracePeriod);
+        
+        if ProgressStatusFile != None or ProgressPrintInterval != None:
+            # In campaign mode, the number of atoms is set for each job by the sweeps.
+            
+            monitor = ProgressMonitor(
+                statusFile = ProgressStatusFile, numAtoms = GetNumAtoms("POSCAR") if campaign == None else None, printInterval = ProgressPrintInterval, scriptName = "CPUTest.py"
+                );
+            
+            monitor.Start();
+    
+    cache = ResultCache(ResultCacheFile, maxEntries = ResultCacheMaxEntries) if ResultCacheFile != None else None;
+    
+    # Telemetry is not collected for tests run through the batch system.
+    
+    resultColumns = GetResultColumns(extraStatistics = DataOutputExtraStatistics, telemetry = TelemetryInterval != None and BatchSystem == None);
+    
+    campaignResults, store = [], None;
+    
+    for i, (system, sweep) in enumerate(zip(systems, sweeps)):
+        if system != None:
+            print("Campaign: system {0} of {1}: {2} ({3} atoms)".format(i + 1, len(systems), system.Name, system.NumAtoms));
+            print("");
+        
+        if not CollectOnly:
+            if campaign != None:
+                campaign.Prune(system, sweep);
+            
+            if AdaptiveNSIMSearch:
+                sweep.RunAdaptive(pool, RunDir, VASPRunCommand, "NSIM", skipSCFCycles = SkipSCFCycles, watcherFactory = watcherFactory, samplerFactory = samplerFactory, energyTolerance = EnergyTolerance, scfStepsTolerance = SCFStepsTolerance, monitor = monitor, batch = batch, stager = stager, maxRetries = MaxRetries, executor = executor);
+            else:
+                sweep.Run(pool, RunDir, VASPRunCommand, watcherFactory = watcherFactory, samplerFactory = samplerFactory, monitor = monitor, batch = batch, stager = stager, maxRetries = MaxRetries, pruneFailures = PruneFailedTests, executor = executor);
+            
+            if AdaptiveNSIMSearch or campaign != None:
+                print("Writing skipped tests to \"{0}\"...".format(GetSystemPath(system, SkippedOutputFile)));
+                print("");
                 
-                if NumProcesses % (kparValue * nparValue) != 0:
-                    print("# proc = {0} is not divisible by KPAR * NPAR = {1} -> skipping...".format(NumProcesses, kparValue * nparValue));
-                    print("");
-                    
-                    continue;
+                sweep.WriteSkipped(GetSystemPath(system, SkippedOutputFile));
+        
+        print("Collecting results...");
+        
+        data = sweep.CollectResults(skipSCFCycles = SkipSCFCycles, numJobs = CollectJobs, cache = cache, energyTolerance = EnergyTolerance, scfStepsTolerance = SCFStepsTolerance);
+        
+        if cache != None:
+            cache.Save();
+        
+        print("");
+        
+        if len(data) > 0:
+            print("Writing data to \"{0}\"...".format(GetSystemPath(system, DataOutputFile)));
+            
+            sweep.WriteResults(GetSystemPath(system, DataOutputFile), data, columns = resultColumns);
+            
+            if TimingsOutputFile != None:
+                print("Writing timings to \"{0}\"...".format(GetSystemPath(system, TimingsOutputFile)));
                 
-                for nsimValue in TestNSIMValues:
-                    jobDir = _GetArchiveDirName(ArchiveDirName, NumProcesses, kparValue, nparValue, nsimValue);
+                sweep.WriteTimings(GetSystemPath(system, TimingsOutputFile), data);
             
-                    if os.path.exists(jobDir):
-                        print("Job dir \"{0}\" (# proc = {1}, KPAR = {2}, NPAR = {3}, NSIM = {4}) already exists -> skipping...".format(jobDir, NumProcesses, kparValue, nparValue, nsimValue));
-                        print("");
-                        
-                        continue;
-                    
-                    os.mkdir(RunDir);
-                    
-                    os.chdir(RunDir);
-                    
-                    with open("INCAR", 'w') as outputWriter:
-                        with open("../INCAR", 'r') as inputReader:
-                            for line in inputReader:
-                                outputWriter.write(line);
-                        
-                        outputWriter.write("\n");            
-                        
-                        outputWriter.write("! Parameters automatically added by CPUTest.py.\n");
-                        outputWriter.write("\n");
-                        
-                        outputWriter.write("KPAR = {0}\n".format(kparValue));
-                        outputWriter.write("NPAR = {0}\n".format(nparValue));
-                        outputWriter.write("NSIM = {0}\n".format(nsimValue));
-                    
-                    for vaspInputFile in "KPOINTS", "POSCAR", "POTCAR":
-                        shutil.copy("../{0}".format(vaspInputFile), vaspInputFile);
-                    
-                    print("Running test with # proc = {0}, KPAR = {1}, NPAR = {2}, NSIM = {3}...".format(NumProcesses, kparValue, nparValue, nsimValue));
-                    
-                    status, output = commands.getstatusoutput(
-                        VASPRunCommand.replace("<nproc>", str(NumProcesses))
+            if StoreOutputFile != None:
+                if system != None:
+                    systemStore = sweep.GetResultStore(data, system.Name, system.NumAtoms, "CPU");
+                else:
+                    systemStore = sweep.GetResultStore(
+                        data, SystemName if SystemName != None else GetSystemName("POSCAR"), GetNumAtoms("POSCAR"), "CPU"
                         );
-                    
-                    print("  -> Exit status: {0}".format(status));
-                    
-                    os.chdir("..");
-                    
-                    stdOutFile = "{0}.out".format(jobDir);
-                    
-                    print("  -> Writing std out to \"{0}\"".format(jobDir));
-                    
-                    with open(stdOutFile, 'w') as outputWriter:
-                        outputWriter.write(output);
-                    
-                    if status == 0:
-                        print("  -> Renaming run directory to \"{0}\"".format(jobDir));
-                        os.rename(RunDir, jobDir);
-                    else:
-                        shutil.rmtree(RunDir);
-                    
-                    print("");
-    
-    print("Collecting results...");
-    
-    data = { };
-    
-    for kparValue in TestKPARValues:
-        for nparValue in TestNPARValues:
-            if NumProcesses % (kparValue * nparValue) == 0:
-                for nsimValue in TestNSIMValues:
-                    jobDir = _GetArchiveDirName(ArchiveDirName, NumProcesses, kparValue, nparValue, nsimValue);
-                    
-                    if os.path.isdir(jobDir):
-                        numSCFSteps, tSCFAve, tElapsed, finalTotalEnergy = CollectResults(jobDir, outcarSkipSCFCycles = SkipSCFCycles);
-                        
-                        if numSCFSteps != None and tSCFAve != None and tElapsed != None and finalTotalEnergy != None:
-                            print("  -> Collected data for # proc = {0}, KPAR = {1}, NPAR = {2}, NSIM = {3}".format(NumProcesses, kparValue, nparValue, nsimValue));
-                            data[(NumProcesses, kparValue, nparValue, nsimValue)] = (numSCFSteps, tSCFAve, tElapsed, finalTotalEnergy);
-                        else:
-                            print("  -> Failed to collect data for # proc = {0}, KPAR = {1}, NPAR = {2}, NSIM = {3}".format(NumProcesses, kparValue, nparValue, nsimValue));
-                    else:
-                        print("  -> Archive dir \"{0}\" not found -> skipping # proc = {1}, KPAR = {2}, NPAR = {3}, NSIM = {4}".format(jobDir, NumProcesses, kparValue, nparValue, nsimValue));
-    
-    print("");
-    
-    if len(data) > 0:
-        print("Writing data to \"{0}\"...".format(DataOutputFile));
-        
-        with open(DataOutputFile, 'w') as outputWriter:
-            outputWriterCSV = csv.writer(outputWriter, delimiter = ',', quotechar = '\"', quoting = csv.QUOTE_ALL);
+                
+                if store == None:
+                    store = systemStore;
+                else:
+                    store.Extend(systemStore);
+        else:
+            print("No data collected - please check the *.out files from VASP jobs");
+        
+        print("");
+        
+        if campaign != None:
+            campaign.AddResults(system, sweep, data);
             
-            outputWriterCSV.writerow(["# Proc", "KPAR", "NPAR", "NSIM", "# SCF Steps", "t_SCF,Ave [s]", "t_Elapsed [s]", "Final E_0 [eV]"]);
+            campaignResults.append((system, sweep, data));
             
-            for key in sorted(data.keys()):
-                outputWriterCSV.writerow(key + data[key]);
-    else:
-        print("No data collected - please check the *.out files from VASP jobs");
+            if not CollectOnly:
+                campaign.PrintForecast(systems[i + 1:], sweep);
+    
+    if monitor != None:
+        monitor.Stop();
+    
+    if stager != None and stager.GetSummary() != "":
+        print("Staged input files: {0}".format(stager.GetSummary()));
+        print("");
+    
+    if campaign != None and any(len(data) > 0 for _, _, data in campaignResults):
+        print("Writing campaign results to \"{0}\"...".format(CampaignOutputFile));
+        
+        campaign.WriteResults(CampaignOutputFile, campaignResults, columns = resultColumns);
+    
+    if store != None:
+        print("Writing result store to \"{0}\"...".format(StoreOutputFile));
+        
+        store.Save(StoreOutputFile);
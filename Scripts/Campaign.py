@@ -0,0 +1,267 @@
+# Campaign.py by J. M. Skelton
+
+
+import csv;
+import glob;
+import math;
+import os;
+import shutil;
+
+from collections import OrderedDict;
+
+from Monitor import DefaultScalingExponent, FormatDuration;
+from ResultStore import GetNumAtoms, GetSystemName;
+from Shared import IsTruncated;
+
+
+# Default factor for pruning configurations: configurations predicted to be more than this many times slower than the fastest for the next system are skipped.
+# Larger systems often favour more MPI processes, so this is deliberately generous.
+
+DefaultPruneFactor = 3.0;
+
+# Input files shared by all the systems in a campaign.
+
+_SharedInputFiles = ["INCAR", "KPOINTS", "POTCAR"];
+
+
+def _GetSystemName(poscarFile):
+    # Files named "POSCAR_<system>.vasp", as in Benchmarks/GeTe/InputFiles, are named after <system>; otherwise, the name is made from the POSCAR file (see ResultStore.GetSystemName()).
+    
+    fileName = os.path.basename(poscarFile);
+    
+    if fileName.startswith("POSCAR_"):
+        return os.path.splitext(fileName[len("POSCAR_"):])[0];
+    
+    return GetSystemName(poscarFile);
+
+def FitPowerLaw(numAtoms, values, scalingExponent = DefaultScalingExponent):
+    # Least-squares fit of log(value) = log(a) + b log(N); returns (a, b).
+    # If values are only available for one system size, b is set to scalingExponent.
+    
+    logN = [math.log(float(n)) for n in numAtoms];
+    logValues = [math.log(value) for value in values];
+    
+    numPoints = len(logN);
+    
+    meanLogN, meanLogValues = sum(logN) / numPoints, sum(logValues) / numPoints;
+    
+    varLogN = sum((x - meanLogN) ** 2 for x in logN);
+    
+    if varLogN > 0.0:
+        exponent = sum((x - meanLogN) * (y - meanLogValues) for x, y in zip(logN, logValues)) / varLogN;
+    else:
+        exponent = scalingExponent;
+    
+    return (math.exp(meanLogValues - exponent * meanLogN), exponent);
+
+
+class CampaignSystem(object):
+    def __init__(self, poscarFile):
+        self.POSCARFile = poscarFile;
+        
+        self.Name = _GetSystemName(poscarFile);
+        self.NumAtoms = GetNumAtoms(poscarFile);
+        
+        # Directory the sweep for the system is run in.
+        
+        self.Directory = self.Name;
+
+
+def GetSystemPath(system, path):
+    # Returns path in the directory for system, or path itself if system is None (i.e. when not running a campaign).
+    
+    return os.path.join(system.Directory, path) if system != None else path;
+
+def GetCampaignSystems(poscarFiles):
+    # poscarFiles: a list of POSCAR files and/or glob patterns (e.g. "POSCAR_*.vasp"), or a single pattern.
+    # Returns a list of CampaignSystem objects, ordered smallest first.
+    
+    if isinstance(poscarFiles, str):
+        poscarFiles = [poscarFiles];
+    
+    filePaths = [];
+    
+    for pattern in poscarFiles:
+        matches = sorted(glob.glob(pattern));
+        
+        if len(matches) == 0:
+            raise Exception("Error: No POSCAR files found matching \"{0}\".".format(pattern));
+        
+        filePaths = filePaths + [filePath for filePath in matches if filePath not in filePaths];
+    
+    systems = sorted((CampaignSystem(filePath) for filePath in filePaths), key = lambda system: (system.NumAtoms, system.Name));
+    
+    names = [system.Name for system in systems];
+    
+    for name in names:
+        if names.count(name) > 1:
+            raise Exception("Error: More than one POSCAR file gives the system name \"{0}\" - please rename the files.".format(name));
+    
+    return systems;
+
+
+class Campaign(object):
+    def __init__(self, poscarFiles, pruneFactor = DefaultPruneFactor, maxTestTime = None, scalingExponent = DefaultScalingExponent):
+        # Runs a sweep for each of a series of structures (see GetCampaignSystems()), sharing the INCAR, KPOINTS and POTCAR files, from the smallest to the largest.
+        # The results for the systems already run are used to skip configurations for the larger ones: those that failed or gave invalid results for the previous system, those predicted to be more than pruneFactor times slower than the fastest, and, if maxTestTime is set, those predicted to run for longer than maxTestTime seconds.
+        # Predictions are made by fitting power laws in the number of atoms to the t_SCF and t_Elapsed of each configuration (see FitPowerLaw()).
+        
+        self.Systems = GetCampaignSystems(poscarFiles);
+        
+        self.PruneFactor = pruneFactor;
+        self.MaxTestTime = maxTestTime;
+        self.ScalingExponent = scalingExponent;
+        
+        # Results for each configuration (point key): list of (system name, number of atoms, t_SCF, t_Elapsed) for each system it was tested on, with t_SCF set to None if it failed.
+        
+        self._history = OrderedDict();
+    
+    def CheckSetup(self, inputDir = "."):
+        for vaspInputFile in _SharedInputFiles:
+            if not os.path.isfile(os.path.join(inputDir, vaspInputFile)):
+                raise Exception("Error: Required VASP input file \"{0}\" not found.".format(vaspInputFile));
+    
+    def PrepareSystemDirs(self, inputDir = "."):
+        # Sets up the directory for each system with its POSCAR and copies of the shared input files.
+        # Files left from a previous run are replaced, so that changes to the input files are picked up.
+        
+        for system in self.Systems:
+            if not os.path.isdir(system.Directory):
+                os.makedirs(system.Directory);
+            
+            for vaspInputFile in _SharedInputFiles + ["POSCAR"]:
+                filePath = os.path.join(system.Directory, vaspInputFile);
+                
+                if os.path.lexists(filePath):
+                    os.remove(filePath);
+            
+            shutil.copy(system.POSCARFile, os.path.join(system.Directory, "POSCAR"));
+            
+            for vaspInputFile in _SharedInputFiles:
+                shutil.copy(os.path.join(inputDir, vaspInputFile), os.path.join(system.Directory, vaspInputFile));
+    
+    def AddResults(self, system, sweep, data):
+        # Records the results for system; data is as returned by Sweep.CollectResults().
+        # Points that were tested but have no results (e.g. VASP crashed or the test was abandoned), or that failed validation, are recorded as failed; t_Elapsed is not used for points stopped early.
+        
+        for point in sweep.Points:
+            tSCFAve, tElapsed = None, None;
+            
+            if point.Key in data:
+                _, results, record = data[point.Key];
+                
+                if results[-1] != "No":
+                    tSCFAve = record['TSCFAve'];
+                    
+                    if not IsTruncated(sweep.GetArchiveDir(point)):
+                        tElapsed = record['TElapsed'];
+            
+            self._history.setdefault(point.Key, []).append((system.Name, system.NumAtoms, tSCFAve, tElapsed));
+    
+    def _Predict(self, key, numAtoms, index):
+        # Extrapolates the t_SCF (index = 2) or t_Elapsed (index = 3) of a configuration to numAtoms; returns None if it has not been run successfully.
+        
+        history = [item for item in self._history.get(key, []) if item[index] != None and item[index] > 0.0];
+        
+        if len(history) == 0:
+            return None;
+        
+        prefactor, exponent = FitPowerLaw([item[1] for item in history], [item[index] for item in history], scalingExponent = self.ScalingExponent);
+        
+        return prefactor * float(numAtoms) ** exponent;
+    
+    def Prune(self, system, sweep):
+        # Moves the points in sweep that are not worth testing for system to sweep.Skipped, and prints the predicted run time of the rest.
+        
+        for point in list(sweep.Points):
+            history = self._history.get(point.Key);
+            
+            if history != None and history[-1][2] == None:
+                sweep.Skip(point, "Campaign: {0} failed or gave invalid results for {1}".format(point.Label, history[-1][0]));
+        
+        predictedTSCF = OrderedDict();
+        
+        for point in sweep.Points:
+            tSCFAve = self._Predict(point.Key, system.NumAtoms, 2);
+            
+            if tSCFAve != None:
+                predictedTSCF[point.Key] = tSCFAve;
+        
+        if self.PruneFactor != None and len(predictedTSCF) > 0:
+            bestTSCF = min(predictedTSCF.values());
+            
+            for point in list(sweep.Points):
+                if point.Key in predictedTSCF and predictedTSCF[point.Key] > self.PruneFactor * bestTSCF:
+                    sweep.Skip(point, "Campaign: predicted t_SCF for {0} with {1} ({2:.3f} s) is more than {3:g}x the fastest ({4:.3f} s)".format(
+                        system.Name, point.Label, predictedTSCF[point.Key], self.PruneFactor, bestTSCF
+                        ));
+        
+        predictedTElapsed = OrderedDict();
+        
+        for point in list(sweep.Points):
+            tElapsed = self._Predict(point.Key, system.NumAtoms, 3);
+            
+            if tElapsed == None:
+                continue;
+            
+            if self.MaxTestTime != None and tElapsed > self.MaxTestTime:
+                sweep.Skip(point, "Campaign: predicted t_Elapsed for {0} with {1} ({2}) is longer than {3}".format(
+                    system.Name, point.Label, FormatDuration(tElapsed), FormatDuration(self.MaxTestTime)
+                    ));
+            else:
+                predictedTElapsed[point.Key] = tElapsed;
+        
+        print("Campaign: {0} ({1} atoms): {2} test(s), {3} skipped".format(system.Name, system.NumAtoms, len(sweep.Points), len(sweep.Skipped)));
+        
+        if len(predictedTElapsed) > 0:
+            print("  -> Predicted test time: {0} for {1} of {2} test(s)".format(FormatDuration(sum(predictedTElapsed.values())), len(predictedTElapsed), len(sweep.Points)));
+        
+        print("");
+    
+    def PrintForecast(self, systems, sweep):
+        # Prints the predicted test time for each of systems if all the configurations in sweep that have not failed so far were to be tested.
+        
+        lines = [];
+        
+        for system in systems:
+            predictions = [];
+            
+            for point in sweep.Points:
+                history = self._history.get(point.Key);
+                
+                if history != None and history[-1][2] != None:
+                    tElapsed = self._Predict(point.Key, system.NumAtoms, 3);
+                    
+                    if tElapsed != None:
+                        predictions.append(tElapsed);
+            
+            if len(predictions) > 0:
+                lines.append("  -> {0} ({1} atoms): {2} for {3} test(s)".format(system.Name, system.NumAtoms, FormatDuration(sum(predictions)), len(predictions)));
+        
+        if len(lines) > 0:
+            print("Campaign: predicted test times for the remaining systems, before pruning:");
+            
+            for line in lines:
+                print(line);
+            
+            print("");
+    
+    def WriteResults(self, filePath, results, columns = None):
+        # Writes the results for all the systems to one file; results is a list of (system, sweep, data) tuples, with data as returned by Sweep.CollectResults().
+        # columns is passed to Sweep.GetResultRows().
+        
+        with open(filePath, 'w') as outputWriter:
+            outputWriterCSV = csv.writer(outputWriter, delimiter = ',', quotechar = '\"', quoting = csv.QUOTE_ALL);
+            
+            headersWritten = False;
+            
+            for system, sweep, data in results:
+                headers, rows = sweep.GetResultRows(data, columns = columns);
+                
+                if not headersWritten:
+                    outputWriterCSV.writerow(["System", "# Atoms"] + headers);
+                    
+                    headersWritten = True;
+                
+                for row in rows:
+                    outputWriterCSV.writerow([system.Name, system.NumAtoms] + row);
@@ -0,0 +1,118 @@
+# Compare.py by J. M. Skelton
+
+
+import argparse;
+import sys;
+
+from Regression import CompareResults, MatchColumns, WriteComparisons;
+from ResultStore import LoadResults;
+
+
+def _FormatKey(key):
+    values = dict(zip(MatchColumns, key));
+    
+    label = "{0}, {1}, # proc = {2}, KPAR = {3}, NPAR = {4}, NSIM = {5}".format(
+        values["System"], "CPU" if values["Device"] == "CPU" else "{0}GPU".format(values["NumGPUs"]),
+        values["NumProcesses"], values["KPAR"], values["NPAR"], values["NSIM"]
+        );
+    
+    if values["ExtraTags"] != "":
+        label = "{0}, {1}".format(label, values["ExtraTags"]);
+    
+    return label;
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Compare two sets of benchmark results (e.g. before and after rebuilding VASP) and flag configurations that have become significantly slower; exits with status 1 if any are found.");
+    
+    parser.set_defaults(
+        Threshold = 5.0,
+        Alpha = 0.05
+        );
+    
+    parser.add_argument(
+        "--old",
+        type = str, nargs = '+', dest = 'OldFiles', required = True,
+        help = "reference results: result stores (\".npz\" or \".parquet\") and/or CSV files written by CPUTest.py and GPUTest.py"
+        );
+    
+    parser.add_argument(
+        "--new",
+        type = str, nargs = '+', dest = 'NewFiles', required = True,
+        help = "results to compare against the reference"
+        );
+    
+    parser.add_argument(
+        "--threshold",
+        type = float, dest = 'Threshold',
+        help = "flag configurations where t_SCF has increased by more than this percentage (default: 5)"
+        );
+    
+    parser.add_argument(
+        "--alpha",
+        type = float, dest = 'Alpha',
+        help = "significance level for the test on the SCF times of repeated runs, or the per-step SCF times of single runs (default: 0.05)"
+        );
+    
+    parser.add_argument(
+        "--check_elapsed",
+        dest = 'CheckElapsed', action = 'store_true',
+        help = "also fail if t_Elapsed has increased by more than the threshold (t_Elapsed is a single measurement, so no significance test is applied)"
+        );
+    
+    parser.add_argument(
+        "--poscar_dir",
+        type = str, dest = 'POSCARDir',
+        help = "directory containing \"POSCAR_<system>.vasp\" files to read the number of atoms from when importing CSV files"
+        );
+    
+    parser.add_argument(
+        "--output",
+        type = str, dest = 'OutputFile',
+        help = "write the comparison for every matched configuration to a CSV file"
+        );
+    
+    args = parser.parse_args();
+    
+    oldStore = LoadResults(args.OldFiles, poscarDir = args.POSCARDir);
+    newStore = LoadResults(args.NewFiles, poscarDir = args.POSCARDir);
+    
+    comparisons, oldOnly, newOnly = CompareResults(oldStore, newStore, threshold = args.Threshold / 100.0, alpha = args.Alpha);
+    
+    print("Compared {0} configuration(s) ({1} only in old results, {2} only in new results)".format(len(comparisons), len(oldOnly), len(newOnly)));
+    
+    failures = [];
+    
+    for comparison in comparisons:
+        isFailure = comparison['Status'] == "Regression" or (args.CheckElapsed and comparison['ElapsedRegression']);
+        
+        if comparison['Status'] == "OK" and not comparison['ElapsedRegression']:
+            continue;
+        
+        print("");
+        print("{0}: {1}".format(comparison['Status'] if comparison['Status'] != "OK" else "t_Elapsed slower", _FormatKey(comparison['Key'])));
+        
+        print("  -> t_SCF: {0:.3f} -> {1:.3f} s ({2:+.1f} %{3})".format(
+            comparison['OldTSCF'], comparison['NewTSCF'], 100.0 * comparison['TSCFChange'],
+            ", p = {0:.2g}".format(comparison['PValueFaster' if comparison['Status'] == "Faster" else 'PValue']) if comparison['PValue'] != None else ", not enough data to test significance"
+            ));
+        
+        print("  -> t_Elapsed: {0:.1f} -> {1:.1f} s ({2:+.1f} %)".format(comparison['OldTElapsed'], comparison['NewTElapsed'], 100.0 * comparison['TElapsedChange']));
+        
+        if isFailure:
+            failures.append(comparison);
+    
+    if args.OutputFile != None:
+        print("");
+        print("Writing comparison to \"{0}\"...".format(args.OutputFile));
+        
+        WriteComparisons(args.OutputFile, comparisons);
+    
+    print("");
+    
+    if len(failures) > 0:
+        print("FAIL: {0} configuration(s) more than {1:g} % slower".format(len(failures), args.Threshold));
+        
+        sys.exit(1);
+    
+    print("PASS: No configurations more than {0:g} % slower".format(args.Threshold));
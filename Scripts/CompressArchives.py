@@ -0,0 +1,125 @@
+# CompressArchives.py by J. M. Skelton
+
+
+import argparse;
+import os;
+
+from multiprocessing.pool import ThreadPool;
+
+from Shared import CollectRunRecord;
+from Staging import ArchiveCompressionFormats, CheckCompressionFormat, DefaultArchiveFiles, Stager;
+
+
+def _CompressArchive(archiveDir, stager, verify, skipSCFCycles):
+    # Returns (messages, whether the results collected after compressing match those collected before).
+    
+    if verify:
+        recordBefore = CollectRunRecord(archiveDir, outcarSkipSCFCycles = skipSCFCycles);
+    
+    messages = stager.Archive(archiveDir);
+    
+    if not verify:
+        return (messages, True);
+    
+    recordAfter = CollectRunRecord(archiveDir, outcarSkipSCFCycles = skipSCFCycles);
+    
+    return (messages, recordAfter == recordBefore);
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Compress the archive directories from a finished set of benchmarks (e.g. \"GPUTest-*\"), optionally removing files not needed to collect the results; the results can still be collected by CPUTest.py, GPUTest.py and GetTimings.py.");
+    
+    parser.set_defaults(
+        Format = "gz",
+        NumJobs = 4,
+        SkipSCFCycles = 0
+        );
+    
+    parser.add_argument(
+        metavar = "archive_dir", type = str, nargs = '+',
+        dest = 'ArchiveDirs',
+        help = "archive directories to compress"
+        );
+    
+    parser.add_argument(
+        "--format",
+        type = str, dest = 'Format', choices = ArchiveCompressionFormats,
+        help = "compression format (default: gz)"
+        );
+    
+    parser.add_argument(
+        "--jobs",
+        type = int, dest = 'NumJobs',
+        help = "number of directories to compress in parallel (default: 4)"
+        );
+    
+    parser.add_argument(
+        "--slim",
+        action = 'store_true', dest = 'Slim',
+        help = "remove files other than those in --keep_files and the files needed to collect the results"
+        );
+    
+    parser.add_argument(
+        "--keep_files",
+        type = str, nargs = '+', dest = 'KeepFiles',
+        help = "files to keep with --slim (default: {0})".format(" ".join(DefaultArchiveFiles))
+        );
+    
+    parser.add_argument(
+        "--verify",
+        action = 'store_true', dest = 'Verify',
+        help = "check the results collected from each directory are the same before and after compressing it"
+        );
+    
+    parser.add_argument(
+        "--skip_scf_cycles",
+        type = int, dest = 'SkipSCFCycles',
+        help = "exclude the first N SCF cycles from the averages compared by --verify (default: 0)"
+        );
+    
+    args = parser.parse_args();
+    
+    CheckCompressionFormat(args.Format);
+    
+    archiveFiles = None;
+    
+    if args.Slim:
+        archiveFiles = args.KeepFiles if args.KeepFiles != None else DefaultArchiveFiles;
+    
+    stager = Stager(archiveFiles = archiveFiles, archiveCompression = args.Format);
+    
+    archiveDirs = [];
+    
+    for archiveDir in args.ArchiveDirs:
+        if os.path.isdir(archiveDir):
+            archiveDirs.append(archiveDir);
+        else:
+            print("\"{0}\" is not a directory -> skipping".format(archiveDir));
+    
+    # The compression libraries (and the zstd command) release the GIL, so threads can compress several directories at once.
+    
+    pool = ThreadPool(max(1, min(args.NumJobs, len(archiveDirs))));
+    
+    numFailed = 0;
+    
+    try:
+        results = pool.imap(lambda archiveDir: _CompressArchive(archiveDir, stager, args.Verify, args.SkipSCFCycles), archiveDirs);
+        
+        for archiveDir, (messages, success) in zip(archiveDirs, results):
+            print("Compressing \"{0}\"...".format(archiveDir));
+            
+            for message in messages if len(messages) > 0 else ["Nothing to do"]:
+                print("  -> {0}".format(message));
+            
+            if not success:
+                print("  -> WARNING: Results collected after compressing do not match those collected before");
+                
+                numFailed += 1;
+            
+            print("");
+    finally:
+        pool.close();
+        pool.join();
+    
+    if numFailed > 0:
+        raise Exception("Error: The results collected from {0} director(ies) changed after compressing.".format(numFailed));
@@ -0,0 +1,228 @@
+# Execution.py by J. M. Skelton
+
+
+import argparse;
+import os;
+import signal;
+import subprocess;
+import sys;
+import time;
+
+try:
+    from shlex import quote as _ShellQuote;
+except ImportError:
+    from pipes import quote as _ShellQuote;
+
+from Watcher import KillProcessGroup;
+
+
+# Reasons for a command being killed by an Executor.
+
+WallTimeReason = "wall-clock limit";
+IdleReason = "idle-output limit";
+
+# Default time [s] between sending a timed-out job SIGTERM and SIGKILL, to give mpirun time to stop the VASP processes.
+
+DefaultGracePeriod = 30.0;
+
+# Keyword arguments to subprocess.Popen() to start a command in a new session (and so a new process group); preexec_fn is not safe to use with threads, so it is only used on Python 2, which lacks start_new_session.
+
+NewSessionArguments = { 'start_new_session' : True } if sys.version_info[0] >= 3 else { 'preexec_fn' : os.setsid };
+
+
+class CommandResult(object):
+    def __init__(self, status, runTime, outputSize, killReason = None, limit = None):
+        # status: exit status of the command (negative for a signal); runTime: wall time [s]; outputSize: size of the output file [bytes].
+        # killReason: WallTimeReason or IdleReason if the command was killed for exceeding limit [s], otherwise None.
+        
+        self.Status = status;
+        self.RunTime = runTime;
+        self.OutputSize = outputSize;
+        
+        self.KillReason = killReason;
+        self.Limit = limit;
+    
+    @property
+    def TimedOut(self):
+        return self.KillReason != None;
+    
+    @property
+    def Summary(self):
+        if self.KillReason == None:
+            return None;
+        
+        return "Killed after exceeding the {0} of {1:.0f} s".format(self.KillReason, self.Limit);
+
+
+def FormatSize(numBytes):
+    for unit in "B", "kB", "MB", "GB":
+        if numBytes < 1024.0 or unit == "GB":
+            return "{0:.0f} {1}".format(numBytes, unit) if unit == "B" else "{0:.1f} {1}".format(numBytes, unit);
+        
+        numBytes = numBytes / 1024.0;
+
+def _GetActivityTime(filePaths):
+    # Latest modification time of filePaths, or None if none of them exist.
+    
+    times = [];
+    
+    for filePath in filePaths:
+        try:
+            times.append(os.path.getmtime(filePath));
+        except OSError:
+            pass;
+    
+    return max(times) if len(times) > 0 else None;
+
+def _IsProcessGroupAlive(process):
+    # Signal 0 checks whether any process in the group still exists without signalling it.
+    
+    try:
+        os.killpg(process.pid, 0);
+    except OSError:
+        return False;
+    
+    return True;
+
+
+class Executor(object):
+    def __init__(self, wallTimeLimit = None, idleTimeout = None, gracePeriod = DefaultGracePeriod, pollInterval = 0.2):
+        # Runs commands with their standard output and error written straight to a file, so the output is never held in memory, and stops commands that run for longer than wallTimeLimit [s] or produce no output for idleTimeout [s].
+        # Commands are started in a new process group; commands that time out are sent SIGTERM, followed by SIGKILL if they have not exited gracePeriod [s] later.
+        
+        if wallTimeLimit != None and wallTimeLimit <= 0.0:
+            raise Exception("Error: If set, wallTimeLimit must be > 0.");
+        
+        if idleTimeout != None and idleTimeout <= 0.0:
+            raise Exception("Error: If set, idleTimeout must be > 0.");
+        
+        self.WallTimeLimit = wallTimeLimit;
+        self.IdleTimeout = idleTimeout;
+        
+        self.GracePeriod = gracePeriod;
+        self.PollInterval = pollInterval;
+    
+    def Run(self, command, outputFile, workingDirectory = None, environment = None, activityFiles = None, watchers = None):
+        # Runs command in a shell and returns a CommandResult.
+        # activityFiles: other files (e.g. the OUTCAR) that count as output for the idle timeout, as VASP may write little to the standard output.
+        # watchers: objects with Start(process) and Join() methods (e.g. a Watcher.EarlyStopWatcher or a Telemetry.TelemetrySampler) to run alongside the command.
+        
+        if activityFiles == None:
+            activityFiles = [];
+        
+        if watchers == None:
+            watchers = [];
+        
+        with open(outputFile, 'wb') as outputWriter:
+            startTime = time.time();
+            
+            process = subprocess.Popen(
+                command, shell = True, cwd = workingDirectory, env = environment,
+                stdout = outputWriter, stderr = subprocess.STDOUT, **NewSessionArguments
+                );
+            
+            for watcher in watchers:
+                watcher.Start(process);
+            
+            killReason, limit = self._Wait(process, startTime, [outputFile] + activityFiles);
+            
+            for watcher in watchers:
+                watcher.Join();
+            
+            runTime = time.time() - startTime;
+        
+        result = CommandResult(process.returncode, runTime, os.path.getsize(outputFile), killReason = killReason, limit = limit);
+        
+        # Note the reason at the end of the output, for anyone reading it later.
+        
+        if result.TimedOut:
+            with open(outputFile, 'a') as outputWriter:
+                outputWriter.write("\n*** {0} ***\n".format(result.Summary));
+        
+        return result;
+    
+    def _Wait(self, process, startTime, activityFiles):
+        # Waits for process to exit, killing it if it exceeds a limit; returns (kill reason, limit), or (None, None) if it exited by itself.
+        
+        if self.WallTimeLimit == None and self.IdleTimeout == None:
+            process.wait();
+            
+            return (None, None);
+        
+        lastActivityTime = startTime;
+        
+        while process.poll() == None:
+            now = time.time();
+            
+            activityTime = _GetActivityTime(activityFiles);
+            
+            if activityTime != None:
+                lastActivityTime = max(lastActivityTime, activityTime);
+            
+            if self.WallTimeLimit != None and now - startTime > self.WallTimeLimit:
+                self._Kill(process);
+                
+                return (WallTimeReason, self.WallTimeLimit);
+            
+            if self.IdleTimeout != None and now - lastActivityTime > self.IdleTimeout:
+                self._Kill(process);
+                
+                return (IdleReason, self.IdleTimeout);
+            
+            time.sleep(self.PollInterval);
+        
+        return (None, None);
+    
+    def _Kill(self, process):
+        KillProcessGroup(process, signal.SIGTERM);
+        
+        stopTime = time.time();
+        
+        # The shell usually exits straight away, so wait for the rest of the group (e.g. mpirun stopping the VASP processes) as well.
+        
+        while time.time() - stopTime < self.GracePeriod:
+            process.poll();
+            
+            if not _IsProcessGroupAlive(process):
+                break;
+            
+            time.sleep(0.1);
+        
+        # Processes that ignore SIGTERM are killed.
+        
+        KillProcessGroup(process, signal.SIGKILL);
+        
+        process.wait();
+
+
+if __name__ == "__main__":
+    # Runs a command with an Executor, e.g. to try out the limits with a command that hangs or floods its output:
+    #   python Execution.py --wall_time 10 --idle_timeout 2 -- sh -c "echo start; sleep 60"
+    
+    parser = argparse.ArgumentParser(description = "Run a command with its output streamed to a file and wall-clock and idle-output limits.");
+    
+    parser.add_argument("--output_file", default = "Execution.out", help = "File to write the output to (default: Execution.out)");
+    parser.add_argument("--wall_time", type = float, default = None, help = "Wall-clock limit [s]");
+    parser.add_argument("--idle_timeout", type = float, default = None, help = "Idle-output limit [s]");
+    parser.add_argument("--grace_period", type = float, default = 5.0, help = "Time between SIGTERM and SIGKILL [s] (default: 5)");
+    parser.add_argument("command", nargs = argparse.REMAINDER, help = "Command to run");
+    
+    args = parser.parse_args();
+    
+    command = args.command[1:] if len(args.command) > 0 and args.command[0] == "--" else args.command;
+    
+    if len(command) == 0:
+        parser.error("No command given.");
+    
+    executor = Executor(wallTimeLimit = args.wall_time, idleTimeout = args.idle_timeout, gracePeriod = args.grace_period);
+    
+    result = executor.Run(" ".join(_ShellQuote(item) for item in command), args.output_file);
+    
+    print("Exit status: {0}".format(result.Status));
+    print("Run time [s]: {0:.2f}".format(result.RunTime));
+    print("Output: {0} written to \"{1}\"".format(FormatSize(result.OutputSize), args.output_file));
+    
+    if result.TimedOut:
+        print(result.Summary);
+    
+    sys.exit(0 if result.Status == 0 else 1);
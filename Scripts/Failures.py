@@ -0,0 +1,202 @@
+# Failures.py by J. M. Skelton
+
+
+import os;
+import re;
+
+from Launcher import GetNumGPUs;
+
+
+# Classes of failure recognised by ClassifyFailure().
+
+HostMemoryFailure = "Out of host memory";
+GPUMemoryFailure = "Out of GPU memory";
+CUDAFailure = "CUDA error";
+MPIAbortFailure = "MPI abort";
+CrashFailure = "Crash";
+ParallelisationFailure = "Bad KPAR/NPAR";
+TimeoutFailure = "Timeout";
+UnknownFailure = "Unknown";
+
+# Failures that may not happen again if the test is rerun (e.g. a GPU left busy by another job, or a dropped network connection); the others, including crashes (e.g. segmentation faults), are deterministic, and retrying them only wastes node hours.
+
+TransientFailures = [CUDAFailure, MPIAbortFailure];
+
+# Patterns in the output from VASP, the MPI launcher and the batch system for each class of failure, in the order they are tried.
+# The specific causes come first, since e.g. VASP running out of GPU memory also prints a CUDA error and makes mpirun report an MPI abort.
+# Only explicit aborts and lost connections count as MPI aborts; processes killed by a signal (e.g. a segmentation fault), which the MPI launcher also reports, are classified as crashes.
+
+_FailurePatterns = [
+    (ParallelisationFailure, [
+        r"M_divide: can not subdivide",
+        r"\b(KPAR|NPAR|NCORE)\b.*\b(not|must)\b.*\bdivi(sor|sible|de)"
+        ]),
+    (GPUMemoryFailure, [
+        r"CUDA.*out of memory",
+        r"cudaErrorMemoryAllocation",
+        r"CUBLAS_STATUS_ALLOC_FAILED",
+        r"CUFFT_ALLOC_FAILED",
+        r"cudaMalloc.*(fail|error)",
+        r"(GPU|device).*out of memory",
+        r"out of (GPU|device) memory"
+        ]),
+    (HostMemoryFailure, [
+        r"insufficient virtual memory",
+        r"cannot allocate memory",
+        r"std::bad_alloc",
+        r"oom[-_ ]kill",
+        r"Out of memory: Kill",
+        r"exceeded (job )?memory limit"
+        ]),
+    (TimeoutFailure, [
+        r"DUE TO TIME LIMIT",
+        r"job killed: walltime",
+        r"exceeded.*wall ?time"
+        ]),
+    (CUDAFailure, [
+        r"CUDA (runtime )?error",
+        r"CUBLAS_STATUS_\w+",
+        r"CUFFT error",
+        r"cuda\w*Error\w+",
+        r"no CUDA-capable device",
+        r"CUDA-capable devices? (is|are) busy"
+        ]),
+    (MPIAbortFailure, [
+        r"MPI_ABORT was invoked",
+        r"application called MPI_Abort",
+        r"[OP]RTE has lost communication",
+        r"NODE FAILURE"
+        ]),
+    (CrashFailure, [
+        r"exited on signal \d+",
+        r"KILLED BY SIGNAL: \d+",
+        r"Segmentation fault",
+        r"SIGSEGV",
+        r"forrtl: severe \(174\)",
+        r"EXIT CODE: 13[49]"
+        ])
+    ];
+
+_FailureRegexes = [(failureClass, re.compile("|".join("(?:{0})".format(pattern) for pattern in patterns), re.IGNORECASE)) for failureClass, patterns in _FailurePatterns];
+
+# Only the end of each output file is searched, as VASP and the MPI launcher print their errors last, and an OUTCAR can be very large.
+
+_TailSize = 64 * 1024;
+
+# INCAR tags that (all else being equal) certainly increase the GPU memory needed by each process when they are increased: NSIM, the number of bands optimised at once.
+
+_MemoryTags = ["NSIM"];
+
+# INCAR tags that set how the processes are divided between k-points and bands.
+
+_ParallelisationTags = ["KPAR", "NPAR", "NCORE"];
+
+
+class Failure(object):
+    def __init__(self, failureClass, detail = None):
+        # failureClass: one of the *Failure classes above; detail: the line of output that identified the failure, if any.
+        
+        self.Class = failureClass;
+        self.Detail = detail;
+    
+    @property
+    def Transient(self):
+        return self.Class in TransientFailures;
+    
+    def __str__(self):
+        return "{0} (\"{1}\")".format(self.Class, self.Detail) if self.Detail != None else self.Class;
+
+
+def _ReadTail(filePath):
+    with open(filePath, 'rb') as inputReader:
+        inputReader.seek(0, os.SEEK_END);
+        inputReader.seek(max(inputReader.tell() - _TailSize, 0));
+        
+        return inputReader.read().decode('utf-8', 'replace');
+
+def ClassifyFailure(outputFiles):
+    # Returns a Failure for a test that failed, from the ends of outputFiles (e.g. the captured standard output and the OUTCAR); files that do not exist are ignored.
+    
+    tails = [_ReadTail(filePath) for filePath in outputFiles if filePath != None and os.path.isfile(filePath)];
+    
+    for failureClass, regex in _FailureRegexes:
+        for tail in tails:
+            match = regex.search(tail);
+            
+            if match:
+                start = tail.rfind('\n', 0, match.start()) + 1;
+                end = tail.find('\n', match.end());
+                
+                return Failure(failureClass, tail[start:end if end != -1 else len(tail)].strip());
+    
+    return Failure(UnknownFailure);
+
+def _GetTagValues(job):
+    tags = { };
+    
+    for tag, value in job.INCARTags:
+        value = str(value).strip();
+        
+        try:
+            value = float(value);
+        except ValueError:
+            value = value.upper();
+        
+        tags.setdefault(tag.upper(), value);
+    
+    return tags;
+
+def _GetNumGPUs(job):
+    # Number of GPUs used by job, or None if this is not known (e.g. if GPUs are not allocated and every job can see all of them).
+    
+    if job.RanksPerGPU != None:
+        return GetNumGPUs(job.NumProcesses, job.RanksPerGPU);
+    
+    return job.NumGPUs if job.NumGPUs > 0 else None;
+
+def _GetRanksPerGPU(job):
+    numGPUs = _GetNumGPUs(job);
+    
+    return float(job.NumProcesses) / numGPUs if numGPUs != None else None;
+
+def _IsLarger(job, failedJob):
+    # Returns True if job needs at least as much memory on each GPU as failedJob: the same test with the same number of processes, and larger (or the same) NSIM and/or more (or the same number of) processes sharing each GPU.
+    # Other changes (e.g. more processes in total, or larger KPAR/NPAR) change how the data are distributed, so do not make running out of memory certain.
+    
+    if job.NumProcesses != failedJob.NumProcesses or job.NumThreads != failedJob.NumThreads or job.UseMPS != failedJob.UseMPS:
+        return False;
+    
+    tags, failedTags = _GetTagValues(job), _GetTagValues(failedJob);
+    
+    for tag in set(tags.keys()) | set(failedTags.keys()):
+        value, failedValue = tags.get(tag), failedTags.get(tag);
+        
+        if tag in _MemoryTags and isinstance(value, float) and isinstance(failedValue, float):
+            if value < failedValue:
+                return False;
+        elif value != failedValue:
+            return False;
+    
+    # If the GPUs used by the jobs are not known, they must be the same.
+    
+    ranksPerGPU, failedRanksPerGPU = _GetRanksPerGPU(job), _GetRanksPerGPU(failedJob);
+    
+    if ranksPerGPU == None or failedRanksPerGPU == None:
+        return ranksPerGPU == failedRanksPerGPU;
+    
+    return ranksPerGPU >= failedRanksPerGPU;
+
+def IsDoomed(job, failedJob, failure):
+    # Returns True if job (a Scheduler.Job) would certainly fail in the same way as failedJob, which failed with failure.
+    # Jobs with the same KPAR/NPAR/NCORE and number of processes as a job that could not divide the processes between them would fail in the same way, as would jobs that need at least as much memory on each GPU as one that ran out of GPU memory (see _IsLarger()).
+    # Other failures (including running out of host memory, which depends on what else is running on the node) do not say anything certain about other jobs.
+    
+    if failure.Class == ParallelisationFailure:
+        tags, failedTags = _GetTagValues(job), _GetTagValues(failedJob);
+        
+        return job.NumProcesses == failedJob.NumProcesses and all(tags.get(tag) == failedTags.get(tag) for tag in _ParallelisationTags);
+    
+    if failure.Class == GPUMemoryFailure:
+        return _IsLarger(job, failedJob);
+    
+    return False;
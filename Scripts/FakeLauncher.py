@@ -0,0 +1,138 @@
+# FakeLauncher.py by J. M. Skelton
+
+
+# Minimal stand-ins for mpirun and nvidia-cuda-mps-control, for testing the GPU sharing settings in GPUTest.py (see TestRanksPerGPU, TestMPS and TestOMPThreads) on a machine without GPUs or MPI.
+# "mpirun" starts one process per rank with the environment variables set by Open MPI for the rank of each process, so the "<bind>" wrapper assigns GPUs as it would under mpirun.
+# "rank" appends the GPU, OpenMP and MPS settings seen by each rank to FakeLauncher.log in the current directory, and then runs the command for rank 0 only (e.g. a stand-in for VASP), so that the other ranks do not overwrite its output.
+# "mps-control" records that the MPS daemon was started ("-d") and stopped ("quit" on the standard input) in CUDA_MPS_PIPE_DIRECTORY, and logs both to control.log in CUDA_MPS_LOG_DIRECTORY, as the real daemon does.
+
+# Usage: python FakeLauncher.py mpirun -np <nproc> <command> [<args>...]
+#        python FakeLauncher.py rank <command> [<args>...]
+#        python FakeLauncher.py mps-control [-d]
+
+# For example, in GPUTest.py:
+#   VASPRunCommand = "python /path/to/FakeLauncher.py mpirun -np <nproc> <bind> python /path/to/FakeLauncher.py rank <command>";
+#   MPSControlCommand = "python /path/to/FakeLauncher.py mps-control";
+
+
+import os;
+import subprocess;
+import sys;
+
+
+# File created in CUDA_MPS_PIPE_DIRECTORY while the fake MPS daemon is "running".
+
+_MPSStateFileName = "FakeMPS.running";
+
+
+def _MPIRun(args):
+    numProcesses = 1;
+    
+    while len(args) > 0 and args[0].startswith('-'):
+        if args[0] in ("-np", "-n"):
+            numProcesses = int(args[1]);
+            args = args[2:];
+        elif args[0] == "--":
+            args = args[1:];
+            break;
+        else:
+            raise Exception("Error: Unsupported mpirun option \"{0}\".".format(args[0]));
+    
+    if len(args) == 0:
+        raise Exception("Error: No command given to mpirun.");
+    
+    processes = [];
+    
+    for rank in range(numProcesses):
+        environment = dict(os.environ);
+        
+        environment.update({
+            'OMPI_COMM_WORLD_SIZE' : str(numProcesses), 'OMPI_COMM_WORLD_RANK' : str(rank),
+            'OMPI_COMM_WORLD_LOCAL_SIZE' : str(numProcesses), 'OMPI_COMM_WORLD_LOCAL_RANK' : str(rank)
+            });
+        
+        processes.append(subprocess.Popen(args, env = environment));
+    
+    # As with mpirun, the exit status is non-zero if any of the ranks fail.
+    
+    statuses = [process.wait() for process in processes];
+    
+    return max(statuses, key = abs);
+
+def _Rank(args):
+    rank = int(os.environ.get('OMPI_COMM_WORLD_RANK', "0"));
+    
+    pipeDir = os.environ.get('CUDA_MPS_PIPE_DIRECTORY');
+    
+    mpsState = "running" if pipeDir != None and os.path.isfile(os.path.join(pipeDir, _MPSStateFileName)) else "off";
+    
+    line = "Rank {0}: CUDA_VISIBLE_DEVICES = {1}, OMP_NUM_THREADS = {2}, MPS = {3}\n".format(
+        rank, os.environ.get('CUDA_VISIBLE_DEVICES', "(not set)"), os.environ.get('OMP_NUM_THREADS', "(not set)"), mpsState
+        );
+    
+    # A single write to a file opened for appending is atomic for short lines, so the ranks can log concurrently.
+    
+    fileDescriptor = os.open("FakeLauncher.log", os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644);
+    
+    try:
+        os.write(fileDescriptor, line.encode('utf-8'));
+    finally:
+        os.close(fileDescriptor);
+    
+    if rank != 0 or len(args) == 0:
+        return 0;
+    
+    return subprocess.call(args);
+
+def _MPSControl(args):
+    pipeDir, logDir = os.environ.get('CUDA_MPS_PIPE_DIRECTORY'), os.environ.get('CUDA_MPS_LOG_DIRECTORY');
+    
+    if pipeDir == None or not os.path.isdir(pipeDir):
+        sys.stderr.write("Error: CUDA_MPS_PIPE_DIRECTORY is not set or does not exist.\n");
+        return 1;
+    
+    stateFile = os.path.join(pipeDir, _MPSStateFileName);
+    
+    if "-d" in args:
+        if os.path.isfile(stateFile):
+            sys.stderr.write("Error: An MPS control daemon is already running in \"{0}\".\n".format(pipeDir));
+            return 1;
+        
+        open(stateFile, 'w').close();
+        
+        message = "Starting control daemon (CUDA_VISIBLE_DEVICES = {0})".format(os.environ.get('CUDA_VISIBLE_DEVICES', "(not set)"));
+    else:
+        commands = [line.strip() for line in sys.stdin if line.strip() != ""];
+        
+        if commands != ["quit"]:
+            sys.stderr.write("Error: Only the \"quit\" command is supported.\n");
+            return 1;
+        
+        if not os.path.isfile(stateFile):
+            sys.stderr.write("Error: No MPS control daemon is running in \"{0}\".\n".format(pipeDir));
+            return 1;
+        
+        os.remove(stateFile);
+        
+        message = "Stopping control daemon";
+    
+    if logDir != None and os.path.isdir(logDir):
+        with open(os.path.join(logDir, "control.log"), 'a') as outputWriter:
+            outputWriter.write("{0}\n".format(message));
+    
+    return 0;
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("mpirun", "rank", "mps-control"):
+        print("Usage: python FakeLauncher.py mpirun|rank|mps-control [options]");
+        sys.exit(1);
+    
+    command, args = sys.argv[1], sys.argv[2:];
+    
+    if command == "mpirun":
+        sys.exit(_MPIRun(args));
+    elif command == "rank":
+        sys.exit(_Rank(args));
+    else:
+        sys.exit(_MPSControl(args));
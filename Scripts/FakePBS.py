@@ -0,0 +1,201 @@
+# FakePBS.py by J. M. Skelton
+
+
+# Minimal stand-ins for the PBS Pro qsub and qstat commands, for testing the batch-system support in CPUTest.py and GPUTest.py (see BatchCommands) on a machine without a batch system.
+# Jobs are run on the local machine in the background, one array subjob at a time, with the PBS_* environment variables set as by PBS; afterok dependencies are honoured, and jobs whose dependencies fail are deleted.
+# The state of the jobs is kept in the directory set by the FAKE_PBS_DIR environment variable (default: ".fakepbs" in the current directory).
+
+# Usage: python FakePBS.py qsub [-W depend=afterok:<id>[:<id>...]] <script>
+#        python FakePBS.py qstat [-t] [-u <user>]
+
+
+import getpass;
+import json;
+import os;
+import subprocess;
+import sys;
+import time;
+
+from Execution import NewSessionArguments;
+
+
+# Server name appended to the job IDs, e.g. "1000.fakepbs".
+
+_ServerName = "fakepbs";
+
+
+def _GetStateDir():
+    return os.path.abspath(os.environ.get("FAKE_PBS_DIR", ".fakepbs"));
+
+def _GetJobFile(jobID):
+    return os.path.join(_GetStateDir(), "{0}.json".format(jobID));
+
+def _ReadJob(jobID):
+    with open(_GetJobFile(jobID), 'r') as inputReader:
+        return json.load(inputReader);
+
+def _WriteJob(job):
+    jobFile = _GetJobFile(job['ID']);
+    
+    with open("{0}.tmp".format(jobFile), 'w') as outputWriter:
+        json.dump(job, outputWriter);
+    
+    os.rename("{0}.tmp".format(jobFile), jobFile);
+
+def _GetNextJobID():
+    counterFile = os.path.join(_GetStateDir(), "NextJobID");
+    
+    jobID = 1000;
+    
+    if os.path.isfile(counterFile):
+        with open(counterFile, 'r') as inputReader:
+            jobID = int(inputReader.read());
+    
+    with open(counterFile, 'w') as outputWriter:
+        outputWriter.write("{0}\n".format(jobID + 1));
+    
+    return str(jobID);
+
+def _QSub(args):
+    dependencies = [];
+    
+    for i, arg in enumerate(args[:-1]):
+        if arg == "-W" and args[i + 1].startswith("depend=afterok:"):
+            dependencies = [dependency.split('.')[0] for dependency in args[i + 1][len("depend=afterok:"):].split(':')];
+    
+    scriptFile = os.path.abspath(args[-1]);
+    
+    # Read the job name, array range and output directory from the #PBS directives.
+    
+    name, arrayIndices, outputDir = os.path.basename(scriptFile), None, os.getcwd();
+    
+    with open(scriptFile, 'r') as inputReader:
+        for line in inputReader:
+            if line.startswith("#PBS -N "):
+                name = line.strip()[len("#PBS -N "):];
+            elif line.startswith("#PBS -J "):
+                first, last = line.strip()[len("#PBS -J "):].split('-');
+                arrayIndices = list(range(int(first), int(last) + 1));
+            elif line.startswith("#PBS -o "):
+                outputDir = line.strip()[len("#PBS -o "):];
+    
+    if not os.path.isdir(_GetStateDir()):
+        os.makedirs(_GetStateDir());
+    
+    jobID = _GetNextJobID();
+    
+    _WriteJob({
+        'ID' : jobID, 'Name' : name, 'Script' : scriptFile, 'SubmitDir' : os.getcwd(), 'Dependencies' : dependencies,
+        'ArrayIndices' : arrayIndices, 'OutputDir' : outputDir,
+        'States' : dict((str(i), "Q") for i in (arrayIndices if arrayIndices != None else [-1])),
+        'ExitStatuses' : { }
+        });
+    
+    with open(os.devnull, 'w') as devNull:
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "run", jobID], env = dict(os.environ, FAKE_PBS_DIR = _GetStateDir()),
+            stdout = devNull, stderr = devNull, **NewSessionArguments
+            );
+    
+    print("{0}{1}.{2}".format(jobID, "[]" if arrayIndices != None else "", _ServerName));
+
+def _Run(jobID):
+    job = _ReadJob(jobID);
+    
+    # Wait for the dependencies; if any of them fail, the job is deleted without running, as PBS does with afterok dependencies that cannot be satisfied.
+    
+    while True:
+        dependencies = [_ReadJob(dependency) for dependency in job['Dependencies']];
+        
+        if any(status != 0 for dependency in dependencies for status in dependency['ExitStatuses'].values()):
+            job['States'] = dict((key, "F") for key in job['States']);
+            _WriteJob(job);
+            
+            return;
+        
+        if all(state == "F" for dependency in dependencies for state in dependency['States'].values()):
+            break;
+        
+        time.sleep(0.2);
+    
+    # The array parent is listed as "B" (begun) while its subjobs run.
+    
+    for key in sorted(job['States'], key = int):
+        environment = dict(os.environ, PBS_JOBID = "{0}.{1}".format(jobID, _ServerName), PBS_JOBNAME = job['Name'], PBS_O_WORKDIR = job['SubmitDir']);
+        
+        logFile = "{0}.o{1}".format(job['Name'], jobID);
+        
+        if key != "-1":
+            environment.update({ 'PBS_JOBID' : "{0}[{1}].{2}".format(jobID, key, _ServerName), 'PBS_ARRAY_ID' : "{0}[].{1}".format(jobID, _ServerName), 'PBS_ARRAY_INDEX' : key });
+            
+            logFile = "{0}.{1}".format(logFile, key);
+        
+        job['States'][key] = "R";
+        _WriteJob(job);
+        
+        # As with "-j oe", the standard error is merged into the log; like PBS, jobs are started in the home directory (here, the submit directory).
+        
+        with open(os.path.join(job['OutputDir'], logFile), 'w') as outputWriter:
+            status = subprocess.call(["sh", job['Script']], cwd = job['SubmitDir'], env = environment, stdout = outputWriter, stderr = subprocess.STDOUT);
+        
+        job['States'][key] = "F";
+        job['ExitStatuses'][key] = status;
+        _WriteJob(job);
+
+def _QStat(args):
+    # Always prints the alternate layout of "qstat -t -u <user>", listing the subjobs of job arrays along with their parents; finished jobs are left out, apart from subjobs of arrays that are still running, which are shown as "X".
+    
+    if not os.path.isdir(_GetStateDir()):
+        return;
+    
+    user = getpass.getuser();
+    
+    rows = [];
+    
+    for fileName in sorted(os.listdir(_GetStateDir())):
+        if not fileName.endswith(".json"):
+            continue;
+        
+        job = _ReadJob(fileName[:-len(".json")]);
+        
+        states = job['States'];
+        
+        if all(state == "F" for state in states.values()):
+            continue;
+        
+        if job['ArrayIndices'] == None:
+            rows.append(("{0}.{1}".format(job['ID'], _ServerName), job['Name'], states["-1"]));
+        else:
+            rows.append(("{0}[].{1}".format(job['ID'], _ServerName), job['Name'], "B" if any(state != "Q" for state in states.values()) else "Q"));
+            
+            for key in sorted(states, key = int):
+                rows.append(("{0}[{1}].{2}".format(job['ID'], key, _ServerName), job['Name'], "X" if states[key] == "F" else states[key]));
+    
+    if len(rows) == 0:
+        return;
+    
+    print("");
+    print("{0}:".format(_ServerName));
+    print("{0:<60} Req'd  Req'd   Elap".format(""));
+    print("Job ID          Username Queue    Jobname    SessID NDS TSK Memory Time  S Time");
+    print("--------------- -------- -------- ---------- ------ --- --- ------ ----- - -----");
+    
+    for jobID, name, state in rows:
+        print("{0:<15} {1:<8} {2:<8} {3:<10} {4:>6} {5:>3} {6:>3} {7:>6} {8:>5} {9} {10:>5}".format(
+            jobID, user[:8], "workq", name[:10], "--" if state in ("Q", "B", "X") else "1234", 1, 1, "--", "--", state, "--"
+            ));
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("qsub", "qstat", "run"):
+        print("Usage: python FakePBS.py qsub|qstat [options]");
+        sys.exit(1);
+    
+    command, args = sys.argv[1], sys.argv[2:];
+    
+    if command == "qsub":
+        _QSub(args);
+    elif command == "qstat":
+        _QStat(args);
+    else:
+        _Run(args[0]);
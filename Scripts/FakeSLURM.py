@@ -0,0 +1,162 @@
+# FakeSLURM.py by J. M. Skelton
+
+
+# Minimal stand-ins for the SLURM sbatch and squeue commands, for testing the batch-system support in CPUTest.py and GPUTest.py (see BatchCommands) on a machine without a batch system.
+# Jobs are run on the local machine in the background, one job-array task at a time, with the SLURM_* environment variables set as by SLURM; afterok dependencies are honoured, and jobs whose dependencies fail are cancelled.
+# The state of the jobs is kept in the directory set by the FAKE_SLURM_DIR environment variable (default: ".fakeslurm" in the current directory).
+
+# Usage: python FakeSLURM.py sbatch [--parsable] [--dependency=afterok:<id>[:<id>...]] [--kill-on-invalid-dep=yes] <script>
+#        python FakeSLURM.py squeue [-h] [-r] [-o <format>] [-u <user>]
+
+
+import json;
+import os;
+import subprocess;
+import sys;
+import time;
+
+from Execution import NewSessionArguments;
+
+
+def _GetStateDir():
+    return os.path.abspath(os.environ.get("FAKE_SLURM_DIR", ".fakeslurm"));
+
+def _GetJobFile(jobID):
+    return os.path.join(_GetStateDir(), "{0}.json".format(jobID));
+
+def _ReadJob(jobID):
+    with open(_GetJobFile(jobID), 'r') as inputReader:
+        return json.load(inputReader);
+
+def _WriteJob(job):
+    jobFile = _GetJobFile(job['ID']);
+    
+    with open("{0}.tmp".format(jobFile), 'w') as outputWriter:
+        json.dump(job, outputWriter);
+    
+    os.rename("{0}.tmp".format(jobFile), jobFile);
+
+def _GetNextJobID():
+    counterFile = os.path.join(_GetStateDir(), "NextJobID");
+    
+    jobID = 1000;
+    
+    if os.path.isfile(counterFile):
+        with open(counterFile, 'r') as inputReader:
+            jobID = int(inputReader.read());
+    
+    with open(counterFile, 'w') as outputWriter:
+        outputWriter.write("{0}\n".format(jobID + 1));
+    
+    return str(jobID);
+
+def _SBatch(args):
+    dependencies = [];
+    
+    for arg in args[:-1]:
+        if arg.startswith("--dependency=afterok:"):
+            dependencies = arg[len("--dependency=afterok:"):].split(':');
+    
+    scriptFile = os.path.abspath(args[-1]);
+    
+    # Read the array size and output file from the #SBATCH directives.
+    
+    arrayIndices, outputFile = None, "slurm-%j.out";
+    
+    with open(scriptFile, 'r') as inputReader:
+        for line in inputReader:
+            if line.startswith("#SBATCH --array="):
+                first, last = line.strip()[len("#SBATCH --array="):].split('-');
+                arrayIndices = list(range(int(first), int(last) + 1));
+            elif line.startswith("#SBATCH --output="):
+                outputFile = line.strip()[len("#SBATCH --output="):];
+    
+    if not os.path.isdir(_GetStateDir()):
+        os.makedirs(_GetStateDir());
+    
+    jobID = _GetNextJobID();
+    
+    _WriteJob({
+        'ID' : jobID, 'Script' : scriptFile, 'SubmitDir' : os.getcwd(), 'Dependencies' : dependencies,
+        'ArrayIndices' : arrayIndices, 'OutputFile' : outputFile,
+        'States' : dict((str(i), "PENDING") for i in (arrayIndices if arrayIndices != None else [-1]))
+        });
+    
+    with open(os.devnull, 'w') as devNull:
+        subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "run", jobID], env = dict(os.environ, FAKE_SLURM_DIR = _GetStateDir()),
+            stdout = devNull, stderr = devNull, **NewSessionArguments
+            );
+    
+    print(jobID);
+
+def _Run(jobID):
+    job = _ReadJob(jobID);
+    
+    # Wait for the dependencies; if any of them fail, cancel the job (as with --kill-on-invalid-dep=yes).
+    
+    while True:
+        states = [state for dependency in job['Dependencies'] for state in _ReadJob(dependency)['States'].values()];
+        
+        if any(state in ("FAILED", "CANCELLED") for state in states):
+            job['States'] = dict((key, "CANCELLED") for key in job['States']);
+            _WriteJob(job);
+            
+            return;
+        
+        if all(state == "COMPLETED" for state in states):
+            break;
+        
+        time.sleep(0.2);
+    
+    for key in sorted(job['States'], key = int):
+        environment = dict(os.environ, SLURM_JOB_ID = jobID, SLURM_SUBMIT_DIR = job['SubmitDir']);
+        
+        outputFile = job['OutputFile'].replace("%j", jobID);
+        
+        if key != "-1":
+            environment.update({ 'SLURM_ARRAY_JOB_ID' : jobID, 'SLURM_ARRAY_TASK_ID' : key });
+            
+            outputFile = outputFile.replace("%A", jobID).replace("%a", key);
+        
+        job['States'][key] = "RUNNING";
+        _WriteJob(job);
+        
+        with open(os.path.join(job['SubmitDir'], outputFile), 'w') as outputWriter:
+            status = subprocess.call(["sh", job['Script']], cwd = job['SubmitDir'], env = environment, stdout = outputWriter, stderr = subprocess.STDOUT);
+        
+        job['States'][key] = "COMPLETED" if status == 0 else "FAILED";
+        _WriteJob(job);
+
+def _SQueue(args):
+    # Always prints "%i %T" (job ID and state) for each pending or running job (or array task), without a header, as with "squeue -h -r -o "%i %T"".
+    
+    if not os.path.isdir(_GetStateDir()):
+        return;
+    
+    for fileName in sorted(os.listdir(_GetStateDir())):
+        if not fileName.endswith(".json"):
+            continue;
+        
+        job = _ReadJob(fileName[:-len(".json")]);
+        
+        for key in sorted(job['States'], key = int):
+            state = job['States'][key];
+            
+            if state in ("PENDING", "RUNNING"):
+                print("{0} {1}".format(job['ID'] if key == "-1" else "{0}_{1}".format(job['ID'], key), state));
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("sbatch", "squeue", "run"):
+        print("Usage: python FakeSLURM.py sbatch|squeue [options]");
+        sys.exit(1);
+    
+    command, args = sys.argv[1], sys.argv[2:];
+    
+    if command == "sbatch":
+        _SBatch(args);
+    elif command == "squeue":
+        _SQueue(args);
+    else:
+        _Run(args[0]);
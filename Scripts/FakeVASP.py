@@ -0,0 +1,320 @@
+# FakeVASP.py by J. M. Skelton
+
+
+# A stand-in for VASP, for testing CPUTest.py and GPUTest.py end to end on a machine without VASP (see SimulateVASPTimeScale).
+# Reads the INCAR and POSCAR files in the current directory, estimates t_SCF and the number of SCF steps with a Planner.TimingModel, and writes OUTCAR and OSZICAR files in the format written by VASP as the "calculation" progresses, so the progress monitor, early stopping and result collection can all be tested.
+# The simulated run takes the modelled time multiplied by --time_scale, while the times in the OUTCAR are the modelled ones, so the results do not depend on the time scale.
+# As VASP, the run stops after the current SCF step if a STOPCAR with LABORT = .TRUE. is written, and fails if NPAR or KPAR do not divide the number of processes.
+
+# Usage: python FakeVASP.py [--device cpu|gpu] [--nproc <nproc>] [--gpus <num_gpus>] [--time_scale <scale>] [options]
+
+# For example, in CPUTest.py:
+#   VASPRunCommand = "python /path/to/FakeVASP.py --nproc <nproc> --time_scale 0.01";
+
+
+import argparse;
+import math;
+import os;
+import random;
+import sys;
+import time;
+
+from Planner import DefaultGPUSpeedup, DefaultNumSCFSteps, DefaultReferenceTSCF, TimingModel;
+from ResultStore import GetNumAtoms;
+from Shared import ReadINCARTags;
+
+
+# Total energy per atom, from the GeTe benchmarks (E0 = -161.24335 eV for GeTe-64), and the energy of the first SCF step relative to the converged energy.
+
+_EnergyPerAtom = -161.24335 / 64.0;
+
+_InitialEnergyPerAtom = 66.4;
+
+# Factor by which the error in the energy falls with each SCF step.
+
+_ConvergenceRate = 0.35;
+
+# Fractions of t_SCF taken by the routines whose timings VASP prints for each SCF step.
+
+_SCFRoutineFractions = [("POTLOK", 0.08), ("SETDIJ", 0.002), ("EDDAV", 0.85), ("DOS", 0.001)];
+
+# Memory usage of rank 0, and of the busiest process, in kB: a fixed overhead plus an amount per atom.
+
+_BaseMemory = 50000.0;
+_MemoryPerAtom = 800.0;
+
+
+def _FormatFortranFloat(value, numDigits):
+    # Formats value as Fortran's Ew.d edit descriptor does, e.g. " 0.425081442009E+04" or "-0.161243360000E+03".
+    
+    if value == 0.0:
+        return " 0.{0}E+00".format("0" * numDigits);
+    
+    exponent = int(math.floor(math.log10(abs(value)))) + 1;
+    
+    mantissa = "{0:.{1}f}".format(abs(value) / 10.0 ** exponent, numDigits);
+    
+    # Rounding can give a mantissa of 1.0.
+    
+    if mantissa.startswith("1"):
+        exponent = exponent + 1;
+        mantissa = "{0:.{1}f}".format(abs(value) / 10.0 ** exponent, numDigits);
+    
+    return "{0}{1}E{2:+03d}".format("-" if value < 0.0 else " ", mantissa, exponent);
+
+def _FormatShortFortranFloat(value, numDigits):
+    # As _FormatFortranFloat(), but without the leading zero, as in the energies printed at the end of each ionic step in the OSZICAR, e.g. "-.16124336E+03".
+    
+    return _FormatFortranFloat(value, numDigits).replace("0.", ".", 1).strip();
+
+def _GetNumGPUs(args):
+    # Number of GPUs used by the job: the number of devices the job was bound to (see Launcher.WriteLaunchScripts()) or can see, or else --gpus.
+    
+    for variable in 'BIND_GPU_DEVICES', 'CUDA_VISIBLE_DEVICES':
+        devices = [device for device in os.environ.get(variable, "").split(',') if device.strip() != ""];
+        
+        if len(devices) > 0:
+            return len(devices);
+    
+    return args.NumGPUs;
+
+def _CheckDivisibility(numProcesses, tags):
+    # Returns the error VASP prints if the processes cannot be divided between the k-point groups (KPAR) and the band groups (NPAR), or None if they can.
+    
+    kpar, npar = int(tags.get("KPAR", "1")), int(tags.get("NPAR", "1"));
+    
+    if numProcesses % kpar != 0:
+        return " M_divide: can not subdivide {0:12d} nodes by {1:12d}".format(numProcesses, kpar);
+    
+    if (numProcesses // kpar) % npar != 0:
+        return " M_divide: can not subdivide {0:12d} nodes by {1:12d}".format(numProcesses // kpar, npar);
+    
+    return None;
+
+def _IsStopRequested():
+    if not os.path.isfile("STOPCAR"):
+        return False;
+    
+    return ReadINCARTags("STOPCAR").get("LABORT", "").upper().strip('.') in ("TRUE", "T");
+
+def _GetOUTCARHeader(numProcesses, numGPUs, numThreads, tags):
+    kpar = int(tags.get("KPAR", "1"));
+    npar = int(tags.get("NPAR", str(numProcesses // kpar)));
+    
+    lines = [
+        " vasp.5.4.4.18Apr17-6-g9f103f2a35 (build Jan 01 2020 12:00:00) complex",
+        "",
+        " executed on             LinuxIFC date {0}".format(time.strftime("%Y.%m.%d  %H:%M:%S")),
+        " running on {0:4d} total cores".format(numProcesses),
+        " distrk:  each k-point on {0:4d} cores, {1:4d} groups".format(numProcesses // kpar, kpar),
+        " distr:  one band on NCORE= {0:4d} cores, {1:4d} groups".format(max(numProcesses // kpar // npar, 1), npar)
+        ];
+    
+    if numThreads != None:
+        lines.append(" OpenMP threads per MPI process: {0:4d}".format(numThreads));
+    
+    if numGPUs > 0:
+        lines.append(" Using {0} GPU(s)".format(numGPUs));
+    
+    lines = lines + [
+        "",
+        " --------------------------------------------------------------------------------------------------------",
+        ""
+        ];
+    
+    return "\n".join(lines) + "\n";
+
+def _GetOUTCARSCFBlock(step, tSCF, energy):
+    lines = [
+        "----------------------------------------- Iteration    1({0:4d})  ---------------------------------------".format(step),
+        ""
+        ];
+    
+    for routine, fraction in _SCFRoutineFractions:
+        lines.append("    {0}:  cpu time {1:11.4f}: real time {2:11.4f}".format(routine, tSCF * fraction * 0.99, tSCF * fraction));
+    
+    lines = lines + [
+        "",
+        "  free energy    TOTEN  = {0:18.8f} eV".format(energy),
+        "",
+        "      LOOP:  cpu time {0:11.4f}: real time {1:11.4f}".format(tSCF * 0.99, tSCF),
+        ""
+        ];
+    
+    return "\n".join(lines) + "\n";
+
+def _GetOUTCARFooter(tTotal, tLoop, memory):
+    lines = [
+        "     LOOP+:  cpu time {0:11.4f}: real time {1:11.4f}".format(tLoop * 0.99, tLoop),
+        "",
+        " total amount of memory used by VASP MPI-rank0 {0:11.0f}. kBytes".format(memory),
+        "",
+        "",
+        " General timing and accounting informations for this job:",
+        " ========================================================",
+        "",
+        "                  Total CPU time used (sec): {0:14.3f}".format(tTotal * 0.99),
+        "                            User time (sec): {0:14.3f}".format(tTotal * 0.97),
+        "                          System time (sec): {0:14.3f}".format(tTotal * 0.02),
+        "                         Elapsed time (sec): {0:14.3f}".format(tTotal),
+        "",
+        "                   Maximum memory used (kb): {0:14.0f}.".format(memory * 1.5),
+        "                   Average memory used (kb): {0:14.0f}.".format(memory),
+        ""
+        ];
+    
+    return "\n".join(lines) + "\n";
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Simulate a VASP run in the current directory, writing OUTCAR and OSZICAR files with timings from a simple performance model.");
+    
+    parser.set_defaults(
+        Device = "cpu",
+        NumProcesses = int(os.environ.get('OMPI_COMM_WORLD_SIZE', "1")),
+        NumGPUs = 1,
+        TimeScale = 0.01,
+        ReferenceTSCF = DefaultReferenceTSCF,
+        NumSCFSteps = DefaultNumSCFSteps,
+        GPUSpeedup = DefaultGPUSpeedup,
+        Noise = 0.02
+        );
+    
+    parser.add_argument(
+        "--device",
+        type = str, dest = 'Device', choices = ["cpu", "gpu"],
+        help = "simulate the CPU or GPU version of VASP (default: cpu)"
+        );
+    
+    parser.add_argument(
+        "--nproc",
+        type = int, dest = 'NumProcesses',
+        help = "number of MPI processes (default: the size of the Open MPI job, if run under mpirun, otherwise 1)"
+        );
+    
+    parser.add_argument(
+        "--gpus",
+        type = int, dest = 'NumGPUs',
+        help = "number of GPUs for --device gpu, if not set by BIND_GPU_DEVICES or CUDA_VISIBLE_DEVICES (default: 1)"
+        );
+    
+    parser.add_argument(
+        "--time_scale",
+        type = float, dest = 'TimeScale',
+        help = "ratio of the real run time to the modelled one (default: 0.01)"
+        );
+    
+    parser.add_argument(
+        "--reference_tscf",
+        type = float, dest = 'ReferenceTSCF',
+        help = "modelled t_SCF of a 64-atom system on one core, in seconds (default: {0})".format(DefaultReferenceTSCF)
+        );
+    
+    parser.add_argument(
+        "--scf_steps",
+        type = int, dest = 'NumSCFSteps',
+        help = "number of SCF steps to converge, if not set by NELM/NELMIN (default: {0})".format(DefaultNumSCFSteps)
+        );
+    
+    parser.add_argument(
+        "--gpu_speedup",
+        type = float, dest = 'GPUSpeedup',
+        help = "throughput of one GPU relative to one core (default: {0})".format(DefaultGPUSpeedup)
+        );
+    
+    parser.add_argument(
+        "--noise",
+        type = float, dest = 'Noise',
+        help = "relative standard deviation of the SCF step times (default: 0.02)"
+        );
+    
+    args = parser.parse_args();
+    
+    tags = ReadINCARTags("INCAR");
+    
+    numAtoms = GetNumAtoms("POSCAR");
+    
+    numThreads = int(os.environ['OMP_NUM_THREADS']) if 'OMP_NUM_THREADS' in os.environ else None;
+    
+    numGPUs = _GetNumGPUs(args) if args.Device == "gpu" else 0;
+    
+    useMPS = 'CUDA_MPS_PIPE_DIRECTORY' in os.environ;
+    
+    print(" running on {0:4d} total cores".format(args.NumProcesses));
+    
+    message = _CheckDivisibility(args.NumProcesses, tags);
+    
+    if message != None:
+        print(message);
+        sys.exit(1);
+    
+    model = TimingModel(referenceTSCF = args.ReferenceTSCF, numSCFSteps = args.NumSCFSteps, gpuSpeedup = args.GPUSpeedup);
+    
+    tSCF = model.GetTSCF(numAtoms, args.NumProcesses, tags, numThreads = numThreads, numGPUs = numGPUs, useMPS = useMPS);
+    
+    numSCFSteps = model.GetNumSCFSteps(tags);
+    
+    energy = _EnergyPerAtom * numAtoms;
+    
+    # The setup (reading the inputs, initialising the wavefunctions, etc.) takes the difference between t_Elapsed and the SCF steps.
+    
+    tSetup = model.GetTElapsed(tSCF, 0);
+    
+    time.sleep(tSetup * args.TimeScale);
+    
+    tLoop = tSetup;
+    
+    with open("OUTCAR", 'w') as outcarWriter, open("OSZICAR", 'w') as oszicarWriter:
+        outcarWriter.write(_GetOUTCARHeader(args.NumProcesses, numGPUs, numThreads, tags));
+        outcarWriter.flush();
+        
+        error = _InitialEnergyPerAtom * numAtoms;
+        
+        for step in range(1, numSCFSteps + 1):
+            tStep = tSCF * max(random.gauss(1.0, args.Noise), 0.1);
+            
+            time.sleep(tStep * args.TimeScale);
+            
+            tLoop = tLoop + tStep;
+            
+            newError = error * _ConvergenceRate;
+            
+            outcarWriter.write(_GetOUTCARSCFBlock(step, tStep, energy + newError));
+            outcarWriter.flush();
+            
+            oszicarWriter.write("DAV: {0:3d}    {1}   {2}   {3}  {4:5d}   {5}\n".format(
+                step, _FormatFortranFloat(energy + newError, 12), _FormatFortranFloat(newError - error, 5), _FormatFortranFloat((newError - error) * 0.1, 5),
+                numAtoms * 16, _FormatFortranFloat(abs(newError) ** 0.5, 3)
+                ));
+            
+            oszicarWriter.flush();
+            
+            print("DAV: {0:3d}    {1}".format(step, _FormatFortranFloat(energy + newError, 12)));
+            
+            error = newError;
+            
+            if _IsStopRequested():
+                break;
+        
+        oszicarWriter.write("   1 F= {0} E0= {1}  d E ={2}\n".format(
+            _FormatShortFortranFloat(energy + error, 8), _FormatShortFortranFloat(energy + error * 0.5, 8), _FormatShortFortranFloat(energy + error, 6)
+            ));
+        
+        memory = _BaseMemory + _MemoryPerAtom * numAtoms;
+        
+        outcarWriter.write(_GetOUTCARFooter(tLoop, tLoop - tSetup, memory));
+    
+    # Other outputs, so that the archive and staging options can be tested.
+    
+    with open("vasprun.xml", 'w') as outputWriter:
+        outputWriter.write("<?xml version=\"1.0\" encoding=\"ISO-8859-1\"?>\n<modeling>\n <calculation>\n");
+        outputWriter.write("  <time name=\"totalsc\">{0:8.2f} {1:8.2f}</time>\n".format(tLoop * 0.99, tLoop));
+        outputWriter.write(" </calculation>\n</modeling>\n");
+    
+    with open("POSCAR", 'r') as inputReader, open("CONTCAR", 'w') as outputWriter:
+        outputWriter.write(inputReader.read());
+    
+    with open("WAVECAR", 'wb') as outputWriter:
+        outputWriter.write(b"\0" * (64 * 1024));
+    
+    print("   1 F= {0} E0= {1}".format(_FormatShortFortranFloat(energy + error, 8), _FormatShortFortranFloat(energy + error * 0.5, 8)));
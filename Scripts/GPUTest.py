@@ -9,7 +9,24 @@ TestNumProcesses = [1, 2, 4, 8, 12, 16];
 
 TestNSIMValues = [1, 2, 4, 8, 12, 16, 24, 32, 48, 64];
 
-# Temporary directory to run VASP jobs.
+# Other INCAR tags to test, as a list of (tag, values) pairs, e.g. [("LPLANE", [".TRUE.", ".FALSE."])].
+# If more than one value is given for a tag, the lower-case tag name (e.g. "<lplane>") must appear in ArchiveDirName.
+
+TestExtraTags = [];
+
+# GPU sharing settings to test: the number of MPI processes sharing each GPU, whether the processes share the GPUs through the CUDA Multi-Process Service (MPS), and the number of OpenMP threads per process, e.g. [1, 2, 4], [False, True] and [1, 2].
+# If set to None, the setting is not tested: the processes share the GPUs in PoolGPUIDs/GPUsPerJob, MPS is not used, and OMP_NUM_THREADS is inherited from the environment.
+# If TestRanksPerGPU is set, each test uses # proc / ranks-per-GPU GPUs (rather than GPUsPerJob), and numbers of processes that are not divisible by it, or need more GPUs than in PoolGPUIDs, are skipped.
+# Each process is allocated TestOMPThreads cores from the resource pool (see PoolCoresPerNode) or the batch system.
+# As for TestExtraTags, the placeholders "<ranks_per_gpu>", "<mps>" and "<omp_num_threads>" must appear in ArchiveDirName for settings with more than one value.
+
+TestRanksPerGPU = None;
+
+TestMPS = None;
+
+TestOMPThreads = None;
+
+# Temporary directory to run VASP jobs; each job is run in its own subdirectory.
 # ** The script needs to overwrite the contents of this directory, and will therefore crash if it exists when it starts [better safe than sorry, right?] **
 
 RunDir = "Tmp";
@@ -21,62 +38,327 @@ TargetKPARValues = [1, 2, 4];
 
 # Command to execute VASP.
 # The string "<nproc>" must be present, and will be substituted with the number of MPI processes.
+# If the string "<bind>" is present, it is substituted with a wrapper that binds each MPI process to one of the job's GPUs, in order, e.g. "mpirun -np <nproc> <bind> vasp_gpu"; otherwise, every process sees all the job's GPUs.
+# Tests with GPU sharing settings (TestRanksPerGPU, TestMPS or TestOMPThreads) are run through a "Launch.sh" script written to the job directory, which sets OMP_NUM_THREADS, starts and stops the MPS daemon and then runs VASPRunCommand.
 
 VASPRunCommand = "mpirun -np <nproc> ~/scratch/VASP/vasp.5.4.1.gpu/bin/vasp_gpu";
 
+# Command used to start ("-d") and stop (by writing "quit" to its input) the MPS control daemon for tests with MPS enabled; the daemon is run with a separate pipe directory for each test, and its logs are written to "MPS-Log" in the job directory.
+# MPS is only started on the node running the launch script, so tests with MPS should not span more than one node.
+# FakeLauncher.py can be used to test a setup on a machine without GPUs: set MPSControlCommand to "python /path/to/FakeLauncher.py mps-control" and replace mpirun in VASPRunCommand with "python /path/to/FakeLauncher.py mpirun".
+
+MPSControlCommand = "nvidia-cuda-mps-control";
+
+# Resources available for running jobs concurrently.
+# PoolCoresPerNode is the number of cores on each node; PoolGPUIDs is a list of the GPU device IDs on each node, and each job is bound to GPUsPerJob of them by setting CUDA_VISIBLE_DEVICES.
+# Jobs are only run concurrently if both PoolCoresPerNode and PoolGPUIDs are set; otherwise, jobs are run one at a time, so that they do not compete for the same GPUs.
+# If PoolGPUIDs is set to None, CUDA_VISIBLE_DEVICES is not set and every job can see all the GPUs on the node.
+# PoolNodes is a list of host names to run jobs on; if set to None, all jobs are run on the current node.
+# If PoolNodes is set, the string "<host>" in VASPRunCommand will be substituted with the node a job is assigned to.
+
+PoolCoresPerNode = None;
+
+PoolGPUIDs = None;
+
+GPUsPerJob = 1;
+
+PoolNodes = None;
+
+# Batch system to submit the tests to, rather than running them in the current job: "slurm" or "pbs"; if set to None, the tests are run directly on the resources set by the Pool* parameters.
+# Each test is submitted as a separate batch job (or job-array task) requesting the number of MPI processes in the test and GPUsPerJob GPUs; the script waits for the jobs to finish and then collects the results as usual.
+# EarlyStopTolerance, TelemetryInterval, WallTimeLimit and IdleTimeout are not used for tests run through the batch system.
+
+BatchSystem = None;
+
+# Number of cores per node, used to work out how many nodes to request for each test.
+
+BatchCoresPerNode = 16;
+
+# Wall time limit for each test.
+
+BatchWallTime = "6:00:00";
+
+# Extra batch directives for each test, e.g. ["--partition=batch-acc", "--account=free"] for SLURM or ["-q batch"] for PBS.
+
+BatchDirectives = [];
+
+# Commands run at the start of each batch job, e.g. to load modules: ["module load openmpi/intel/1.8.4"].
+
+BatchSetupCommands = [];
+
+# If True, tests needing the same resources are submitted as job arrays; otherwise, each test is submitted as a separate job.
+# If AbortNSIMLoopOnFirstFail is True, the tests for each number of MPI processes are always submitted as separate jobs chained with dependencies, so a failure cancels the rest (job arrays cannot be stopped part way through).
+
+BatchUseArrays = True;
+
+# Interval (in seconds) at which to check the queue for finished jobs.
+
+BatchPollInterval = 60.0;
+
+# Commands used to submit and query jobs, as a (submit, query) tuple; if set to None, the defaults for BatchSystem are used ("sbatch"/"squeue" or "qsub"/"qstat").
+# FakeSLURM.py and FakePBS.py can be used to test a setup without a batch system: ("python FakeSLURM.py sbatch", "python FakeSLURM.py squeue") or ("python FakePBS.py qsub", "python FakePBS.py qstat").
+
+BatchCommands = None;
+
+# File to record the state of submitted jobs in; if the script is restarted, jobs that were already submitted are waited for rather than submitted again.
+
+BatchStateFile = "GPUTest-Batch.json";
+
 # Name of archive directories to store completed jobs.
 # The strings "<nproc>" and "<nsim>" must be present, and will be substituted with the number of MPI processes and the value of NSIM, respectively.
 # Optionally, the strings "<kpar>" and "<npar>" may be present, and will be replaced by the values of KPAR and NPAR.
 
 ArchiveDirName = "GPUTest-<nproc>-<nsim>";
 
-# If True, abort the loop over values of NSIM for a given number of MPI processes the first time a non-zero exit code is encountered.
+# Ways of staging the KPOINTS, POSCAR and POTCAR files into the job directories, in order of preference: "hardlink", "reflink" (a copy-on-write clone, e.g. on Btrfs or XFS), "symlink" and "copy".
+# The files are copied if none of the others work (e.g. hard links across filesystems); set to ["copy"] to always copy them.
+# ** Links share the input files between the jobs, so these should not be modified while the tests are running **
+
+StagingModes = ["hardlink", "reflink", "symlink", "copy"];
+
+# If RunDir is on a different filesystem to the input files (e.g. a scratch filesystem), setting StagingCacheDir to a directory on the same filesystem as RunDir copies the input files there once and links the job files to the copies.
+
+StagingCacheDir = None;
+
+# Files to keep in the archive directories, e.g. ["INCAR", "OUTCAR", "OSZICAR", "vasprun.xml"]; the files needed to collect the results are always kept.
+# If set to None, the whole job directory is kept.
+
+ArchiveFiles = None;
+
+# If set to "gz", "bz2", "xz" (Python 3 only) or "zst" (requires the zstandard module or the zstd command), compress the files kept in the archive directories; the results are collected from the compressed files.
+
+ArchiveCompression = None;
+
+# If True, abort the loop over values of NSIM for a given number of MPI processes the first time a test fails (after any retries; see MaxRetries).
+# In this case, the NSIM values for a given number of MPI processes are run one after the other, and only jobs with different numbers of processes are run concurrently.
 
 AbortNSIMLoopOnFirstFail = True;
 
+# Failed tests are classified from their output as running out of host or GPU memory, CUDA errors, MPI aborts, crashes, bad KPAR/NPAR values or timeouts (see Failures.py).
+# Tests that fail with a transient error (a CUDA error other than running out of memory, or an MPI abort or lost connection, but not a crash such as a segmentation fault) are rerun up to MaxRetries times (default: 0, i.e. failed tests are not rerun); the output of each failed attempt is kept as "<archive dir>.attempt<N>.out".
+
+MaxRetries = 0;
+
+# If True, skip the tests that are certain to fail after another test has failed: after a test runs out of GPU memory, the same test (with the same number of processes) with larger NSIM and/or more processes sharing each GPU, and after a test fails because KPAR/NPAR do not divide the number of processes, the other tests with the same values and number of processes.
+# Other failures (e.g. running out of host memory, or timeouts) do not cause any tests to be skipped.
+# With PruneFailedTests, AbortNSIMLoopOnFirstFail can be set to False, so the other NSIM values are still tested after e.g. a timeout.
+
+PruneFailedTests = False;
+
+# If True, search for the fastest value of NSIM for each number of MPI processes (and value of any extra tags being tested), rather than testing every value in TestNSIMValues.
+# The search assumes t_SCF varies smoothly with NSIM with a single minimum, and uses a golden-section search over the (sorted) values in TestNSIMValues, typically needing around half the tests.
+# The values that were not tested, and the reason, are written to SkippedOutputFile.
+# AbortNSIMLoopOnFirstFail is ignored; failed tests are treated as being slower than any that succeed.
+
+AdaptiveNSIMSearch = False;
+
+# Path to the output file for tests skipped by the adaptive NSIM search.
+# ** As with DataOutputFile, the script will crash if this file already exists when it starts **
+
+SkippedOutputFile = "GPUTest-Skipped.csv";
+
+# Number of archive directories to collect results from in parallel.
+
+CollectJobs = 8;
+
+# Path to a file used to cache the results collected from archive directories, so that re-collecting results (e.g. with CollectOnly = True) only needs to parse the output files of new or modified jobs.
+# If set to None, the results are always parsed from the output files.
+# Entries are matched to the archive directories by path and by the size and modification time of the OUTCAR and OSZICAR files, not by the VASP binary or the INCAR, so use a separate cache file (or delete it) when re-running tests into the same directories, e.g. "ResultCache.jsonl".
+
+ResultCacheFile = None;
+
+# Maximum number of entries to keep in ResultCacheFile; the least recently used entries are removed first.
+
+ResultCacheMaxEntries = 10000;
+
+# Path to a JSON file the progress of the tests is written to while they are running (the state of each test, the SCF times of running tests and the estimated time remaining), e.g. "GPUTest-Status.json"; set to None to disable.
+# The file is updated every few seconds, and can be viewed with ShowProgress.py.
+
+ProgressStatusFile = None;
+
+# Interval (in seconds) at which to print a progress summary, with the SCF times of running tests and the estimated time remaining, e.g. 60.0; if set to None (the default), no summaries are printed.
+
+ProgressPrintInterval = None;
+
 # If True, skip running tests and collect results from any archive directories found.
 
 CollectOnly = False;
 
+# If True, don't run or collect any tests: print the tests that would be run, those that would be skipped (e.g. because there are not enough GPUs for the number of processes per GPU) and any duplicates, with an estimate of how long each would take, write them to PlanOutputFile, and exit.
+# The estimates come from a simple timing model (see Planner.py) and are only a rough guide; tests removed by AdaptiveNSIMSearch, EarlyStopTolerance or a campaign are not predicted, so the totals are upper bounds.
+
+DryRun = False;
+
+# Path to the output file for DryRun.
+# ** As with DataOutputFile, the script will crash if this file already exists when it starts **
+
+PlanOutputFile = "GPUTest-Plan.csv";
+
+# Parameters of the timing model used by DryRun and SimulateVASPTimeScale: t_SCF (in seconds) of a 64-atom system on one core, which is scaled to the number of atoms in the POSCAR, and the number of SCF steps to converge (if not set by NELM/NELMIN or FixedSCFSteps).
+
+PlanReferenceTSCF = 16.0;
+
+PlanNumSCFSteps = 20;
+
+# Throughput of one GPU, used by one process, relative to one core, for the timing model.
+
+PlanGPUSpeedup = 5.0;
+
+# If set, the tests are run with a simulated VASP (FakeVASP.py) in place of VASPRunCommand (and FakeLauncher.py in place of mpirun and MPSControlCommand), to test the setup end to end on a machine without VASP or GPUs.
+# The simulated VASP writes OUTCAR and OSZICAR files with the times from the timing model, and each test takes SimulateVASPTimeScale times the modelled time (e.g. 0.01).
+
+SimulateVASPTimeScale = None;
+
 # Path to the data output file.
 # ** As the script would overwrite this file, it will crash if it already exists when it starts [again, better safe than sorry...] **
 
 DataOutputFile = "GPUTest.csv";
 
+# If True, the median, standard deviation and minimum SCF time, the average ionic-step time and the memory use reported in the OUTCAR are added to the data output file.
+# The telemetry summary (see TelemetryInterval) is added if telemetry is enabled; the result store (StoreOutputFile) always has all the columns.
+
+DataOutputExtraStatistics = False;
+
+# Path to an output file for the timings of each SCF and ionic step and the breakdown of the time spent in each routine, for all tests, e.g. "GPUTest-Timings.csv"; set to None to disable.
+# ** As with DataOutputFile, the script will crash if this file already exists when it starts **
+
+TimingsOutputFile = None;
+
+# Path to a result store to write the results to, with one row per test, for analysis alongside other benchmarks; set to None to disable.
+# The format is set by the extension: ".npz" (requires NumPy) or ".parquet" (requires PyArrow).
+# The tests are recorded as using GPUsPerJob GPUs (or # proc / ranks-per-GPU if TestRanksPerGPU is set), so this should be set to the number of GPUs visible to each job even if PoolGPUIDs is not set.
+# ** As with DataOutputFile, the script will crash if this file already exists when it starts **
+
+StoreOutputFile = None;
+
+# Name of the system used to label the results in StoreOutputFile; if set to None, the name is made from the POSCAR title line and the number of atoms (e.g. "GeTe-64").
+
+SystemName = None;
+
+# Structures to run a campaign over, as a list of POSCAR files and/or patterns, e.g. ["POSCAR_GeTe-*.vasp"]; if set to None, the tests are run for the structure in POSCAR.
+# The tests are run for each structure in turn, from the smallest to the largest, with the INCAR, KPOINTS and POTCAR files in the current directory.
+# Each structure is run in a directory named after it (e.g. "GeTe-64" for "POSCAR_GeTe-64.vasp"), which holds its archive directories and its DataOutputFile, TimingsOutputFile and SkippedOutputFile; StoreOutputFile contains the results for all the structures.
+# The timings for the smaller structures are used to skip unpromising configurations for the larger ones and to predict how long the tests will take.
+
+CampaignPOSCARFiles = None;
+
+# In a campaign, configurations that failed or gave invalid results for the previous structure are skipped, as are those predicted to have a t_SCF more than CampaignPruneFactor times the fastest; set to None to only skip failed configurations.
+
+CampaignPruneFactor = 3.0;
+
+# If set, configurations predicted to take longer than this (in seconds) are also skipped.
+
+CampaignMaxTestTime = None;
+
+# Path to an output file for the results for all the structures in a campaign.
+# ** As with DataOutputFile, the script will crash if this file already exists when it starts **
+
+CampaignOutputFile = "GPUTest-Campaign.csv";
+
+# Tolerances for checking the results of the tests: the final energy of each test must be within EnergyTolerance eV of the consensus (median) value over all the tests, and the number of SCF steps within SCFStepsTolerance (as a fraction) of the consensus value.
+# Tests that fail the checks are marked as invalid in DataOutputFile and StoreOutputFile, and treated as failed by the adaptive NSIM search; set EnergyTolerance to None to disable the checks, or SCFStepsTolerance to None to only check the energies.
+
+EnergyTolerance = 1.0e-3;
+
+SCFStepsTolerance = 0.5;
+
 # If larger than zero, the first N SCF steps will be ignored when computing the average SCF time.
 # Useful for benchmarking e.g. ALGO = Fast or hybrids, where the first five SCF steps (typically) are very different to the others.
 
 SkipSCFCycles = 5;
 
+# If set, run a fixed workload of SkipSCFCycles + FixedSCFSteps SCF steps in every test, rather than converging the SCF to EDIFF: NELM and NELMIN are set to this number of steps and EDIFF to zero, overriding any values in the INCAR file.
+# Every test then does the same amount of work, so t_Elapsed can be compared between tests, and the cost of each test is capped; the final energies are not converged, but the number of SCF steps is the same for every test.
 
-import commands;
-import csv;
-import os;
+FixedSCFSteps = None;
 
-import shutil;
+# If larger than zero, stop each job once the average SCF time (excluding the first SkipSCFCycles steps) is known to within +/- this fraction of its value at 95 % confidence, e.g. 0.02 = +/- 2 %.
+# Jobs are stopped by writing a STOPCAR with LABORT = .TRUE., and the archive directory is flagged by a file named TRUNCATED.
+# ** t_Elapsed and the final energy from truncated jobs are not comparable to those from complete runs **
 
-from Shared import CollectResults;
+EarlyStopTolerance = 0.0;
 
+# Minimum number of SCF steps (after SkipSCFCycles) to average over before a job can be stopped early.
 
-def _CalculateKPARAndNPAR(numProcesses, targetKPARValues):
-    kparValue = 1;
-    
-    for targetKPAR in sorted(targetKPARValues)[::-1]:
-        if numProcesses % targetKPAR == 0:
-            kparValue = targetKPAR;
-    
-    return (kparValue, numProcesses // kparValue);
+EarlyStopMinSCFSteps = 5;
 
-def _GetArchiveDirName(template, nproc, nsim, kpar, npar):
-    jobDir = template;
-    
-    for find, replace in ("<nproc>", nproc), ("<nsim>", nsim), ("<kpar>", kpar), ("<npar>", npar):
-        jobDir = jobDir.replace(find, str(replace));
-    
-    return jobDir;
+# If set, kill any test that runs for longer than WallTimeLimit seconds, or that writes nothing to its standard output or OUTCAR for IdleTimeout seconds (e.g. a hung vasp_gpu run), so that one test cannot hold up the rest of the sweep.
+# Tests that are killed are sent SIGTERM, followed by SIGKILL KillGracePeriod seconds later, and are recorded as failed with a timeout; IdleTimeout should be set well above the longest expected SCF step.
+
+WallTimeLimit = None;
+IdleTimeout = None;
+
+KillGracePeriod = 30.0;
+
+# If set, sample the CPU utilisation and resident memory (RSS) of the processes in each job every TelemetryInterval seconds, along with the utilisation and memory use of its GPU(s), while it runs.
+# The samples are written to "<archive dir>.telemetry.csv", and the peak memory and mean utilisation are added to DataOutputFile and StoreOutputFile.
+# Only processes on the node running the script are sampled.
+
+TelemetryInterval = None;
+
+# Command used to sample the GPUs; if it is not found, only the CPU and memory usage are recorded.
+
+TelemetryGPUCommand = "nvidia-smi";
+
+
+import os;
+import sys;
+
+from Batch import BatchRunner, GetBatchBackend;
+from Campaign import Campaign, GetSystemPath;
+from Execution import Executor;
+from Monitor import ProgressMonitor;
+from Planner import GetSimulatedVASPCommand, PrintPlanTotals, SweepPlan, TimingModel, WritePlans;
+from ResultStore import CheckStoreFormat, GetNumAtoms, GetSystemName;
+from Scheduler import ResourcePool;
+from Shared import ResultCache;
+from Staging import Stager;
+from Launcher import MPSKey, OMPThreadsKey, RanksPerGPUKey;
+from Sweep import FixedWorkloadTags, GetResultColumns, KPARRule, NumProcessesKey, RanksPerGPUFilter, Sweep;
+from Telemetry import GetGPUProbe, TelemetrySampler;
+from Watcher import EarlyStopWatcher;
 
 
 if __name__ == "__main__":
+    if TestExtraTags == None:
+        TestExtraTags = [];
+    
+    # Timing model for dry runs and simulated runs.
+    
+    timingModel = TimingModel(referenceTSCF = PlanReferenceTSCF, numSCFSteps = PlanNumSCFSteps, gpuSpeedup = PlanGPUSpeedup, numGPUs = GPUsPerJob);
+    
+    if SimulateVASPTimeScale != None:
+        VASPRunCommand, MPSControlCommand = GetSimulatedVASPCommand(SimulateVASPTimeScale, timingModel);
+        
+        print("Simulating VASP with: {0}".format(VASPRunCommand));
+        print("");
+    
+    # The GPU sharing settings are swept along with the INCAR tags, but set how the jobs are launched (see Launcher.py).
+    
+    launchParameters = [(name, values) for name, values in [(RanksPerGPUKey, TestRanksPerGPU), (MPSKey, TestMPS), (OMPThreadsKey, TestOMPThreads)] if values != None];
+    
+    # In campaign mode, a sweep is run for each system in its own directory; otherwise, systems is [None] and the sweep is run in the current directory.
+    
+    campaign = None;
+    
+    if CampaignPOSCARFiles != None:
+        campaign = Campaign(CampaignPOSCARFiles, pruneFactor = CampaignPruneFactor, maxTestTime = CampaignMaxTestTime);
+    
+    systems = campaign.Systems if campaign != None else [None];
+    
+    fixedTags = FixedWorkloadTags(FixedSCFSteps, skipSCFCycles = SkipSCFCycles) if FixedSCFSteps != None else None;
+    
+    sweeps = [
+        Sweep(
+            [(NumProcessesKey, TestNumProcesses), ("NSIM", TestNSIMValues)] + launchParameters + TestExtraTags,
+            GetSystemPath(system, ArchiveDirName), "GPUTest.py", rules = [KPARRule(TargetKPARValues)],
+            filters = [RanksPerGPUFilter(maxGPUs = len(PoolGPUIDs) if PoolGPUIDs != None and BatchSystem == None else None)],
+            inputDir = system.Directory if system != None else ".", numAtoms = system.NumAtoms if system != None else None,
+            fixedTags = fixedTags, mpsControlCommand = MPSControlCommand
+            )
+            for system in systems
+        ];
+    
     # Startup checks.
     
     # ArchiveDirName is required regardless of CollectOnly.
@@ -84,142 +366,200 @@ if __name__ == "__main__":
     if "<nproc>" not in ArchiveDirName or "<nsim>" not in ArchiveDirName:
         raise Exception("Error: The strings \"<nproc>\" and \"<nsim>\" must appear in ArchiveDirName.");
     
-    # DataOutputFile must not exist regardless of CollectOnly.
+    # Resources for running the tests, which are also used to estimate the wall time in a dry run.
+    # Without a core count and GPU IDs to bind the jobs to, concurrent jobs would share the GPUs and the timings would be meaningless, so the jobs are run one at a time.
     
-    if os.path.isfile(DataOutputFile):
-        raise Exception("Error: DataOutputFile \"{0}\" already exists - please rename/delete and run again.".format(DataOutputFile));
+    pool = ResourcePool(
+        PoolCoresPerNode if PoolCoresPerNode != None else max(TestNumProcesses) * (max(TestOMPThreads) if TestOMPThreads != None else 1), gpuIDs = PoolGPUIDs, nodes = PoolNodes,
+        maxJobs = 1 if PoolCoresPerNode == None or PoolGPUIDs == None else None
+        );
     
-    if not CollectOnly:
-        # These other checks are only needed if CollectOnly is False.
+    # Batch jobs always request GPUsPerJob GPUs, or # proc / ranks-per-GPU if TestRanksPerGPU is set.
     
-        if os.path.isdir(RunDir):
-            raise Exception("Error: RunDir \"{0}\" already exists - please remove and run again.".format(RunDir));
+    numGPUs = GPUsPerJob if PoolGPUIDs != None or BatchSystem != None else 0;
+    
+    abortParameter = "NSIM" if AbortNSIMLoopOnFirstFail else None;
+    
+    if DryRun:
+        if os.path.isfile(PlanOutputFile):
+            raise Exception("Error: PlanOutputFile \"{0}\" already exists - please rename/delete and run again.".format(PlanOutputFile));
         
-        if "<nproc>" not in VASPRunCommand:
-            raise Exception("Error: The string \"<nproc>\" must appear in VASPRunCommand.");
+        plans = [];
         
-        for vaspInputFile in "INCAR", "KPOINTS", "POSCAR", "POTCAR":
-            if not os.path.isfile(vaspInputFile):
-                raise Exception("Error: Required VASP input file \"{0}\" not found.".format(vaspInputFile));
+        for system, sweep in zip(systems, sweeps):
+            if system != None:
+                name, numAtoms = system.Name, system.NumAtoms;
+            else:
+                name, numAtoms = SystemName if SystemName != None else GetSystemName("POSCAR"), GetNumAtoms("POSCAR");
+            
+            # Check the archive directory names and output files as for a real run; the other checks are on the run setup.
+            
+            sweep.CheckSetup(GetSystemPath(system, DataOutputFile), RunDir, VASPRunCommand, True);
+            
+            # Batch jobs wait in the queue, so the wall time is not estimated for them.
+            
+            plan = SweepPlan(sweep, timingModel, numAtoms, numGPUs = numGPUs, abortParameter = abortParameter, pool = pool if BatchSystem == None else None);
+            
+            plan.Print(name);
+            
+            plans.append((name, plan));
         
-        with open("INCAR", 'r') as inputReader:
-            for line in inputReader:
-                if "KPAR" in line or "NPAR" in line or "NSIM" in line:
-                    raise Exception("Error: INCAR file must not contain the KPAR, NPAR or NSIM control tags - these are set by the script.");
+        PrintPlanTotals(plans, campaign = campaign != None);
+        
+        print("Writing plan to \"{0}\"...".format(PlanOutputFile));
+        
+        WritePlans(PlanOutputFile, plans);
+        
+        sys.exit(0);
     
-    if not CollectOnly:
-        for numProcesses in TestNumProcesses:
-            kparValue, nparValue = _CalculateKPARAndNPAR(numProcesses, TargetKPARValues);
-            
-            for nsimValue in TestNSIMValues:
-                jobDir = _GetArchiveDirName(ArchiveDirName, numProcesses, nsimValue, kparValue, nparValue);
-        
-                if os.path.exists(jobDir):
-                    print("Job dir \"{0}\" (# proc = {1}, NSIM = {2}) already exists -> skipping...".format(jobDir, numProcesses, nsimValue));
-                    print("");
-                    
-                    continue;
-                
-                os.mkdir(RunDir);
-                
-                os.chdir(RunDir);
-                
-                with open("INCAR", 'w') as outputWriter:
-                    with open("../INCAR", 'r') as inputReader:
-                        for line in inputReader:
-                            outputWriter.write(line);
-                    
-                    outputWriter.write("\n");            
-                    
-                    outputWriter.write("! Parameters automatically added by GPUTest.py.\n");
-                    outputWriter.write("\n");
-                    
-                    outputWriter.write("KPAR = {0}\n".format(kparValue));
-                    outputWriter.write("NPAR = {0}\n".format(nparValue));
-                    outputWriter.write("NSIM = {0}\n".format(nsimValue));
-                
-                for vaspInputFile in "KPOINTS", "POSCAR", "POTCAR":
-                    shutil.copy("../{0}".format(vaspInputFile), vaspInputFile);
-                
-                print("Running test with # proc = {0}, NSIM = {1}...".format(numProcesses, nsimValue));
-                
-                status, output = commands.getstatusoutput(
-                    VASPRunCommand.replace("<nproc>", str(numProcesses))
-                    );
-                
-                print("  -> Exit status: {0}".format(status));
-                
-                os.chdir("..");
-                
-                stdOutFile = "{0}.out".format(jobDir);
-                
-                print("  -> Writing std out to \"{0}\"".format(jobDir));
-                
-                with open(stdOutFile, 'w') as outputWriter:
-                    outputWriter.write(output);
-                
-                if status == 0:
-                    print("  -> Renaming run directory to \"{0}\"".format(jobDir));
-                    os.rename(RunDir, jobDir);
-                else:
-                    shutil.rmtree(RunDir);
-                    
-                    if AbortNSIMLoopOnFirstFail:
-                        break;
-                
-                print("");
+    if campaign != None:
+        if os.path.isfile(CampaignOutputFile):
+            raise Exception("Error: CampaignOutputFile \"{0}\" already exists - please rename/delete and run again.".format(CampaignOutputFile));
+        
+        if not CollectOnly:
+            campaign.CheckSetup();
+            campaign.PrepareSystemDirs();
+    
+    for system, sweep in zip(systems, sweeps):
+        sweep.CheckSetup(GetSystemPath(system, DataOutputFile), RunDir, VASPRunCommand, CollectOnly, runDirMayExist = BatchSystem != None and os.path.isfile(BatchStateFile));
+        
+        if TimingsOutputFile != None and os.path.isfile(GetSystemPath(system, TimingsOutputFile)):
+            raise Exception("Error: TimingsOutputFile \"{0}\" already exists - please rename/delete and run again.".format(GetSystemPath(system, TimingsOutputFile)));
+        
+        if (AdaptiveNSIMSearch or campaign != None) and not CollectOnly and os.path.isfile(GetSystemPath(system, SkippedOutputFile)):
+            raise Exception("Error: SkippedOutputFile \"{0}\" already exists - please rename/delete and run again.".format(GetSystemPath(system, SkippedOutputFile)));
     
-    print("Collecting results...");
+    if StoreOutputFile != None:
+        if os.path.isfile(StoreOutputFile):
+            raise Exception("Error: StoreOutputFile \"{0}\" already exists - please rename/delete and run again.".format(StoreOutputFile));
+        
+        CheckStoreFormat(StoreOutputFile);
     
-    data = { };
+    monitor, stager, executor = None, None, None;
     
-    for numProcesses in TestNumProcesses:
-        kparValue, nparValue = _CalculateKPARAndNPAR(numProcesses, TargetKPARValues);
+    if not CollectOnly:
+        watcherFactory = None;
+        
+        if EarlyStopTolerance > 0.0:
+            watcherFactory = lambda runDir: EarlyStopWatcher(
+                runDir, EarlyStopTolerance, skipSCFCycles = SkipSCFCycles, minSCFSteps = EarlyStopMinSCFSteps
+                );
+        
+        samplerFactory = None;
         
-        for nsimValue in TestNSIMValues:
-            jobDir = _GetArchiveDirName(ArchiveDirName, numProcesses, nsimValue, kparValue, nparValue);
+        if TelemetryInterval != None:
+            samplerFactory = lambda runDir, gpuIDs: TelemetrySampler(TelemetryInterval, gpuProbe = GetGPUProbe(TelemetryGPUCommand), gpuIDs = gpuIDs);
+        
+        batch = None;
+        
+        if BatchSystem != None:
+            batch = BatchRunner(
+                GetBatchBackend(BatchSystem, commands = BatchCommands), BatchCoresPerNode, wallTime = BatchWallTime, directives = BatchDirectives,
+                setupCommands = BatchSetupCommands, useArrays = BatchUseArrays, pollInterval = BatchPollInterval, stateFile = BatchStateFile
+                );
+        
+        stager = Stager(modes = StagingModes, cacheDir = StagingCacheDir, archiveFiles = ArchiveFiles, archiveCompression = ArchiveCompression);
+        
+        executor = Executor(wallTimeLimit = WallTimeLimit, idleTimeout = IdleTimeout, gracePeriod = KillGracePeriod);
+        
+        if ProgressStatusFile != None or ProgressPrintInterval != None:
+            # In campaign mode, the number of atoms is set for each job by the sweeps.
             
-            if os.path.isdir(jobDir):
-                numSCFSteps, tSCFAve, tElapsed, finalTotalEnergy = CollectResults(jobDir, outcarSkipSCFCycles = SkipSCFCycles);
-                
-                if numSCFSteps != None and tSCFAve != None and tElapsed != None and finalTotalEnergy != None:
-                    print("  -> Collected data for # proc = {0}, NSIM = {1}".format(numProcesses, nsimValue));
-                    data[(numProcesses, nsimValue)] = (kparValue, nparValue, numSCFSteps, tSCFAve, tElapsed, finalTotalEnergy);
-                else:
-                    print("  -> Failed to collect data for # proc = {0}, NSIM = {1}".format(numProcesses, nsimValue));
-            else:
-                print("  -> Archive dir \"{0}\" not found -> skipping # proc = {1}, NSIM = {2}".format(jobDir, numProcesses, nsimValue));
+            monitor = ProgressMonitor(
+                statusFile = ProgressStatusFile, numAtoms = GetNumAtoms("POSCAR") if campaign == None else None, printInterval = ProgressPrintInterval, scriptName = "GPUTest.py"
+                );
+            
+            monitor.Start();
+    
+    cache = ResultCache(ResultCacheFile, maxEntries = ResultCacheMaxEntries) if ResultCacheFile != None else None;
+    
+    # Telemetry is not collected for tests run through the batch system.
+    
+    resultColumns = GetResultColumns(extraStatistics = DataOutputExtraStatistics, telemetry = TelemetryInterval != None and BatchSystem == None);
     
-    print("");
+    campaignResults, store = [], None;
     
-    if len(data) > 0:
-        print("Writing data to \"{0}\"...".format(DataOutputFile));
+    for i, (system, sweep) in enumerate(zip(systems, sweeps)):
+        if system != None:
+            print("Campaign: system {0} of {1}: {2} ({3} atoms)".format(i + 1, len(systems), system.Name, system.NumAtoms));
+            print("");
         
-        with open(DataOutputFile, 'w') as outputWriter:
-            outputWriterCSV = csv.writer(outputWriter, delimiter = ',', quotechar = '\"', quoting = csv.QUOTE_ALL);
+        if not CollectOnly:
+            if campaign != None:
+                campaign.Prune(system, sweep);
             
-            outputWriterCSV.writerow(["# Proc", "NSIM", "KPAR", "NPAR", "# SCF Steps", "t_SCF,Ave [s]", "t_Elapsed [s]", "Final E_0 [eV]"]);
+            if AdaptiveNSIMSearch:
+                sweep.RunAdaptive(pool, RunDir, VASPRunCommand, "NSIM", skipSCFCycles = SkipSCFCycles, numGPUs = numGPUs, watcherFactory = watcherFactory, samplerFactory = samplerFactory, energyTolerance = EnergyTolerance, scfStepsTolerance = SCFStepsTolerance, monitor = monitor, batch = batch, stager = stager, maxRetries = MaxRetries, executor = executor);
+            else:
+                sweep.Run(
+                    pool, RunDir, VASPRunCommand, numGPUs = numGPUs,
+                    abortParameter = abortParameter, watcherFactory = watcherFactory, samplerFactory = samplerFactory, monitor = monitor, batch = batch, stager = stager,
+                    maxRetries = MaxRetries, pruneFailures = PruneFailedTests, executor = executor
+                    );
             
-            for key in sorted(data.keys()):
-                outputWriterCSV.writerow(key + data[key]);
+            if AdaptiveNSIMSearch or campaign != None:
+                print("Writing skipped tests to \"{0}\"...".format(GetSystemPath(system, SkippedOutputFile)));
+                print("");
+                
+                sweep.WriteSkipped(GetSystemPath(system, SkippedOutputFile));
+        
+        print("Collecting results...");
+        
+        data = sweep.CollectResults(skipSCFCycles = SkipSCFCycles, numJobs = CollectJobs, cache = cache, energyTolerance = EnergyTolerance, scfStepsTolerance = SCFStepsTolerance);
+        
+        if cache != None:
+            cache.Save();
+        
+        print("");
+        
+        if len(data) > 0:
+            print("Writing data to \"{0}\"...".format(GetSystemPath(system, DataOutputFile)));
             
-            outputWriterCSV.writerow([]);
+            sweep.WriteResults(GetSystemPath(system, DataOutputFile), data, matrixParameters = (NumProcessesKey, "NSIM"), columns = resultColumns);
             
-            for matrixHeader, matrixColumn in ("# SCF Steps", 2), ("t_SCF,Ave [s]", 3), ("t_Elapsed [s]", 4):
-                outputWriterCSV.writerow(["Data: {0}".format(matrixHeader)]);
-                outputWriterCSV.writerow([]);
+            if TimingsOutputFile != None:
+                print("Writing timings to \"{0}\"...".format(GetSystemPath(system, TimingsOutputFile)));
                 
-                outputWriterCSV.writerow(["", "NSIM"]);
-                outputWriterCSV.writerow(["# Proc"] + TestNSIMValues);
-                
-                for numProcesses in TestNumProcesses:
-                    outputWriterCSV.writerow(
-                        [numProcesses] + [
-                            data[(numProcesses, nsimValue)][matrixColumn] if (numProcesses, nsimValue) in data else '-'
-                                for nsimValue in TestNSIMValues
-                                ]
+                sweep.WriteTimings(GetSystemPath(system, TimingsOutputFile), data);
+            
+            if StoreOutputFile != None:
+                if system != None:
+                    systemStore = sweep.GetResultStore(data, system.Name, system.NumAtoms, "GPU", numGPUs = GPUsPerJob);
+                else:
+                    systemStore = sweep.GetResultStore(
+                        data, SystemName if SystemName != None else GetSystemName("POSCAR"), GetNumAtoms("POSCAR"), "GPU", numGPUs = GPUsPerJob
                         );
                 
-                outputWriterCSV.writerow([]);
-    else:
-        print("No data collected - please check the *.out files from VASP jobs");
+                if store == None:
+                    store = systemStore;
+                else:
+                    store.Extend(systemStore);
+        else:
+            print("No data collected - please check the *.out files from VASP jobs");
+        
+        print("");
+        
+        if campaign != None:
+            campaign.AddResults(system, sweep, data);
+            
+            campaignResults.append((system, sweep, data));
+            
+            if not CollectOnly:
+                campaign.PrintForecast(systems[i + 1:], sweep);
+    
+    if monitor != None:
+        monitor.Stop();
+    
+    if stager != None and stager.GetSummary() != "":
+        print("Staged input files: {0}".format(stager.GetSummary()));
+        print("");
+    
+    if campaign != None and any(len(data) > 0 for _, _, data in campaignResults):
+        print("Writing campaign results to \"{0}\"...".format(CampaignOutputFile));
+        
+        campaign.WriteResults(CampaignOutputFile, campaignResults, columns = resultColumns);
+    
+    if store != None:
+        print("Writing result store to \"{0}\"...".format(StoreOutputFile));
+        
+        store.Save(StoreOutputFile);
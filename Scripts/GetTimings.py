@@ -4,14 +4,15 @@
 import argparse;
 import os;
 
-from Shared import CollectResults;
+from Shared import CollectRunRecordsParallel, ResultCache;
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description = "Extract timing information and final total energy from the output files in a VASP directory.");
     
     parser.set_defaults(
-        SkipSCFCycles = 0
+        SkipSCFCycles = 0,
+        NumJobs = 1
         );    
     
     parser.add_argument(
@@ -26,19 +27,63 @@ if __name__ == "__main__":
         help = "exclude the first N SCF cycles from the average (default: 0)"
         );
     
+    parser.add_argument(
+        "--jobs",
+        type = int, dest = 'NumJobs',
+        help = "number of directories to process in parallel (default: 1)"
+        );
+    
+    parser.add_argument(
+        "--cache",
+        type = str, dest = 'CacheFile',
+        help = "cache results in a file, so directories whose output files have not changed are not re-parsed on subsequent runs"
+        );
+    
     args = parser.parse_args();
     
+    cache = ResultCache(args.CacheFile) if args.CacheFile != None else None;
+    
+    vaspDirectories = [vaspDirectory for vaspDirectory in args.VASPDirectories if os.path.isdir(vaspDirectory)];
+    
+    records = dict(zip(
+        vaspDirectories, CollectRunRecordsParallel(vaspDirectories, outcarSkipSCFCycles = args.SkipSCFCycles, numJobs = args.NumJobs, cache = cache)
+        ));
+    
+    if cache != None:
+        cache.Save();
+    
     for vaspDirectory in args.VASPDirectories:
-        if os.path.isdir(vaspDirectory):
+        if vaspDirectory in records:
             print("Analysing \"{0}\"...".format(vaspDirectory));
             
-            numSCFSteps, tSCFAve, tElapsed, finalTotalEnergy = CollectResults(vaspDirectory, outcarSkipSCFCycles = args.SkipSCFCycles);
+            record = records[vaspDirectory];
+            
+            numSCFSteps, tSCFAve, tElapsed, finalTotalEnergy = record['NumSCFSteps'], record['TSCFAve'], record['TElapsed'], record['FinalTotalEnergy'];
                     
             if numSCFSteps != None and tSCFAve != None and tElapsed != None and finalTotalEnergy != None:
                 print("  -> # SCF steps: {0}".format(numSCFSteps));
                 print("  -> Avgerage t_SCF [s]: {0:.2f}".format(tSCFAve));
+                
+                if record['TSCFStdDev'] != None:
+                    print("  -> Median/Min t_SCF [s]: {0:.2f} / {1:.2f} (std. dev. {2:.2f})".format(record['TSCFMedian'], record['TSCFMin'], record['TSCFStdDev']));
+                
+                if record['TIonicAve'] != None:
+                    print("  -> Average t_Ionic [s]: {0:.2f} ({1} step(s))".format(record['TIonicAve'], len(record['IonicTimes'])));
+                
                 print("  -> Elapsed time [s]: {0:.2f}".format(tElapsed));
                 print("  -> Final E_0 [eV]: {0:.8f}".format(finalTotalEnergy));
+                
+                if record['MaxMemory'] != None:
+                    print("  -> Max. memory [kB]: {0:.0f}".format(record['MaxMemory']));
+                
+                if record['Rank0Memory'] != None:
+                    print("  -> Rank-0 memory [kB]: {0:.0f}".format(record['Rank0Memory']));
+                
+                if len(record['RoutineTimes']) > 0:
+                    print("  -> Routine timings (# calls, t_CPU [s], t_Real [s]):");
+                    
+                    for name, numCalls, tCPU, tReal in sorted(record['RoutineTimes'], key = lambda item: -item[3]):
+                        print("     {0:<12} {1:6d} {2:12.2f} {3:12.2f}".format(name, numCalls, tCPU, tReal));
             else:
                 print("  -> Failed to collect data... please check the folder is a valid VASP directory");
         else:
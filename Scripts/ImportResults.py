@@ -0,0 +1,59 @@
+# ImportResults.py by J. M. Skelton
+
+
+import argparse;
+import os;
+
+from ResultStore import ImportResultsCSV, LoadResultStore, ResultStore;
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Import CSV files written by CPUTest.py and GPUTest.py (e.g. Benchmarks/GeTe/Results_*/*.csv) into a columnar result store.");
+    
+    parser.add_argument(
+        metavar = "csv_file", type = str, nargs = '+',
+        dest = 'CSVFiles',
+        help = "CSV files to import; the system and device are taken from file names of the form \"<device>_<system>.csv\", e.g. \"4GPU_GeTe-128.csv\""
+        );
+    
+    parser.add_argument(
+        "-o", "--output",
+        type = str, dest = 'OutputFile', required = True,
+        help = "result store to write (\".npz\", requires NumPy, or \".parquet\", requires PyArrow)"
+        );
+    
+    parser.add_argument(
+        "--poscar_dir",
+        type = str, dest = 'POSCARDir',
+        help = "directory containing \"POSCAR_<system>.vasp\" files to read the number of atoms from (default: taken from the end of the system name)"
+        );
+    
+    parser.add_argument(
+        "--append",
+        dest = 'Append', action = 'store_true',
+        help = "add the imported results to an existing result store, rather than refusing to overwrite it"
+        );
+    
+    args = parser.parse_args();
+    
+    store = ResultStore();
+    
+    if os.path.isfile(args.OutputFile):
+        if not args.Append:
+            raise Exception("Error: Output file \"{0}\" already exists - please rename/delete, or use --append.".format(args.OutputFile));
+        
+        store = LoadResultStore(args.OutputFile);
+        
+        print("Loaded {0} row(s) from \"{1}\"".format(len(store), args.OutputFile));
+    
+    for csvFile in args.CSVFiles:
+        results = ImportResultsCSV(csvFile, poscarDir = args.POSCARDir);
+        
+        print("Imported {0} row(s) from \"{1}\"".format(len(results), csvFile));
+        
+        store.Extend(results);
+    
+    print("");
+    print("Writing {0} row(s) to \"{1}\"...".format(len(store), args.OutputFile));
+    
+    store.Save(args.OutputFile);
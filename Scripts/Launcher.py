@@ -0,0 +1,142 @@
+# Launcher.py by J. M. Skelton
+
+
+import os;
+
+
+# Names of the sweep parameters that set how the MPI processes are launched, rather than INCAR tags: the number of processes sharing each GPU, whether the processes share the GPUs through the CUDA Multi-Process Service (MPS), and the number of OpenMP threads per process.
+
+RanksPerGPUKey = "RANKS_PER_GPU";
+MPSKey = "MPS";
+OMPThreadsKey = "OMP_NUM_THREADS";
+
+LaunchKeys = [RanksPerGPUKey, MPSKey, OMPThreadsKey];
+
+# Command used to start and stop the MPS control daemon.
+
+DefaultMPSControlCommand = "nvidia-cuda-mps-control";
+
+# Scripts written to the run directory of jobs with launch settings.
+
+LaunchScriptName = "Launch.sh";
+BindScriptName = "BindGPU.sh";
+
+# Environment variables set by common MPI launchers to the rank of each process on its node: Open MPI, MVAPICH2, Intel MPI/MPICH (Hydra) and SLURM (srun).
+
+_LocalRankVariables = ["OMPI_COMM_WORLD_LOCAL_RANK", "MV2_COMM_WORLD_LOCAL_RANK", "MPI_LOCALRANKID", "SLURM_LOCALID"];
+
+
+def GetNumGPUs(numProcesses, ranksPerGPU):
+    # Number of GPUs used by numProcesses MPI processes with ranksPerGPU processes sharing each GPU; the last GPU is shared by fewer processes if numProcesses is not divisible by ranksPerGPU.
+    
+    return (numProcesses + ranksPerGPU - 1) // ranksPerGPU;
+
+def _GetBindScript(ranksPerGPU, scriptName):
+    # Script to bind each MPI process to one GPU, with ranksPerGPU processes on each in turn: runs the command passed as arguments with CUDA_VISIBLE_DEVICES set to the entry in BIND_GPU_DEVICES (comma-separated) for the rank of the process on its node.
+    
+    localRank = "0";
+    
+    for variable in _LocalRankVariables[::-1]:
+        localRank = "${{{0}:-{1}}}".format(variable, localRank);
+    
+    return [
+        "#!/bin/sh",
+        "",
+        "# Generated by {0}: runs the command given as arguments with {1} MPI process(es) per GPU.".format(scriptName, ranksPerGPU),
+        "",
+        "LOCAL_RANK={0}".format(localRank),
+        "",
+        "DEVICE=$(echo \"$BIND_GPU_DEVICES\" | tr ',' '\\n' | sed -n \"$((LOCAL_RANK / {0} + 1))p\")".format(ranksPerGPU),
+        "",
+        "if [ -z \"$DEVICE\" ] ; then",
+        "    echo \"{0}: no GPU for local rank $LOCAL_RANK in BIND_GPU_DEVICES=$BIND_GPU_DEVICES\" >&2".format(BindScriptName),
+        "    exit 1",
+        "fi",
+        "",
+        "export CUDA_VISIBLE_DEVICES=$DEVICE",
+        "",
+        "exec \"$@\""
+        ];
+
+def _GetLaunchScript(job, command, numDevices, scriptName):
+    lines = [
+        "#!/bin/sh",
+        "",
+        "# Generated by {0} for the test with {1}.".format(scriptName, job.Label),
+        ""
+        ];
+    
+    if job.NumThreads != None:
+        lines = lines + ["export OMP_NUM_THREADS={0}".format(job.NumThreads), ""];
+    
+    if numDevices > 0:
+        # MPS clients number the GPUs relative to those visible to the MPS server; otherwise the device IDs in CUDA_VISIBLE_DEVICES (set for the job by Scheduler._ExecuteJob() or the batch system) are used.
+        
+        ordinals = ",".join(str(i) for i in range(numDevices));
+        
+        lines = lines + [
+            "export BIND_GPU_DEVICES={0}".format(ordinals if job.UseMPS else "${{CUDA_VISIBLE_DEVICES:-{0}}}".format(ordinals)),
+            ""
+            ];
+    
+    if job.UseMPS:
+        # The pipe directory holds a Unix socket, the path to which is limited to ~100 characters, so it is created under /tmp rather than in the run directory.
+        # The daemon is stopped when the script exits, including if the job is killed with SIGTERM or SIGINT (e.g. by an EarlyStopWatcher).
+        
+        lines = lines + [
+            "export CUDA_MPS_PIPE_DIRECTORY=$(mktemp -d \"${TMPDIR:-/tmp}/MPS-Pipe.XXXXXX\") || exit 1",
+            "export CUDA_MPS_LOG_DIRECTORY=\"$PWD/MPS-Log\"",
+            "",
+            "mkdir -p \"$CUDA_MPS_LOG_DIRECTORY\"",
+            "",
+            "{0} -d || {{ rm -rf \"$CUDA_MPS_PIPE_DIRECTORY\" ; exit 1 ; }}".format(job.MPSControlCommand),
+            "",
+            "StopMPS() {",
+            "    echo quit | {0}".format(job.MPSControlCommand),
+            "    rm -rf \"$CUDA_MPS_PIPE_DIRECTORY\"",
+            "}",
+            "",
+            "trap StopMPS EXIT",
+            "trap 'exit 143' TERM",
+            "trap 'exit 130' INT",
+            ""
+            ];
+    
+    lines = lines + [command, "", "exit $?"];
+    
+    return lines;
+
+def WriteLaunchScripts(job, runDir, command, scriptName, gpuIDs = None):
+    # Writes the scripts to launch job with its launch settings to runDir, and returns the command to run them from runDir, or returns command unchanged if the job has no launch settings.
+    # The script sets OMP_NUM_THREADS and starts and stops the MPS control daemon, as needed, and then runs command.
+    # If the string "<bind>" appears in command, it is replaced by a wrapper that binds each MPI process to a GPU, e.g. "mpirun -np <nproc> <bind> vasp_gpu"; the GPUs are those in gpuIDs or, if these are not known (e.g. for batch jobs), CUDA_VISIBLE_DEVICES.
+    # Without "<bind>", every process sees all of the job's GPUs and VASP chooses which to use.
+    
+    ranksPerGPU, numDevices = job.RanksPerGPU, 0;
+    
+    if "<bind>" in command:
+        numDevices = len(gpuIDs) if gpuIDs != None and len(gpuIDs) > 0 else job.NumGPUs;
+        
+        if ranksPerGPU != None:
+            numDevices = GetNumGPUs(job.NumProcesses, ranksPerGPU);
+        elif numDevices > 0:
+            ranksPerGPU = (job.NumProcesses + numDevices - 1) // numDevices;
+        
+        if numDevices > 0:
+            command = command.replace("<bind>", "sh \"$PWD/{0}\"".format(BindScriptName));
+        else:
+            command = command.replace("<bind>", "");
+    
+    if job.NumThreads == None and not job.UseMPS and numDevices == 0:
+        return command;
+    
+    if numDevices > 0:
+        with open(os.path.join(runDir, BindScriptName), 'w') as outputWriter:
+            for line in _GetBindScript(ranksPerGPU, scriptName):
+                outputWriter.write("{0}\n".format(line));
+    
+    with open(os.path.join(runDir, LaunchScriptName), 'w') as outputWriter:
+        for line in _GetLaunchScript(job, command, numDevices, scriptName):
+            outputWriter.write("{0}\n".format(line));
+    
+    return "sh ./{0}".format(LaunchScriptName);
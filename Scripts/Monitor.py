@@ -0,0 +1,376 @@
+# Monitor.py by J. M. Skelton
+
+
+import heapq;
+import json;
+import os;
+import re;
+import threading;
+import time;
+
+from Scheduler import PrintLines;
+from Shared import FindOutputFile, OUTCARParser;
+
+
+# Lines for each SCF step in OSZICAR files, e.g. "DAV:  12    -0.161243356E+03 ...", from which the current energy is taken.
+
+_OSZICAR_SCFStepRegex = re.compile(r"^\s*(?P<algorithm>[A-Z]+):\s+(?P<step>\d+)\s+(?P<energy>[-+.\dE]+)");
+
+# Default exponent for scaling the run times of completed jobs with the number of atoms (t ~ N^B); the power-law fits to the GeTe benchmarks give B ~ 1.8-2.2.
+
+DefaultScalingExponent = 2.0;
+
+
+def FormatDuration(seconds):
+    if seconds == None:
+        return "unknown";
+    
+    seconds = int(round(seconds));
+    
+    return "{0:d}:{1:02d}:{2:02d}".format(seconds // 3600, (seconds // 60) % 60, seconds % 60);
+
+def _GetMedian(values):
+    values = sorted(values);
+    
+    numValues = len(values);
+    
+    return values[numValues // 2] if numValues % 2 == 1 else (values[numValues // 2 - 1] + values[numValues // 2]) / 2.0;
+
+def EstimateRemainingTime(completed, running, pending, numSlots, scalingExponent = DefaultScalingExponent):
+    # completed: list of (number of atoms, run time) for finished jobs.
+    # running: list of (number of atoms, time so far, estimated time remaining or None) for running jobs; if the time remaining is None, it is estimated from the completed jobs.
+    # pending: list of the number of atoms in each job waiting to run.
+    # The run time of a job is estimated as the median of t / N^B over the completed jobs times N^B, and the pending jobs are assigned in order to the first of numSlots job slots to become free.
+    # Returns the estimated time to finish all the jobs, or None if there are no completed jobs to estimate from.
+    
+    if len(completed) == 0:
+        return None;
+    
+    costPerAtom = _GetMedian([t / float(numAtoms) ** scalingExponent for numAtoms, t in completed]);
+    
+    slots = [];
+    
+    for numAtoms, tElapsed, remaining in running:
+        if remaining == None:
+            remaining = max(costPerAtom * float(numAtoms) ** scalingExponent - tElapsed, 0.0);
+        
+        slots.append(remaining);
+    
+    slots = slots + [0.0] * max(numSlots - len(slots), 0);
+    
+    heapq.heapify(slots);
+    
+    for numAtoms in pending:
+        heapq.heappush(slots, heapq.heappop(slots) + costPerAtom * float(numAtoms) ** scalingExponent);
+    
+    return max(slots) if len(slots) > 0 else 0.0;
+
+
+class _MonitoredJob(object):
+    def __init__(self, job, numAtoms):
+        self.Job = job;
+        self.NumAtoms = numAtoms;
+        
+        self.RunDir = None;
+        self.Host = None;
+        self.GPUIDs = [];
+        
+        self.StartTime = None;
+        self.EndTime = None;
+        
+        self.Status = 'Pending';
+        
+        self.OUTCARParser = None;
+        
+        self.Energy = None;
+        
+        # Number of SCF times already printed in the terminal view.
+        
+        self.NumSCFTimesPrinted = 0;
+
+
+class ProgressMonitor(object):
+    def __init__(self, statusFile = None, numAtoms = None, printInterval = 60.0, pollInterval = 5.0, scalingExponent = DefaultScalingExponent, scriptName = None):
+        # Tracks the jobs run by Scheduler.RunJobs() across a campaign: tails the OUTCAR and OSZICAR files of running jobs, prints a summary with the new SCF times every printInterval seconds, and writes the status to statusFile as JSON (see GetStatus()).
+        # numAtoms is used for jobs that do not set Job.NumAtoms; the time remaining is estimated from the completed jobs (see EstimateRemainingTime()).
+        # Set printInterval to None to only write the status file.
+        
+        self.StatusFile = statusFile;
+        self.NumAtoms = numAtoms;
+        
+        self.PrintInterval = printInterval;
+        self.PollInterval = pollInterval;
+        
+        self.ScalingExponent = scalingExponent;
+        self.ScriptName = scriptName;
+        
+        self._jobs = [];
+        self._jobsByArchiveDir = { };
+        
+        self._maxRunning = 1;
+        
+        self._startTime = time.time();
+        self._lastPrintTime = self._startTime;
+        
+        self._lock = threading.Lock();
+        
+        self._stopEvent = threading.Event();
+        self._thread = None;
+    
+    def Start(self):
+        self._Update(printSummary = False);
+        
+        self._thread = threading.Thread(target = self._Watch);
+        self._thread.daemon = True;
+        self._thread.start();
+    
+    def Stop(self):
+        # Stops the monitor and writes the final status.
+        
+        if self._thread != None:
+            self._stopEvent.set();
+            self._thread.join();
+            
+            self._thread = None;
+        
+        self._Update();
+    
+    def AddJobs(self, jobs):
+        # Called by RunJobs() with the jobs it is about to run; jobs may be added in several batches, e.g. for each round of an adaptive search.
+        
+        with self._lock:
+            for job in jobs:
+                numAtoms = job.NumAtoms if job.NumAtoms != None else self.NumAtoms;
+                
+                monitoredJob = _MonitoredJob(job, numAtoms);
+                
+                self._jobs.append(monitoredJob);
+                self._jobsByArchiveDir[job.ArchiveDir] = monitoredJob;
+    
+    def JobStarted(self, job, runDir, host = None, gpuIDs = None):
+        with self._lock:
+            monitoredJob = self._jobsByArchiveDir[job.ArchiveDir];
+            
+            monitoredJob.RunDir = runDir;
+            monitoredJob.Host = host;
+            monitoredJob.GPUIDs = list(gpuIDs) if gpuIDs != None else [];
+            
+            monitoredJob.StartTime = time.time();
+            monitoredJob.Status = 'Running';
+            
+            monitoredJob.OUTCARParser = OUTCARParser(os.path.join(runDir, "OUTCAR"));
+            
+            numRunning = sum(1 for otherJob in self._jobs if otherJob.Status == 'Running');
+            
+            self._maxRunning = max(self._maxRunning, numRunning);
+    
+    def JobFinished(self, job, status):
+        # status: job status set by RunJobs() ('Success', 'Failed' or 'Aborted').
+        
+        with self._lock:
+            monitoredJob = self._jobsByArchiveDir[job.ArchiveDir];
+            
+            monitoredJob.EndTime = time.time() if monitoredJob.StartTime != None else None;
+            monitoredJob.Status = status;
+            
+            # Pick up any SCF steps written since the last poll from the archived OUTCAR.
+            
+            outcarPath = FindOutputFile(job.ArchiveDir, "OUTCAR");
+            
+            if status == 'Success' and outcarPath != None:
+                parser = OUTCARParser(outcarPath);
+                parser.Update();
+                
+                monitoredJob.OUTCARParser = parser;
+    
+    def _PollJob(self, monitoredJob):
+        # The run directory is renamed to the archive directory when the job finishes, which may happen while it is being read.
+        
+        try:
+            if os.path.isfile(monitoredJob.OUTCARParser.FilePath):
+                monitoredJob.OUTCARParser.Update();
+            
+            oszicarPath = os.path.join(monitoredJob.RunDir, "OSZICAR");
+            
+            if os.path.isfile(oszicarPath):
+                with open(oszicarPath, 'r') as inputReader:
+                    for line in inputReader:
+                        match = _OSZICAR_SCFStepRegex.match(line);
+                        
+                        if match:
+                            try:
+                                monitoredJob.Energy = float(match.group('energy'));
+                            except ValueError:
+                                pass;
+        except (IOError, OSError):
+            pass;
+    
+    def _EstimateRemainingTime(self, now):
+        completed = [
+            (monitoredJob.NumAtoms, monitoredJob.EndTime - monitoredJob.StartTime)
+                for monitoredJob in self._jobs if monitoredJob.Status == 'Success' and monitoredJob.NumAtoms != None and monitoredJob.EndTime != None
+            ];
+        
+        # The number of SCF steps in the running jobs is estimated from the completed jobs.
+        
+        numSCFSteps = [
+            len(monitoredJob.OUTCARParser.SCFTimes)
+                for monitoredJob in self._jobs if monitoredJob.Status == 'Success' and monitoredJob.OUTCARParser != None and len(monitoredJob.OUTCARParser.SCFTimes) > 0
+            ];
+        
+        expectedNumSCFSteps = _GetMedian(numSCFSteps) if len(numSCFSteps) > 0 else None;
+        
+        running = [];
+        
+        for monitoredJob in self._jobs:
+            if monitoredJob.Status != 'Running':
+                continue;
+            
+            if monitoredJob.NumAtoms == None:
+                return None;
+            
+            remaining = None;
+            
+            scfTimes = monitoredJob.OUTCARParser.SCFTimes;
+            
+            if expectedNumSCFSteps != None and len(scfTimes) > 0:
+                remaining = max(expectedNumSCFSteps - len(scfTimes), 0) * sum(scfTimes) / len(scfTimes);
+            
+            running.append((monitoredJob.NumAtoms, now - monitoredJob.StartTime, remaining));
+        
+        pending = [monitoredJob.NumAtoms for monitoredJob in self._jobs if monitoredJob.Status == 'Pending'];
+        
+        if any(numAtoms == None for numAtoms in pending):
+            return None;
+        
+        return EstimateRemainingTime(completed, running, pending, self._maxRunning, scalingExponent = self.ScalingExponent);
+    
+    def GetStatus(self):
+        # Returns the status of the campaign as a dictionary (the content of the status file).
+        
+        now = time.time();
+        
+        with self._lock:
+            for monitoredJob in self._jobs:
+                if monitoredJob.Status == 'Running':
+                    self._PollJob(monitoredJob);
+            
+            tRemaining = self._EstimateRemainingTime(now);
+            
+            counts = { };
+            
+            for monitoredJob in self._jobs:
+                counts[monitoredJob.Status] = counts.get(monitoredJob.Status, 0) + 1;
+            
+            jobs = [];
+            
+            for monitoredJob in self._jobs:
+                job = monitoredJob.Job;
+                
+                scfTimes = list(monitoredJob.OUTCARParser.SCFTimes) if monitoredJob.OUTCARParser != None else [];
+                
+                jobs.append({
+                    'Label' : job.Label, 'ArchiveDir' : job.ArchiveDir, 'Status' : monitoredJob.Status,
+                    'NumProcesses' : job.NumProcesses, 'NumGPUs' : job.NumGPUs, 'NumAtoms' : monitoredJob.NumAtoms,
+                    'Host' : monitoredJob.Host, 'GPUIDs' : monitoredJob.GPUIDs,
+                    'Elapsed' : ((monitoredJob.EndTime if monitoredJob.EndTime != None else now) - monitoredJob.StartTime) if monitoredJob.StartTime != None else None,
+                    'NumSCFSteps' : len(scfTimes), 'SCFTimes' : scfTimes,
+                    'TSCFAve' : sum(scfTimes) / len(scfTimes) if len(scfTimes) > 0 else None,
+                    'Energy' : monitoredJob.Energy
+                    });
+        
+        return {
+            'Script' : self.ScriptName, 'StartTime' : self._startTime, 'UpdateTime' : now, 'Elapsed' : now - self._startTime,
+            'NumJobs' : len(jobs),
+            'NumPending' : counts.get('Pending', 0), 'NumRunning' : counts.get('Running', 0), 'NumSuccess' : counts.get('Success', 0),
+            'NumFailed' : counts.get('Failed', 0) + counts.get('Aborted', 0),
+            'Remaining' : tRemaining, 'ETA' : now + tRemaining if tRemaining != None else None,
+            'Jobs' : jobs
+            };
+    
+    def _WriteStatus(self, status):
+        # Write to a temporary file and rename, so readers never see a partially-written file.
+        
+        tempFile = "{0}.tmp".format(self.StatusFile);
+        
+        with open(tempFile, 'w') as outputWriter:
+            json.dump(status, outputWriter, indent = 1);
+        
+        os.rename(tempFile, self.StatusFile);
+    
+    def _Update(self, printSummary = True):
+        status = self.GetStatus();
+        
+        if self.StatusFile != None:
+            self._WriteStatus(status);
+        
+        if printSummary and self.PrintInterval != None:
+            lines = FormatStatus(status, newSCFTimes = self._GetNewSCFTimes());
+            
+            PrintLines(lines + [""]);
+    
+    def _GetNewSCFTimes(self):
+        newSCFTimes = { };
+        
+        with self._lock:
+            for monitoredJob in self._jobs:
+                if monitoredJob.Status == 'Running':
+                    scfTimes = monitoredJob.OUTCARParser.SCFTimes;
+                    
+                    newSCFTimes[monitoredJob.Job.ArchiveDir] = (monitoredJob.NumSCFTimesPrinted, scfTimes[monitoredJob.NumSCFTimesPrinted:]);
+                    
+                    monitoredJob.NumSCFTimesPrinted = len(scfTimes);
+        
+        return newSCFTimes;
+    
+    def _Watch(self):
+        while not self._stopEvent.wait(self.PollInterval):
+            printSummary = self.PrintInterval != None and time.time() - self._lastPrintTime >= self.PrintInterval;
+            
+            if printSummary:
+                self._lastPrintTime = time.time();
+            
+            self._Update(printSummary = printSummary);
+
+
+def FormatStatus(status, newSCFTimes = None):
+    # Returns lines summarising a status dictionary from ProgressMonitor.GetStatus() for the terminal view.
+    # newSCFTimes optionally maps archive directories to (index of first step, list of SCF times) to show the SCF times since the last summary; otherwise the last few SCF times of each running job are shown.
+    
+    lines = ["Progress: {0} of {1} test(s) finished ({2} failed), {3} running, {4} pending; elapsed {5}, estimated time remaining {6}".format(
+        status['NumSuccess'] + status['NumFailed'], status['NumJobs'], status['NumFailed'], status['NumRunning'], status['NumPending'],
+        FormatDuration(status['Elapsed']), FormatDuration(status['Remaining'])
+        )];
+    
+    if status['ETA'] != None and status['NumPending'] + status['NumRunning'] > 0:
+        lines.append("  -> ETA: {0}".format(time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(status['ETA']))));
+    
+    for job in status['Jobs']:
+        if job['Status'] != 'Running':
+            continue;
+        
+        line = "  -> {0}: running for {1}".format(job['Label'], FormatDuration(job['Elapsed']));
+        
+        if job['Host'] != None:
+            line = "{0} on {1}".format(line, job['Host']);
+        
+        if job['NumSCFSteps'] > 0:
+            line = "{0}, {1} SCF step(s), t_SCF,Ave = {2:.3f} s".format(line, job['NumSCFSteps'], job['TSCFAve']);
+        
+        if job['Energy'] != None:
+            line = "{0}, E = {1:.5f} eV".format(line, job['Energy']);
+        
+        lines.append(line);
+        
+        if newSCFTimes != None:
+            firstStep, scfTimes = newSCFTimes.get(job['ArchiveDir'], (0, []));
+        else:
+            firstStep = max(job['NumSCFSteps'] - 5, 0);
+            scfTimes = job['SCFTimes'][firstStep:];
+        
+        if len(scfTimes) > 0:
+            lines.append("     t_SCF [s] (steps {0}-{1}): {2}".format(
+                firstStep + 1, firstStep + len(scfTimes), ", ".join("{0:.3f}".format(t) for t in scfTimes)
+                ));
+    
+    return lines;
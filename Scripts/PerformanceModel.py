@@ -0,0 +1,345 @@
+# PerformanceModel.py by J. M. Skelton
+
+
+import csv;
+import os;
+
+import numpy as np;
+
+from Analysis import DeviceClassKey, GetGroupIDs, GetValidMask;
+from Shared import ReadINCARTags;
+
+
+# Columns identifying a configuration; a power law in the workload estimate (see GetWorkloadEstimates()) is fitted to the average SCF times of each configuration.
+
+ConfigurationKeys = [DeviceClassKey, "NumProcesses", "KPAR", "NPAR", "NSIM", "ExtraTags"];
+
+# Features of a system read from its input files by GetSystemFeatures(); features that cannot be determined are set to None.
+
+FeatureKeys = ["NumAtoms", "NumElectrons", "ENCUT", "Volume", "NumKPoints", "GammaOnly"];
+
+# Critical value of the normal distribution for the 95 % prediction intervals.
+
+_Z95 = 1.96;
+
+# Default limit on how far Recommend() extrapolates: configurations tested only on systems with workload estimates more than this factor below the new system are excluded.
+
+DefaultMaxExtrapolation = 4.0;
+
+
+def _ReadPOSCAR(poscarFile):
+    # Returns (lattice vectors, atom counts) from a POSCAR file; the lattice vectors are scaled by the scale factor (or to the volume, if it is negative).
+    
+    with open(poscarFile, 'r') as inputReader:
+        lines = [inputReader.readline() for i in range(7)];
+    
+    scale = float(lines[1].split()[0]);
+    
+    latticeVectors = np.array([[float(value) for value in line.split()[:3]] for line in lines[2:5]]);
+    
+    if scale < 0.0:
+        latticeVectors = latticeVectors * (-scale / abs(np.linalg.det(latticeVectors))) ** (1.0 / 3.0);
+    else:
+        latticeVectors = latticeVectors * scale;
+    
+    # As in ResultStore.GetNumAtoms(), the atom counts are on the sixth line in VASP 4 files and the seventh in VASP 5 files.
+    
+    countsLine = lines[5] if all(item.isdigit() for item in lines[5].split()) else lines[6];
+    
+    return (latticeVectors, [int(count) for count in countsLine.split()]);
+
+def _ReadKPOINTS(kpointsFile, latticeVectors):
+    # Returns (number of k-points, Gamma point only) from a KPOINTS file.
+    # For automatic meshes, the number of k-points is the number of mesh points, before any reduction by symmetry.
+    
+    with open(kpointsFile, 'r') as inputReader:
+        lines = [line.strip() for line in inputReader];
+    
+    numKPoints = int(lines[1].split()[0]);
+    mode = lines[2][:1].upper();
+    
+    if numKPoints > 0:
+        if mode == 'L':
+            # Line mode: numKPoints points along each line segment, each of which is given by a pair of lines.
+            
+            numKPoints = numKPoints * (len([line for line in lines[4:] if line != ""]) // 2);
+            
+            return (numKPoints, False);
+        
+        # Explicit list of k-points.
+        
+        kPoints = [[float(value) for value in line.split()[:3]] for line in lines[3:3 + numKPoints]];
+        
+        return (numKPoints, numKPoints == 1 and all(value == 0.0 for value in kPoints[0]));
+    
+    if mode in ('G', 'M'):
+        subdivisions = [int(value) for value in lines[3].split()[:3]];
+    elif mode == 'A':
+        # Fully automatic: N_i = max(1, int(R_k |b_i| + 0.5)), with the reciprocal lattice vectors b_i without the factor of 2 pi.
+        
+        length = float(lines[3].split()[0]);
+        
+        reciprocalLengths = np.linalg.norm(np.linalg.inv(latticeVectors).T, axis = 1);
+        
+        subdivisions = [max(1, int(length * reciprocalLength + 0.5)) for reciprocalLength in reciprocalLengths];
+    else:
+        raise Exception("Error: Unsupported KPOINTS file \"{0}\" - only line-mode, explicit and automatic (Gamma, Monkhorst-Pack and fully-automatic) meshes are supported.".format(kpointsFile));
+    
+    numKPoints = subdivisions[0] * subdivisions[1] * subdivisions[2];
+    
+    return (numKPoints, numKPoints == 1);
+
+def _ReadPOTCAR(potcarFile):
+    # Returns a list of (ZVAL, ENMAX) for each species in a POTCAR file.
+    
+    species = [];
+    
+    zVal = None;
+    
+    with open(potcarFile, 'r') as inputReader:
+        for line in inputReader:
+            if "ZVAL" in line:
+                zVal = float(line.split("ZVAL")[1].split('=')[1].split()[0]);
+            elif "ENMAX" in line and zVal != None:
+                species.append((zVal, float(line.split("ENMAX")[1].split('=')[1].split(';')[0])));
+                
+                zVal = None;
+    
+    return species;
+
+def GetSystemFeatures(poscarFile, incarFile = None, kpointsFile = None, potcarFile = None):
+    # Returns a dictionary with the features in FeatureKeys for the system defined by the input files; features that cannot be determined (e.g. the number of electrons if POTCAR is not available) are set to None.
+    # The number of electrons is taken from NELECT in the INCAR file, if set, or else from the valences in the POTCAR file, and ENCUT from the INCAR file or else the largest ENMAX in the POTCAR file.
+    
+    features = dict((key, None) for key in FeatureKeys);
+    
+    latticeVectors, atomCounts = _ReadPOSCAR(poscarFile);
+    
+    features["NumAtoms"] = sum(atomCounts);
+    features["Volume"] = abs(float(np.linalg.det(latticeVectors)));
+    
+    incarTags = ReadINCARTags(incarFile) if incarFile != None and os.path.isfile(incarFile) else { };
+    
+    potcarSpecies = _ReadPOTCAR(potcarFile) if potcarFile != None and os.path.isfile(potcarFile) else [];
+    
+    if len(potcarSpecies) != len(atomCounts):
+        potcarSpecies = [];
+    
+    if "NELECT" in incarTags:
+        features["NumElectrons"] = float(incarTags["NELECT"]);
+    elif len(potcarSpecies) > 0:
+        features["NumElectrons"] = sum(count * zVal for count, (zVal, _) in zip(atomCounts, potcarSpecies));
+    
+    if "ENCUT" in incarTags:
+        features["ENCUT"] = float(incarTags["ENCUT"]);
+    elif len(potcarSpecies) > 0:
+        features["ENCUT"] = max(enMax for _, enMax in potcarSpecies);
+    
+    if kpointsFile != None and os.path.isfile(kpointsFile):
+        features["NumKPoints"], features["GammaOnly"] = _ReadKPOINTS(kpointsFile, latticeVectors);
+    
+    return features;
+
+def GetWorkloadEstimates(featureSets):
+    # Returns (workloads, features used): an array with an estimate of the cost of an SCF step for each of featureSets (dictionaries from GetSystemFeatures()), and the list of features used to calculate it.
+    # The estimate is N_bands * N_PW * N_k, with N_bands proportional to the number of electrons and N_PW to V * ENCUT^(3/2), halved for Gamma-only calculations, which use real wavefunctions; the fitted power laws account for the actual scaling.
+    # Features that are not known for every system are left out (N_bands and N_PW are then taken to be proportional to the number of atoms), so the estimates are consistent with each other.
+    
+    def _IsKnown(key):
+        return all(features.get(key) != None for features in featureSets);
+    
+    featuresUsed = ["NumAtoms"];
+    
+    numAtoms = np.array([features["NumAtoms"] for features in featureSets], dtype = np.float64);
+    
+    if _IsKnown("NumElectrons"):
+        numBands = np.array([features["NumElectrons"] for features in featureSets], dtype = np.float64) / 2.0;
+        
+        featuresUsed.append("NumElectrons");
+    else:
+        numBands = numAtoms;
+    
+    if _IsKnown("Volume") and _IsKnown("ENCUT"):
+        numPlaneWaves = np.array([features["Volume"] * features["ENCUT"] ** 1.5 for features in featureSets], dtype = np.float64);
+        
+        featuresUsed = featuresUsed + ["Volume", "ENCUT"];
+    else:
+        numPlaneWaves = numAtoms;
+    
+    workloads = numBands * numPlaneWaves;
+    
+    if _IsKnown("NumKPoints"):
+        workloads = workloads * np.array([features["NumKPoints"] * (0.5 if features["GammaOnly"] else 1.0) for features in featureSets], dtype = np.float64);
+        
+        featuresUsed = featuresUsed + ["NumKPoints", "GammaOnly"];
+    
+    return (workloads, featuresUsed);
+
+def ParseExtraTags(extraTags):
+    # Inverse of the ExtraTags column written by Sweep.GetResultStore(), e.g. "LPLANE = .FALSE., NELM = 25" -> [("LPLANE", ".FALSE."), ("NELM", "25")].
+    
+    return [tuple(item.strip() for item in tag.split('=', 1)) for tag in extraTags.split(", ")] if extraTags != "" else [];
+
+
+class PerformanceModel(object):
+    def __init__(self, arrays, workloads):
+        # arrays: result arrays from Analysis.LoadResultArrays() or Analysis.GetAnalysisArrays(); workloads: array with the workload estimate (see GetWorkloadEstimates()) for the system in each row.
+        # Fits log(t_SCF) = log(A) + B log(W) to the valid runs for each configuration (ConfigurationKeys) by linear regression.
+        # Configurations tested at a single system size use the exponent B fitted to all the configurations for the same device class, and the residual variance is pooled over each device class to estimate the uncertainty in the predictions.
+        
+        valid = np.nonzero(GetValidMask(arrays) & np.isfinite(workloads) & (workloads > 0.0))[0];
+        
+        if len(valid) == 0:
+            raise Exception("Error: PerformanceModel(): No valid results to fit.");
+        
+        x, y = np.log(workloads[valid]), np.log(arrays["TSCFAve"][valid]);
+        
+        groupIDs, firstIndices = GetGroupIDs([arrays[key][valid] for key in ConfigurationKeys]);
+        
+        numGroups = len(firstIndices);
+        
+        self.Configurations = dict((key, arrays[key][valid][firstIndices]) for key in ConfigurationKeys);
+        
+        numRuns = np.bincount(groupIDs, minlength = numGroups).astype(np.float64);
+        
+        # Number of system sizes tested with each configuration.
+        
+        _, sizeIndices = GetGroupIDs([groupIDs, x]);
+        
+        numSizes = np.bincount(groupIDs[sizeIndices], minlength = numGroups);
+        
+        xMean = np.bincount(groupIDs, weights = x, minlength = numGroups) / numRuns;
+        yMean = np.bincount(groupIDs, weights = y, minlength = numGroups) / numRuns;
+        
+        dx, dy = x - xMean[groupIDs], y - yMean[groupIDs];
+        
+        sxx = np.bincount(groupIDs, weights = dx * dx, minlength = numGroups);
+        sxy = np.bincount(groupIDs, weights = dx * dy, minlength = numGroups);
+        
+        deviceIDs, _ = GetGroupIDs([self.Configurations[DeviceClassKey]]);
+        
+        numDevices = np.max(deviceIDs) + 1;
+        
+        isFitted = numSizes > 1;
+        
+        pooledSxx = np.bincount(deviceIDs, weights = sxx, minlength = numDevices);
+        pooledSxy = np.bincount(deviceIDs, weights = sxy, minlength = numDevices);
+        
+        pooledExponents = np.full(numDevices, np.nan);
+        
+        np.divide(pooledSxy, pooledSxx, out = pooledExponents, where = pooledSxx > 0.0);
+        
+        exponents = np.where(isFitted, sxy / np.where(isFitted, sxx, 1.0), pooledExponents[deviceIDs]);
+        
+        residuals = dy - exponents[groupIDs] * dx;
+        
+        sumSquares = np.bincount(groupIDs, weights = residuals ** 2, minlength = numGroups);
+        
+        degreesOfFreedom = np.bincount(deviceIDs, weights = numRuns - np.where(isFitted, 2.0, 1.0), minlength = numDevices);
+        
+        pooledVariances = np.full(numDevices, np.nan);
+        
+        np.divide(np.bincount(deviceIDs, weights = sumSquares, minlength = numDevices), degreesOfFreedom, out = pooledVariances, where = degreesOfFreedom > 0.0);
+        
+        # Range of workloads each configuration was tested over, to flag extrapolated predictions.
+        
+        xMin, xMax = np.full(numGroups, np.inf), np.full(numGroups, -np.inf);
+        
+        np.minimum.at(xMin, groupIDs, x);
+        np.maximum.at(xMax, groupIDs, x);
+        
+        self.Configurations.update({
+            "NumRuns" : numRuns.astype(np.int64), "NumSizes" : numSizes,
+            "LogA" : yMean - exponents * xMean, "B" : exponents,
+            "XMean" : xMean, "Sxx" : np.where(isFitted, sxx, pooledSxx[deviceIDs]), "Variance" : pooledVariances[deviceIDs],
+            "WorkloadMin" : np.exp(xMin), "WorkloadMax" : np.exp(xMax)
+            });
+    
+    def Predict(self, workload):
+        # Returns a dictionary with the configurations and the predicted average SCF time for a system with the given workload estimate, with a 95 % prediction interval ("TSCFLower", "TSCFUpper").
+        # Configurations whose exponent could not be fitted (i.e. device classes tested at only one system size) are predicted as NaN.
+        
+        x = np.log(float(workload));
+        
+        configurations = self.Configurations;
+        
+        logT = configurations["LogA"] + configurations["B"] * x;
+        
+        leverage = 1.0 / configurations["NumRuns"] + (x - configurations["XMean"]) ** 2 / np.where(configurations["Sxx"] > 0.0, configurations["Sxx"], np.inf);
+        
+        sigma = np.sqrt(configurations["Variance"] * (1.0 + leverage));
+        
+        predictions = dict(configurations);
+        
+        predictions.update({
+            "TSCFPredicted" : np.exp(logT),
+            "TSCFLower" : np.exp(logT - _Z95 * sigma), "TSCFUpper" : np.exp(logT + _Z95 * sigma),
+            "Extrapolated" : (workload < configurations["WorkloadMin"]) | (workload > configurations["WorkloadMax"])
+            });
+        
+        return predictions;
+    
+    def Recommend(self, workload, deviceClass = None, maxProcesses = None, numKPoints = None, extraTags = "", count = 5, maxExtrapolation = DefaultMaxExtrapolation):
+        # Returns the count best configurations for each device class (or only deviceClass, if set), in the format returned by Predict(), sorted by device class and rank, with a "Rank" column added.
+        # Configurations are ranked by the upper bound of the prediction interval rather than the predicted time, so a configuration backed by few runs or a loose fit does not outrank a well-characterised one with a similar prediction; configurations whose interval is unknown are ranked after the others by predicted time.
+        # Configurations with more than maxProcesses processes, KPAR larger than numKPoints, or different extra tags are excluded, as are configurations only tested on systems with workloads more than maxExtrapolation times smaller than workload (if set).
+        
+        predictions = self.Predict(workload);
+        
+        mask = np.isfinite(predictions["TSCFPredicted"]) & (predictions["ExtraTags"] == extraTags);
+        
+        if deviceClass != None:
+            mask = mask & (predictions[DeviceClassKey] == deviceClass);
+        
+        if maxProcesses != None:
+            mask = mask & (predictions["NumProcesses"] <= maxProcesses);
+        
+        if numKPoints != None:
+            mask = mask & (predictions["KPAR"] <= numKPoints);
+        
+        if maxExtrapolation != None:
+            mask = mask & (workload <= maxExtrapolation * predictions["WorkloadMax"]);
+        
+        indices = np.nonzero(mask)[0];
+        
+        upperBounds = np.where(np.isfinite(predictions["TSCFUpper"][indices]), predictions["TSCFUpper"][indices], np.inf);
+        
+        indices = indices[np.lexsort([predictions["TSCFPredicted"][indices], upperBounds, predictions[DeviceClassKey][indices]])];
+        
+        # Rank within each device class.
+        
+        deviceClasses = predictions[DeviceClassKey][indices];
+        
+        ranks = np.arange(len(indices)) - np.searchsorted(deviceClasses, deviceClasses) + 1;
+        
+        indices, ranks = indices[ranks <= count], ranks[ranks <= count];
+        
+        shortlist = dict((key, array[indices]) for key, array in predictions.items());
+        
+        shortlist["Rank"] = ranks;
+        
+        return shortlist;
+
+
+def WriteShortlist(filePath, shortlist):
+    headers = [
+        "Device", "Rank", "# Proc", "KPAR", "NPAR", "NSIM", "Extra Tags",
+        "t_SCF,Pred. [s]", "t_SCF,Lower [s]", "t_SCF,Upper [s]", "B", "# Runs", "# Sizes", "Extrapolated"
+        ];
+    
+    names = [
+        DeviceClassKey, "Rank", "NumProcesses", "KPAR", "NPAR", "NSIM", "ExtraTags",
+        "TSCFPredicted", "TSCFLower", "TSCFUpper", "B", "NumRuns", "NumSizes", "Extrapolated"
+        ];
+    
+    with open(filePath, 'w') as outputWriter:
+        outputWriterCSV = csv.writer(outputWriter, delimiter = ',', quotechar = '\"', quoting = csv.QUOTE_ALL);
+        
+        outputWriterCSV.writerow(headers);
+        
+        for i in range(len(shortlist["Rank"])):
+            row = [shortlist[name][i].item() for name in names];
+            
+            # Intervals that could not be estimated (too few runs) are left blank.
+            
+            outputWriterCSV.writerow([value if value == value else "" for value in row[:-1]] + ["Yes" if row[-1] else "No"]);
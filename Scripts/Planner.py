@@ -0,0 +1,383 @@
+# Planner.py by J. M. Skelton
+
+
+import csv;
+import heapq;
+import math;
+import os;
+import sys;
+
+from Launcher import GetNumGPUs;
+from Monitor import DefaultScalingExponent, FormatDuration;
+from Shared import ReadINCARTags;
+from Sweep import GetParameterHeader;
+
+
+# Scripts used to simulate VASP runs (see GetSimulatedVASPCommand()).
+
+_FakeVASPScript = os.path.join(os.path.dirname(os.path.abspath(__file__)), "FakeVASP.py");
+_FakeLauncherScript = os.path.join(os.path.dirname(os.path.abspath(__file__)), "FakeLauncher.py");
+
+# Defaults for the timing model, from rough fits to the GeTe benchmarks in Benchmarks/GeTe: GeTe-64 runs at t_SCF ~ 1.2 s on 16 cores and ~ 3.4 s with one process on one GPU, and takes ~ 20 SCF steps.
+
+DefaultReferenceTSCF = 16.0;
+DefaultReferenceNumAtoms = 64;
+
+DefaultSerialFraction = 0.02;
+DefaultGPUSpeedup = 5.0;
+
+DefaultNumSCFSteps = 20;
+
+# VASP's default NELM, used if the SCF cannot converge (EDIFF = 0).
+
+_DefaultNELM = 60;
+
+# In the GeTe benchmarks, t_Elapsed ~ (# SCF steps + 5) x t_SCF: the setup and the first few (non-self-consistent) steps take around five average SCF steps.
+
+_StartupSCFSteps = 5.0;
+
+# Values of NSIM around which the model is fastest, and the fractional slowdown per factor of two away from them.
+
+_OptimalNSIM = { "CPU" : 4, "GPU" : 16 };
+
+_NSIMPenalty = 0.03;
+
+# Fractional slowdown per factor of two between NPAR and its optimal value: sqrt(# proc / KPAR) on CPUs and # proc / KPAR (i.e. NCORE = 1) on GPUs.
+
+_NPARPenalty = 0.1;
+
+# Speedup from each extra OpenMP thread per process, relative to an extra MPI process, on CPUs and GPUs (where the GPU does most of the work).
+
+_OMPThreadEfficiency = { "CPU" : 0.5, "GPU" : 0.05 };
+
+# Extra throughput from sharing each GPU between several processes, in the limit of many processes per GPU, with and without MPS.
+
+_GPUSharingGain = { False : 0.3, True : 0.6 };
+
+
+def _GetIntegerTag(tags, tag, default):
+    try:
+        return int(float(str(tags[tag]).strip()));
+    except (KeyError, ValueError):
+        return default;
+
+
+class TimingModel(object):
+    def __init__(self, referenceTSCF = DefaultReferenceTSCF, numSCFSteps = DefaultNumSCFSteps, gpuSpeedup = DefaultGPUSpeedup, numGPUs = 0, referenceNumAtoms = DefaultReferenceNumAtoms, scalingExponent = DefaultScalingExponent, serialFraction = DefaultSerialFraction):
+        # A simple model of the run time of VASP jobs, for planning sweeps and for FakeVASP.py; it captures the broad trends rather than predicting the times for a given machine.
+        # referenceTSCF: t_SCF (in seconds) of a referenceNumAtoms-atom system on one core; t_SCF scales with the number of atoms as N^scalingExponent.
+        # numSCFSteps: number of SCF steps to converge, if not set by NELM/NELMIN.
+        # gpuSpeedup: throughput of one GPU used by one MPI process, relative to one core.
+        # numGPUs: number of GPUs used by each job, if not set by the job (e.g. GPUTest.GPUsPerJob); if zero, jobs are modelled as running on CPUs.
+        # The speedup with the number of processes (or GPUs) follows Amdahl's law with serialFraction; k-point parallelism (KPAR) reduces the serial fraction, and NPAR and NSIM away from their optimal values, and sharing GPUs between processes, are modelled with simple penalties.
+        
+        self.ReferenceTSCF = referenceTSCF;
+        self.ReferenceNumAtoms = referenceNumAtoms;
+        self.ScalingExponent = scalingExponent;
+        self.SerialFraction = serialFraction;
+        self.GPUSpeedup = gpuSpeedup;
+        self.NumSCFSteps = numSCFSteps;
+        self.NumGPUs = numGPUs;
+    
+    def GetTSCF(self, numAtoms, numProcesses, incarTags, numThreads = None, numGPUs = 0, ranksPerGPU = None, useMPS = False):
+        # incarTags: dictionary of the (upper-case) INCAR tags for the job.
+        
+        tSCFSerial = self.ReferenceTSCF * (float(numAtoms) / self.ReferenceNumAtoms) ** self.ScalingExponent;
+        
+        kpar = max(_GetIntegerTag(incarTags, "KPAR", 1), 1);
+        
+        device = "GPU" if numGPUs > 0 else "CPU";
+        
+        threadFactor = 1.0 + _OMPThreadEfficiency[device] * ((numThreads if numThreads != None else 1) - 1);
+        
+        if device == "GPU":
+            if ranksPerGPU == None:
+                ranksPerGPU = max(numProcesses // numGPUs, 1);
+            
+            sharingFactor = 1.0 + _GPUSharingGain[bool(useMPS)] * (1.0 - 1.0 / ranksPerGPU);
+            
+            numWorkers = numGPUs * self.GPUSpeedup * sharingFactor * threadFactor;
+            
+            optimalNPAR = float(numProcesses) / kpar;
+        else:
+            numWorkers = numProcesses * threadFactor;
+            
+            optimalNPAR = math.sqrt(float(numProcesses) / kpar);
+        
+        serialFraction = self.SerialFraction / kpar;
+        
+        speedup = 1.0 / (serialFraction + (1.0 - serialFraction) / numWorkers);
+        
+        npar = max(_GetIntegerTag(incarTags, "NPAR", int(round(optimalNPAR))), 1);
+        nsim = max(_GetIntegerTag(incarTags, "NSIM", 4), 1);
+        
+        penalty = (1.0 + _NPARPenalty * abs(math.log(npar / max(optimalNPAR, 1.0), 2))) * (1.0 + _NSIMPenalty * abs(math.log(float(nsim) / _OptimalNSIM[device], 2)));
+        
+        return tSCFSerial / speedup * penalty;
+    
+    def GetNumSCFSteps(self, incarTags):
+        # The SCF never converges with EDIFF = 0 (see Sweep.FixedWorkloadTags()), so runs for NELM steps.
+        
+        numSCFSteps = self.NumSCFSteps;
+        
+        try:
+            if float(str(incarTags.get("EDIFF", 1.0e-4)).lower().replace('d', 'e')) == 0.0:
+                numSCFSteps = _GetIntegerTag(incarTags, "NELM", _DefaultNELM);
+        except ValueError:
+            pass;
+        
+        numSCFSteps = min(numSCFSteps, _GetIntegerTag(incarTags, "NELM", _DefaultNELM));
+        numSCFSteps = max(numSCFSteps, _GetIntegerTag(incarTags, "NELMIN", 0));
+        
+        return numSCFSteps;
+    
+    def GetTElapsed(self, tSCF, numSCFSteps):
+        return (numSCFSteps + _StartupSCFSteps) * tSCF;
+    
+    def Estimate(self, job, numAtoms, incarTags = None):
+        # Returns (# SCF steps, t_SCF, t_Elapsed) for job (a Scheduler.Job); incarTags are the tags set in the INCAR file, which are overridden by those set for the job.
+        
+        tags = dict(incarTags) if incarTags != None else { };
+        
+        for tag, value in job.INCARTags:
+            tags[tag.upper()] = value;
+        
+        numGPUs = job.NumGPUs if job.NumGPUs > 0 else self.NumGPUs;
+        
+        if job.RanksPerGPU != None:
+            numGPUs = GetNumGPUs(job.NumProcesses, job.RanksPerGPU);
+        
+        tSCF = self.GetTSCF(numAtoms, job.NumProcesses, tags, numThreads = job.NumThreads, numGPUs = numGPUs, ranksPerGPU = job.RanksPerGPU, useMPS = job.UseMPS);
+        
+        numSCFSteps = self.GetNumSCFSteps(tags);
+        
+        return (numSCFSteps, tSCF, self.GetTElapsed(tSCF, numSCFSteps));
+
+
+def GetSimulatedVASPCommand(timeScale, timingModel):
+    # Returns (VASP run command, MPS control command) to run FakeVASP.py in place of VASP, with the same timing model as timingModel and taking timeScale times the modelled time, for testing the sweep scripts end to end (see SimulateVASPTimeScale in CPUTest.py and GPUTest.py).
+    # If timingModel is for GPUs, the processes are started with FakeLauncher.py and each bound to a GPU, so that the GPU sharing settings (see Launcher.py) are simulated as well; the MPS control command is then that in FakeLauncher.py.
+    
+    python = "\"{0}\"".format(sys.executable);
+    
+    command = "{0} \"{1}\" --nproc <nproc> --time_scale {2} --reference_tscf {3} --scf_steps {4}".format(
+        python, _FakeVASPScript, timeScale, timingModel.ReferenceTSCF, timingModel.NumSCFSteps
+        );
+    
+    if timingModel.NumGPUs == 0:
+        return (command, None);
+    
+    launcher = "{0} \"{1}\"".format(python, _FakeLauncherScript);
+    
+    command = "{0} mpirun -np <nproc> <bind> {0} rank {1} --device gpu --gpus {2} --gpu_speedup {3}".format(
+        launcher, command, timingModel.NumGPUs, timingModel.GPUSpeedup
+        );
+    
+    return (command, "{0} mps-control".format(launcher));
+
+def SimulateSchedule(jobs, durations, pool, abortGroupOnFail = False):
+    # Replays the scheduling in Scheduler.RunJobs() for jobs with the given durations on the resources in pool, assuming every job succeeds.
+    # Returns a list of (start time, end time) for each job.
+    
+    pending = list(range(len(jobs)));
+    
+    running, times = [], [None] * len(jobs);
+    
+    now = 0.0;
+    
+    while len(pending) > 0 or len(running) > 0:
+        waitingGroups = set(jobs[i].Group for _, i, _ in running);
+        
+        for i in pending[:]:
+            job = jobs[i];
+            
+            if abortGroupOnFail and job.Group != None and job.Group in waitingGroups:
+                continue;
+            
+            allocation = pool.TryAllocate(job.NumCores, job.NumGPUs);
+            
+            if allocation == None:
+                waitingGroups.add(job.Group);
+                continue;
+            
+            pending.remove(i);
+            
+            waitingGroups.add(job.Group);
+            
+            times[i] = (now, now + durations[i]);
+            
+            heapq.heappush(running, (now + durations[i], i, allocation));
+        
+        now, _, allocation = heapq.heappop(running);
+        
+        pool.Release(allocation);
+    
+    return times;
+
+
+class _PlanEntry(object):
+    def __init__(self, point, status, reason = None, job = None):
+        # status: 'Run', 'Skipped' (by a filter), 'Duplicate' (of another point), 'Done' (the archive directory exists) or 'Too Large' (for the resources).
+        
+        self.Point = point;
+        self.Status = status;
+        self.Reason = reason;
+        self.Job = job;
+        
+        self.NumSCFSteps, self.TSCF, self.TElapsed = None, None, None;
+        
+        self.StartTime, self.EndTime = None, None;
+
+
+class SweepPlan(object):
+    def __init__(self, sweep, timingModel, numAtoms, incarFile = "INCAR", numGPUs = 0, abortParameter = None, pool = None):
+        # Works out which points in sweep would be run, skipped or are duplicates, and estimates the run time of each test with timingModel (a TimingModel).
+        # numGPUs and abortParameter are as for Sweep.Run(); if pool is set to a Scheduler.ResourcePool, the tests are scheduled on it as by Scheduler.RunJobs() to estimate the wall time.
+        # Duplicates are points that would run the same test as an earlier point (the same number of processes, INCAR tags and launch settings) or use the same archive directory.
+        
+        self.Sweep = sweep;
+        self.NumAtoms = numAtoms;
+        
+        incarTags = ReadINCARTags(incarFile) if incarFile != None and os.path.isfile(incarFile) else { };
+        
+        self.Entries = [];
+        
+        seenTests, seenArchiveDirs = { }, { };
+        
+        for point, job in zip(sweep.Points, sweep.GetJobs(numGPUs = numGPUs, abortParameter = abortParameter)):
+            testKey = (job.NumProcesses, tuple(sorted((tag.upper(), str(value)) for tag, value in job.INCARTags)), job.NumThreads, job.RanksPerGPU, job.UseMPS);
+            
+            if testKey in seenTests:
+                self.Entries.append(_PlanEntry(point, 'Duplicate', "Same test as {0}".format(seenTests[testKey].Label)));
+            elif job.ArchiveDir in seenArchiveDirs:
+                self.Entries.append(_PlanEntry(point, 'Duplicate', "Same archive directory as {0} (\"{1}\")".format(seenArchiveDirs[job.ArchiveDir].Label, job.ArchiveDir)));
+            elif os.path.exists(job.ArchiveDir):
+                self.Entries.append(_PlanEntry(point, 'Done', "Archive directory \"{0}\" already exists".format(job.ArchiveDir)));
+            elif pool != None and not pool.CanFit(job.NumCores, job.NumGPUs):
+                self.Entries.append(_PlanEntry(point, 'Too Large', "Requires more cores/GPUs than are available in the resource pool"));
+            else:
+                entry = _PlanEntry(point, 'Run', job = job);
+                
+                entry.NumSCFSteps, entry.TSCF, entry.TElapsed = timingModel.Estimate(job, numAtoms, incarTags = incarTags);
+                
+                self.Entries.append(entry);
+            
+            seenTests.setdefault(testKey, point);
+            seenArchiveDirs.setdefault(job.ArchiveDir, point);
+        
+        for point, reason in sweep.Skipped:
+            self.Entries.append(_PlanEntry(point, 'Skipped', reason));
+        
+        # Estimate the wall time by scheduling the tests on the resource pool.
+        
+        self.WallTime = None;
+        
+        runEntries = self.GetEntries('Run');
+        
+        if pool != None and len(runEntries) > 0:
+            times = SimulateSchedule([entry.Job for entry in runEntries], [entry.TElapsed for entry in runEntries], pool, abortGroupOnFail = abortParameter != None);
+            
+            for entry, (startTime, endTime) in zip(runEntries, times):
+                entry.StartTime, entry.EndTime = startTime, endTime;
+            
+            self.WallTime = max(endTime for _, endTime in times);
+    
+    def GetEntries(self, status):
+        return [entry for entry in self.Entries if entry.Status == status];
+    
+    def GetTotalTime(self):
+        return sum(entry.TElapsed for entry in self.GetEntries('Run'));
+    
+    def GetResourceHours(self):
+        # Returns (core hours, GPU hours) for the tests to be run.
+        
+        runEntries = self.GetEntries('Run');
+        
+        return (
+            sum(entry.TElapsed * entry.Job.NumCores for entry in runEntries) / 3600.0,
+            sum(entry.TElapsed * entry.Job.NumGPUs for entry in runEntries) / 3600.0
+            );
+    
+    def Print(self, name):
+        counts = ", ".join("{0} {1}".format(len(self.GetEntries(status)), label) for status, label in [
+            ('Run', "to run"), ('Skipped', "skipped"), ('Duplicate', "duplicate(s)"), ('Done', "already run"), ('Too Large', "too large for the resource pool")
+            ] if status == 'Run' or len(self.GetEntries(status)) > 0);
+        
+        print("Dry run: {0} ({1} atoms): {2} test(s): {3}".format(name, self.NumAtoms, len(self.Entries), counts));
+        
+        for entry in self.GetEntries('Run'):
+            print("  -> {0}: {1} SCF steps x t_SCF ~ {2:.2f} s -> t_Elapsed ~ {3}".format(entry.Point.Label, entry.NumSCFSteps, entry.TSCF, FormatDuration(entry.TElapsed)));
+        
+        # As in Sweep.PrintSkipped(), several points are usually skipped for the same reason, so each reason is only printed once.
+        
+        reasons = [];
+        
+        for entry in self.Entries:
+            if entry.Status != 'Run' and (entry.Status, entry.Reason) not in reasons:
+                reasons.append((entry.Status, entry.Reason));
+        
+        for status, reason in reasons:
+            print("  -> {0}: {1}".format(status, reason));
+        
+        coreHours, gpuHours = self.GetResourceHours();
+        
+        print("  -> Estimated test time: {0} in total ({1:.1f} core hours{2})".format(
+            FormatDuration(self.GetTotalTime()), coreHours, ", {0:.1f} GPU hours".format(gpuHours) if gpuHours > 0.0 else ""
+            ));
+        
+        if self.WallTime != None:
+            print("  -> Estimated wall time: {0} with the tests run concurrently on the resource pool".format(FormatDuration(self.WallTime)));
+        
+        print("");
+
+
+def WritePlans(filePath, plans):
+    # plans: list of (system name, SweepPlan) tuples.
+    
+    with open(filePath, 'w') as outputWriter:
+        outputWriterCSV = csv.writer(outputWriter, delimiter = ',', quotechar = '\"', quoting = csv.QUOTE_ALL);
+        
+        headersWritten = False;
+        
+        for name, plan in plans:
+            axisNames = [parameter for parameter, _ in plan.Sweep.Parameters];
+            derivedNames = plan.Sweep.GetDerivedNames([entry.Point for entry in plan.Entries]);
+            
+            if not headersWritten:
+                outputWriterCSV.writerow(
+                    ["System", "# Atoms"] + [GetParameterHeader(parameter) for parameter in axisNames + derivedNames]
+                        + ["Status", "Reason", "# Cores", "# GPUs", "# SCF Steps", "t_SCF [s]", "t_Elapsed [s]", "Start [s]", "End [s]"]
+                    );
+                
+                headersWritten = True;
+            
+            for entry in plan.Entries:
+                values = [entry.Point.Values.get(parameter, "") for parameter in axisNames + derivedNames];
+                
+                estimates = [entry.Job.NumCores, entry.Job.NumGPUs] if entry.Job != None else ["", ""];
+                
+                estimates = estimates + [round(value, 3) if value != None else "" for value in (entry.NumSCFSteps, entry.TSCF, entry.TElapsed, entry.StartTime, entry.EndTime)];
+                
+                outputWriterCSV.writerow([name, plan.NumAtoms] + values + [entry.Status, entry.Reason if entry.Reason != None else ""] + estimates);
+
+def PrintPlanTotals(plans, campaign = False):
+    # plans: list of (system name, SweepPlan) tuples.
+    
+    totalTime = sum(plan.GetTotalTime() for _, plan in plans);
+    
+    resourceHours = [plan.GetResourceHours() for _, plan in plans];
+    
+    print("Dry run: {0} test(s) to run, estimated test time {1} ({2:.1f} core hours{3})".format(
+        sum(len(plan.GetEntries('Run')) for _, plan in plans), FormatDuration(totalTime), sum(coreHours for coreHours, _ in resourceHours),
+        ", {0:.1f} GPU hours".format(sum(gpuHours for _, gpuHours in resourceHours)) if any(gpuHours > 0.0 for _, gpuHours in resourceHours) else ""
+        ));
+    
+    if all(plan.WallTime != None for _, plan in plans if len(plan.GetEntries('Run')) > 0):
+        print("  -> Estimated wall time: {0}".format(FormatDuration(sum(plan.WallTime for _, plan in plans if plan.WallTime != None))));
+    else:
+        print("  -> The wall time depends on the batch queue and is not estimated");
+    
+    # The adaptive NSIM search, early stopping and pruning configurations between structures in a campaign all reduce the number and/or length of the tests.
+    
+    print("  -> Tests skipped by AdaptiveNSIMSearch{0}, or stopped early with EarlyStopTolerance, are not predicted, so these are upper bounds".format(" or by the campaign" if campaign else ""));
+    print("");
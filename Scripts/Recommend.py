@@ -0,0 +1,270 @@
+# Recommend.py by J. M. Skelton
+
+
+import argparse;
+import os;
+
+import numpy as np;
+
+from Analysis import DeviceClassKey, LoadResultArrays;
+from PerformanceModel import DefaultMaxExtrapolation, GetSystemFeatures, GetWorkloadEstimates, ParseExtraTags, PerformanceModel, WriteShortlist;
+from Scheduler import ResourcePool;
+from Sweep import FixedWorkloadTags, NumProcessesKey, Sweep;
+from Validation import DefaultEnergyTolerance, DefaultSCFStepsTolerance;
+
+
+def _GetHistoryFeatures(systems, numAtoms, poscarDir):
+    # Features for the systems in the historical results, read from "POSCAR_<system>.vasp" and the INCAR, KPOINTS and POTCAR files in poscarDir, if available; otherwise only the number of atoms is known.
+    
+    featureSets = [];
+    
+    for system, systemNumAtoms in zip(systems, numAtoms):
+        poscarFile = os.path.join(poscarDir, "POSCAR_{0}.vasp".format(system)) if poscarDir != None else None;
+        
+        if poscarFile != None and os.path.isfile(poscarFile):
+            featureSets.append(GetSystemFeatures(
+                poscarFile, incarFile = os.path.join(poscarDir, "INCAR"), kpointsFile = os.path.join(poscarDir, "KPOINTS"), potcarFile = os.path.join(poscarDir, "POTCAR")
+                ));
+        else:
+            featureSets.append({ "NumAtoms" : systemNumAtoms });
+    
+    return featureSets;
+
+def _FormatConfiguration(shortlist, i):
+    label = "# proc = {0}, KPAR = {1}, NPAR = {2}, NSIM = {3}".format(shortlist["NumProcesses"][i], shortlist["KPAR"][i], shortlist["NPAR"][i], shortlist["NSIM"][i]);
+    
+    if shortlist["ExtraTags"][i] != "":
+        label = "{0}, {1}".format(label, shortlist["ExtraTags"][i]);
+    
+    return label;
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Recommend the fastest configurations (number of processes, KPAR, NPAR and NSIM) for a new system from the results of previous benchmarks, without a full sweep.");
+    
+    parser.set_defaults(
+        InputDir = ".",
+        ExtraTags = "",
+        Count = 5,
+        MaxExtrapolation = DefaultMaxExtrapolation,
+        OutputFile = "Recommend.csv",
+        VASPRunCommand = None,
+        RunDir = "Tmp",
+        SkipSCFCycles = 5,
+        VerifyOutputFile = "Recommend-Verify.csv"
+        );
+    
+    parser.add_argument(
+        metavar = "results_file", type = str, nargs = '+',
+        dest = 'ResultFiles',
+        help = "result stores (\".npz\" or \".parquet\") and/or CSV files written by CPUTest.py and GPUTest.py"
+        );
+    
+    parser.add_argument(
+        "--poscar_dir",
+        type = str, dest = 'POSCARDir',
+        help = "directory containing \"POSCAR_<system>.vasp\" files for the systems in the results, and the INCAR, KPOINTS and (optionally) POTCAR files used to run them; if not set, only the number of atoms is used to compare the systems"
+        );
+    
+    parser.add_argument(
+        "--input_dir",
+        type = str, dest = 'InputDir',
+        help = "directory containing the INCAR, KPOINTS, POSCAR and (optionally) POTCAR files for the new system (default: current directory)"
+        );
+    
+    parser.add_argument(
+        "--device",
+        type = str, dest = 'Device',
+        help = "device to recommend configurations for, e.g. \"CPU\", \"1GPU\" or \"4GPU\" (default: all devices in the results)"
+        );
+    
+    parser.add_argument(
+        "--max_processes",
+        type = int, dest = 'MaxProcesses',
+        help = "only recommend configurations with up to this many MPI processes"
+        );
+    
+    parser.add_argument(
+        "--extra_tags",
+        type = str, dest = 'ExtraTags',
+        help = "only use results with these extra INCAR tags, as written to the ExtraTags column of the result store (e.g. \"LPLANE = .FALSE.\"; default: results without extra tags)"
+        );
+    
+    parser.add_argument(
+        "--count",
+        type = int, dest = 'Count',
+        help = "number of configurations to recommend for each device (default: 5)"
+        );
+    
+    parser.add_argument(
+        "--max_extrapolation",
+        type = float, dest = 'MaxExtrapolation',
+        help = "exclude configurations only tested on systems with a workload estimate more than this factor smaller than the new system (default: {0:g}; 0 to disable)".format(DefaultMaxExtrapolation)
+        );
+    
+    parser.add_argument(
+        "--output",
+        type = str, dest = 'OutputFile',
+        help = "output file for the recommended configurations (default: Recommend.csv)"
+        );
+    
+    parser.add_argument(
+        "--verify",
+        dest = 'Verify', action = 'store_true',
+        help = "run a sweep over the recommended configurations for the new system, from --input_dir; requires --device and --vasp_command"
+        );
+    
+    parser.add_argument(
+        "--vasp_command",
+        type = str, dest = 'VASPRunCommand',
+        help = "command to run VASP for --verify, with \"<nproc>\" in place of the number of MPI processes, e.g. \"mpirun -np <nproc> vasp_std\""
+        );
+    
+    parser.add_argument(
+        "--run_dir",
+        type = str, dest = 'RunDir',
+        help = "temporary directory to run the --verify jobs in; must not exist (default: Tmp)"
+        );
+    
+    parser.add_argument(
+        "--cores_per_node",
+        type = int, dest = 'CoresPerNode',
+        help = "number of cores available for --verify jobs, which are run concurrently if they fit (default: the largest number of processes in the recommendations, i.e. one job at a time)"
+        );
+    
+    parser.add_argument(
+        "--skip_scf_cycles",
+        type = int, dest = 'SkipSCFCycles',
+        help = "exclude the first N SCF cycles from the average SCF times of the --verify jobs (default: 5)"
+        );
+    
+    parser.add_argument(
+        "--fixed_scf_steps",
+        type = int, dest = 'FixedSCFSteps',
+        help = "run the --verify jobs with a fixed workload of --skip_scf_cycles + N SCF steps (see FixedSCFSteps in CPUTest.py and GPUTest.py)"
+        );
+    
+    parser.add_argument(
+        "--verify_output",
+        type = str, dest = 'VerifyOutputFile',
+        help = "output file for the results of --verify; must not exist (default: Recommend-Verify.csv)"
+        );
+    
+    args = parser.parse_args();
+    
+    if args.Verify and (args.Device == None or args.VASPRunCommand == None):
+        raise Exception("Error: --verify requires --device and --vasp_command to be set.");
+    
+    arrays = LoadResultArrays(args.ResultFiles, poscarDir = args.POSCARDir);
+    
+    print("Loaded {0} result(s)".format(len(arrays["System"])));
+    print("");
+    
+    # Features for the historical systems and the new one, from which consistent workload estimates are calculated.
+    
+    systems, indices = np.unique(arrays["System"], return_index = True);
+    
+    featureSets = _GetHistoryFeatures(systems, arrays["NumAtoms"][indices], args.POSCARDir);
+    
+    newFeatures = GetSystemFeatures(
+        os.path.join(args.InputDir, "POSCAR"), incarFile = os.path.join(args.InputDir, "INCAR"), kpointsFile = os.path.join(args.InputDir, "KPOINTS"), potcarFile = os.path.join(args.InputDir, "POTCAR")
+        );
+    
+    workloads, featuresUsed = GetWorkloadEstimates(featureSets + [newFeatures]);
+    
+    print("New system: {0}".format(", ".join("{0} = {1}".format(key, round(value, 2) if isinstance(value, float) else value) for key, value in sorted(newFeatures.items()) if value != None)));
+    print("  -> Workload estimated from: {0}".format(", ".join(featuresUsed)));
+    print("");
+    
+    systemWorkloads = dict(zip(systems, workloads[:-1]));
+    
+    model = PerformanceModel(arrays, np.array([systemWorkloads[system] for system in arrays["System"]]));
+    
+    shortlist = model.Recommend(
+        workloads[-1], deviceClass = args.Device, maxProcesses = args.MaxProcesses, numKPoints = newFeatures["NumKPoints"], extraTags = args.ExtraTags, count = args.Count,
+        maxExtrapolation = args.MaxExtrapolation if args.MaxExtrapolation > 0.0 else None
+        );
+    
+    if len(shortlist["Rank"]) == 0:
+        raise Exception("Error: No configurations to recommend - please check --device, --max_processes and --extra_tags match the results, or increase --max_extrapolation.");
+    
+    print("Recommended configurations (predicted t_SCF with 95 % prediction interval, ranked by the upper bound):");
+    
+    for i in range(len(shortlist["Rank"])):
+        interval = "{0:.2f}-{1:.2f} s".format(shortlist["TSCFLower"][i], shortlist["TSCFUpper"][i]) if np.isfinite(shortlist["TSCFLower"][i]) else "unknown";
+        
+        print("  -> {0:<5} #{1}: {2} -> t_SCF ~ {3:.2f} s ({4}; {5} run(s), {6} size(s)){7}".format(
+            shortlist[DeviceClassKey][i], shortlist["Rank"][i], _FormatConfiguration(shortlist, i), shortlist["TSCFPredicted"][i], interval,
+            shortlist["NumRuns"][i], shortlist["NumSizes"][i], " [extrapolated]" if shortlist["Extrapolated"][i] else ""
+            ));
+    
+    print("");
+    
+    WriteShortlist(args.OutputFile, shortlist);
+    
+    print("Wrote \"{0}\"".format(args.OutputFile));
+    print("");
+    
+    if args.Verify:
+        # Sweep the union of the recommended values and skip the combinations that were not recommended.
+        
+        keys = set(zip(*[shortlist[name].tolist() for name in ("NumProcesses", "KPAR", "NPAR", "NSIM")]));
+        
+        parameters = [(name, sorted(set(key[i] for key in keys))) for i, name in enumerate([NumProcessesKey, "KPAR", "NPAR", "NSIM"])];
+        
+        fixedTags = ParseExtraTags(args.ExtraTags);
+        
+        if args.FixedSCFSteps != None:
+            fixedTags = fixedTags + FixedWorkloadTags(args.FixedSCFSteps, skipSCFCycles = args.SkipSCFCycles);
+        
+        sweep = Sweep(
+            parameters, os.path.normpath(os.path.join(args.InputDir, "Recommend-<nproc>-<kpar>-<npar>-<nsim>")), "Recommend.py",
+            filters = [lambda values: None if tuple(values[name] for name, _ in parameters) in keys else "Configuration not recommended"],
+            inputDir = args.InputDir, numAtoms = newFeatures["NumAtoms"], fixedTags = fixedTags
+            );
+        
+        sweep.CheckSetup(args.VerifyOutputFile, args.RunDir, args.VASPRunCommand, False);
+        
+        pool = ResourcePool(args.CoresPerNode if args.CoresPerNode != None else max(key[0] for key in keys));
+        
+        sweep.Run(pool, args.RunDir, args.VASPRunCommand);
+        
+        print("Collecting results...");
+        
+        data = sweep.CollectResults(skipSCFCycles = args.SkipSCFCycles, energyTolerance = DefaultEnergyTolerance, scfStepsTolerance = DefaultSCFStepsTolerance);
+        
+        print("");
+        
+        if len(data) == 0:
+            raise Exception("Error: No data collected from the --verify jobs - please check the *.out files from VASP jobs.");
+        
+        print("Verification (measured vs. predicted t_SCF):");
+        
+        for i in range(len(shortlist["Rank"])):
+            key = (shortlist["NumProcesses"][i].item(), shortlist["KPAR"][i].item(), shortlist["NPAR"][i].item(), shortlist["NSIM"][i].item());
+            
+            if key in data:
+                _, results, record = data[key];
+                
+                inInterval = shortlist["TSCFLower"][i] <= record['TSCFAve'] <= shortlist["TSCFUpper"][i];
+                
+                print("  -> #{0}: {1} -> t_SCF = {2:.2f} s (predicted {3:.2f} s{4}){5}".format(
+                    shortlist["Rank"][i], _FormatConfiguration(shortlist, i), record['TSCFAve'], shortlist["TSCFPredicted"][i],
+                    "" if inInterval or not np.isfinite(shortlist["TSCFLower"][i]) else ", outside interval", " [invalid]" if results[-1] == "No" else ""
+                    ));
+            else:
+                print("  -> #{0}: {1} -> failed".format(shortlist["Rank"][i], _FormatConfiguration(shortlist, i)));
+        
+        print("");
+        
+        validData = [(point, record) for point, results, record in data.values() if results[-1] != "No"];
+        
+        if len(validData) > 0:
+            point, record = min(validData, key = lambda item: item[1]['TSCFAve']);
+            
+            print("Fastest configuration: {0} (t_SCF = {1:.2f} s)".format(point.Label, record['TSCFAve']));
+            print("");
+        
+        print("Writing data to \"{0}\"...".format(args.VerifyOutputFile));
+        
+        sweep.WriteResults(args.VerifyOutputFile, data);
@@ -0,0 +1,208 @@
+# Regression.py by J. M. Skelton
+
+
+import csv;
+import math;
+
+from collections import OrderedDict;
+
+
+# Columns used to match runs between two sets of results.
+# The device and number of GPUs are included so that e.g. 1GPU and 4GPU runs with the same number of processes are not compared; any extra INCAR tags must also match.
+
+MatchColumns = ["System", "Device", "NumGPUs", "NumProcesses", "KPAR", "NPAR", "NSIM", "ExtraTags"];
+
+
+def _BetaContinuedFraction(a, b, x, maxIterations = 200, epsilon = 3.0e-14):
+    # Continued fraction for the incomplete beta function, evaluated with the modified Lentz method (Numerical Recipes, Sec. 6.4).
+    
+    tiny = 1.0e-300;
+    
+    c, d = 1.0, 1.0 - (a + b) * x / (a + 1.0);
+    
+    d = 1.0 / (d if abs(d) > tiny else tiny);
+    
+    h = d;
+    
+    for m in range(1, maxIterations + 1):
+        for numerator in (m * (b - m) * x / ((a + 2 * m - 1.0) * (a + 2 * m)), -(a + m) * (a + b + m) * x / ((a + 2 * m) * (a + 2 * m + 1.0))):
+            d = 1.0 + numerator * d;
+            d = 1.0 / (d if abs(d) > tiny else tiny);
+            
+            c = 1.0 + numerator / c;
+            c = c if abs(c) > tiny else tiny;
+            
+            h *= c * d;
+        
+        if abs(c * d - 1.0) < epsilon:
+            break;
+    
+    return h;
+
+def RegularisedIncompleteBeta(a, b, x):
+    if x <= 0.0:
+        return 0.0;
+    
+    if x >= 1.0:
+        return 1.0;
+    
+    front = math.exp(math.lgamma(a + b) - math.lgamma(a) - math.lgamma(b) + a * math.log(x) + b * math.log(1.0 - x));
+    
+    if x < (a + 1.0) / (a + b + 2.0):
+        return front * _BetaContinuedFraction(a, b, x) / a;
+    
+    return 1.0 - front * _BetaContinuedFraction(b, a, 1.0 - x) / b;
+
+def StudentTUpperTail(t, degreesOfFreedom):
+    # P(T > t) for Student's t distribution.
+    
+    tail = 0.5 * RegularisedIncompleteBeta(degreesOfFreedom / 2.0, 0.5, degreesOfFreedom / (degreesOfFreedom + t * t));
+    
+    return tail if t >= 0.0 else 1.0 - tail;
+
+def GetSummaryStatistics(samples):
+    # Returns (mean, variance, number of samples) with the sample variance.
+    
+    numSamples = len(samples);
+    
+    mean = sum(samples) / numSamples;
+    
+    return (mean, sum((sample - mean) ** 2 for sample in samples) / (numSamples - 1), numSamples);
+
+def WelchTTest(statistics1, statistics2):
+    # One-sided Welch's t-test for the mean of sample 2 being larger than that of sample 1, given (mean, variance, number of samples) for each.
+    # Returns the p value.
+    
+    mean1, variance1, numSamples1 = statistics1;
+    mean2, variance2, numSamples2 = statistics2;
+    
+    error1, error2 = variance1 / numSamples1, variance2 / numSamples2;
+    
+    if error1 + error2 == 0.0:
+        return 0.0 if mean2 > mean1 else 1.0;
+    
+    t = (mean2 - mean1) / math.sqrt(error1 + error2);
+    
+    degreesOfFreedom = (error1 + error2) ** 2 / (error1 ** 2 / (numSamples1 - 1) + error2 ** 2 / (numSamples2 - 1));
+    
+    return StudentTUpperTail(t, degreesOfFreedom);
+
+def GetSCFSamples(store, index):
+    # Returns the SCF times averaged for a run (i.e. excluding any skipped at the start), or None if the per-step times were not stored.
+    
+    scfTimes = store.GetSCFTimes(index);
+    
+    numSCFSteps = store.Columns["NumSCFSteps"][index];
+    
+    if len(scfTimes) == 0 or numSCFSteps <= 0:
+        return None;
+    
+    return scfTimes[max(len(scfTimes) - numSCFSteps, 0):];
+
+def _GroupRuns(store):
+    # Groups the valid runs in store by MatchColumns; repeated runs of the same configuration are pooled.
+    # Runs that failed the validation (Valid = 0) are left out, as are runs without timings; runs that were not checked (Valid = -1) are kept.
+    
+    groups = OrderedDict();
+    
+    for i in range(len(store)):
+        tSCF = store.Columns["TSCFAve"][i];
+        
+        if tSCF != tSCF or store.Columns["NumSCFSteps"][i] <= 0 or store.Columns["Valid"][i] == 0:
+            continue;
+        
+        key = tuple(store.Columns[name][i] for name in MatchColumns);
+        
+        groups.setdefault(key, []).append(i);
+    
+    return groups;
+
+def _GetGroupStatistics(store, indices):
+    # Returns (mean t_SCF, mean t_Elapsed, (mean, variance, n) for the SCF times or None).
+    # If the configuration was run more than once, the statistics are calculated from the average SCF times of the runs, which are the independent samples; their spread includes the run-to-run variation (e.g. from node placement or contention) as well as the step-to-step noise.
+    # For a single run, the per-step SCF times are used if available, otherwise the standard deviation in the results (e.g. from CSV files written by newer versions of the sweep scripts), if any.
+    # This is a heuristic: the steps within a run are not independent and the run-to-run variation is not captured, so the p values are optimistic, and repeated runs should be used where a reliable test is needed.
+    
+    tSCF = sum(store.Columns["TSCFAve"][i] for i in indices) / len(indices);
+    
+    tElapsedValues = [store.Columns["TElapsed"][i] for i in indices if store.Columns["TElapsed"][i] == store.Columns["TElapsed"][i]];
+    
+    tElapsed = sum(tElapsedValues) / len(tElapsedValues) if len(tElapsedValues) > 0 else float('nan');
+    
+    if len(indices) > 1:
+        return (tSCF, tElapsed, GetSummaryStatistics([store.Columns["TSCFAve"][i] for i in indices]));
+    
+    index = indices[0];
+    
+    samples = GetSCFSamples(store, index);
+    
+    if samples != None and len(samples) > 1:
+        return (tSCF, tElapsed, GetSummaryStatistics(samples));
+    
+    stdDev, numSCFSteps = store.Columns["TSCFStdDev"][index], store.Columns["NumSCFSteps"][index];
+    
+    if stdDev == stdDev and numSCFSteps > 1:
+        return (tSCF, tElapsed, (store.Columns["TSCFAve"][index], stdDev ** 2, numSCFSteps));
+    
+    return (tSCF, tElapsed, None);
+
+def CompareResults(oldStore, newStore, threshold = 0.05, alpha = 0.05):
+    # Compares the runs in newStore against the matching runs in oldStore.
+    # A run is flagged as a regression if its average SCF time is more than threshold (e.g. 0.05 = 5 %) slower and the slowdown is statistically significant at the alpha level (one-sided Welch's t-test on the average SCF times of repeated runs, or the per-step SCF times of single runs; see _GetGroupStatistics()).
+    # If there is not enough data to test the significance, any slowdown larger than threshold is flagged.
+    # Returns (comparisons, keys only in oldStore, keys only in newStore), where comparisons is a list of dictionaries; PValue and PValueFaster are the p values for the new runs being slower and faster, respectively.
+    
+    oldGroups, newGroups = _GroupRuns(oldStore), _GroupRuns(newStore);
+    
+    comparisons = [];
+    
+    for key, newIndices in newGroups.items():
+        if key not in oldGroups:
+            continue;
+        
+        oldTSCF, oldTElapsed, oldStatistics = _GetGroupStatistics(oldStore, oldGroups[key]);
+        newTSCF, newTElapsed, newStatistics = _GetGroupStatistics(newStore, newIndices);
+        
+        tSCFChange = newTSCF / oldTSCF - 1.0;
+        tElapsedChange = newTElapsed / oldTElapsed - 1.0 if oldTElapsed == oldTElapsed and newTElapsed == newTElapsed else float('nan');
+        
+        pSlower, pFaster = None, None;
+        
+        if oldStatistics != None and newStatistics != None:
+            pSlower = WelchTTest(oldStatistics, newStatistics);
+            pFaster = WelchTTest(newStatistics, oldStatistics);
+        
+        status = "OK";
+        
+        if tSCFChange > threshold:
+            status = "Regression" if pSlower == None or pSlower < alpha else "Slower (not significant)";
+        elif tSCFChange < -threshold and (pFaster == None or pFaster < alpha):
+            status = "Faster";
+        
+        comparisons.append({
+            'Key' : key, 'Status' : status,
+            'OldTSCF' : oldTSCF, 'NewTSCF' : newTSCF, 'TSCFChange' : tSCFChange, 'PValue' : pSlower, 'PValueFaster' : pFaster,
+            'OldTElapsed' : oldTElapsed, 'NewTElapsed' : newTElapsed, 'TElapsedChange' : tElapsedChange,
+            'ElapsedRegression' : tElapsedChange > threshold
+            });
+    
+    return (
+        comparisons,
+        [key for key in oldGroups if key not in newGroups],
+        [key for key in newGroups if key not in oldGroups]
+        );
+
+def WriteComparisons(filePath, comparisons):
+    with open(filePath, 'w') as outputWriter:
+        outputWriterCSV = csv.writer(outputWriter, delimiter = ',', quotechar = '\"', quoting = csv.QUOTE_ALL);
+        
+        outputWriterCSV.writerow(
+            ["System", "Device", "# GPUs", "# Proc", "KPAR", "NPAR", "NSIM", "Extra Tags"]
+            + ["t_SCF,Ave (Old) [s]", "t_SCF,Ave (New) [s]", "t_SCF Change [%]", "p (Slower)", "t_Elapsed (Old) [s]", "t_Elapsed (New) [s]", "t_Elapsed Change [%]", "Status"]
+            );
+        
+        for comparison in comparisons:
+            outputWriterCSV.writerow(list(comparison['Key']) + [
+                comparison['OldTSCF'], comparison['NewTSCF'], 100.0 * comparison['TSCFChange'], comparison['PValue'] if comparison['PValue'] != None else "",
+                comparison['OldTElapsed'], comparison['NewTElapsed'], 100.0 * comparison['TElapsedChange'], comparison['Status']
+                ]);
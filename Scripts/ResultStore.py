@@ -0,0 +1,326 @@
+# ResultStore.py by J. M. Skelton
+
+
+import csv;
+import os;
+import re;
+
+from collections import OrderedDict;
+
+from Validation import DefaultEnergyTolerance, DefaultSCFStepsTolerance, ValidateResults;
+
+
+# Columns in a result store, with one row per run, and the type of each.
+# Missing integer values are stored as -1 and missing float values as NaN, so every column can be stored as a typed array.
+# Valid is set to 1 or 0 if the final energy and number of SCF steps of a run passed or failed the checks in Validation.ValidateResults(), or -1 if the run was not checked.
+# The times of the SCF steps in each run are stored separately, as a flat array of times and an array of offsets to the start of each run ("compressed sparse row" format).
+
+StoreColumns = [
+    ("System", str), ("NumAtoms", int), ("Device", str), ("NumGPUs", int),
+    ("NumProcesses", int), ("KPAR", int), ("NPAR", int), ("NSIM", int), ("ExtraTags", str),
+    ("NumSCFSteps", int), ("TSCFAve", float), ("TElapsed", float), ("FinalTotalEnergy", float),
+    ("TSCFMedian", float), ("TSCFStdDev", float), ("TSCFMin", float), ("TIonicAve", float),
+    ("MaxMemory", float), ("Rank0Memory", float),
+    ("PeakRSS", float), ("MeanCPUUsage", float), ("MeanGPUUtilisation", float), ("PeakGPUMemory", float),
+    ("Valid", int),
+    ("Source", str)
+    ];
+
+# Columns in the CSV files written by CPUTest.py and GPUTest.py (see Sweep.ResultHeaders); other columns are taken to be extra INCAR tags.
+
+_CSVHeaderColumns = {
+    "# Proc" : "NumProcesses", "KPAR" : "KPAR", "NPAR" : "NPAR", "NSIM" : "NSIM",
+    "# SCF Steps" : "NumSCFSteps", "t_SCF,Ave [s]" : "TSCFAve", "t_Elapsed [s]" : "TElapsed", "Final E_0 [eV]" : "FinalTotalEnergy",
+    "t_SCF,Median [s]" : "TSCFMedian", "t_SCF,StdDev [s]" : "TSCFStdDev", "t_SCF,Min [s]" : "TSCFMin", "t_Ionic,Ave [s]" : "TIonicAve",
+    "Max. Memory [kB]" : "MaxMemory", "Rank-0 Memory [kB]" : "Rank0Memory",
+    "Peak RSS [kB]" : "PeakRSS", "CPU Usage,Mean [%]" : "MeanCPUUsage", "GPU Util.,Mean [%]" : "MeanGPUUtilisation", "GPU Memory,Peak [kB]" : "PeakGPUMemory",
+    "Valid" : "Valid"
+    };
+
+_CSVValidValues = { "Yes" : 1, "No" : 0, "" : -1 };
+
+# Names of the CSV files in Benchmarks/*/Results_*, e.g. "CPU-Gamma_GeTe-64.csv" or "4GPU_GeTe-128.csv".
+
+_CSVFileNameRegex = re.compile(r"^(?P<prefix>[^_]+)_(?P<system>.+)\.csv$");
+
+_CSVGPUPrefixRegex = re.compile(r"^(?P<num_gpus>\d*)GPU");
+
+# Trailing number of atoms in system names such as "GeTe-64".
+
+_SystemNumAtomsRegex = re.compile(r"-(?P<num_atoms>\d+)$");
+
+
+def _GetMissingValue(columnType):
+    return -1 if columnType == int else float('nan') if columnType == float else "";
+
+def _ConvertValue(value, columnType):
+    if value == None or value == "":
+        return _GetMissingValue(columnType);
+    
+    if columnType == int:
+        return int(float(value));
+    
+    return columnType(value);
+
+
+class ResultStore(object):
+    def __init__(self):
+        # Table of benchmark results stored by column; use Save() and LoadResultStore() to write to and read from NPZ or Parquet files.
+        
+        self.Columns = OrderedDict((name, []) for name, _ in StoreColumns);
+        
+        self.SCFTimes = [];
+        self.SCFTimeOffsets = [0];
+    
+    def __len__(self):
+        return len(self.Columns["System"]);
+    
+    def AddRow(self, values, scfTimes = None):
+        # values: dictionary of column values; columns that are not set are stored as missing.
+        # scfTimes: times of all the SCF steps in the run, if available.
+        
+        for name, columnType in StoreColumns:
+            self.Columns[name].append(_ConvertValue(values.get(name), columnType));
+        
+        if scfTimes != None:
+            self.SCFTimes.extend(float(t) for t in scfTimes);
+        
+        self.SCFTimeOffsets.append(len(self.SCFTimes));
+    
+    def Extend(self, other):
+        for i in range(len(other)):
+            self.AddRow(other.GetRow(i), scfTimes = other.GetSCFTimes(i));
+    
+    def GetRow(self, index):
+        return OrderedDict((name, self.Columns[name][index]) for name, _ in StoreColumns);
+    
+    def GetSCFTimes(self, index):
+        return self.SCFTimes[self.SCFTimeOffsets[index]:self.SCFTimeOffsets[index + 1]];
+    
+    def Select(self, **criteria):
+        # Returns a new ResultStore with the rows where each column named in criteria has the given value, e.g. Select(System = "GeTe-64", Device = "CPU").
+        
+        for name in criteria:
+            if name not in self.Columns:
+                raise Exception("Error: ResultStore.Select(): Unknown column \"{0}\".".format(name));
+        
+        store = ResultStore();
+        
+        for i in range(len(self)):
+            if all(self.Columns[name][i] == value for name, value in criteria.items()):
+                store.AddRow(self.GetRow(i), scfTimes = self.GetSCFTimes(i));
+        
+        return store;
+    
+    def GetArrays(self):
+        # Returns the columns as a dictionary of NumPy arrays, for vectorised queries over the table; requires NumPy.
+        
+        import numpy as np;
+        
+        arrays = OrderedDict();
+        
+        for name, columnType in StoreColumns:
+            arrays[name] = np.array(self.Columns[name], dtype = np.int64 if columnType == int else np.float64 if columnType == float else np.str_);
+        
+        arrays["SCFTimes"] = np.array(self.SCFTimes, dtype = np.float64);
+        arrays["SCFTimeOffsets"] = np.array(self.SCFTimeOffsets, dtype = np.int64);
+        
+        return arrays;
+    
+    def Save(self, filePath):
+        # The format is chosen from the file extension: ".npz" (requires NumPy) or ".parquet" (requires PyArrow).
+        
+        storeFormat = GetStoreFormat(filePath);
+        
+        if storeFormat == 'npz':
+            import numpy as np;
+            
+            # np.savez_compressed() adds ".npz" to the file name if it is not there already, so write to an open file instead.
+            
+            with open(filePath, 'wb') as outputWriter:
+                np.savez_compressed(outputWriter, **self.GetArrays());
+        else:
+            import pyarrow;
+            import pyarrow.parquet;
+            
+            columns = OrderedDict(self.Columns);
+            columns["SCFTimes"] = [self.GetSCFTimes(i) for i in range(len(self))];
+            
+            pyarrow.parquet.write_table(pyarrow.table(columns), filePath);
+
+
+def GetStoreFormat(filePath):
+    extension = os.path.splitext(filePath)[1].lower();
+    
+    if extension == ".npz":
+        return 'npz';
+    elif extension == ".parquet":
+        return 'parquet';
+    
+    raise Exception("Error: Result store \"{0}\" must have the extension \".npz\" or \".parquet\".".format(filePath));
+
+def CheckStoreFormat(filePath):
+    # Checks the module needed to write the store at filePath is available, so scripts can fail at startup rather than after running the benchmarks.
+    
+    storeFormat = GetStoreFormat(filePath);
+    
+    try:
+        if storeFormat == 'npz':
+            import numpy;
+        else:
+            import pyarrow;
+    except ImportError:
+        raise Exception("Error: Writing \"{0}\" requires the {1} module.".format(filePath, "NumPy" if storeFormat == 'npz' else "PyArrow"));
+
+def LoadResultStore(filePath):
+    storeFormat = GetStoreFormat(filePath);
+    
+    store = ResultStore();
+    
+    if storeFormat == 'npz':
+        import numpy as np;
+        
+        with np.load(filePath, allow_pickle = False) as arrays:
+            numRows = len(arrays["SCFTimeOffsets"]) - 1;
+            
+            for name, columnType in StoreColumns:
+                # Columns added since the store was written are filled with missing values.
+                
+                if name in arrays:
+                    store.Columns[name] = [columnType(value) for value in arrays[name].tolist()];
+                else:
+                    store.Columns[name] = [_GetMissingValue(columnType)] * numRows;
+            
+            store.SCFTimes = arrays["SCFTimes"].tolist();
+            store.SCFTimeOffsets = arrays["SCFTimeOffsets"].tolist();
+    else:
+        import pyarrow.parquet;
+        
+        columns = pyarrow.parquet.read_table(filePath).to_pydict();
+        
+        numRows = len(columns["SCFTimes"]);
+        
+        for name, columnType in StoreColumns:
+            if name in columns:
+                store.Columns[name] = [_ConvertValue(value, columnType) for value in columns[name]];
+            else:
+                store.Columns[name] = [_GetMissingValue(columnType)] * numRows;
+        
+        for scfTimes in columns["SCFTimes"]:
+            store.SCFTimes.extend(scfTimes if scfTimes != None else []);
+            store.SCFTimeOffsets.append(len(store.SCFTimes));
+    
+    return store;
+
+def LoadResults(filePaths, poscarDir = None):
+    # Loads result stores (".npz" or ".parquet") and/or imports CSV files written by CPUTest.py and GPUTest.py, and returns the combined results as a ResultStore.
+    
+    store = ResultStore();
+    
+    for filePath in filePaths:
+        if os.path.splitext(filePath)[1].lower() == ".csv":
+            store.Extend(ImportResultsCSV(filePath, poscarDir = poscarDir));
+        else:
+            store.Extend(LoadResultStore(filePath));
+    
+    return store;
+
+def GetNumAtoms(poscarFile):
+    # Number of atoms in a POSCAR file; in VASP 5 files the atom counts are on the seventh line, after the atomic symbols, whereas VASP 4 files have them on the sixth.
+    
+    with open(poscarFile, 'r') as inputReader:
+        lines = [inputReader.readline() for i in range(7)];
+    
+    countsLine = lines[5] if all(item.isdigit() for item in lines[5].split()) else lines[6];
+    
+    return sum(int(count) for count in countsLine.split());
+
+def GetSystemName(poscarFile):
+    # Default system name for results from a POSCAR file, made from the first word of the title line and the number of atoms, e.g. "GeTe-64".
+    
+    with open(poscarFile, 'r') as inputReader:
+        title = inputReader.readline().split();
+    
+    return "{0}-{1}".format(title[0] if len(title) > 0 else "System", GetNumAtoms(poscarFile));
+
+def GetDeviceFromPrefix(prefix):
+    # Returns (device, number of GPUs) from the prefix of a result CSV file name, e.g. "CPU-Gamma" -> ("CPU", 0) or "4GPU" -> ("GPU", 4).
+    
+    match = _CSVGPUPrefixRegex.match(prefix);
+    
+    if match:
+        return ("GPU", int(match.group('num_gpus')) if match.group('num_gpus') != "" else 1);
+    
+    return ("CPU", 0);
+
+def ImportResultsCSV(filePath, system = None, numAtoms = None, device = None, numGPUs = None, poscarDir = None, energyTolerance = DefaultEnergyTolerance, scfStepsTolerance = DefaultSCFStepsTolerance):
+    # Reads a CSV file written by CPUTest.py or GPUTest.py into a ResultStore; the "Data: ..." matrix blocks at the end of the file are ignored, as they duplicate the table at the top.
+    # If system and/or device are not given, they are taken from the file name, e.g. "4GPU_GeTe-128.csv" -> system = "GeTe-128", device = "GPU", numGPUs = 4.
+    # If numAtoms is not given, it is read from "POSCAR_<system>.vasp" in poscarDir, if set, or else taken from the end of the system name.
+    # Files written before the sweep scripts validated the results do not have a "Valid" column; the rows in these files are validated against each other with energyTolerance and scfStepsTolerance, unless energyTolerance is set to None.
+    
+    fileName = os.path.basename(filePath);
+    
+    match = _CSVFileNameRegex.match(fileName);
+    
+    if system == None:
+        system = match.group('system') if match else os.path.splitext(fileName)[0];
+    
+    if device == None:
+        device, defaultNumGPUs = GetDeviceFromPrefix(match.group('prefix')) if match else ("CPU", 0);
+        
+        if numGPUs == None:
+            numGPUs = defaultNumGPUs;
+    
+    if numAtoms == None:
+        poscarFile = os.path.join(poscarDir, "POSCAR_{0}.vasp".format(system)) if poscarDir != None else None;
+        
+        if poscarFile != None and os.path.isfile(poscarFile):
+            numAtoms = GetNumAtoms(poscarFile);
+        else:
+            match = _SystemNumAtomsRegex.search(system);
+            
+            if match:
+                numAtoms = int(match.group('num_atoms'));
+    
+    store = ResultStore();
+    
+    with open(filePath, 'r') as inputReader:
+        inputReaderCSV = csv.reader(inputReader);
+        
+        headers = next(inputReaderCSV);
+        
+        for row in inputReaderCSV:
+            # The table ends at the first blank row; files rewritten by PadCSV.py have rows of empty strings.
+            
+            if all(value == "" for value in row):
+                break;
+            
+            values = { 'System' : system, 'NumAtoms' : numAtoms, 'Device' : device, 'NumGPUs' : numGPUs, 'Source' : fileName };
+            
+            extraTags = [];
+            
+            for header, value in zip(headers, row):
+                if header == "":
+                    continue;
+                
+                if header == "Valid":
+                    values['Valid'] = _CSVValidValues.get(value, -1);
+                elif header in _CSVHeaderColumns:
+                    values[_CSVHeaderColumns[header]] = value;
+                else:
+                    extraTags.append("{0} = {1}".format(header, value));
+            
+            values['ExtraTags'] = ", ".join(extraTags);
+            
+            store.AddRow(values);
+    
+    if "Valid" not in headers and energyTolerance != None:
+        validation = ValidateResults(
+            [(store.Columns["FinalTotalEnergy"][i], store.Columns["NumSCFSteps"][i]) if store.Columns["FinalTotalEnergy"][i] == store.Columns["FinalTotalEnergy"][i] and store.Columns["NumSCFSteps"][i] > 0 else None for i in range(len(store))],
+            energyTolerance = energyTolerance, scfStepsTolerance = scfStepsTolerance
+            );
+        
+        store.Columns["Valid"] = [1 if valid == True else 0 if valid == False else -1 for valid, _ in validation];
+    
+    return store;
@@ -0,0 +1,480 @@
+# Scheduler.py by J. M. Skelton
+
+
+import os;
+import shutil;
+import sys;
+import threading;
+
+from Execution import Executor, FormatSize;
+from Failures import ClassifyFailure, Failure, IsDoomed, TimeoutFailure, UnknownFailure;
+from Launcher import DefaultMPSControlCommand, WriteLaunchScripts;
+from Telemetry import GetTelemetryFile;
+
+
+# Lock used to stop the messages printed by concurrent jobs from interleaving.
+
+_PrintLock = threading.Lock();
+
+
+def PrintLines(lines):
+    with _PrintLock:
+        for line in lines:
+            print(line);
+        
+        sys.stdout.flush();
+
+
+class ResourcePool(object):
+    def __init__(self, coresPerNode, gpuIDs = None, nodes = None, maxJobs = None):
+        # maxJobs: if set, the maximum number of jobs allocated at once, e.g. 1 to run jobs one at a time when the resources are not known.
+        
+        if coresPerNode == None or coresPerNode < 1:
+            raise Exception("Error: ResourcePool(): coresPerNode must be a positive integer.");
+        
+        if maxJobs != None and maxJobs < 1:
+            raise Exception("Error: ResourcePool(): If set, maxJobs must be a positive integer.");
+        
+        if nodes == None or len(nodes) == 0:
+            nodes = [None];
+        
+        if gpuIDs == None:
+            gpuIDs = [];
+        
+        self._coresPerNode = coresPerNode;
+        self._numGPUsPerNode = len(gpuIDs);
+        
+        self._freeCores = [coresPerNode for node in nodes];
+        self._freeGPUs = [list(gpuIDs) for node in nodes];
+        
+        self._nodes = list(nodes);
+        
+        self._maxJobs = maxJobs;
+        self._numJobs = 0;
+    
+    def CanFit(self, numCores, numGPUs):
+        return numCores <= self._coresPerNode and numGPUs <= self._numGPUsPerNode;
+    
+    def TryAllocate(self, numCores, numGPUs):
+        # First fit: jobs are never split across nodes.
+        
+        if self._maxJobs != None and self._numJobs >= self._maxJobs:
+            return None;
+        
+        for i, node in enumerate(self._nodes):
+            if self._freeCores[i] >= numCores and len(self._freeGPUs[i]) >= numGPUs:
+                gpuIDs = self._freeGPUs[i][:numGPUs];
+                
+                self._freeCores[i] -= numCores;
+                self._freeGPUs[i] = self._freeGPUs[i][numGPUs:];
+                
+                self._numJobs += 1;
+                
+                return (i, numCores, gpuIDs);
+        
+        return None;
+    
+    def Release(self, allocation):
+        i, numCores, gpuIDs = allocation;
+        
+        self._freeCores[i] += numCores;
+        self._freeGPUs[i] = sorted(self._freeGPUs[i] + gpuIDs);
+        
+        self._numJobs -= 1;
+    
+    def GetHost(self, allocation):
+        return self._nodes[allocation[0]];
+
+
+class Job(object):
+    def __init__(self, archiveDir, label, numProcesses, incarTags, numGPUs = 0, group = None, numAtoms = None, inputDir = ".", numThreads = None, ranksPerGPU = None, useMPS = False, mpsControlCommand = DefaultMPSControlCommand):
+        # archiveDir: directory the run is archived to on success; if it already exists, the job is skipped.
+        # label: description of the sweep point used in status messages, e.g. "# proc = 4, NSIM = 8".
+        # incarTags: list of (tag, value) tuples appended to the INCAR file.
+        # group: jobs sharing a group (e.g. a row of NSIM values) can be abandoned together when one of them fails.
+        # numAtoms: number of atoms in the system, if known; used by Monitor.ProgressMonitor to estimate the time remaining.
+        # inputDir: directory containing the INCAR, KPOINTS, POSCAR and POTCAR files for the job.
+        # numThreads, ranksPerGPU, useMPS: launch settings (see Launcher.WriteLaunchScripts()); each process is allocated numThreads cores, if set.
+        
+        self.ArchiveDir = archiveDir;
+        self.Label = label;
+        
+        self.NumProcesses = numProcesses;
+        self.NumGPUs = numGPUs;
+        
+        self.INCARTags = incarTags;
+        
+        self.Group = group;
+        
+        self.NumAtoms = numAtoms;
+        
+        self.InputDir = inputDir;
+        
+        self.NumThreads = numThreads;
+        self.RanksPerGPU = ranksPerGPU;
+        self.UseMPS = useMPS;
+        
+        self.MPSControlCommand = mpsControlCommand;
+        
+        self.Status = None;
+        
+        # Set by RunJobs(): the number of times the job has been started, the Failures.Failure if it failed, and the reason it was not run if it was aborted.
+        
+        self.Attempts = 0;
+        self.Failure = None;
+        self.Reason = None;
+    
+    @property
+    def NumCores(self):
+        return self.NumProcesses * (self.NumThreads if self.NumThreads != None else 1);
+
+
+def _RemoveINCARTags(line, tags):
+    # Returns line, without the line break, with any assignments to the (upper-case) tags in tags removed, or None if it does not set any of them.
+    # Several assignments may be given on one line separated by semicolons, and comments start with "!" or "#".
+    
+    line = line.rstrip("\r\n");
+    
+    commentIndex = len(line);
+    
+    for commentChar in "!", "#":
+        if commentChar in line:
+            commentIndex = min(commentIndex, line.index(commentChar));
+    
+    statements = line[:commentIndex].split(';');
+    
+    keptStatements = [statement for statement in statements if statement.split('=')[0].strip().upper() not in tags];
+    
+    if len(keptStatements) == len(statements):
+        return None;
+    
+    return ";".join(keptStatements).strip();
+
+def PrepareRunDir(runDir, incarTags, scriptName, inputDir = ".", stager = None):
+    # If stager is set to a Staging.Stager, it is used to stage the KPOINTS, POSCAR and POTCAR files (e.g. as hard links); otherwise, the files are copied.
+    
+    os.makedirs(runDir);
+    
+    tags = set(tag.upper() for tag, _ in incarTags);
+    
+    with open(os.path.join(runDir, "INCAR"), 'w') as outputWriter:
+        with open(os.path.join(inputDir, "INCAR"), 'r') as inputReader:
+            for line in inputReader:
+                # VASP reads the first value given for each tag, so lines setting any of the tags added below (e.g. Sweep.FixedWorkloadTags()) are commented out.
+                
+                newLine = _RemoveINCARTags(line, tags);
+                
+                if newLine == None:
+                    outputWriter.write(line);
+                else:
+                    outputWriter.write("! {0}\n".format(line.rstrip("\r\n")));
+                    
+                    if newLine != "":
+                        outputWriter.write("{0}\n".format(newLine));
+        
+        outputWriter.write("\n");
+        
+        outputWriter.write("! Parameters automatically added by {0}.\n".format(scriptName));
+        outputWriter.write("\n");
+        
+        for tag, value in incarTags:
+            outputWriter.write("{0} = {1}\n".format(tag, value));
+    
+    if stager != None:
+        stager.Stage(runDir, ["KPOINTS", "POSCAR", "POTCAR"], inputDir = inputDir);
+    else:
+        for vaspInputFile in "KPOINTS", "POSCAR", "POTCAR":
+            shutil.copy(os.path.join(inputDir, vaspInputFile), os.path.join(runDir, vaspInputFile));
+
+def GetRunCommand(vaspRunCommand, numProcesses, host = None):
+    command = vaspRunCommand.replace("<nproc>", str(numProcesses));
+    
+    if host != None:
+        command = command.replace("<host>", host);
+    
+    return command;
+
+def GetStdOutFile(job):
+    return "{0}.out".format(job.ArchiveDir);
+
+def _ExecuteJob(job, runDir, command, gpuIDs, scriptName, watcherFactory = None, samplerFactory = None, stager = None, executor = None):
+    # Clear out the run directory left behind if the script was killed while the job was running.
+    
+    if os.path.isdir(runDir):
+        shutil.rmtree(runDir);
+    
+    PrepareRunDir(runDir, job.INCARTags, scriptName, inputDir = job.InputDir, stager = stager);
+    
+    command = WriteLaunchScripts(job, runDir, command, scriptName, gpuIDs = gpuIDs);
+    
+    environment = dict(os.environ);
+    
+    if gpuIDs != None and len(gpuIDs) > 0:
+        environment["CUDA_VISIBLE_DEVICES"] = ",".join(str(gpuID) for gpuID in gpuIDs);
+    
+    watcher = watcherFactory(runDir) if watcherFactory != None else None;
+    sampler = samplerFactory(runDir, gpuIDs) if samplerFactory != None else None;
+    
+    stdOutFile = GetStdOutFile(job);
+    
+    # The output is written to the std out file as the job runs.
+    
+    result = executor.Run(
+        command, stdOutFile, workingDirectory = runDir, environment = environment, activityFiles = [os.path.join(runDir, "OUTCAR")],
+        watchers = [item for item in (watcher, sampler) if item != None]
+        );
+    
+    status = result.Status;
+    
+    messages = ["Finished test with {0}...".format(job.Label)];
+    messages.append("  -> Exit status: {0}".format(status));
+    messages.append("  -> Run time: {0:.1f} s, std out: {1}".format(result.RunTime, FormatSize(result.OutputSize)));
+    
+    # If the watcher stopped the job, VASP may have been killed, but the timings are still valid as long as the OUTCAR contains the SCF steps the decision was based on; otherwise, e.g. if VASP crashed before the STOPCAR was read, the job is treated as failed.
+    
+    if watcher != None and watcher.Truncated:
+        messages.append("  -> {0}".format(watcher.Summary));
+        
+        if status == 0 or watcher.HasSCFSteps():
+            status = 0;
+        else:
+            messages.append("  -> WARNING: OUTCAR does not contain the SCF steps used to stop the job");
+    
+    messages.append("  -> Std out written to \"{0}\"".format(stdOutFile));
+    
+    if sampler != None:
+        telemetryFile = GetTelemetryFile(job.ArchiveDir);
+        
+        messages.append("  -> Writing telemetry to \"{0}\" ({1} sample(s), {2:.2f} s spent sampling)".format(telemetryFile, len(sampler.Samples), sampler.SamplingTime));
+        
+        sampler.Write(telemetryFile);
+    
+    if status == 0:
+        # Slim down the run directory before moving it, so less has to be copied if RunDir is on a different filesystem to the archive directory.
+        
+        if stager != None:
+            messages += ["  -> {0}".format(message) for message in stager.Archive(runDir)];
+        
+        messages.append("  -> Renaming run directory to \"{0}\"".format(job.ArchiveDir));
+        shutil.move(runDir, job.ArchiveDir);
+    else:
+        # VASP prints most errors to the standard output, but some only appear in the OUTCAR, which is removed with the run directory.
+        
+        if result.TimedOut:
+            job.Failure = Failure(TimeoutFailure, result.Summary);
+        else:
+            job.Failure = ClassifyFailure([stdOutFile, os.path.join(runDir, "OUTCAR")]);
+        
+        messages.append("  -> Failure: {0}".format(job.Failure));
+        
+        shutil.rmtree(runDir);
+    
+    messages.append("");
+    
+    PrintLines(messages);
+    
+    return status;
+
+def _PrintFailureSummary(jobs):
+    counts = { };
+    
+    for job in jobs:
+        if job.Status == 'Failed' and job.Failure != None:
+            counts[job.Failure.Class] = counts.get(job.Failure.Class, 0) + 1;
+    
+    numRetried = sum(1 for job in jobs if job.Attempts > 1);
+    numPruned = sum(1 for job in jobs if job.Status == 'Aborted' and job.Reason != None);
+    
+    if len(counts) == 0 and numRetried == 0 and numPruned == 0:
+        return;
+    
+    PrintLines([
+        "Failures: {0}".format(", ".join("{0}: {1}".format(failureClass, count) for failureClass, count in sorted(counts.items())) if len(counts) > 0 else "none"),
+        "  -> {0} test(s) retried, {1} test(s) skipped as certain to fail".format(numRetried, numPruned),
+        ""
+        ]);
+
+def RunJobs(jobs, pool, runDir, vaspRunCommand, scriptName, abortGroupOnFail = False, watcherFactory = None, samplerFactory = None, monitor = None, stager = None, maxRetries = 0, pruneFailures = False, executor = None):
+    # Runs jobs concurrently on the resources in pool.
+    # Each job is set up in its own subdirectory of runDir and renamed to its archive directory if VASP exits cleanly.
+    # Jobs are started in the order given, but smaller jobs may be started ahead of larger ones waiting for resources.
+    # If watcherFactory is set, it is called with the run directory of each job to create a watcher (e.g. Watcher.EarlyStopWatcher) to monitor it while it runs.
+    # If samplerFactory is set, it is called with the run directory and GPU IDs of each job to create a Telemetry.TelemetrySampler, and the samples are written next to the archive directory (see Telemetry.GetTelemetryFile()), whether or not the job succeeds.
+    # If monitor is set to a Monitor.ProgressMonitor, it is notified as jobs are queued, started and finished.
+    # If stager is set to a Staging.Stager, it is used to stage the input files into the run directories and to slim down the archive directories.
+    # Failed jobs are classified from their output (see Failures.ClassifyFailure()): jobs that fail with a transient error (e.g. a CUDA error) are rerun up to maxRetries times, and if pruneFailures is set, pending jobs that would certainly fail in the same way as a failed job (see Failures.IsDoomed()) are not run.
+    # If executor is set to an Execution.Executor, it is used to run the jobs with its wall-clock and idle-output limits; jobs that exceed them are killed and classified as timeouts.
+    
+    if executor == None:
+        executor = Executor();
+    
+    for job in jobs:
+        if not pool.CanFit(job.NumCores, job.NumGPUs):
+            raise Exception("Error: The test with {0} requires more cores/GPUs than are available in the resource pool.".format(job.Label));
+    
+    pending = [];
+    
+    for job in jobs:
+        if os.path.exists(job.ArchiveDir):
+            PrintLines([
+                "Job dir \"{0}\" ({1}) already exists -> skipping...".format(job.ArchiveDir, job.Label),
+                ""
+                ]);
+            
+            job.Status = 'Skipped';
+        else:
+            pending.append(job);
+    
+    if len(pending) == 0:
+        return;
+    
+    if monitor != None:
+        monitor.AddJobs(pending);
+    
+    # RunJobs() may be called several times during a sweep (e.g. for each round of an adaptive search).
+    
+    if not os.path.isdir(runDir):
+        os.makedirs(runDir);
+    
+    condition = threading.Condition();
+    
+    running = [];
+    failedGroups = set();
+    
+    def _Prune(failedJob):
+        # Called with the condition held.
+        
+        for job in pending[:]:
+            if IsDoomed(job, failedJob, failedJob.Failure):
+                job.Status = 'Aborted';
+                job.Reason = "{0} with {1}".format(failedJob.Failure.Class, failedJob.Label);
+                
+                pending.remove(job);
+                
+                PrintLines(["Skipping test with {0}: certain to fail after {1}".format(job.Label, job.Reason), ""]);
+                
+                if monitor != None:
+                    monitor.JobFinished(job, job.Status);
+    
+    def _Worker(job, jobRunDir, command, allocation):
+        status = None;
+        
+        job.Failure = None;
+        
+        try:
+            status = _ExecuteJob(job, jobRunDir, command, allocation[2], scriptName, watcherFactory = watcherFactory, samplerFactory = samplerFactory, stager = stager, executor = executor);
+        except Exception as exception:
+            PrintLines(["  -> Error running test with {0}: {1}".format(job.Label, exception), ""]);
+            
+            # Errors in setting up or archiving the job are not retried, but the run directory is removed, as for a failed job, so the job is run again if the sweep is resumed.
+            
+            job.Failure = Failure(UnknownFailure, str(exception));
+            
+            if os.path.isdir(jobRunDir):
+                shutil.rmtree(jobRunDir, ignore_errors = True);
+        finally:
+            retry = status != 0 and job.Failure != None and job.Failure.Transient and job.Attempts <= maxRetries;
+            
+            if retry:
+                # Keep the output from each failed attempt.
+                
+                stdOutFile = GetStdOutFile(job);
+                
+                if os.path.isfile(stdOutFile):
+                    os.rename(stdOutFile, "{0}.attempt{1}.out".format(job.ArchiveDir, job.Attempts));
+                
+                PrintLines(["Retrying test with {0} after a transient failure (attempt {1} of {2})".format(job.Label, job.Attempts + 1, maxRetries + 1), ""]);
+            elif monitor != None:
+                monitor.JobFinished(job, 'Success' if status == 0 else 'Failed');
+            
+            # Always hand the resources back, otherwise RunJobs() would wait forever.
+            
+            with condition:
+                if retry:
+                    # The job goes back to the front of the queue, so it is run before the rest of its group.
+                    
+                    job.Status = None;
+                    
+                    pending.insert(0, job);
+                else:
+                    job.Status = 'Success' if status == 0 else 'Failed';
+                    
+                    if status != 0 and job.Group != None:
+                        failedGroups.add(job.Group);
+                    
+                    if pruneFailures and job.Failure != None:
+                        _Prune(job);
+                
+                pool.Release(allocation);
+                running.remove(job);
+                
+                condition.notify();
+    
+    with condition:
+        while len(pending) > 0 or len(running) > 0:
+            waitingGroups = set(otherJob.Group for otherJob in running);
+            
+            for job in pending[:]:
+                if abortGroupOnFail and job.Group != None and job.Group in failedGroups:
+                    PrintLines(["Skipping test with {0} after a previous failure".format(job.Label), ""]);
+                    
+                    job.Status = 'Aborted';
+                    pending.remove(job);
+                    
+                    if monitor != None:
+                        monitor.JobFinished(job, job.Status);
+                    
+                    continue;
+                
+                # Keep the jobs within a group in order, so a failure can still abort the rest of the group.
+                
+                if abortGroupOnFail and job.Group != None and job.Group in waitingGroups:
+                    continue;
+                
+                allocation = pool.TryAllocate(job.NumCores, job.NumGPUs);
+                
+                if allocation == None:
+                    waitingGroups.add(job.Group);
+                    continue;
+                
+                pending.remove(job);
+                running.append(job);
+                
+                job.Attempts = job.Attempts + 1;
+                
+                waitingGroups.add(job.Group);
+                
+                host = pool.GetHost(allocation);
+                
+                command = GetRunCommand(vaspRunCommand, job.NumProcesses, host = host);
+                
+                messages = ["Running test with {0}...".format(job.Label)];
+                
+                if host != None:
+                    messages.append("  -> Host: {0}".format(host));
+                
+                if len(allocation[2]) > 0:
+                    messages.append("  -> GPU(s): {0}".format(", ".join(str(gpuID) for gpuID in allocation[2])));
+                
+                messages.append("");
+                
+                PrintLines(messages);
+                
+                jobRunDir = os.path.join(runDir, job.ArchiveDir.replace(os.sep, '_'));
+                
+                if monitor != None:
+                    monitor.JobStarted(job, jobRunDir, host = host, gpuIDs = allocation[2]);
+                
+                thread = threading.Thread(target = _Worker, args = (job, jobRunDir, command, allocation));
+                thread.daemon = True;
+                thread.start();
+            
+            if len(running) > 0:
+                condition.wait(1.0);
+    
+    _PrintFailureSummary(jobs);
+    
+    # Only remove the top-level run directory if it is empty, i.e. nothing went wrong.
+    
+    if len(os.listdir(runDir)) == 0:
+        os.rmdir(runDir);
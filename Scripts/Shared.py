@@ -1,35 +1,418 @@
 # Shared.py by J. M. Skelton
 
 
+import binascii;
+import bz2;
+import copy;
+import gzip;
+import json;
+import math;
+import mmap;
 import os;
 import re;
+import subprocess;
+import threading;
+import time;
 
+from collections import OrderedDict;
+from multiprocessing.pool import ThreadPool;
 
-_OUTCAR_TSCFRegex = re.compile("LOOP\:\s+cpu time\s+\d+\.\d+\:\s+real time\s+(?P<t_scf>\d+\.\d+)");
-_OUTCAR_TElapsedRegex = re.compile("Elapsed time \(sec\)\:\s+(?P<t_elapsed>\d+\.\d+)");
+
+# OUTCAR regexes for scanning memory-mapped files; [^\S\n] matches any whitespace apart from a newline, so matches cannot span lines.
+# _OUTCAR_TimingBytesRegex matches the "<routine>:  cpu time x: real time y" lines written for each routine, which include the SCF ("LOOP") and ionic ("LOOP+") step timings.
+
+_OUTCAR_TimingBytesRegex = re.compile(br"[^\S\n]*(?P<routine>[^\s:]+):[^\S\n]+cpu time[^\S\n]+(?P<t_cpu>\d+\.\d+):[^\S\n]+real time[^\S\n]+(?P<t_real>\d+\.\d+)");
+_OUTCAR_TElapsedBytesRegex = re.compile(br"Elapsed time \(sec\):[^\S\n]+(?P<t_elapsed>\d+\.\d+)");
+_OUTCAR_MaxMemoryBytesRegex = re.compile(br"Maximum memory used \(kb\):[^\S\n]+(?P<memory>\d+\.?\d*)");
+_OUTCAR_Rank0MemoryBytesRegex = re.compile(br"total amount of memory used by VASP MPI-rank0[^\S\n]+(?P<memory>\d+\.?\d*)");
 
 _OSZICAR_TotalEnergyRegex = re.compile("E0= (?P<total_energy>[+-]?\d*\.\d+E[+-]?\d+)");
 
+# Name of the file used to flag jobs that were stopped early by Watcher.EarlyStopWatcher.
 
-def ParseOUTCAR(filePath, skipSCFCycles = 0):
-    numSCFSteps, tSCFAve, tElapsed = None, None, None;
+TruncatedFileName = "TRUNCATED";
+
+# Extensions of compressed output files, in the order they are looked for by FindOutputFile().
+# ".xz" files require the lzma module (Python 3.3 or later), and ".zst" files the zstandard module or the zstd command.
+
+CompressedFileExtensions = [".gz", ".xz", ".bz2", ".zst"];
+
+# Size of the blocks compressed files are decompressed and scanned in.
+
+_StreamBlockSize = 4 * 1024 * 1024;
+
+# Number of bytes before the resume offset that OUTCARParser checks have not changed between calls.
+
+_SignatureSize = 256;
+
+
+def FindExecutable(name):
+    # Equivalent to shutil.which(), which is not available in Python 2.
     
-    scfTimes = [];
+    if os.path.dirname(name) != "":
+        return name if os.access(name, os.X_OK) else None;
     
-    with open(filePath, 'r') as inputReader:
-        for line in inputReader:
-            match = _OUTCAR_TSCFRegex.search(line);
+    for directory in os.environ.get("PATH", "").split(os.pathsep):
+        filePath = os.path.join(directory, name);
+        
+        if os.path.isfile(filePath) and os.access(filePath, os.X_OK):
+            return filePath;
+    
+    return None;
+
+def GetCompressedExtension(filePath):
+    # Returns the extension in CompressedFileExtensions that filePath ends with, or None if it is not compressed.
+    
+    for extension in CompressedFileExtensions:
+        if filePath.endswith(extension):
+            return extension;
+    
+    return None;
+
+def FindOutputFile(vaspDirectory, fileName):
+    # Returns the path to fileName (e.g. "OUTCAR") in vaspDirectory, or to a compressed copy (e.g. "OUTCAR.gz") if the file itself is not present; returns None if neither are found.
+    
+    filePath = os.path.join(vaspDirectory, fileName);
+    
+    if os.path.isfile(filePath):
+        return filePath;
+    
+    for extension in CompressedFileExtensions:
+        if os.path.isfile(filePath + extension):
+            return filePath + extension;
+    
+    return None;
+
+
+class _CommandReader(object):
+    # Minimal read-only file object over the output of a decompression command, e.g. "zstd -dc".
+    
+    def __init__(self, command):
+        self._process = subprocess.Popen(command, stdout = subprocess.PIPE);
+    
+    def read(self, size = -1):
+        return self._process.stdout.read(size);
+    
+    def close(self):
+        self._process.stdout.close();
+        self._process.wait();
+    
+    def __enter__(self):
+        return self;
+    
+    def __exit__(self, *args):
+        self.close();
+
+
+def OpenOutputFile(filePath):
+    # Opens filePath for reading in binary mode, decompressing it on the fly if it has one of the extensions in CompressedFileExtensions.
+    
+    extension = GetCompressedExtension(filePath);
+    
+    if extension == None:
+        return open(filePath, 'rb');
+    
+    if extension == ".gz":
+        return gzip.open(filePath, 'rb');
+    
+    if extension == ".bz2":
+        return bz2.BZ2File(filePath, 'rb');
+    
+    if extension == ".xz":
+        try:
+            import lzma;
+        except ImportError:
+            raise Exception("Error: Reading \"{0}\" requires the lzma module (Python 3.3 or later).".format(filePath));
+        
+        return lzma.open(filePath, 'rb');
+    
+    try:
+        import zstandard;
+        
+        return zstandard.open(filePath, 'rb');
+    except ImportError:
+        if FindExecutable("zstd") == None:
+            raise Exception("Error: Reading \"{0}\" requires the zstandard module or the zstd command.".format(filePath));
+        
+        return _CommandReader(["zstd", "-d", "-c", "-q", filePath]);
+
+
+class OUTCARParser(object):
+    def __init__(self, filePath):
+        # Incremental OUTCAR parser: each call to Update() or Events() resumes from the byte offset reached by the previous call, so re-parsing a file that is still being written (or has not changed) only costs time proportional to the new output.
+        # If the file is replaced, truncated or rewritten, the parser starts again from the beginning: besides the device and inode, which can be reused after a run directory is deleted, the size and modification time of the file and the bytes before the resume offset are checked.
+        # Compressed files (see CompressedFileExtensions) are decompressed and scanned in blocks without being written to disk; they are assumed to be complete, and are only parsed again if they are replaced.
+        
+        self.FilePath = filePath;
+        
+        self._Reset();
+        
+        # Offset of the start of the first line that has not been parsed; a partially-written last line is left until the rest of it appears.
+        
+        self._fileID = None;
+        self._fileSize, self._fileMTime = None, None;
+        
+        self._lock = threading.Lock();
+    
+    def GetState(self):
+        # Checkpoint of the parser state, e.g. for saving to disk; can be restored with SetState().
+        
+        return {
+            'Offset' : self._offset, 'FileID' : self._fileID, 'FileSize' : self._fileSize, 'FileMTime' : self._fileMTime,
+            'Signature' : binascii.hexlify(self._signature).decode('ascii'),
+            'SCFTimes' : list(self.SCFTimes), 'SCFCPUTimes' : list(self.SCFCPUTimes),
+            'IonicTimes' : list(self.IonicTimes), 'IonicCPUTimes' : list(self.IonicCPUTimes),
+            'RoutineTimes' : [[name] + list(values) for name, values in self.RoutineTimes.items()],
+            'TElapsed' : self.TElapsed, 'MaxMemory' : self.MaxMemory, 'Rank0Memory' : self.Rank0Memory
+            };
+    
+    def SetState(self, state):
+        self._offset = state['Offset'];
+        self._fileID = tuple(state['FileID']) if state['FileID'] != None else None;
+        self._fileSize, self._fileMTime = state.get('FileSize'), state.get('FileMTime');
+        
+        self._signature = binascii.unhexlify(state.get('Signature', "").encode('ascii'));
+        
+        self.SCFTimes = list(state['SCFTimes']);
+        self.SCFCPUTimes = list(state['SCFCPUTimes']);
+        
+        self.IonicTimes = list(state['IonicTimes']);
+        self.IonicCPUTimes = list(state['IonicCPUTimes']);
+        
+        self.RoutineTimes = OrderedDict((item[0], list(item[1:])) for item in state['RoutineTimes']);
+        
+        self.TElapsed = state['TElapsed'];
+        
+        self.MaxMemory = state['MaxMemory'];
+        self.Rank0Memory = state['Rank0Memory'];
+    
+    def _Reset(self):
+        # SCFTimes and IonicTimes are the real (wall-clock) times of each step; SCFCPUTimes and IonicCPUTimes are the corresponding CPU times.
+        # RoutineTimes maps the name of each routine in the timing output (POTLOK, EDDAV, etc.) to [number of calls, total CPU time, total real time].
+        # MaxMemory and Rank0Memory are the "Maximum memory used" and "total amount of memory used by VASP MPI-rank0" figures in kB.
+        
+        self.SCFTimes, self.SCFCPUTimes = [], [];
+        self.IonicTimes, self.IonicCPUTimes = [], [];
+        
+        self.RoutineTimes = OrderedDict();
+        
+        self.TElapsed = None;
+        
+        self.MaxMemory, self.Rank0Memory = None, None;
+        
+        self._offset = 0;
+        
+        # Up to _SignatureSize bytes before self._offset, used to check that the part of the file already parsed has not changed.
+        
+        self._signature = b"";
+    
+    def _IsChanged(self, fileID, fileStat):
+        # Returns True if the file is not the one parsed up to self._offset.
+        
+        if fileID != self._fileID or fileStat.st_size < self._offset:
+            return True;
+        
+        if self._fileMTime != None and (fileStat.st_mtime < self._fileMTime or (fileStat.st_size == self._fileSize and fileStat.st_mtime != self._fileMTime)):
+            return True;
+        
+        return False;
+    
+    def _AddEvent(self, eventType, match):
+        # Updates the parsed data from a regex match and returns the corresponding event.
+        
+        if eventType == 'Timing':
+            routine = match.group('routine').decode('ascii', 'replace');
             
-            if match:
-                scfTimes.append(
-                    float(match.group('t_scf'))
-                    );
-            else:
-                match = _OUTCAR_TElapsedRegex.search(line);
+            tCPU, tReal = float(match.group('t_cpu')), float(match.group('t_real'));
+            
+            if routine == "LOOP":
+                self.SCFTimes.append(tReal);
+                self.SCFCPUTimes.append(tCPU);
+                
+                return ('SCF', tReal);
+            
+            if routine == "LOOP+":
+                self.IonicTimes.append(tReal);
+                self.IonicCPUTimes.append(tCPU);
+                
+                return ('Ionic', tReal);
+            
+            values = self.RoutineTimes.setdefault(routine, [0, 0.0, 0.0]);
+            
+            values[0] += 1;
+            values[1] += tCPU;
+            values[2] += tReal;
+            
+            return ('Routine', (routine, tCPU, tReal));
+        
+        value = float(match.group(1));
+        
+        if eventType == 'Elapsed':
+            self.TElapsed = value;
+        elif eventType == 'MaxMemory':
+            self.MaxMemory = value;
+        else:
+            self.Rank0Memory = value;
+        
+        return (eventType, value);
+    
+    def Events(self):
+        # Generator over the events parsed from output written since the last call: ('SCF', t_SCF) for each "LOOP:" line, ('Ionic', t_Ionic) for each "LOOP+:" line, ('Routine', (name, t_CPU, t_Real)) for the other routine timings, ('Elapsed', t_Elapsed) for the final timing, and ('MaxMemory', kB) and ('Rank0Memory', kB) for the memory usage.
+        
+        fileStat = os.stat(self.FilePath);
+        
+        fileID = (fileStat.st_dev, fileStat.st_ino);
+        
+        if GetCompressedExtension(self.FilePath) != None:
+            if fileID != self._fileID or fileStat.st_size != self._fileSize or fileStat.st_mtime != self._fileMTime:
+                self._Reset();
+                
+                for event in self._StreamEvents():
+                    yield event;
+                
+                self._fileID = fileID;
+                self._fileSize, self._fileMTime = fileStat.st_size, fileStat.st_mtime;
+            
+            return;
+        
+        if self._IsChanged(fileID, fileStat):
+            self._Reset();
+            self._fileID = fileID;
+        
+        self._fileSize, self._fileMTime = fileStat.st_size, fileStat.st_mtime;
+        
+        if fileStat.st_size == self._offset:
+            return;
+        
+        with open(self.FilePath, 'rb') as inputReader:
+            buffer = mmap.mmap(inputReader.fileno(), 0, access = mmap.ACCESS_READ);
+            
+            try:
+                # A new file may have been written to a reused inode, in which case the bytes before the offset will (almost certainly) be different.
                 
-                if match:
-                    tElapsed = float(match.group('t_elapsed'));
+                if buffer[self._offset - len(self._signature):self._offset] != self._signature:
+                    self._Reset();
+                
+                end = buffer.rfind(b"\n", self._offset) + 1;
+                
+                if end <= self._offset:
+                    return;
+                
+                for eventType, match, lineEnd in _ScanOUTCAR(buffer, self._offset, end):
+                    event = self._AddEvent(eventType, match);
+                    
+                    self._offset = lineEnd;
+                    
+                    yield event;
+                
+                self._offset = end;
+                
+                self._signature = buffer[max(end - _SignatureSize, 0):end];
+            finally:
+                buffer.close();
+    
+    def _StreamEvents(self):
+        # As the file cannot be memory mapped, it is read in blocks, and any partial line at the end of each block is carried over to the next.
+        
+        with OpenOutputFile(self.FilePath) as inputReader:
+            remainder = b"";
+            
+            while True:
+                block = inputReader.read(_StreamBlockSize);
+                
+                if len(block) == 0:
+                    break;
+                
+                buffer = remainder + block;
+                
+                end = buffer.rfind(b"\n") + 1;
+                
+                for eventType, match, lineEnd in _ScanOUTCAR(buffer, 0, end):
+                    yield self._AddEvent(eventType, match);
+                
+                self._offset += end;
+                
+                remainder = buffer[end:];
+    
+    def Update(self):
+        # Parses any new output and returns the number of events found.
+        
+        return sum(1 for _ in self.Events());
+    
+    def GetResults(self, skipSCFCycles = 0):
+        return SummariseSCFTimes(self.SCFTimes, self.TElapsed, skipSCFCycles);
+    
+    def GetTimingRecord(self, skipSCFCycles = 0):
+        # Returns a dictionary with the summary statistics and the full per-step data; see GetEmptyTimingRecord().
+        
+        record = GetEmptyTimingRecord();
+        
+        numSCFSteps, tSCFAve, tElapsed = self.GetResults(skipSCFCycles = skipSCFCycles);
+        
+        record['NumSCFSteps'], record['TSCFAve'], record['TElapsed'] = numSCFSteps, tSCFAve, tElapsed;
+        
+        if numSCFSteps != None:
+            record['TSCFMedian'], record['TSCFStdDev'], record['TSCFMin'], record['TSCFMax'] = _GetStatistics(self.SCFTimes[len(self.SCFTimes) - numSCFSteps:]);
+        
+        if len(self.IonicTimes) > 0:
+            record['TIonicAve'] = sum(self.IonicTimes) / len(self.IonicTimes);
+        
+        record['SCFTimes'], record['SCFCPUTimes'] = list(self.SCFTimes), list(self.SCFCPUTimes);
+        record['IonicTimes'], record['IonicCPUTimes'] = list(self.IonicTimes), list(self.IonicCPUTimes);
+        
+        record['RoutineTimes'] = [[name] + list(values) for name, values in self.RoutineTimes.items()];
+        
+        record['MaxMemory'], record['Rank0Memory'] = self.MaxMemory, self.Rank0Memory;
+        
+        return record;
+
+
+# Parsers for OUTCAR files parsed by ParseOUTCAR(), indexed by path; only the _MaxOUTCARParsers most recently used are kept.
+
+_OUTCARParsers = OrderedDict();
 
+_MaxOUTCARParsers = 64;
+
+_OUTCARParsersLock = threading.Lock();
+
+
+def GetEmptyTimingRecord():
+    # Per-run record returned by CollectRunRecord(); the per-step data are stored as lists ("columns") so the record can be stored as JSON, and can be converted to NumPy arrays by the analysis tools if required.
+    # SCFTimes/SCFCPUTimes and IonicTimes/IonicCPUTimes are the real and CPU times of every SCF and ionic step, including those excluded from the statistics by skipSCFCycles.
+    # RoutineTimes is a list of [name, number of calls, total CPU time, total real time] for the other routines in the timing output.
+    
+    return {
+        'NumSCFSteps' : None, 'TSCFAve' : None, 'TSCFMedian' : None, 'TSCFStdDev' : None, 'TSCFMin' : None, 'TSCFMax' : None,
+        'TIonicAve' : None, 'TElapsed' : None, 'FinalTotalEnergy' : None, 'TotalEnergies' : [],
+        'SCFTimes' : [], 'SCFCPUTimes' : [], 'IonicTimes' : [], 'IonicCPUTimes' : [], 'RoutineTimes' : [],
+        'MaxMemory' : None, 'Rank0Memory' : None
+        };
+
+def _GetStatistics(samples):
+    # Returns the median, (sample) standard deviation, minimum and maximum of samples; the standard deviation is None if there are fewer than two samples.
+    
+    numSamples = len(samples);
+    
+    sortedSamples = sorted(samples);
+    
+    if numSamples % 2 == 1:
+        median = sortedSamples[numSamples // 2];
+    else:
+        median = (sortedSamples[numSamples // 2 - 1] + sortedSamples[numSamples // 2]) / 2.0;
+    
+    stdDev = None;
+    
+    if numSamples > 1:
+        mean = sum(samples) / numSamples;
+        stdDev = math.sqrt(sum((sample - mean) ** 2 for sample in samples) / (numSamples - 1));
+    
+    return (median, stdDev, sortedSamples[0], sortedSamples[-1]);
+
+def SummariseSCFTimes(scfTimes, tElapsed, skipSCFCycles):
+    # Returns the (numSCFSteps, tSCFAve, tElapsed) tuple returned by ParseOUTCAR(), averaging over the SCF steps after the first skipSCFCycles.
+    
+    numSCFSteps, tSCFAve = None, None;
+    
     if skipSCFCycles > 0:
         if len(scfTimes) > skipSCFCycles:
             scfTimes = scfTimes[skipSCFCycles:];
@@ -37,41 +420,320 @@ def ParseOUTCAR(filePath, skipSCFCycles = 0):
             print("WARNING: _ParseOUTCAR(): Number of SCF steps {0} <= skipSCFCycles {1}".format(len(scfTimes), skipSCFCycles));
             scfTimes = [];
     
-    if len(scfTimes) > 0:                        
+    if len(scfTimes) > 0:
         numSCFSteps = len(scfTimes);
         tSCFAve = sum(scfTimes) / numSCFSteps;
     
     return (numSCFSteps, tSCFAve, tElapsed);
 
+def _ScanOUTCAR(buffer, start, end):
+    # Only a tiny fraction of the lines in an OUTCAR are of interest, so rather than applying the regexes to every line, search for the literal strings "cpu time", "Elapsed time", etc. and only try to match the regexes where they are found.
+    # Yields (event type, regex match, offset of the end of the line) tuples in the order they appear in buffer[start:end], which must end with a newline.
+    # The routine timing regex is matched from the start of the line, as the routine name comes before the literal; the others are matched from the literal.
+    
+    anchors = [
+        (b"cpu time", _OUTCAR_TimingBytesRegex, 'Timing', True),
+        (b"Elapsed time", _OUTCAR_TElapsedBytesRegex, 'Elapsed', False),
+        (b"Maximum memory used", _OUTCAR_MaxMemoryBytesRegex, 'MaxMemory', False),
+        (b"total amount of memory used by VASP MPI-rank0", _OUTCAR_Rank0MemoryBytesRegex, 'Rank0Memory', False)
+        ];
+    
+    nextIndices = [buffer.find(literal, start, end) for literal, _, _, _ in anchors];
+    
+    while True:
+        candidates = [i for i, index in enumerate(nextIndices) if index != -1];
+        
+        if len(candidates) == 0:
+            break;
+        
+        i = min(candidates, key = lambda i: nextIndices[i]);
+        
+        literal, regex, eventType, matchFromLineStart = anchors[i];
+        
+        index = nextIndices[i];
+        lineEnd = buffer.find(b"\n", index, end) + 1;
+        
+        matchStart = index;
+        
+        if matchFromLineStart:
+            matchStart = max(buffer.rfind(b"\n", start, index) + 1, start);
+        
+        match = regex.match(buffer, matchStart, lineEnd);
+        
+        if match:
+            yield (eventType, match, lineEnd);
+            
+            # As for the line-by-line parser, only the first match on each line is used.
+            
+            position = lineEnd;
+        else:
+            position = index + 1;
+        
+        for j, (literal, _, _, _) in enumerate(anchors):
+            if nextIndices[j] != -1 and nextIndices[j] < position:
+                nextIndices[j] = buffer.find(literal, position, end);
+
+def GetOUTCARParser(filePath):
+    # Returns the OUTCARParser for filePath, creating one if needed, so that repeated calls pick up where the last one left off.
+    
+    key = os.path.abspath(filePath);
+    
+    with _OUTCARParsersLock:
+        parser = _OUTCARParsers.pop(key, None);
+        
+        if parser == None:
+            parser = OUTCARParser(filePath);
+        
+        _OUTCARParsers[key] = parser;
+        
+        while len(_OUTCARParsers) > _MaxOUTCARParsers:
+            _OUTCARParsers.popitem(last = False);
+        
+        return parser;
+
+def ParseOUTCAR(filePath, skipSCFCycles = 0):
+    parser = GetOUTCARParser(filePath);
+    
+    with parser._lock:
+        parser.Update();
+        
+        return parser.GetResults(skipSCFCycles = skipSCFCycles);
+
+def ParseOSZICAREnergies(filePath):
+    # Returns the total energy (E0) at each ionic step.
+    
+    # filePath may be compressed (see CompressedFileExtensions); OSZICAR files are small, so they are read in one go.
+    
+    totalEnergies = [];
+    
+    with OpenOutputFile(filePath) as inputReader:
+        text = inputReader.read().decode('utf-8', 'replace');
+    
+    for line in text.splitlines():
+        match = _OSZICAR_TotalEnergyRegex.search(line);
+        
+        if match:
+            totalEnergies.append(float(match.group('total_energy')));
+    
+    return totalEnergies;
+
 def ParseOSZICAR(filePath):
-    finalTotalEnergy = None;
+    totalEnergies = ParseOSZICAREnergies(filePath);
     
-    with open(filePath, 'r') as inputReader:
+    return totalEnergies[-1] if len(totalEnergies) > 0 else None;
+
+def ReadINCARTags(incarFile):
+    # Returns a dictionary of the (upper-case) tags set in an INCAR file; as in VASP, the first value given for a tag is used.
+    
+    tags = { };
+    
+    with open(incarFile, 'r') as inputReader:
         for line in inputReader:
-            match = _OSZICAR_TotalEnergyRegex.search(line);
+            for commentChar in "!", "#":
+                line = line.split(commentChar)[0];
+            
+            for statement in line.split(';'):
+                if '=' in statement:
+                    tag, value = statement.split('=', 1);
+                    
+                    tag = tag.strip().upper();
+                    
+                    if tag not in tags:
+                        tags[tag] = value.strip();
+    
+    return tags;
+
+# Version of the data stored by ResultCache; entries written by other versions are ignored.
+
+_ResultCacheVersion = 2;
+
+
+class ResultCache(object):
+    def __init__(self, filePath, maxEntries = 10000):
+        # On-disk cache of the records returned by CollectRunRecord(), stored as JSON lines.
+        # Entries are keyed on the directory path and skipSCFCycles, and are only used if the size and modification time of the OUTCAR and OSZICAR files are unchanged.
+        # New entries are appended to the file as they are added; Save() rewrites the file, evicting the least recently used entries if there are more than maxEntries.
+        
+        self.FilePath = filePath;
+        self.MaxEntries = maxEntries;
+        
+        self.NumHits, self.NumMisses = 0, 0;
+        
+        self._entries = { };
+        
+        self._lock = threading.Lock();
+        
+        if os.path.isfile(filePath):
+            with open(filePath, 'r') as inputReader:
+                for line in inputReader:
+                    try:
+                        entry = json.loads(line);
+                    except ValueError:
+                        # Most likely a partly-written line from a run that was killed.
+                        
+                        continue;
+                    
+                    if entry.get('Version') == _ResultCacheVersion:
+                        self._entries[entry['Key']] = entry;
+    
+    @staticmethod
+    def _GetKey(vaspDirectory, skipSCFCycles):
+        return "{0}|{1}".format(os.path.abspath(vaspDirectory), skipSCFCycles);
+    
+    @staticmethod
+    def _GetFileIDs(vaspDirectory):
+        # The names of compressed files are recorded with their extensions, so compressing an archive directory invalidates its entry.
+        
+        fileIDs = [];
+        
+        for fileName in "OUTCAR", "OSZICAR":
+            filePath = FindOutputFile(vaspDirectory, fileName);
             
-            if match:
-                finalTotalEnergy = float(match.group('total_energy'));
+            if filePath != None:
+                fileStat = os.stat(filePath);
+                fileIDs.append([os.path.basename(filePath), fileStat.st_size, fileStat.st_mtime]);
+            else:
+                fileIDs.append([fileName, None, None]);
+        
+        return fileIDs;
     
-    return finalTotalEnergy;
+    def Get(self, vaspDirectory, skipSCFCycles):
+        # Returns the cached record, or None if there is none or the files have changed since it was cached.
+        
+        key = ResultCache._GetKey(vaspDirectory, skipSCFCycles);
+        
+        fileIDs = ResultCache._GetFileIDs(vaspDirectory);
+        
+        with self._lock:
+            entry = self._entries.get(key);
+            
+            if entry == None or entry['FileIDs'] != fileIDs:
+                self.NumMisses += 1;
+                return None;
+            
+            entry['LastUsed'] = time.time();
+            
+            self.NumHits += 1;
+            
+            # Callers get their own copy, so changes to the record (e.g. adding telemetry) are not written back to the cache.
+            
+            return copy.deepcopy(entry['Record']);
+    
+    def Put(self, vaspDirectory, skipSCFCycles, record, fileIDs = None):
+        # fileIDs should be obtained before parsing the files, so that if they are modified while being parsed, the entry will not be used.
+        
+        if fileIDs == None:
+            fileIDs = ResultCache._GetFileIDs(vaspDirectory);
+        
+        entry = {
+            'Version' : _ResultCacheVersion, 'Key' : ResultCache._GetKey(vaspDirectory, skipSCFCycles),
+            'FileIDs' : fileIDs, 'Record' : copy.deepcopy(record), 'LastUsed' : time.time()
+            };
+        
+        with self._lock:
+            self._entries[entry['Key']] = entry;
+            
+            with open(self.FilePath, 'a') as outputWriter:
+                outputWriter.write(json.dumps(entry) + "\n");
+    
+    def Save(self):
+        with self._lock:
+            entries = sorted(self._entries.values(), key = lambda entry: entry['LastUsed']);
+            
+            if len(entries) > self.MaxEntries:
+                entries = entries[len(entries) - self.MaxEntries:];
+            
+            self._entries = dict((entry['Key'], entry) for entry in entries);
+            
+            # Write to a temporary file and rename, so the cache is never left half written.
+            
+            tempFilePath = "{0}.tmp".format(self.FilePath);
+            
+            with open(tempFilePath, 'w') as outputWriter:
+                for entry in entries:
+                    outputWriter.write(json.dumps(entry) + "\n");
+            
+            os.rename(tempFilePath, self.FilePath);
 
-def CollectResults(vaspDirectory, outcarSkipSCFCycles = 0):
-    numSCFSteps, tSCFAve, tElapsed = None, None, None;
+
+def CollectRunRecord(vaspDirectory, outcarSkipSCFCycles = 0, cache = None):
+    # Returns the per-run record described in GetEmptyTimingRecord(), with the timings and memory usage from the OUTCAR file and the total energies from the OSZICAR file.
+    # Either file may be compressed (see FindOutputFile()).
+    # If cache is set to a ResultCache, records for directories whose files have not changed since they were last parsed are read from it.
     
-    outcarPath = os.path.join(vaspDirectory, "OUTCAR");
+    fileIDs = None;
     
-    if os.path.isfile(outcarPath):
-        numSCFSteps, tSCFAve, tElapsed = ParseOUTCAR(outcarPath, skipSCFCycles = outcarSkipSCFCycles);
-    else:
-        print("WARNING: _CollectResults(): \"{0}\" not found".format(outcarPath));
+    if cache != None:
+        record = cache.Get(vaspDirectory, outcarSkipSCFCycles);
+        
+        if record != None:
+            return record;
+        
+        fileIDs = ResultCache._GetFileIDs(vaspDirectory);
     
-    finalTotalEnergy = None;
+    record = GetEmptyTimingRecord();
     
-    oszicarPath = os.path.join(vaspDirectory, "OSZICAR");
+    outcarPath = FindOutputFile(vaspDirectory, "OUTCAR");
     
-    if os.path.isfile(oszicarPath):
-        finalTotalEnergy = ParseOSZICAR(oszicarPath);
+    if outcarPath != None:
+        # The run is finished, so the parser is not kept for later calls.
+        
+        parser = OUTCARParser(outcarPath);
+        parser.Update();
+        
+        record = parser.GetTimingRecord(skipSCFCycles = outcarSkipSCFCycles);
     else:
-        print("WARNING: _CollectResults(): \"{0}\" not found".format(oszicarPath));
+        print("WARNING: _CollectResults(): \"{0}\" not found".format(os.path.join(vaspDirectory, "OUTCAR")));
     
-    return (numSCFSteps, tSCFAve, tElapsed, finalTotalEnergy);
+    oszicarPath = FindOutputFile(vaspDirectory, "OSZICAR");
+    
+    if oszicarPath != None:
+        record['TotalEnergies'] = ParseOSZICAREnergies(oszicarPath);
+        
+        if len(record['TotalEnergies']) > 0:
+            record['FinalTotalEnergy'] = record['TotalEnergies'][-1];
+    else:
+        print("WARNING: _CollectResults(): \"{0}\" not found".format(os.path.join(vaspDirectory, "OSZICAR")));
+    
+    if cache != None:
+        cache.Put(vaspDirectory, outcarSkipSCFCycles, record, fileIDs = fileIDs);
+    
+    return record;
+
+def GetResultsFromRecord(record):
+    # Returns the (numSCFSteps, tSCFAve, tElapsed, finalTotalEnergy) tuple returned by CollectResults().
+    
+    return (record['NumSCFSteps'], record['TSCFAve'], record['TElapsed'], record['FinalTotalEnergy']);
+
+def CollectResults(vaspDirectory, outcarSkipSCFCycles = 0, cache = None):
+    return GetResultsFromRecord(
+        CollectRunRecord(vaspDirectory, outcarSkipSCFCycles = outcarSkipSCFCycles, cache = cache)
+        );
+
+def CollectRunRecordsParallel(vaspDirectories, outcarSkipSCFCycles = 0, numJobs = 1, cache = None):
+    # Calls CollectRunRecord() for each directory, using up to numJobs threads; collecting from many directories on a networked filesystem is dominated by I/O latency, which the threads overlap.
+    # The records are returned in the same order as vaspDirectories.
+    
+    vaspDirectories = list(vaspDirectories);
+    
+    if numJobs <= 1 or len(vaspDirectories) <= 1:
+        return [CollectRunRecord(vaspDirectory, outcarSkipSCFCycles = outcarSkipSCFCycles, cache = cache) for vaspDirectory in vaspDirectories];
+    
+    pool = ThreadPool(min(numJobs, len(vaspDirectories)));
+    
+    try:
+        return pool.map(
+            lambda vaspDirectory: CollectRunRecord(vaspDirectory, outcarSkipSCFCycles = outcarSkipSCFCycles, cache = cache), vaspDirectories
+            );
+    finally:
+        pool.close();
+        pool.join();
+
+def CollectResultsParallel(vaspDirectories, outcarSkipSCFCycles = 0, numJobs = 1, cache = None):
+    return [
+        GetResultsFromRecord(record)
+            for record in CollectRunRecordsParallel(vaspDirectories, outcarSkipSCFCycles = outcarSkipSCFCycles, numJobs = numJobs, cache = cache)
+        ];
+
+def IsTruncated(vaspDirectory):
+    return os.path.isfile(os.path.join(vaspDirectory, TruncatedFileName));
@@ -0,0 +1,48 @@
+# ShowProgress.py by J. M. Skelton
+
+
+import argparse;
+import json;
+import time;
+
+from Monitor import FormatStatus;
+
+
+def _ShowStatus(statusFile):
+    with open(statusFile, 'r') as inputReader:
+        status = json.load(inputReader);
+    
+    print("{0} (updated {1}):".format(statusFile, time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(status['UpdateTime']))));
+    
+    for line in FormatStatus(status):
+        print(line);
+    
+    print("");
+    
+    return status;
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Show the progress of running benchmarks from the status file written by CPUTest.py and GPUTest.py (ProgressStatusFile).");
+    
+    parser.add_argument(
+        metavar = "status_file", type = str,
+        dest = 'StatusFile',
+        help = "status file, e.g. \"GPUTest-Status.json\""
+        );
+    
+    parser.add_argument(
+        "--follow",
+        type = float, dest = 'FollowInterval',
+        help = "re-read the status file every N seconds until all the tests have finished"
+        );
+    
+    args = parser.parse_args();
+    
+    status = _ShowStatus(args.StatusFile);
+    
+    if args.FollowInterval != None:
+        while status['NumPending'] + status['NumRunning'] > 0:
+            time.sleep(args.FollowInterval);
+            
+            status = _ShowStatus(args.StatusFile);
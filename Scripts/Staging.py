@@ -0,0 +1,307 @@
+# Staging.py by J. M. Skelton
+
+
+import bz2;
+import gzip;
+import os;
+import shutil;
+import subprocess;
+import threading;
+
+from Shared import FindExecutable, GetCompressedExtension, TruncatedFileName;
+
+
+# Ways of staging the input files into job directories, in the default order of preference.
+# "hardlink" and "reflink" (a copy-on-write clone, e.g. on Btrfs or XFS) need the input files and run directories to be on the same filesystem; "symlink" works across filesystems, but the links point back to the input files, so these must not be moved or modified while jobs are running.
+
+StagingModes = ["hardlink", "reflink", "symlink", "copy"];
+
+# Files kept in slimmed-down archive directories by default: the input and output files needed to re-collect the results (OUTCAR, OSZICAR and the TRUNCATED flag), the INCAR with the parameters that were tested, and vasprun.xml, which contains the timings as well.
+
+DefaultArchiveFiles = ["INCAR", "OUTCAR", "OSZICAR", "vasprun.xml", TruncatedFileName];
+
+# Compression formats for archived files, which are also the extensions added to the file names; the parsers in Shared.py read the compressed files directly.
+# "xz" requires the lzma module (Python 3.3 or later), and "zst" the zstandard module or the zstd command.
+
+ArchiveCompressionFormats = ["gz", "bz2", "xz", "zst"];
+
+# Files read when collecting results, which are never deleted.
+
+_CollectedFiles = ["OUTCAR", "OSZICAR", TruncatedFileName];
+
+# Files that are never compressed: TRUNCATED is an (empty) flag, and is looked for by name.
+
+_UncompressedFiles = [TruncatedFileName];
+
+# ioctl() request used to clone files on Linux (FICLONE in linux/fs.h).
+
+_FICLONE = 0x40049409;
+
+
+def _HardLink(source, destination):
+    os.link(source, destination);
+
+def _RefLink(source, destination):
+    # fcntl is only available on Unix-like systems.
+    
+    import fcntl;
+    
+    with open(source, 'rb') as inputReader:
+        with open(destination, 'wb') as outputWriter:
+            fcntl.ioctl(outputWriter.fileno(), _FICLONE, inputReader.fileno());
+
+def _SymLink(source, destination):
+    os.symlink(os.path.abspath(source), destination);
+
+def _Copy(source, destination):
+    shutil.copy(source, destination);
+
+_StagingFunctions = { 'hardlink' : _HardLink, 'reflink' : _RefLink, 'symlink' : _SymLink, 'copy' : _Copy };
+
+def StageFile(source, destination, modes = None, linkSource = None):
+    # Stages source to destination using the first of modes (default: StagingModes) that works, and returns the mode used.
+    # If linkSource is set, hard links and clones are made from it rather than source (e.g. a copy on the same filesystem as destination).
+    # Copying is always tried as a last resort; errors from copying are not caught.
+    
+    if modes == None:
+        modes = StagingModes;
+    
+    for mode in modes:
+        if mode == 'copy':
+            break;
+        
+        try:
+            _StagingFunctions[mode](linkSource if linkSource != None and mode in ('hardlink', 'reflink') else source, destination);
+            
+            return mode;
+        except (AttributeError, ImportError, IOError, OSError):
+            # e.g. EXDEV for links across filesystems, EOPNOTSUPP for clones on filesystems without copy-on-write, or os.symlink() not being available on Windows with Python 2.
+            
+            if os.path.lexists(destination):
+                os.remove(destination);
+    
+    _Copy(source, destination);
+    
+    return 'copy';
+
+def CheckCompressionFormat(compression):
+    # Raises an exception if compression is not one of ArchiveCompressionFormats, or cannot be used with the available modules and commands.
+    
+    if compression not in ArchiveCompressionFormats:
+        raise Exception("Error: Unknown compression format \"{0}\" - must be one of {1}.".format(compression, ", ".join("\"{0}\"".format(item) for item in ArchiveCompressionFormats)));
+    
+    if compression == "xz":
+        try:
+            import lzma;
+        except ImportError:
+            raise Exception("Error: xz compression requires the lzma module (Python 3.3 or later).");
+    
+    if compression == "zst":
+        try:
+            import zstandard;
+        except ImportError:
+            if FindExecutable("zstd") == None:
+                raise Exception("Error: zst compression requires the zstandard module or the zstd command.");
+
+def _OpenCompressed(filePath, compression):
+    if compression == "gz":
+        return gzip.open(filePath, 'wb');
+    elif compression == "bz2":
+        return bz2.BZ2File(filePath, 'wb');
+    elif compression == "xz":
+        import lzma;
+        
+        return lzma.open(filePath, 'wb');
+    else:
+        import zstandard;
+        
+        return zstandard.open(filePath, 'wb');
+
+def CompressFile(filePath, compression):
+    # Compresses filePath to filePath + "." + compression and deletes the original; returns the number of bytes saved.
+    # The compressed file is written to a temporary file and renamed, so a file is never left half compressed.
+    
+    compressedFilePath = "{0}.{1}".format(filePath, compression);
+    tempFilePath = "{0}.tmp".format(compressedFilePath);
+    
+    try:
+        with open(filePath, 'rb') as inputReader:
+            with _OpenCompressed(tempFilePath, compression) as outputWriter:
+                shutil.copyfileobj(inputReader, outputWriter);
+    except ImportError:
+        # zstandard module not available -> fall back to the zstd command (checked for by CheckCompressionFormat()).
+        
+        if subprocess.call(["zstd", "-q", "-f", "-o", tempFilePath, filePath]) != 0:
+            raise Exception("Error: CompressFile(): Failed to compress \"{0}\" with zstd.".format(filePath));
+    
+    shutil.copystat(filePath, tempFilePath);
+    
+    savedSize = os.path.getsize(filePath) - os.path.getsize(tempFilePath);
+    
+    os.rename(tempFilePath, compressedFilePath);
+    os.remove(filePath);
+    
+    return savedSize;
+
+def _GetFreedSize(filePath):
+    # Returns the space freed by deleting filePath: nothing for links, or for files hard linked from elsewhere (e.g. staged input files).
+    
+    if os.path.islink(filePath):
+        return 0;
+    
+    fileStat = os.stat(filePath);
+    
+    return fileStat.st_size if fileStat.st_nlink == 1 else 0;
+
+
+class Stager(object):
+    def __init__(self, modes = None, cacheDir = None, archiveFiles = None, archiveCompression = None):
+        # Stages the input files into job directories, and optionally slims down the archive directories of completed jobs.
+        # modes: staging modes to try, in order of preference (default: StagingModes); the mode that works for each input file is remembered, so failed attempts are not repeated for every job.
+        # cacheDir: if set, input files on a different filesystem to the run directories are copied here once, and hard linked or cloned from the copies; the copies are refreshed if the input files change.
+        # archiveFiles: names of the files to keep in archive directories (e.g. DefaultArchiveFiles); if set to None, archive directories are left as they are.
+        # archiveCompression: if set to one of ArchiveCompressionFormats, the files kept in archive directories are compressed.
+        
+        if modes == None:
+            modes = StagingModes;
+        
+        for mode in modes:
+            if mode not in StagingModes:
+                raise Exception("Error: Unknown staging mode \"{0}\" - must be one of {1}.".format(mode, ", ".join("\"{0}\"".format(item) for item in StagingModes)));
+        
+        if archiveCompression != None:
+            CheckCompressionFormat(archiveCompression);
+        
+        self.Modes = list(modes);
+        self.CacheDir = cacheDir;
+        
+        self.ArchiveFiles = list(archiveFiles) if archiveFiles != None else None;
+        self.ArchiveCompression = archiveCompression;
+        
+        # Number of files staged with each mode.
+        
+        self.Counts = dict((mode, 0) for mode in StagingModes);
+        
+        self._lock = threading.Lock();
+        
+        # Index into Modes to start from for each (source file, destination device), and the cached copy to stage each source file from.
+        
+        self._modeIndices = { };
+        self._sources = { };
+    
+    def _GetSource(self, source, device):
+        # Called with self._lock held.
+        
+        if self.CacheDir == None or ('hardlink' not in self.Modes and 'reflink' not in self.Modes):
+            return source;
+        
+        key = (source, device);
+        
+        if key not in self._sources:
+            sourceStat = os.stat(source);
+            
+            if sourceStat.st_dev == device:
+                self._sources[key] = source;
+            else:
+                if not os.path.isdir(self.CacheDir):
+                    os.makedirs(self.CacheDir);
+                
+                cachedSource = os.path.join(os.path.abspath(self.CacheDir), "{0}-{1}".format(sourceStat.st_dev, source.strip(os.sep).replace(os.sep, '_')));
+                
+                # Copies left over from a previous sweep are reused if the size and modification time match the input file.
+                
+                if os.path.isfile(cachedSource):
+                    cachedStat = os.stat(cachedSource);
+                    
+                    if cachedStat.st_size != sourceStat.st_size or int(cachedStat.st_mtime) != int(sourceStat.st_mtime):
+                        os.remove(cachedSource);
+                
+                if not os.path.isfile(cachedSource):
+                    shutil.copy2(source, "{0}.tmp".format(cachedSource));
+                    os.rename("{0}.tmp".format(cachedSource), cachedSource);
+                
+                self._sources[key] = cachedSource if os.stat(cachedSource).st_dev == device else source;
+        
+        return self._sources[key];
+    
+    def Stage(self, runDir, fileNames, inputDir = "."):
+        # Stages the files in fileNames from inputDir into runDir, which must already exist.
+        
+        device = os.stat(runDir).st_dev;
+        
+        for fileName in fileNames:
+            source = os.path.abspath(os.path.join(inputDir, fileName));
+            destination = os.path.join(runDir, fileName);
+            
+            key = (source, device);
+            
+            with self._lock:
+                modes = self.Modes[self._modeIndices.get(key, 0):];
+                
+                # Links and clones are made from the cached copy, if any; symbolic links should point to the input file.
+                
+                linkSource = self._GetSource(source, device) if 'hardlink' in modes or 'reflink' in modes else source;
+            
+            mode = StageFile(source, destination, modes = modes, linkSource = linkSource);
+            
+            with self._lock:
+                if mode in self.Modes:
+                    self._modeIndices[key] = max(self._modeIndices.get(key, 0), self.Modes.index(mode));
+                
+                self.Counts[mode] += 1;
+    
+    def GetSummary(self):
+        return ", ".join("{0}: {1}".format(mode, self.Counts[mode]) for mode in StagingModes if self.Counts[mode] > 0);
+    
+    def Archive(self, archiveDir):
+        # archiveDir may also be the run directory of a completed job, before it is moved to its archive directory.
+        # Deletes the files in archiveDir not in ArchiveFiles and compresses the rest if ArchiveCompression is set.
+        # Returns a list of messages describing what was done.
+        
+        messages = [];
+        
+        if self.ArchiveFiles != None:
+            keepFiles = set(self.ArchiveFiles) | set(_CollectedFiles);
+            
+            numRemoved, freedSize = 0, 0;
+            
+            for fileName in sorted(os.listdir(archiveDir)):
+                # Files compressed previously are kept if the uncompressed files would be.
+                
+                extension = GetCompressedExtension(fileName);
+                
+                if (fileName[:-len(extension)] if extension != None else fileName) in keepFiles:
+                    continue;
+                
+                filePath = os.path.join(archiveDir, fileName);
+                
+                if os.path.isdir(filePath) and not os.path.islink(filePath):
+                    shutil.rmtree(filePath);
+                else:
+                    freedSize += _GetFreedSize(filePath);
+                    os.remove(filePath);
+                
+                numRemoved += 1;
+            
+            if numRemoved > 0:
+                messages.append("Removed {0} file(s) not needed to collect the results ({1:.2f} MB)".format(numRemoved, freedSize / 1048576.0));
+        
+        if self.ArchiveCompression != None:
+            numCompressed, savedSize = 0, 0;
+            
+            for fileName in sorted(os.listdir(archiveDir)):
+                filePath = os.path.join(archiveDir, fileName);
+                
+                # Links (e.g. staged input files) are skipped, as compressing them would not save any space.
+                
+                if fileName in _UncompressedFiles or GetCompressedExtension(fileName) != None or fileName.endswith(".tmp") or not os.path.isfile(filePath) or _GetFreedSize(filePath) == 0:
+                    continue;
+                
+                savedSize += CompressFile(filePath, self.ArchiveCompression);
+                
+                numCompressed += 1;
+            
+            if numCompressed > 0:
+                messages.append("Compressed {0} file(s) ({1:.2f} MB saved)".format(numCompressed, savedSize / 1048576.0));
+        
+        return messages;
@@ -0,0 +1,716 @@
+# Sweep.py by J. M. Skelton
+
+
+import csv;
+import os;
+
+from collections import OrderedDict;
+
+from Launcher import DefaultMPSControlCommand, GetNumGPUs, LaunchKeys, MPSKey, OMPThreadsKey, RanksPerGPUKey;
+from ResultStore import ResultStore;
+from Scheduler import Job, RunJobs;
+from Shared import CollectRunRecord, CollectRunRecordsParallel, IsTruncated;
+from Telemetry import GetTelemetryFile, ReadTelemetry, SummariseTelemetry;
+from Validation import ValidateResults;
+
+
+# Name of the sweep parameter for the number of MPI processes; all other parameters, except the launch settings in Launcher.LaunchKeys, are INCAR tags.
+
+NumProcessesKey = "NPROC";
+
+# Headers for the columns of collected results written to the data output file.
+
+ResultHeaders = [
+    "# SCF Steps", "t_SCF,Ave [s]", "t_Elapsed [s]", "Final E_0 [eV]",
+    "t_SCF,Median [s]", "t_SCF,StdDev [s]", "t_SCF,Min [s]", "t_Ionic,Ave [s]", "Max. Memory [kB]", "Rank-0 Memory [kB]",
+    "Peak RSS [kB]", "CPU Usage,Mean [%]", "GPU Util.,Mean [%]", "GPU Memory,Peak [kB]",
+    "Valid"
+    ];
+
+# Keys of the values in the records returned by Shared.CollectRunRecord(), plus the telemetry summary from Telemetry.SummariseTelemetry(), corresponding to ResultHeaders; the last column is the result of the validation in Sweep.CollectResults().
+
+_ResultRecordKeys = [
+    'NumSCFSteps', 'TSCFAve', 'TElapsed', 'FinalTotalEnergy',
+    'TSCFMedian', 'TSCFStdDev', 'TSCFMin', 'TIonicAve', 'MaxMemory', 'Rank0Memory',
+    'PeakRSS', 'MeanCPUUsage', 'MeanGPUUtilisation', 'PeakGPUMemory'
+    ];
+
+# Indices in ResultHeaders of the extra SCF-time statistics and memory figures, and of the telemetry summary, which are only written to the data output file if requested (see GetResultColumns()).
+
+_ExtraStatisticsColumns = list(range(4, 10));
+_TelemetryColumns = list(range(10, 14));
+
+# Fraction of the bracket between the lower/upper bounds and the inner points in a golden-section search, (3 - sqrt(5)) / 2.
+
+_GoldenSectionFraction = 0.381966;
+
+
+def GetResultColumns(extraStatistics = False, telemetry = False):
+    # Returns the indices of the columns in ResultHeaders to write: the number of SCF steps, t_SCF, t_Elapsed, the final energy and the validation result, plus the extra statistics and the telemetry summary if set.
+    
+    columns = list(range(4));
+    
+    if extraStatistics:
+        columns = columns + _ExtraStatisticsColumns;
+    
+    if telemetry:
+        columns = columns + _TelemetryColumns;
+    
+    return columns + [len(ResultHeaders) - 1];
+
+def CalculateKPARAndNPAR(numProcesses, targetKPARValues):
+    kparValue = 1;
+    
+    for targetKPAR in sorted(targetKPARValues)[::-1]:
+        if numProcesses % targetKPAR == 0:
+            kparValue = targetKPAR;
+    
+    return (kparValue, numProcesses // kparValue);
+
+def KPARRule(targetKPARValues):
+    # Rule for deriving KPAR and NPAR from the number of MPI processes, as used for the GPU tests.
+    
+    def _Rule(values):
+        kparValue, nparValue = CalculateKPARAndNPAR(values[NumProcessesKey], targetKPARValues);
+        
+        return [("KPAR", kparValue), ("NPAR", nparValue)];
+    
+    return _Rule;
+
+def FixedWorkloadTags(numSCFSteps, skipSCFCycles = 0):
+    # Returns INCAR tags that make every job run exactly skipSCFCycles + numSCFSteps SCF steps (per ionic step), so that t_Elapsed measures the same amount of work for every point.
+    # NELMIN = NELM forces the full number of steps, and EDIFF = 0 stops the SCF from ever being treated as converged.
+    
+    numSteps = skipSCFCycles + numSCFSteps;
+    
+    return [("NELM", numSteps), ("NELMIN", numSteps), ("EDIFF", 0)];
+
+def DivisibilityFilter(values):
+    # If the number of MPI processes is not divisible by KPAR * NPAR, VASP will almost certainly throw an error.
+    
+    numProcesses = values[NumProcessesKey];
+    kparNPAR = values.get("KPAR", 1) * values.get("NPAR", 1);
+    
+    if numProcesses % kparNPAR != 0:
+        return "# proc = {0} is not divisible by KPAR * NPAR = {1}".format(numProcesses, kparNPAR);
+    
+    return None;
+
+def RanksPerGPUFilter(maxGPUs = None):
+    # Filter for points that share the GPUs unevenly between the MPI processes or, if maxGPUs is set, need more than maxGPUs GPUs.
+    
+    def _Filter(values):
+        if RanksPerGPUKey not in values:
+            return None;
+        
+        numProcesses, ranksPerGPU = values[NumProcessesKey], values[RanksPerGPUKey];
+        
+        if numProcesses % ranksPerGPU != 0:
+            return "# proc = {0} is not divisible by {1} = {2}".format(numProcesses, RanksPerGPUKey, ranksPerGPU);
+        
+        if maxGPUs != None and GetNumGPUs(numProcesses, ranksPerGPU) > maxGPUs:
+            return "# proc = {0} with {1} = {2} needs more than {3} GPU(s)".format(numProcesses, RanksPerGPUKey, ranksPerGPU, maxGPUs);
+        
+        return None;
+    
+    return _Filter;
+
+def GetParameterHeader(name):
+    return "# Proc" if name == NumProcessesKey else name;
+
+def GetPlaceholder(name):
+    return "<{0}>".format(name.lower());
+
+def GetArchiveDirName(template, values):
+    jobDir = template;
+    
+    for name, value in values.items():
+        jobDir = jobDir.replace(GetPlaceholder(name), str(value));
+    
+    return jobDir;
+
+
+class GoldenSectionSearch(object):
+    def __init__(self, parameter, values):
+        # Searches for the minimum of a smooth, unimodal function (e.g. t_SCF vs. NSIM) over the sorted parameter values.
+        # Failed evaluations should be given as float('inf').
+        
+        self.Parameter = parameter;
+        self.Values = values;
+        
+        self.Results = { };
+        
+        self._lower, self._upper = 0, len(values) - 1;
+        
+        self._reasons = { };
+    
+    def _FormatResult(self, index):
+        result = self.Results[index];
+        
+        return "t_SCF = {0:.3f} s".format(result) if result != float('inf') else "failed";
+    
+    def _Eliminate(self, indices, better, worse):
+        reason = "{0} = {1} ({2}) is faster than {0} = {3} ({4})".format(
+            self.Parameter, self.Values[better], self._FormatResult(better), self.Values[worse], self._FormatResult(worse)
+            );
+        
+        for index in indices:
+            self._reasons[index] = reason;
+    
+    def GetNextIndices(self):
+        # Returns the indices of the values that need to be evaluated before the search can continue, or an empty list once it has finished.
+        
+        while True:
+            if self._upper - self._lower <= 2:
+                return [index for index in range(self._lower, self._upper + 1) if index not in self.Results];
+            
+            offset = int(round((self._upper - self._lower) * _GoldenSectionFraction));
+            
+            inner1, inner2 = self._lower + offset, self._upper - offset;
+            
+            if inner2 <= inner1:
+                inner2 = inner1 + 1;
+            
+            indices = [index for index in (inner1, inner2) if index not in self.Results];
+            
+            if len(indices) > 0:
+                return indices;
+            
+            if self.Results[inner1] <= self.Results[inner2]:
+                self._Eliminate(range(inner2 + 1, self._upper + 1), inner1, inner2);
+                self._upper = inner2;
+            else:
+                self._Eliminate(range(self._lower, inner1), inner2, inner1);
+                self._lower = inner1;
+    
+    def SetResult(self, index, result):
+        self.Results[index] = result;
+    
+    def GetBestIndex(self):
+        indices = [index for index in self.Results if self.Results[index] != float('inf')];
+        
+        return min(indices, key = lambda index: self.Results[index]) if len(indices) > 0 else None;
+    
+    def GetSkipped(self):
+        # Returns (index, reason) pairs for the values eliminated without being evaluated.
+        
+        return [(index, self._reasons[index]) for index in sorted(self._reasons.keys()) if index not in self.Results];
+
+
+class SweepPoint(object):
+    def __init__(self, axisValues, derivedValues):
+        # Values holds the swept parameters followed by any derived from them by rules, in order.
+        
+        self.Values = OrderedDict(axisValues);
+        
+        for name, value in derivedValues:
+            self.Values[name] = value;
+        
+        self.Key = tuple(value for _, value in axisValues);
+        
+        self._axisValues = list(axisValues);
+        
+        self.Label = self.GetLabel();
+    
+    def GetLabel(self, exclude = None):
+        return ", ".join(
+            "{0} = {1}".format("# proc" if name == NumProcessesKey else name, value) for name, value in self._axisValues if name != exclude
+            );
+    
+    @property
+    def NumProcesses(self):
+        return self.Values[NumProcessesKey];
+    
+    @property
+    def INCARTags(self):
+        return [(name, value) for name, value in self.Values.items() if name != NumProcessesKey and name not in LaunchKeys];
+    
+    @property
+    def LaunchSettings(self):
+        return [(name, value) for name, value in self.Values.items() if name in LaunchKeys];
+    
+    def GetNumGPUs(self, numGPUs):
+        # Number of GPUs used by the point: set by the number of processes per GPU, if swept, and numGPUs otherwise.
+        
+        return GetNumGPUs(self.NumProcesses, self.Values[RanksPerGPUKey]) if RanksPerGPUKey in self.Values else numGPUs;
+
+
+class Sweep(object):
+    def __init__(self, parameters, archiveDirName, scriptName, rules = None, filters = None, inputDir = ".", numAtoms = None, fixedTags = None, mpsControlCommand = DefaultMPSControlCommand):
+        # parameters: list of (name, values) pairs giving the parameter space; the number of MPI processes is given as NumProcessesKey, everything else is treated as an INCAR tag.
+        # rules: functions that take the swept values for a point and return a list of (tag, value) pairs to derive from them (e.g. KPARRule()).
+        # filters: functions that take the values for a point and return a reason to skip it, or None.
+        # inputDir: directory containing the VASP input files; archive directories are created relative to the working directory, so archiveDirName should include inputDir if it is not ".".
+        # numAtoms: number of atoms in the system, if known; passed to the jobs for Monitor.ProgressMonitor.
+        # fixedTags: (tag, value) pairs set for every job (e.g. FixedWorkloadTags()); unlike the swept and derived tags, these may also be set in the INCAR file, and override the values there.
+        # mpsControlCommand: command used to start and stop the MPS control daemon for points with MPS enabled (see Launcher.WriteLaunchScripts()).
+        
+        if NumProcessesKey not in [name for name, _ in parameters]:
+            raise Exception("Error: Sweep(): The parameter space must include the number of MPI processes.");
+        
+        self.Parameters = [(name, list(values)) for name, values in parameters];
+        
+        self.ArchiveDirName = archiveDirName;
+        self.ScriptName = scriptName;
+        
+        self.InputDir = inputDir;
+        self.NumAtoms = numAtoms;
+        
+        self.FixedTags = list(fixedTags) if fixedTags != None else [];
+        
+        self.MPSControlCommand = mpsControlCommand;
+        
+        self.Points, self.Skipped = [], [];
+        
+        for axisValues in self._ExpandParameters(0, []):
+            derivedValues = [];
+            
+            for rule in (rules if rules != None else []):
+                derivedValues = derivedValues + rule(OrderedDict(axisValues));
+            
+            point = SweepPoint(axisValues, derivedValues);
+            
+            reason = None;
+            
+            for pointFilter in (filters if filters != None else []):
+                reason = pointFilter(point.Values);
+                
+                if reason != None:
+                    break;
+            
+            if reason == None:
+                self.Points.append(point);
+            else:
+                self.Skipped.append((point, reason));
+    
+    def _ExpandParameters(self, index, axisValues):
+        if index == len(self.Parameters):
+            yield axisValues;
+        else:
+            name, values = self.Parameters[index];
+            
+            for value in values:
+                for result in self._ExpandParameters(index + 1, axisValues + [(name, value)]):
+                    yield result;
+    
+    def GetSweptParameters(self):
+        return [name for name, values in self.Parameters if len(values) > 1];
+    
+    def GetINCARTags(self):
+        tags = [];
+        
+        for point in self.Points + [point for point, _ in self.Skipped]:
+            for name, _ in point.INCARTags:
+                if name not in tags:
+                    tags.append(name);
+        
+        return tags;
+    
+    def GetArchiveDir(self, point):
+        return GetArchiveDirName(self.ArchiveDirName, point.Values);
+    
+    def CheckSetup(self, dataOutputFile, runDir, vaspRunCommand, collectOnly, runDirMayExist = False):
+        # runDirMayExist should be set when resuming a sweep whose jobs were submitted to a batch system, as the run directory will contain the jobs that are still queued or running.
+        
+        # ArchiveDirName is required regardless of CollectOnly.
+        
+        for name in self.GetSweptParameters():
+            if GetPlaceholder(name) not in os.path.basename(self.ArchiveDirName):
+                raise Exception("Error: If {0} is being tested, the string \"{1}\" must appear in ArchiveDirName.".format(GetParameterHeader(name), GetPlaceholder(name)));
+        
+        # DataOutputFile must not exist regardless of CollectOnly.
+        
+        if os.path.isfile(dataOutputFile):
+            raise Exception("Error: DataOutputFile \"{0}\" already exists - please rename/delete and run again.".format(dataOutputFile));
+        
+        if not collectOnly:
+            # These other checks are only needed if CollectOnly is False.
+            
+            if os.path.isdir(runDir) and not runDirMayExist:
+                raise Exception("Error: RunDir \"{0}\" already exists - please remove and run again.".format(runDir));
+            
+            if "<nproc>" not in vaspRunCommand:
+                raise Exception("Error: The string \"<nproc>\" must appear in VASPRunCommand.");
+            
+            for vaspInputFile in "INCAR", "KPOINTS", "POSCAR", "POTCAR":
+                if not os.path.isfile(os.path.join(self.InputDir, vaspInputFile)):
+                    raise Exception("Error: Required VASP input file \"{0}\" not found.".format(os.path.join(self.InputDir, vaspInputFile)));
+            
+            tags = self.GetINCARTags();
+            
+            with open(os.path.join(self.InputDir, "INCAR"), 'r') as inputReader:
+                for line in inputReader:
+                    if any(tag in line for tag in tags):
+                        raise Exception("Error: INCAR file must not contain the {0} control tags - these are set by the script.".format(", ".join(tags)));
+    
+    def PrintSkipped(self):
+        # Several points are usually skipped for the same reason (e.g. every NSIM value for a bad KPAR/NPAR combination) -> only print each reason once.
+        
+        reasons = [];
+        
+        for _, reason in self.Skipped:
+            if reason not in reasons:
+                reasons.append(reason);
+        
+        for reason in reasons:
+            print("{0} -> skipping...".format(reason));
+            print("");
+    
+    def Skip(self, point, reason):
+        # Moves point from Points to Skipped.
+        
+        self.Points.remove(point);
+        self.Skipped.append((point, reason));
+    
+    def GetJobs(self, numGPUs = 0, abortParameter = None):
+        # If abortParameter is set, points differing only in the value of that parameter (e.g. a row of NSIM values) are grouped, so a failure can abort the rest of the group.
+        
+        jobs = [];
+        
+        for point in self.Points:
+            group = None;
+            
+            if abortParameter != None:
+                group = tuple(value for name, value in point.Values.items() if name != abortParameter);
+            
+            jobs.append(
+                self._GetJob(point, numGPUs = numGPUs, group = group)
+                );
+        
+        return jobs;
+    
+    def _GetJob(self, point, numGPUs = 0, group = None):
+        # numGPUs is the number of GPUs to allocate to each job, or zero if GPUs are not allocated (e.g. CPU jobs, or GPU jobs that can use all the GPUs on a node).
+        
+        return Job(
+            self.GetArchiveDir(point), point.Label, point.NumProcesses, point.INCARTags + self.FixedTags, numGPUs = point.GetNumGPUs(numGPUs) if numGPUs > 0 else 0,
+            group = group, numAtoms = self.NumAtoms, inputDir = self.InputDir,
+            numThreads = point.Values.get(OMPThreadsKey), ranksPerGPU = point.Values.get(RanksPerGPUKey), useMPS = bool(point.Values.get(MPSKey, False)), mpsControlCommand = self.MPSControlCommand
+            );
+    
+    def _RunJobs(self, jobs, pool, runDir, vaspRunCommand, abortGroupOnFail = False, watcherFactory = None, samplerFactory = None, monitor = None, batch = None, stager = None, maxRetries = 0, pruneFailures = False, executor = None):
+        # If batch is set to a Batch.BatchRunner, the jobs are submitted to the batch system instead of being run on the resources in pool; watchers, samplers and executor limits cannot be used with batch jobs (the batch system's wall time applies instead), and failed batch jobs are classified but not retried or used to prune the others.
+        
+        if batch != None:
+            batch.RunJobs(jobs, runDir, vaspRunCommand, self.ScriptName, abortGroupOnFail = abortGroupOnFail, monitor = monitor, stager = stager);
+        else:
+            RunJobs(
+                jobs, pool, runDir, vaspRunCommand, self.ScriptName,
+                abortGroupOnFail = abortGroupOnFail, watcherFactory = watcherFactory, samplerFactory = samplerFactory, monitor = monitor, stager = stager,
+                maxRetries = maxRetries, pruneFailures = pruneFailures, executor = executor
+                );
+    
+    def Run(self, pool, runDir, vaspRunCommand, numGPUs = 0, abortParameter = None, watcherFactory = None, samplerFactory = None, monitor = None, batch = None, stager = None, maxRetries = 0, pruneFailures = False, executor = None):
+        self.PrintSkipped();
+        
+        self._RunJobs(
+            self.GetJobs(numGPUs = numGPUs, abortParameter = abortParameter), pool, runDir, vaspRunCommand,
+            abortGroupOnFail = abortParameter != None, watcherFactory = watcherFactory, samplerFactory = samplerFactory, monitor = monitor, batch = batch, stager = stager,
+            maxRetries = maxRetries, pruneFailures = pruneFailures, executor = executor
+            );
+    
+    def RunAdaptive(self, pool, runDir, vaspRunCommand, parameter, skipSCFCycles = 0, numGPUs = 0, watcherFactory = None, samplerFactory = None, energyTolerance = None, scfStepsTolerance = None, monitor = None, batch = None, stager = None, maxRetries = 0, executor = None):
+        # Rather than testing every value of parameter (e.g. NSIM), search for the fastest one for each combination of the other parameters with a golden-section search.
+        # The searches for different combinations are run in parallel; points eliminated by the searches are moved to Skipped along with the reason.
+        # If energyTolerance is set, the points tested in each round are validated against the consensus over all the points tested so far (see CollectResults()), and points that fail are treated as failed runs by the searches.
+        # Failed runs are treated as worse than any that succeeded, so the searches already steer away from values of parameter that e.g. run out of memory; tests that fail with transient errors are retried up to maxRetries times.
+        
+        self.PrintSkipped();
+        
+        groups = OrderedDict();
+        
+        for point in self.Points:
+            groupKey = tuple(value for name, value in point.Values.items() if name != parameter);
+            
+            if groupKey not in groups:
+                groups[groupKey] = [];
+            
+            groups[groupKey].append(point);
+        
+        searches = [];
+        
+        for groupPoints in groups.values():
+            groupPoints = sorted(groupPoints, key = lambda point: point.Values[parameter]);
+            
+            searches.append(
+                (groupPoints, GoldenSectionSearch(parameter, [point.Values[parameter] for point in groupPoints]))
+                );
+        
+        numRounds = 0;
+        
+        validationData = OrderedDict();
+        
+        while True:
+            evaluate = [];
+            
+            for groupPoints, search in searches:
+                for index in search.GetNextIndices():
+                    evaluate.append((groupPoints[index], search, index));
+            
+            if len(evaluate) == 0:
+                break;
+            
+            numRounds += 1;
+            
+            print("Adaptive {0} search: round {1}, {2} test(s)".format(parameter, numRounds, len(evaluate)));
+            print("");
+            
+            self._RunJobs(
+                [self._GetJob(point, numGPUs = numGPUs) for point, _, _ in evaluate], pool, runDir, vaspRunCommand,
+                watcherFactory = watcherFactory, samplerFactory = samplerFactory, monitor = monitor, batch = batch, stager = stager, maxRetries = maxRetries, executor = executor
+                );
+            
+            tSCFAveValues = [];
+            
+            for point, _, _ in evaluate:
+                tSCFAve = None;
+                
+                jobDir = self.GetArchiveDir(point);
+                
+                if os.path.isdir(jobDir):
+                    record = CollectRunRecord(jobDir, outcarSkipSCFCycles = skipSCFCycles);
+                    
+                    tSCFAve = record['TSCFAve'];
+                    
+                    validationData[point.Key] = (record['FinalTotalEnergy'], record['NumSCFSteps']) if tSCFAve != None and not IsTruncated(jobDir) else None;
+                
+                tSCFAveValues.append(tSCFAve);
+            
+            if energyTolerance != None:
+                validation = dict(zip(validationData.keys(), ValidateResults(list(validationData.values()), energyTolerance = energyTolerance, scfStepsTolerance = scfStepsTolerance)));
+                
+                for i, (point, _, _) in enumerate(evaluate):
+                    if point.Key in validation and validation[point.Key][0] == False:
+                        print("  -> WARNING: Results for {0} failed validation: {1} -> treating as failed".format(point.Label, validation[point.Key][1]));
+                        
+                        tSCFAveValues[i] = None;
+            
+            for (point, search, index), tSCFAve in zip(evaluate, tSCFAveValues):
+                search.SetResult(index, tSCFAve if tSCFAve != None else float('inf'));
+        
+        print("Adaptive {0} search finished after {1} round(s):".format(parameter, numRounds));
+        
+        for groupPoints, search in searches:
+            for index, reason in search.GetSkipped():
+                self.Skip(groupPoints[index], "Adaptive search: {0}".format(reason));
+            
+            bestIndex = search.GetBestIndex();
+            
+            groupLabel = groupPoints[0].GetLabel(exclude = parameter);
+            
+            if bestIndex != None:
+                print("  -> {0}: best {1} = {2} (t_SCF = {3:.3f} s) after {4} of {5} tests".format(
+                    groupLabel, parameter, search.Values[bestIndex], search.Results[bestIndex], len(search.Results), len(groupPoints)
+                    ));
+            else:
+                print("  -> {0}: all {1} tests failed".format(groupLabel, len(search.Results)));
+        
+        print("");
+    
+    def WriteSkipped(self, filePath):
+        with open(filePath, 'w') as outputWriter:
+            outputWriterCSV = csv.writer(outputWriter, delimiter = ',', quotechar = '\"', quoting = csv.QUOTE_ALL);
+            
+            outputWriterCSV.writerow(
+                [GetParameterHeader(name) for name, _ in self.Parameters] + ["Reason"]
+                );
+            
+            for point, reason in self.Skipped:
+                outputWriterCSV.writerow(list(point.Key) + [reason]);
+    
+    def CollectResults(self, skipSCFCycles = 0, numJobs = 1, cache = None, energyTolerance = None, scfStepsTolerance = None):
+        # If numJobs is larger than one, results are collected from that many archive directories in parallel; the output is the same as collecting them one at a time.
+        # If cache is set to a Shared.ResultCache, results are read from it for archive directories that have not changed since they were last collected.
+        # If energyTolerance is set, the final energy and number of SCF steps of each point are checked against the consensus over all the points (see Validation.ValidateResults()), and the "Valid" column is set to "Yes" or "No"; points that fail should not be used as the fastest settings.
+        # Points stopped early are not checked, as their final energies are from truncated runs.
+        # If the jobs were run with a Telemetry.TelemetrySampler, the peak memory and mean utilisation are added to the results; otherwise these columns are left blank.
+        
+        jobDirs = [self.GetArchiveDir(point) for point in self.Points];
+        
+        foundJobDirs = [jobDir for jobDir in jobDirs if os.path.isdir(jobDir)];
+        
+        records = dict(zip(
+            foundJobDirs, CollectRunRecordsParallel(foundJobDirs, outcarSkipSCFCycles = skipSCFCycles, numJobs = numJobs, cache = cache)
+            ));
+        
+        collected = [];
+        
+        for point, jobDir in zip(self.Points, jobDirs):
+            if jobDir in records:
+                telemetryFile = GetTelemetryFile(jobDir);
+                
+                record = dict(records[jobDir]);
+                record.update(SummariseTelemetry(ReadTelemetry(telemetryFile) if os.path.isfile(telemetryFile) else []));
+                
+                if all(record[key] != None for key in _ResultRecordKeys[:4]):
+                    isTruncated = IsTruncated(jobDir);
+                    
+                    if isTruncated:
+                        print("  -> Collected data for {0} (stopped early; t_Elapsed and Final E_0 are from a truncated run)".format(point.Label));
+                    else:
+                        print("  -> Collected data for {0}".format(point.Label));
+                    
+                    collected.append((point, record, isTruncated));
+                else:
+                    print("  -> Failed to collect data for {0}".format(point.Label));
+            else:
+                print("  -> Archive dir \"{0}\" not found -> skipping {1}".format(jobDir, point.Label));
+        
+        validation = [(None, None)] * len(collected);
+        
+        if energyTolerance != None:
+            validation = ValidateResults(
+                [(record['FinalTotalEnergy'], record['NumSCFSteps']) if not isTruncated else None for _, record, isTruncated in collected],
+                energyTolerance = energyTolerance, scfStepsTolerance = scfStepsTolerance
+                );
+        
+        data = OrderedDict();
+        
+        for (point, record, _), (valid, reason) in zip(collected, validation):
+            if valid == False:
+                print("  -> WARNING: Results for {0} failed validation: {1} -> marked as invalid".format(point.Label, reason));
+            
+            results = tuple(record[key] for key in _ResultRecordKeys) + ("Yes" if valid == True else "No" if valid == False else "", );
+            
+            data[point.Key] = (point, results, record);
+        
+        return data;
+    
+    def GetDerivedNames(self, points):
+        # Names of the parameters set by rules (e.g. KPAR and NPAR from the number of processes) for points, in the order they appear.
+        
+        numAxes = len(self.Parameters);
+        
+        derivedNames = [];
+        
+        for point in points:
+            for name in list(point.Values.keys())[numAxes:]:
+                if name not in derivedNames:
+                    derivedNames.append(name);
+        
+        return derivedNames;
+    
+    def GetResultRows(self, data, columns = None):
+        # Returns (headers, rows) for the results in data, with a row for each point.
+        # columns: indices of the columns in ResultHeaders to include (see GetResultColumns()); if not set, the default columns are included.
+        
+        if columns == None:
+            columns = GetResultColumns();
+        
+        axisNames = [name for name, _ in self.Parameters];
+        
+        derivedNames = self.GetDerivedNames([point for point, _, _ in data.values()]);
+        
+        rows = [];
+        
+        for key in sorted(data.keys()):
+            point, results, _ = data[key];
+            
+            # Values that could not be obtained from the output (e.g. the memory usage, which older versions of VASP do not print) are left blank.
+            
+            rows.append(
+                list(key) + [point.Values.get(name, "") for name in derivedNames] + [results[column] if results[column] != None else "" for column in columns]
+                );
+        
+        return ([GetParameterHeader(name) for name in axisNames + derivedNames] + [ResultHeaders[column] for column in columns], rows);
+    
+    def WriteResults(self, filePath, data, matrixParameters = None, columns = None):
+        # If matrixParameters is set to a pair of parameter names, the results are also written as matrices with the first parameter along the rows and the second along the columns.
+        # This is only possible if the other parameters are not being swept.
+        # columns is passed to GetResultRows().
+        
+        headers, rows = self.GetResultRows(data, columns = columns);
+        
+        with open(filePath, 'w') as outputWriter:
+            outputWriterCSV = csv.writer(outputWriter, delimiter = ',', quotechar = '\"', quoting = csv.QUOTE_ALL);
+            
+            outputWriterCSV.writerow(headers);
+            
+            for row in rows:
+                outputWriterCSV.writerow(row);
+            
+            if matrixParameters == None:
+                return;
+            
+            rowName, columnName = matrixParameters;
+            
+            if any(name not in matrixParameters for name in self.GetSweptParameters()):
+                print("WARNING: Sweep.WriteResults(): Parameters other than {0} and {1} are being swept -> not writing data matrices".format(rowName, columnName));
+                return;
+            
+            parameters = OrderedDict(self.Parameters);
+            
+            outputWriterCSV.writerow([]);
+            
+            for matrixColumn, matrixHeader in enumerate(ResultHeaders[:3]):
+                outputWriterCSV.writerow(["Data: {0}".format(matrixHeader)]);
+                outputWriterCSV.writerow([]);
+                
+                outputWriterCSV.writerow(["", GetParameterHeader(columnName)]);
+                outputWriterCSV.writerow([GetParameterHeader(rowName)] + parameters[columnName]);
+                
+                for rowValue in parameters[rowName]:
+                    row = [rowValue];
+                    
+                    for columnValue in parameters[columnName]:
+                        key = tuple(
+                            rowValue if name == rowName else columnValue if name == columnName else values[0]
+                                for name, values in self.Parameters
+                            );
+                        
+                        row.append(data[key][1][matrixColumn] if key in data else '-');
+                    
+                    outputWriterCSV.writerow(row);
+                
+                outputWriterCSV.writerow([]);
+    
+    def GetResultStore(self, data, system, numAtoms, device, numGPUs = 0):
+        # Returns a ResultStore.ResultStore with a row for each point in data, e.g. for saving in a columnar format.
+        
+        store = ResultStore();
+        
+        for key in sorted(data.keys()):
+            point, results, record = data[key];
+            
+            values = dict(record);
+            
+            values.update({
+                'System' : system, 'NumAtoms' : numAtoms, 'Device' : device, 'NumGPUs' : point.GetNumGPUs(numGPUs),
+                'NumProcesses' : point.NumProcesses, 'Valid' : 1 if results[-1] == "Yes" else 0 if results[-1] == "No" else -1, 'Source' : self.ScriptName
+                });
+            
+            # The fixed tags and launch settings are recorded with the extra tags, so that e.g. runs with a fixed workload are not compared to full runs.
+            
+            extraTags = [];
+            
+            for name, value in point.INCARTags + self.FixedTags + point.LaunchSettings:
+                if name in ("KPAR", "NPAR", "NSIM"):
+                    values[name] = value;
+                else:
+                    extraTags.append("{0} = {1}".format(name, value));
+            
+            values['ExtraTags'] = ", ".join(extraTags);
+            
+            store.AddRow(values, scfTimes = record['SCFTimes']);
+        
+        return store;
+    
+    def WriteTimings(self, filePath, data):
+        # Writes the per-step SCF and ionic timings and the per-routine timing breakdown for each point in "long" format, with one row per step/routine.
+        
+        with open(filePath, 'w') as outputWriter:
+            outputWriterCSV = csv.writer(outputWriter, delimiter = ',', quotechar = '\"', quoting = csv.QUOTE_ALL);
+            
+            outputWriterCSV.writerow(
+                [GetParameterHeader(name) for name, _ in self.Parameters] + ["Type", "Step/Routine", "# Calls", "t_CPU [s]", "t_Real [s]"]
+                );
+            
+            for key in sorted(data.keys()):
+                _, _, record = data[key];
+                
+                for recordType, tCPUKey, tRealKey in ("SCF", 'SCFCPUTimes', 'SCFTimes'), ("Ionic", 'IonicCPUTimes', 'IonicTimes'):
+                    for i, (tCPU, tReal) in enumerate(zip(record[tCPUKey], record[tRealKey])):
+                        outputWriterCSV.writerow(list(key) + [recordType, i + 1, 1, tCPU, tReal]);
+                
+                for name, numCalls, tCPU, tReal in record['RoutineTimes']:
+                    outputWriterCSV.writerow(list(key) + ["Routine", name, numCalls, tCPU, tReal]);
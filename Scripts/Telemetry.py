@@ -0,0 +1,284 @@
+# Telemetry.py by J. M. Skelton
+
+
+import csv;
+import os;
+import signal;
+import subprocess;
+import threading;
+import time;
+
+from Execution import NewSessionArguments;
+from Shared import FindExecutable;
+from Watcher import KillProcessGroup;
+
+
+# Suffix added to archive directory names for the telemetry files written by TelemetrySampler, e.g. "GPUTest-4-8" -> "GPUTest-4-8.telemetry.csv".
+
+TelemetryFileSuffix = ".telemetry.csv";
+
+TelemetryHeaders = ["Time [s]", "Type", "ID", "Name", "Utilisation [%]", "Memory [kB]"];
+
+# Time [s] to wait for nvidia-smi before killing it, e.g. if the driver hangs.
+
+DefaultProbeTimeout = 10.0;
+
+# Time [s] TelemetrySampler.Join() waits for the sampling thread, which may be waiting for a sample, before giving up on it.
+
+_JoinTimeout = 2.0 * DefaultProbeTimeout;
+
+
+def GetTelemetryFile(archiveDir):
+    return "{0}{1}".format(archiveDir, TelemetryFileSuffix);
+
+
+class ProcessProbe(object):
+    def __init__(self):
+        # Reads the CPU time and resident set size (RSS) of the processes in a job from /proc (i.e. on Linux).
+        # Jobs are started in their own session, so the processes are identified by their session ID; processes started on other nodes (e.g. by mpirun) are not visible.
+        
+        self._clockTicks = float(os.sysconf('SC_CLK_TCK'));
+        self._pageSize = os.sysconf('SC_PAGE_SIZE');
+        
+        self._lastCPUTimes = { };
+    
+    @staticmethod
+    def IsAvailable():
+        return os.path.isdir("/proc/self");
+    
+    def Sample(self, sessionID):
+        # Returns a list of (PID, name, CPU utilisation in % since the last sample or None, RSS in kB).
+        
+        samples = [];
+        
+        lastCPUTimes, self._lastCPUTimes = self._lastCPUTimes, { };
+        
+        now = time.time();
+        
+        for pid in os.listdir("/proc"):
+            if not pid.isdigit():
+                continue;
+            
+            try:
+                with open(os.path.join("/proc", pid, "stat"), 'r') as inputReader:
+                    stat = inputReader.read();
+            except (IOError, OSError):
+                # Processes can exit between listing /proc and reading their stat file.
+                
+                continue;
+            
+            # The process name is in brackets and may contain spaces; the fields after it start with the state (field 3 in proc(5)).
+            
+            name = stat[stat.find('(') + 1:stat.rfind(')')];
+            fields = stat[stat.rfind(')') + 2:].split();
+            
+            if int(fields[3]) != sessionID:
+                continue;
+            
+            cpuTime = (int(fields[11]) + int(fields[12])) / self._clockTicks;
+            rss = int(fields[21]) * self._pageSize // 1024;
+            
+            utilisation = None;
+            
+            if pid in lastCPUTimes:
+                lastTime, lastCPUTime = lastCPUTimes[pid];
+                
+                if now > lastTime:
+                    utilisation = 100.0 * (cpuTime - lastCPUTime) / (now - lastTime);
+            
+            self._lastCPUTimes[pid] = (now, cpuTime);
+            
+            samples.append((int(pid), name, utilisation, rss));
+        
+        return samples;
+
+
+class StubGPUProbe(object):
+    # GPU probe used when no GPU monitoring tool is available; records nothing.
+    
+    def Sample(self, gpuIDs):
+        return [];
+
+
+class NvidiaSMIProbe(object):
+    def __init__(self, command = "nvidia-smi", timeout = DefaultProbeTimeout):
+        # Queries the utilisation and memory use of GPUs with nvidia-smi; command can be set to e.g. a full path, or a script producing the same output for testing.
+        # GPU probes implement Sample(gpuIDs), which returns a list of (GPU ID, name, utilisation in %, memory used in kB) for the GPUs in gpuIDs (all the GPUs if gpuIDs is empty).
+        # If nvidia-smi does not finish within timeout [s], it is killed and Sample() raises an exception.
+        
+        self.Command = command;
+        self.Timeout = timeout;
+    
+    def Sample(self, gpuIDs):
+        command = "{0} --query-gpu=index,name,utilization.gpu,memory.used --format=csv,noheader,nounits".format(self.Command);
+        
+        if len(gpuIDs) > 0:
+            command = "{0} --id={1}".format(command, ",".join(str(gpuID) for gpuID in gpuIDs));
+        
+        # nvidia-smi is run in its own session so the whole process group can be killed, rather than just the shell; a timer is used rather than the timeout argument to communicate(), which Python 2 lacks.
+        
+        process = subprocess.Popen(command, shell = True, stdout = subprocess.PIPE, stderr = subprocess.PIPE, **NewSessionArguments);
+        
+        timer = threading.Timer(self.Timeout, KillProcessGroup, args = (process, signal.SIGKILL));
+        timer.start();
+        
+        try:
+            output, _ = process.communicate();
+        finally:
+            timer.cancel();
+        
+        if process.returncode == -signal.SIGKILL:
+            raise Exception("Error: \"{0}\" did not finish within {1:.0f} s.".format(self.Command, self.Timeout));
+        
+        samples = [];
+        
+        if process.returncode != 0:
+            return samples;
+        
+        for line in output.decode('utf-8', 'replace').splitlines():
+            values = [value.strip() for value in line.split(',')];
+            
+            if len(values) != 4:
+                continue;
+            
+            try:
+                samples.append((int(values[0]), values[1], float(values[2]), float(values[3]) * 1024.0));
+            except ValueError:
+                # e.g. "[N/A]" on GPUs that do not report utilisation.
+                
+                continue;
+        
+        return samples;
+
+
+def GetGPUProbe(command = "nvidia-smi"):
+    # Returns an NvidiaSMIProbe if command can be found, otherwise a StubGPUProbe.
+    
+    if command != None and FindExecutable(command.split()[0]) != None:
+        return NvidiaSMIProbe(command);
+    
+    return StubGPUProbe();
+
+
+class TelemetrySampler(object):
+    def __init__(self, interval = 10.0, gpuProbe = None, gpuIDs = None):
+        # Samples the CPU utilisation and RSS of the processes in a job, and the utilisation and memory use of its GPUs if gpuProbe is set, every interval seconds while it runs.
+        # Has the same Start()/Join() interface as the watchers in Watcher.py; the samples are written out with Write().
+        # The first sample is taken when the job starts, and each sample costs one pass over /proc (plus one call to the GPU probe), so the overhead is negligible at intervals of a few seconds or more.
+        
+        self.Interval = interval;
+        
+        self.GPUProbe = gpuProbe;
+        self.GPUIDs = list(gpuIDs) if gpuIDs != None else [];
+        
+        # Samples as rows of TelemetryHeaders, and the time spent taking them.
+        
+        self.Samples = [];
+        self.SamplingTime = 0.0;
+        
+        self._processProbe = ProcessProbe() if ProcessProbe.IsAvailable() else None;
+        
+        self._stopEvent = threading.Event();
+        self._thread = None;
+    
+    def Start(self, process):
+        self._thread = threading.Thread(target = self._Sample, args = (process, ));
+        self._thread.daemon = True;
+        self._thread.start();
+    
+    def Join(self):
+        if self._thread != None:
+            self._stopEvent.set();
+            self._thread.join(_JoinTimeout);
+            
+            # The thread is a daemon, so a probe that never returns does not stop the script from exiting.
+            
+            if self._thread.is_alive():
+                print("WARNING: TelemetrySampler.Join(): Sampling thread did not finish within {0:.0f} s.".format(_JoinTimeout));
+    
+    def _Sample(self, process):
+        startTime = time.time();
+        
+        while process.poll() == None:
+            sampleStartTime = time.time();
+            
+            t = round(sampleStartTime - startTime, 3);
+            
+            try:
+                if self._processProbe != None:
+                    for pid, name, utilisation, rss in self._processProbe.Sample(process.pid):
+                        self.Samples.append([t, "Process", pid, name, utilisation, rss]);
+                
+                if self.GPUProbe != None:
+                    for gpuID, name, utilisation, memory in self.GPUProbe.Sample(self.GPUIDs):
+                        self.Samples.append([t, "GPU", gpuID, name, utilisation, memory]);
+            except Exception as exception:
+                # Telemetry is optional -> never let it take down the job.
+                
+                print("WARNING: TelemetrySampler: {0}".format(exception));
+                
+                break;
+            
+            self.SamplingTime += time.time() - sampleStartTime;
+            
+            if self._stopEvent.wait(self.Interval):
+                break;
+    
+    def GetSummary(self):
+        return SummariseTelemetry(self.Samples);
+    
+    def Write(self, filePath):
+        with open(filePath, 'w') as outputWriter:
+            outputWriterCSV = csv.writer(outputWriter, delimiter = ',', quotechar = '\"', quoting = csv.QUOTE_ALL);
+            
+            outputWriterCSV.writerow(TelemetryHeaders);
+            
+            for row in self.Samples:
+                outputWriterCSV.writerow([value if value != None else "" for value in row]);
+
+
+def ReadTelemetry(filePath):
+    # Reads a file written by TelemetrySampler.Write() into a list of rows in the same format as TelemetrySampler.Samples.
+    
+    samples = [];
+    
+    with open(filePath, 'r') as inputReader:
+        inputReaderCSV = csv.reader(inputReader);
+        
+        next(inputReaderCSV);
+        
+        for t, sampleType, sampleID, name, utilisation, memory in inputReaderCSV:
+            samples.append([float(t), sampleType, int(sampleID), name, float(utilisation) if utilisation != "" else None, float(memory)]);
+    
+    return samples;
+
+def SummariseTelemetry(samples):
+    # Returns a dictionary with the peak total RSS of the processes in a job (PeakRSS, kB) and their mean total CPU utilisation (MeanCPUUsage, %, where e.g. 400 % = four cores fully used), and the mean utilisation (MeanGPUUtilisation, %) and peak total memory use (PeakGPUMemory, kB) of the GPUs.
+    # Values that were not sampled are set to None.
+    
+    totals = { };
+    
+    for t, sampleType, _, _, utilisation, memory in samples:
+        key = (sampleType, t);
+        
+        if key not in totals:
+            totals[key] = [0.0, 0, 0.0];
+        
+        if utilisation != None:
+            totals[key][0] += utilisation;
+            totals[key][1] += 1;
+        
+        totals[key][2] += memory;
+    
+    processTotals = [values for (sampleType, _), values in totals.items() if sampleType == "Process"];
+    gpuTotals = [values for (sampleType, _), values in totals.items() if sampleType == "GPU"];
+    
+    cpuUsage = [utilisation for utilisation, numValues, _ in processTotals if numValues > 0];
+    gpuUtilisation = [utilisation / numValues for utilisation, numValues, _ in gpuTotals if numValues > 0];
+    
+    return {
+        'PeakRSS' : max(memory for _, _, memory in processTotals) if len(processTotals) > 0 else None,
+        'MeanCPUUsage' : sum(cpuUsage) / len(cpuUsage) if len(cpuUsage) > 0 else None,
+        'MeanGPUUtilisation' : sum(gpuUtilisation) / len(gpuUtilisation) if len(gpuUtilisation) > 0 else None,
+        'PeakGPUMemory' : max(memory for _, _, memory in gpuTotals) if len(gpuTotals) > 0 else None
+        };
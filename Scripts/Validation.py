@@ -0,0 +1,55 @@
+# Validation.py by J. M. Skelton
+
+
+# Changing the parallelisation (KPAR, NPAR, NSIM, number of processes, CPU vs. GPU) should not change the result of a calculation.
+# The functions in this module check the final energy and number of SCF steps of each run against a consensus reference (the median over all the runs of the same calculation), so runs that converged to a different result (e.g. the NSIM = 1 runs in Benchmarks/GeTe/Results_4GPU/4GPU_GeTe-512.csv) can be excluded when picking the fastest settings.
+
+# Default tolerances: the final energy must be within DefaultEnergyTolerance eV of the reference, and the number of SCF steps within DefaultSCFStepsTolerance (as a fraction) of the reference.
+
+DefaultEnergyTolerance = 1.0e-3;
+DefaultSCFStepsTolerance = 0.5;
+
+# Minimum number of runs needed to form a consensus; with fewer, it is not possible to tell which run is wrong.
+
+MinConsensusRuns = 3;
+
+
+def _GetMedian(values):
+    values = sorted(values);
+    
+    numValues = len(values);
+    
+    if numValues % 2 == 1:
+        return values[numValues // 2];
+    
+    return (values[numValues // 2 - 1] + values[numValues // 2]) / 2.0;
+
+def ValidateResults(results, energyTolerance = DefaultEnergyTolerance, scfStepsTolerance = DefaultSCFStepsTolerance):
+    # results: list of (finalTotalEnergy, numSCFSteps) tuples for runs of the same calculation; entries set to None are not checked, and are not used to form the reference.
+    # Returns a list of (valid, reason) tuples: valid is True or False, or None if the run was not checked (including if there are too few runs to form a consensus), and reason explains why a run failed the checks.
+    # If scfStepsTolerance is None, only the energies are checked.
+    
+    checked = [values for values in results if values != None and values[0] != None and values[1] != None];
+    
+    validation = [(None, None)] * len(results);
+    
+    if len(checked) < MinConsensusRuns:
+        return validation;
+    
+    referenceEnergy = _GetMedian([finalTotalEnergy for finalTotalEnergy, _ in checked]);
+    referenceNumSCFSteps = _GetMedian([numSCFSteps for _, numSCFSteps in checked]);
+    
+    for i, values in enumerate(results):
+        if values == None or values[0] == None or values[1] == None:
+            continue;
+        
+        finalTotalEnergy, numSCFSteps = values;
+        
+        if abs(finalTotalEnergy - referenceEnergy) > energyTolerance:
+            validation[i] = (False, "Final E_0 = {0:.5f} eV differs from the consensus value of {1:.5f} eV by more than {2:g} eV".format(finalTotalEnergy, referenceEnergy, energyTolerance));
+        elif scfStepsTolerance != None and abs(numSCFSteps - referenceNumSCFSteps) > scfStepsTolerance * referenceNumSCFSteps:
+            validation[i] = (False, "{0} SCF steps differs from the consensus value of {1:g} by more than {2:g} %".format(numSCFSteps, referenceNumSCFSteps, 100.0 * scfStepsTolerance));
+        else:
+            validation[i] = (True, None);
+    
+    return validation;
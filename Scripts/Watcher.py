@@ -0,0 +1,139 @@
+# Watcher.py by J. M. Skelton
+
+
+import math;
+import os;
+import signal;
+import threading;
+import time;
+
+from Shared import OUTCARParser, TruncatedFileName;
+
+
+# Two-sided 95 % critical values of Student's t distribution for 1-30 degrees of freedom; for larger samples, the normal value of 1.96 is used.
+
+_TCritical95 = [
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042
+    ];
+
+
+def GetMeanAndConfidenceInterval(samples):
+    # Returns the mean and the half width of the 95 % confidence interval.
+    
+    numSamples = len(samples);
+    
+    mean = sum(samples) / numSamples;
+    
+    if numSamples < 2:
+        return (mean, float('inf'));
+    
+    variance = sum((sample - mean) ** 2 for sample in samples) / (numSamples - 1);
+    
+    tCritical = _TCritical95[numSamples - 2] if numSamples - 1 <= len(_TCritical95) else 1.96;
+    
+    return (mean, tCritical * math.sqrt(variance / numSamples));
+
+def KillProcessGroup(process, sig = signal.SIGTERM):
+    # Jobs are started in their own process group, so that mpirun and the VASP processes behind the shell are signalled as well.
+    
+    try:
+        os.killpg(process.pid, sig);
+    except OSError:
+        pass;
+
+
+class EarlyStopWatcher(object):
+    def __init__(self, runDir, tolerance, skipSCFCycles = 0, minSCFSteps = 5, pollInterval = 5.0, gracePeriod = 120.0):
+        # Tails the OUTCAR in runDir while VASP is running and stops the job once the 95 % confidence interval on the average SCF time (excluding the first skipSCFCycles steps) is within +/- tolerance of the mean.
+        # The job is stopped by writing a STOPCAR with LABORT = .TRUE.; if VASP has not exited gracePeriod seconds later, it is sent SIGTERM.
+        
+        self.RunDir = runDir;
+        
+        self.Tolerance = tolerance;
+        self.SkipSCFCycles = skipSCFCycles;
+        self.MinSCFSteps = minSCFSteps;
+        
+        self.PollInterval = pollInterval;
+        self.GracePeriod = gracePeriod;
+        
+        self.Truncated = False;
+        self.Summary = None;
+        
+        # Number of SCF steps in the OUTCAR when the job was stopped.
+        
+        self.NumSCFSteps = None;
+        
+        self._outcarParser = OUTCARParser(os.path.join(runDir, "OUTCAR"));
+        
+        self._stopEvent = threading.Event();
+        self._thread = None;
+    
+    def Start(self, process):
+        self._thread = threading.Thread(target = self._Watch, args = (process, ));
+        self._thread.daemon = True;
+        self._thread.start();
+    
+    def Join(self):
+        if self._thread != None:
+            self._stopEvent.set();
+            self._thread.join();
+    
+    def HasSCFSteps(self):
+        # Whether the OUTCAR still contains the SCF steps the decision to stop the job was based on, e.g. if VASP crashed or was killed while stopping; should be called after Join().
+        
+        if not self.Truncated:
+            return False;
+        
+        if os.path.isfile(self._outcarParser.FilePath):
+            self._outcarParser.Update();
+        
+        return len(self._outcarParser.SCFTimes) >= self.NumSCFSteps;
+    
+    def _IsConverged(self):
+        scfTimes = self._outcarParser.SCFTimes;
+        
+        samples = scfTimes[self.SkipSCFCycles:];
+        
+        if len(samples) < max(self.MinSCFSteps, 2):
+            return False;
+        
+        mean, halfWidth = GetMeanAndConfidenceInterval(samples);
+        
+        if halfWidth > self.Tolerance * mean:
+            return False;
+        
+        self.NumSCFSteps = len(scfTimes);
+        
+        self.Summary = "Stopped early after {0} SCF steps ({1} averaged): t_SCF,Ave = {2:.3f} +/- {3:.3f} s (95 % CI)".format(
+            len(scfTimes), len(samples), mean, halfWidth
+            );
+        
+        return True;
+    
+    def _Watch(self, process):
+        stopTime = None;
+        
+        while process.poll() == None:
+            if not self.Truncated:
+                if os.path.isfile(self._outcarParser.FilePath):
+                    self._outcarParser.Update();
+                
+                if self._IsConverged():
+                    with open(os.path.join(self.RunDir, "STOPCAR"), 'w') as outputWriter:
+                        outputWriter.write("LABORT = .TRUE.\n");
+                    
+                    with open(os.path.join(self.RunDir, TruncatedFileName), 'w') as outputWriter:
+                        outputWriter.write("{0}\n".format(self.Summary));
+                    
+                    self.Truncated = True;
+                    
+                    stopTime = time.time();
+            elif time.time() - stopTime > self.GracePeriod:
+                KillProcessGroup(process);
+                
+                break;
+            
+            if self._stopEvent.wait(self.PollInterval):
+                break;
@@ -0,0 +1,36 @@
+# conftest.py by J. M. Skelton
+
+
+# Shared fixtures for the tests, which run the scripts end to end with the stand-ins for VASP, SLURM and mpirun (FakeVASP.py, FakeSLURM.py and FakeLauncher.py) in a temporary directory.
+# Run from the Scripts directory with: python -m pytest -q tests
+
+
+import os;
+import shutil;
+import sys;
+
+import pytest;
+
+
+ScriptsDir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)));
+
+if ScriptsDir not in sys.path:
+    sys.path.insert(0, ScriptsDir);
+
+_BenchmarkInputDir = os.path.join(os.path.dirname(ScriptsDir), "Benchmarks", "GeTe", "InputFiles");
+
+
+@pytest.fixture
+def workDir(tmp_path, monkeypatch):
+    # Temporary working directory with the INCAR, KPOINTS and 64-atom POSCAR from the GeTe benchmark, and a placeholder POTCAR.
+    
+    for fileName in "INCAR", "KPOINTS":
+        shutil.copy(os.path.join(_BenchmarkInputDir, fileName), str(tmp_path / fileName));
+    
+    shutil.copy(os.path.join(_BenchmarkInputDir, "POSCAR_GeTe-64.vasp"), str(tmp_path / "POSCAR"));
+    
+    (tmp_path / "POTCAR").write_text(u"POTCAR\n");
+    
+    monkeypatch.chdir(tmp_path);
+    
+    return tmp_path;
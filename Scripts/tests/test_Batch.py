@@ -0,0 +1,65 @@
+# test_Batch.py by J. M. Skelton
+
+
+import os;
+import sys;
+
+from Batch import BatchRunner, GetBatchBackend;
+from Planner import GetSimulatedVASPCommand, TimingModel;
+from Scheduler import Job;
+from Sweep import NumProcessesKey, Sweep;
+
+from conftest import ScriptsDir;
+
+
+def _GetFakeCommands(batchSystem):
+    script = "\"{0}\" \"{1}\"".format(sys.executable, os.path.join(ScriptsDir, "FakeSLURM.py" if batchSystem == "slurm" else "FakePBS.py"));
+    
+    return ("{0} sbatch".format(script), "{0} squeue".format(script)) if batchSystem == "slurm" else ("{0} qsub".format(script), "{0} qstat".format(script));
+
+def _RunAbortGroup(batchSystem):
+    # Runs a group of three jobs in which the second fails; the first succeeds and the third is cancelled without running.
+    
+    command, _ = GetSimulatedVASPCommand(0.002, TimingModel());
+    
+    command = "if grep -q \"^NSIM = 2\" INCAR ; then exit 1 ; fi ; {0}".format(command);
+    
+    jobs = [Job("Test-{0}".format(nsim), "NSIM = {0}".format(nsim), 1, [("NSIM", nsim)], group = 1) for nsim in (1, 2, 4)];
+    
+    batch = BatchRunner(GetBatchBackend(batchSystem, commands = _GetFakeCommands(batchSystem)), 4, pollInterval = 0.2, stateFile = "Batch.json");
+    
+    batch.RunJobs(jobs, "Tmp", command, "test_Batch.py", abortGroupOnFail = True);
+    
+    assert [job.Status for job in jobs] == ['Success', 'Failed', 'Failed'];
+    
+    assert os.path.isdir("Test-1");
+    assert not os.path.exists("Test-2") and not os.path.exists("Test-4");
+    
+    # The third job never ran, so it left no output.
+    
+    assert os.path.isfile("Test-2.out") and not os.path.isfile("Test-4.out");
+    
+    # The state file is kept, as not every job succeeded.
+    
+    assert os.path.isfile("Batch.json");
+
+def test_FakeSLURMAbortGroup(workDir):
+    _RunAbortGroup("slurm");
+
+def test_FakePBSAbortGroup(workDir):
+    _RunAbortGroup("pbs");
+
+def test_FakeSLURMJobArray(workDir):
+    sweep = Sweep([(NumProcessesKey, [1]), ("NSIM", [1, 2, 4])], "Test-<nsim>", "test_Batch.py");
+    
+    command, _ = GetSimulatedVASPCommand(0.002, TimingModel());
+    
+    batch = BatchRunner(GetBatchBackend("slurm", commands = _GetFakeCommands("slurm")), 4, pollInterval = 0.2, stateFile = "Batch.json");
+    
+    sweep.Run(None, "Tmp", command, batch = batch);
+    
+    assert len(sweep.CollectResults()) == 3;
+    
+    # The state file is removed once every job has succeeded.
+    
+    assert not os.path.isfile("Batch.json");
@@ -0,0 +1,50 @@
+# test_Execution.py by J. M. Skelton
+
+
+import time;
+
+from Execution import Executor, IdleReason, WallTimeReason;
+
+
+def test_CompletedCommand(tmp_path):
+    result = Executor(wallTimeLimit = 10.0).Run("echo done", str(tmp_path / "Output.txt"));
+    
+    assert result.Status == 0 and not result.TimedOut;
+    assert (tmp_path / "Output.txt").read_text().strip() == "done";
+
+def test_WallTimeLimit(tmp_path):
+    # The command keeps writing output, so only the wall-clock limit applies.
+    
+    executor = Executor(wallTimeLimit = 1.0, idleTimeout = 5.0, gracePeriod = 1.0, pollInterval = 0.05);
+    
+    startTime = time.time();
+    
+    result = executor.Run("while true; do echo tick; sleep 0.1; done", str(tmp_path / "Output.txt"));
+    
+    assert result.KillReason == WallTimeReason;
+    assert result.Status != 0;
+    assert time.time() - startTime < 5.0;
+    
+    assert result.Summary in (tmp_path / "Output.txt").read_text();
+
+def test_IdleTimeout(tmp_path):
+    executor = Executor(wallTimeLimit = 30.0, idleTimeout = 0.5, gracePeriod = 1.0, pollInterval = 0.05);
+    
+    startTime = time.time();
+    
+    result = executor.Run("echo start; sleep 30", str(tmp_path / "Output.txt"));
+    
+    assert result.KillReason == IdleReason;
+    assert time.time() - startTime < 5.0;
+
+def test_GracePeriodKillsProcessesIgnoringSIGTERM(tmp_path):
+    # The subshell ignores SIGTERM, so it is only stopped by the SIGKILL sent after the grace period.
+    
+    executor = Executor(wallTimeLimit = 0.5, gracePeriod = 0.5, pollInterval = 0.05);
+    
+    startTime = time.time();
+    
+    result = executor.Run("sh -c 'trap \"\" TERM; sleep 30'", str(tmp_path / "Output.txt"));
+    
+    assert result.KillReason == WallTimeReason;
+    assert time.time() - startTime < 5.0;
@@ -0,0 +1,48 @@
+# test_Launcher.py by J. M. Skelton
+
+
+import os;
+
+from Planner import GetSimulatedVASPCommand, TimingModel;
+from Scheduler import Job, ResourcePool, RunJobs;
+
+
+def _ReadLauncherLog(archiveDir):
+    # Returns a dictionary mapping each rank to the line logged for it by FakeLauncher.py.
+    
+    with open(os.path.join(archiveDir, "FakeLauncher.log"), 'r') as inputReader:
+        lines = [line.strip() for line in inputReader if line.startswith("Rank")];
+    
+    return dict((int(line.split(':')[0].split()[1]), line) for line in lines);
+
+def test_GPUBinding(workDir):
+    # Four processes sharing two GPUs: ranks 0 and 1 should be bound to the first of the GPUs allocated to the job, and ranks 2 and 3 to the second.
+    
+    command, mpsControlCommand = GetSimulatedVASPCommand(0.002, TimingModel(numGPUs = 2));
+    
+    job = Job("Test-1", "# proc = 4", 4, [("NSIM", 4)], numGPUs = 2, ranksPerGPU = 2, mpsControlCommand = mpsControlCommand);
+    
+    RunJobs([job], ResourcePool(8, gpuIDs = [3, 5]), "Tmp", command, "test_Launcher.py");
+    
+    assert job.Status == 'Success';
+    
+    ranks = _ReadLauncherLog("Test-1");
+    
+    assert sorted(ranks.keys()) == [0, 1, 2, 3];
+    
+    for rank, gpuID in (0, 3), (1, 3), (2, 5), (3, 5):
+        assert "CUDA_VISIBLE_DEVICES = {0},".format(gpuID) in ranks[rank];
+
+def test_GPUBindingWithMPSAndThreads(workDir):
+    command, mpsControlCommand = GetSimulatedVASPCommand(0.002, TimingModel(numGPUs = 1));
+    
+    job = Job("Test-1", "# proc = 2", 2, [("NSIM", 4)], numGPUs = 1, numThreads = 2, ranksPerGPU = 2, useMPS = True, mpsControlCommand = mpsControlCommand);
+    
+    RunJobs([job], ResourcePool(4, gpuIDs = [1]), "Tmp", command, "test_Launcher.py");
+    
+    assert job.Status == 'Success';
+    
+    ranks = _ReadLauncherLog("Test-1");
+    
+    for rank in 0, 1:
+        assert "OMP_NUM_THREADS = 2" in ranks[rank] and "MPS = running" in ranks[rank];
@@ -0,0 +1,85 @@
+# test_Scheduler.py by J. M. Skelton
+
+
+import os;
+
+from Planner import GetSimulatedVASPCommand, TimingModel;
+from Scheduler import Job, ResourcePool, RunJobs;
+from Shared import CollectRunRecord, IsTruncated;
+from Sweep import NumProcessesKey, Sweep;
+from Watcher import EarlyStopWatcher;
+
+
+# Fraction of the modelled run times taken by the simulated VASP runs.
+
+_TimeScale = 0.002;
+
+
+def _GetFakeVASPCommand(numSCFSteps = 20):
+    command, _ = GetSimulatedVASPCommand(_TimeScale, TimingModel(numSCFSteps = numSCFSteps));
+    
+    return command;
+
+
+def test_SimulatedSweepWithConcurrentPool(workDir, capsys):
+    sweep = Sweep([(NumProcessesKey, [1, 2]), ("NSIM", [1, 2, 4])], "Test-<nproc>-<nsim>", "test_Scheduler.py");
+    
+    # Four cores fit several of the jobs at once.
+    
+    sweep.Run(ResourcePool(4), "Tmp", _GetFakeVASPCommand());
+    
+    output = capsys.readouterr().out;
+    
+    assert output.count("Running test with", 0, output.index("Finished test with")) > 1;
+    
+    data = sweep.CollectResults(skipSCFCycles = 2);
+    
+    assert len(data) == 6;
+    
+    # The first two SCF steps are excluded from the averages.
+    
+    for point, results, record in data.values():
+        assert os.path.isdir(sweep.GetArchiveDir(point));
+        assert record['NumSCFSteps'] == 18 and record['TSCFAve'] > 0.0;
+    
+    # The run directories are renamed to the archive directories, leaving nothing behind.
+    
+    assert not os.path.isdir("Tmp") or len(os.listdir("Tmp")) == 0;
+
+def test_WatcherTruncation(workDir):
+    job = Job("Test-1", "# proc = 1", 1, [("NSIM", 4)]);
+    
+    # A loose tolerance stops the job once the minimum number of SCF steps has been averaged, well before the 200 it would otherwise run.
+    
+    watcherFactory = lambda runDir: EarlyStopWatcher(runDir, 0.5, minSCFSteps = 5, pollInterval = 0.05, gracePeriod = 5.0);
+    
+    RunJobs([job], ResourcePool(1), "Tmp", _GetFakeVASPCommand(numSCFSteps = 200), "test_Scheduler.py", watcherFactory = watcherFactory);
+    
+    assert job.Status == 'Success';
+    assert IsTruncated("Test-1");
+    
+    record = CollectRunRecord("Test-1");
+    
+    assert 5 <= record['NumSCFSteps'] < 200;
+
+def test_WatcherTruncationAfterCrash(workDir):
+    # A job that crashes after being stopped still counts as a success, as long as the OUTCAR has the steps the watcher based its decision on.
+    
+    job = Job("Test-1", "# proc = 1", 1, [("NSIM", 4)]);
+    
+    watcherFactory = lambda runDir: EarlyStopWatcher(runDir, 0.5, minSCFSteps = 5, pollInterval = 0.05, gracePeriod = 5.0);
+    
+    command = "{0}; exit 1".format(_GetFakeVASPCommand(numSCFSteps = 200));
+    
+    RunJobs([job], ResourcePool(1), "Tmp", command, "test_Scheduler.py", watcherFactory = watcherFactory);
+    
+    assert job.Status == 'Success';
+    
+    # Without the early stop, the same failure is reported.
+    
+    job = Job("Test-2", "# proc = 1", 1, [("NSIM", 4)]);
+    
+    RunJobs([job], ResourcePool(1), "Tmp", "{0}; exit 1".format(_GetFakeVASPCommand(numSCFSteps = 5)), "test_Scheduler.py");
+    
+    assert job.Status == 'Failed';
+    assert not os.path.exists("Test-2");